@@ -1,7 +1,7 @@
 """
 E2E тесты Tigrit API: GET /api/health, /api/village, /api/users, /api/events,
 /api/events/active, /api/map, /api/assets, /api/zones, /api/admin/*;
-PUT /api/map (с ключом и без); POST /api/chat/message.
+PUT/PATCH /api/map (с ключом и без), viewport и чанки карты; POST /api/chat/message.
 """
 import os
 
@@ -112,6 +112,54 @@ class TestTigritPutMap:
         assert r.json().get("ok") is True
 
 
+@pytest.mark.e2e
+class TestTigritMapChunks:
+    """GET /api/map по viewport, /api/map/meta, чанки с ETag, PATCH /api/map."""
+
+    def test_viewport_returns_tiles_in_bbox(self, tigrit_client):
+        r = tigrit_client.get("/api/map", params={"x0": 0, "y0": 0, "x1": 15, "y1": 15})
+        assert r.status_code == 200
+        data = r.json()
+        assert isinstance(data["chunks"], dict)
+        assert all(0 <= t["x"] <= 15 and 0 <= t["y"] <= 15 for t in data["tiles"])
+
+    def test_viewport_partial_params_returns_400(self, tigrit_client):
+        r = tigrit_client.get("/api/map", params={"x0": 0, "y0": 0})
+        assert r.status_code == 400
+
+    def test_chunk_etag_304(self, tigrit_client):
+        r = tigrit_client.get("/api/map/chunks/0/0")
+        assert r.status_code == 200
+        etag = r.headers.get("etag")
+        assert etag
+        r2 = tigrit_client.get("/api/map/chunks/0/0", headers={"If-None-Match": etag})
+        assert r2.status_code == 304
+
+    def test_patch_without_key_returns_401_or_503(self, tigrit_client):
+        r = tigrit_client.patch("/api/map", json={"tiles": [{"x": 0, "y": 0, "type": "grass"}]})
+        assert r.status_code in (401, 503)
+
+    def test_patch_updates_chunk_version(self, tigrit_client, tigrit_editor_headers):
+        if not tigrit_editor_headers:
+            pytest.skip("EDITOR_API_KEY не задан")
+        meta = tigrit_client.get("/api/map/meta").json()
+        r = tigrit_client.patch(
+            "/api/map",
+            json={"tiles": [{"x": 1, "y": 1, "type": "house"}], "base_version": meta["version"]},
+            headers=tigrit_editor_headers,
+        )
+        assert r.status_code == 200
+        data = r.json()
+        assert data["version"] > meta["version"]
+        assert data["chunks"].get("0:0") == data["version"]
+        r = tigrit_client.patch(
+            "/api/map",
+            json={"remove": [{"x": 1, "y": 1}], "base_version": meta["version"]},
+            headers=tigrit_editor_headers,
+        )
+        assert r.status_code == 409
+
+
 @pytest.mark.e2e
 class TestTigritZones:
     """GET /api/zones — всегда 200, массив с id и name."""
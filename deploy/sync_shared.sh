@@ -0,0 +1,35 @@
+#!/usr/bin/env bash
+# Общие модули: источник — бэкенд/infrastructure, копии — в сервисах deploy (tigrit_shared) и сервисы/.
+# Каждый образ собирается из своей папки, поэтому модуль копируется, а не импортируется.
+# Правки — только в бэкенд/infrastructure, затем:
+#   bash deploy/sync_shared.sh          — обновить копии
+#   bash deploy/sync_shared.sh --check  — только проверить (код 1, если копия разошлась)
+# Совпадение копий проверяет и тест бэкенд/tests/test_shared_copies.py.
+
+set -e
+ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+SRC="$ROOT/бэкенд/infrastructure"
+
+# модуль в бэкенд/infrastructure → копия (путь от корня репозитория)
+COPIES=(
+  "scheduler.py deploy/tigrit_api/tigrit_shared/scheduler.py"
+  "scheduler.py deploy/tigrit_bot/tigrit_shared/scheduler.py"
+  "http_client.py deploy/tigrit_api/tigrit_shared/http_client.py"
+  "http_client.py сервисы/auth/http_client.py"
+)
+
+status=0
+for pair in "${COPIES[@]}"; do
+  read -r src dst <<< "$pair"
+  if cmp -s "$SRC/$src" "$ROOT/$dst"; then
+    continue
+  fi
+  if [[ "$1" == "--check" ]]; then
+    echo "Копия расходится с бэкенд/infrastructure/$src: $dst" >&2
+    status=1
+  else
+    cp "$SRC/$src" "$ROOT/$dst"
+    echo "  обновлено: $dst"
+  fi
+done
+exit $status
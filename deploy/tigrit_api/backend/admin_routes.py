@@ -8,7 +8,7 @@ import logging
 import os
 from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/admin", tags=["admin-tigrit"])
@@ -289,3 +289,29 @@ async def admin_patch_user(user_id: int, body: Dict[str, Any]):
     )
     logger.info("admin_patch_user: user_id=%s fields=%s", user_id, list(body.keys()))
     return {"ok": True, "updated_fields": list(body.keys()), "user": dict(row) if row else None}
+
+
+# ─── ФОНОВЫЕ ЗАДАЧИ ────────────────────────────────────────────────
+
+@router.get("/jobs", dependencies=[Depends(_require_admin)])
+async def admin_jobs(request: Request, limit: int = Query(50, ge=1, le=200)):
+    """Метрики планировщика этого процесса и последние запуски по кластеру (job_runs)."""
+    scheduler = request.app.state.scheduler
+    return {"metrics": scheduler.metrics(), "runs": await scheduler.recent_runs(limit=limit)}
+
+
+@router.get("/upstreams", dependencies=[Depends(_require_admin)])
+async def admin_upstreams():
+    """Исходящие API этого процесса: состояние circuit breaker, ошибки, гистограмма латентности."""
+    from tigrit_shared.http_client import get_http
+    return get_http().metrics()
+
+
+# ─── КОНФИГ БОТА ───────────────────────────────────────────────────
+
+@router.post("/bot/reload-config", dependencies=[Depends(_require_admin)])
+async def admin_bot_reload_config():
+    """Попросить бота перечитать зоны и tigrit_settings (NOTIFY tigrit_config). Изменения zones/tigrit_settings уведомляют сами."""
+    from tigrit_shared import db
+    await db.execute("SELECT pg_notify('tigrit_config', 'manual')")
+    return {"ok": True}
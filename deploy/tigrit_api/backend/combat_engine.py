@@ -0,0 +1,466 @@
+"""
+Серверные боевые сессии survival: активные бои в памяти процесса.
+
+Каждый бой — CombatState с HP, номером последнего действия и журналом. Действия одного боя
+применяются строго по очереди (asyncio.Lock боя), без чтения/записи строки combat_sessions на удар.
+Запись в БД — фоном раз в FLUSH_INTERVAL одной транзакцией на пачку:
+- новые записи журнала — один INSERT в combat_actions;
+- контрольная точка HP активных боёв — один UPDATE по всем изменившимся;
+- итог завершённого боя (status, winner_id, ended_at) — один раз.
+
+Бой без действий дольше IDLE_TIMEOUT завершается как timeout (победитель — у кого больше HP).
+Переподключение: state(combat_id, after_seq) отдаёт HP и хвост журнала; после перезапуска
+процесса бой поднимается из combat_sessions + combat_actions при первом обращении.
+Активные в БД бои, которых нет в памяти (остались от прошлого процесса), при старте и затем
+раз в IDLE_TIMEOUT завершаются как timeout одним UPDATE (PgCombatStore.expire_idle).
+Если пачка не записалась из-за ошибки данных (SQLSTATE 22/23, например бой удалён), бои пишутся
+по одному, а не записываемый бой отбрасывается из записи — он не блокирует остальные.
+Рассчитано на один процесс API (uvicorn без --workers), как и остальной in-memory слой Тигрит.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from tigrit_shared import db as shared_db
+
+logger = logging.getLogger(__name__)
+
+MAX_HP = 100
+FLUSH_INTERVAL = 1.0
+IDLE_TIMEOUT = 120.0
+SWEEP_INTERVAL = 5.0
+# Завершённый бой держим в памяти ещё столько — для переподключения без похода в БД
+FINISHED_TTL = 60.0
+# Защита от бесконечного боя (взаимное лечение): после стольких действий — timeout
+MAX_ACTIONS = 1000
+SKILL_DAMAGE = {"attack": 14, "dash": 8, "heal": -12}
+DEFAULT_DAMAGE = 10
+
+
+class CombatError(Exception):
+    """Ошибка действия в бою: status — HTTP-код для роутов."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class CombatAction:
+    __slots__ = ("seq", "actor_id", "skill_id", "delta", "attacker_hp", "defender_hp", "ts")
+
+    def __init__(self, seq: int, actor_id: int, skill_id: str, delta: int,
+                 attacker_hp: int, defender_hp: int, ts: datetime):
+        self.seq = seq
+        self.actor_id = actor_id
+        self.skill_id = skill_id
+        self.delta = delta
+        self.attacker_hp = attacker_hp
+        self.defender_hp = defender_hp
+        self.ts = ts
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "seq": self.seq,
+            "actor_id": self.actor_id,
+            "skill_id": self.skill_id,
+            "delta": self.delta,
+            "attacker_hp": self.attacker_hp,
+            "defender_hp": self.defender_hp,
+            "ts": self.ts.isoformat(),
+        }
+
+
+class CombatState:
+    def __init__(self, combat_id: int, attacker_id: int, defender_id: int, location_id: Optional[str],
+                 attacker_hp: int = MAX_HP, defender_hp: int = MAX_HP, status: str = "active"):
+        self.id = combat_id
+        self.attacker_id = attacker_id
+        self.defender_id = defender_id
+        self.location_id = location_id
+        self.attacker_hp = attacker_hp
+        self.defender_hp = defender_hp
+        self.status = status
+        self.winner_id: Optional[int] = None
+        self.ended_at: Optional[datetime] = None
+        self.seq = 0
+        self.log: List[CombatAction] = []
+        self.flushed_seq = 0
+        self.dirty = False
+        self.final_pending = False
+        self.last_action = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def view(self, after_seq: int = 0) -> Dict[str, Any]:
+        return {
+            "combat_id": self.id,
+            "attacker_id": self.attacker_id,
+            "defender_id": self.defender_id,
+            "location_id": self.location_id,
+            "attacker_hp": self.attacker_hp,
+            "defender_hp": self.defender_hp,
+            "status": self.status,
+            "winner_id": self.winner_id,
+            "seq": self.seq,
+            "actions": [a.as_dict() for a in self.log if a.seq > after_seq],
+        }
+
+
+# Классы SQLSTATE, повтор которых не поможет: ошибки данных и ограничений
+PERMANENT_SQLSTATE_CLASSES = ("22", "23")
+
+
+def is_permanent_error(e: BaseException) -> bool:
+    return str(getattr(e, "sqlstate", "") or "")[:2] in PERMANENT_SQLSTATE_CLASSES
+
+
+# (combat_id, seq, actor_id, skill_id, delta, attacker_hp, defender_hp, ts)
+ActionRow = Tuple[int, int, int, str, int, int, int, datetime]
+# (combat_id, attacker_hp, defender_hp, last_seq, status, winner_id, ended_at)
+SessionRow = Tuple[int, int, int, int, str, Optional[int], Optional[datetime]]
+
+
+class PgCombatStore:
+    """Хранение боёв в Postgres (combat_sessions + combat_actions, миграция 013)."""
+
+    async def create(self, attacker_id: int, defender_id: int, location_id: Optional[str]) -> int:
+        return await shared_db.fetchval(
+            """
+            INSERT INTO combat_sessions (attacker_id, defender_id, location_id, attacker_hp, defender_hp, status, started_at)
+            VALUES ($1, $2, $3, $4, $4, 'active', NOW())
+            RETURNING id
+            """,
+            attacker_id,
+            defender_id,
+            location_id,
+            MAX_HP,
+        )
+
+    async def load(self, combat_id: int) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        session = await shared_db.query_one(
+            """
+            SELECT id, attacker_id, defender_id, location_id, attacker_hp, defender_hp, status,
+                   winner_id, ended_at, last_seq, COALESCE(last_action_at, started_at) AS last_action_at
+            FROM combat_sessions
+            WHERE id = $1
+            """,
+            combat_id,
+        )
+        if not session:
+            return None
+        actions = await shared_db.query_all(
+            """
+            SELECT seq, actor_id, skill_id, delta, attacker_hp, defender_hp, ts
+            FROM combat_actions
+            WHERE combat_id = $1 AND seq <= $2
+            ORDER BY seq
+            """,
+            combat_id,
+            int(session["last_seq"]),
+        )
+        return dict(session), [dict(a) for a in actions]
+
+    async def write(self, actions: List[ActionRow], sessions: List[SessionRow]) -> None:
+        pool = await shared_db.get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if actions:
+                    cols = list(zip(*actions))
+                    await conn.execute(
+                        """
+                        INSERT INTO combat_actions (combat_id, seq, actor_id, skill_id, delta, attacker_hp, defender_hp, ts)
+                        SELECT * FROM unnest($1::bigint[], $2::int[], $3::bigint[], $4::text[],
+                                             $5::int[], $6::int[], $7::int[], $8::timestamptz[])
+                        ON CONFLICT (combat_id, seq) DO NOTHING
+                        """,
+                        *[list(c) for c in cols],
+                    )
+                if sessions:
+                    cols = list(zip(*sessions))
+                    await conn.execute(
+                        """
+                        UPDATE combat_sessions c
+                        SET attacker_hp = u.attacker_hp,
+                            defender_hp = u.defender_hp,
+                            last_seq = u.last_seq,
+                            last_action_at = NOW(),
+                            status = u.status,
+                            winner_id = u.winner_id,
+                            ended_at = u.ended_at
+                        FROM unnest($1::bigint[], $2::int[], $3::int[], $4::int[], $5::text[],
+                                    $6::bigint[], $7::timestamptz[])
+                             AS u(id, attacker_hp, defender_hp, last_seq, status, winner_id, ended_at)
+                        WHERE c.id = u.id AND c.status = 'active'
+                        """,
+                        *[list(c) for c in cols],
+                    )
+
+
+    async def expire_idle(self, idle_timeout: float, skip_ids: List[int]) -> int:
+        """Завершить как timeout активные бои без действий дольше idle_timeout (кроме skip_ids — они в памяти)."""
+        return int(await shared_db.fetchval(
+            """
+            WITH expired AS (
+                UPDATE combat_sessions
+                SET status = 'timeout',
+                    ended_at = NOW(),
+                    winner_id = CASE WHEN attacker_hp > defender_hp THEN attacker_id
+                                     WHEN defender_hp > attacker_hp THEN defender_id END
+                WHERE status = 'active'
+                  AND COALESCE(last_action_at, started_at) < NOW() - make_interval(secs => $1)
+                  AND id <> ALL($2::bigint[])
+                RETURNING 1
+            )
+            SELECT count(*) FROM expired
+            """,
+            float(idle_timeout),
+            skip_ids,
+        ) or 0)
+
+
+class CombatEngine:
+    def __init__(self, store: Any = None, flush_interval: float = FLUSH_INTERVAL,
+                 idle_timeout: float = IDLE_TIMEOUT, rng: Optional[random.Random] = None):
+        self.store = store or PgCombatStore()
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.rng = rng or random.Random()
+        self.sessions: Dict[int, CombatState] = {}
+        self._finished_at: Dict[int, float] = {}
+        self._load_locks: Dict[int, asyncio.Lock] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"started": 0, "actions": 0, "finished": 0, "timeouts": 0,
+                      "flushes": 0, "flushed_actions": 0, "errors": 0,
+                      "dropped": 0, "expired_stored": 0}
+
+    # ——— Жизненный цикл ———
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop(), name="combat-engine")
+
+    async def stop(self) -> None:
+        """Останавливает фоновый цикл, дописав журнал и контрольные точки."""
+        self._stopping = True
+        self._wake.set()
+        if self._task:
+            await self._task
+            self._task = None
+        # Действия, пришедшие во время последней записи цикла
+        await self.flush()
+
+    async def _loop(self) -> None:
+        last_sweep = time.monotonic()
+        last_expire = None
+        while True:
+            if last_expire is None or time.monotonic() - last_expire >= self.idle_timeout:
+                last_expire = time.monotonic()
+                await self.expire_stored()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            now = time.monotonic()
+            if now - last_sweep >= SWEEP_INTERVAL:
+                last_sweep = now
+                self.sweep(now)
+            await self.flush()
+            if self._stopping:
+                return
+
+    # ——— Бой ———
+
+    async def start_combat(self, attacker_id: int, defender_id: int, location_id: Optional[str] = None) -> CombatState:
+        combat_id = int(await self.store.create(attacker_id, defender_id, location_id))
+        state = CombatState(combat_id, attacker_id, defender_id, location_id)
+        self.sessions[combat_id] = state
+        self.stats["started"] += 1
+        return state
+
+    async def get(self, combat_id: int) -> CombatState:
+        state = self.sessions.get(combat_id)
+        if state is not None:
+            return state
+        lock = self._load_locks.setdefault(combat_id, asyncio.Lock())
+        async with lock:
+            state = self.sessions.get(combat_id)
+            if state is None:
+                state = await self._load(combat_id)
+            self._load_locks.pop(combat_id, None)
+        return state
+
+    async def _load(self, combat_id: int) -> CombatState:
+        loaded = await self.store.load(combat_id)
+        if loaded is None:
+            raise CombatError(404, "Combat session not found")
+        row, actions = loaded
+        state = CombatState(
+            int(row["id"]), int(row["attacker_id"]), int(row["defender_id"]), row.get("location_id"),
+            int(row["attacker_hp"]), int(row["defender_hp"]), row["status"],
+        )
+        state.winner_id = row.get("winner_id")
+        state.ended_at = row.get("ended_at")
+        state.log = [
+            CombatAction(a["seq"], a["actor_id"], a["skill_id"], a["delta"], a["attacker_hp"], a["defender_hp"], a["ts"])
+            for a in actions
+        ]
+        state.seq = state.flushed_seq = int(row.get("last_seq") or 0)
+        if state.status == "active":
+            idle = datetime.now(timezone.utc) - row["last_action_at"] if row.get("last_action_at") else None
+            if idle is not None and idle.total_seconds() >= self.idle_timeout:
+                self._finish(state, "timeout")
+            self.sessions[state.id] = state
+        return state
+
+    async def act(self, combat_id: int, user_id: int, skill_id: str) -> Tuple[CombatState, CombatAction, str]:
+        """Применить навык user_id в бою. Действия одного боя сериализуются."""
+        state = await self.get(combat_id)
+        async with state.lock:
+            if state.status != "active":
+                raise CombatError(400, "Combat session already ended")
+            if user_id not in (state.attacker_id, state.defender_id):
+                raise CombatError(403, "Доступ к этой боевой сессии запрещён")
+            action, log_entry = self._apply(state, user_id, skill_id)
+        return state, action, log_entry
+
+    def _apply(self, state: CombatState, user_id: int, skill_id: str) -> Tuple[CombatAction, str]:
+        base_damage = SKILL_DAMAGE.get(skill_id, DEFAULT_DAMAGE)
+        delta = int(round(base_damage * self.rng.uniform(0.9, 1.1)))
+        actor_is_attacker = user_id == state.attacker_id
+
+        if skill_id == "heal":
+            if actor_is_attacker:
+                state.attacker_hp = min(MAX_HP, state.attacker_hp - delta)  # delta отрицательный
+            else:
+                state.defender_hp = min(MAX_HP, state.defender_hp - delta)
+            log_entry = "Лечение"
+        else:
+            delta = max(delta, 1)
+            if actor_is_attacker:
+                state.defender_hp = max(0, state.defender_hp - delta)
+            else:
+                state.attacker_hp = max(0, state.attacker_hp - delta)
+            log_entry = f"Удар {skill_id}"
+
+        state.seq += 1
+        action = CombatAction(state.seq, user_id, skill_id, delta, state.attacker_hp, state.defender_hp,
+                              datetime.now(timezone.utc))
+        state.log.append(action)
+        state.dirty = True
+        state.last_action = time.monotonic()
+        self.stats["actions"] += 1
+
+        if state.attacker_hp <= 0 or state.defender_hp <= 0:
+            self._finish(state, "finished")
+        elif state.seq >= MAX_ACTIONS:
+            self._finish(state, "timeout")
+        return action, log_entry
+
+    def _finish(self, state: CombatState, status: str) -> None:
+        state.status = status
+        state.ended_at = datetime.now(timezone.utc)
+        if state.attacker_hp != state.defender_hp:
+            state.winner_id = state.attacker_id if state.attacker_hp > state.defender_hp else state.defender_id
+        state.dirty = True
+        state.final_pending = True
+        self._finished_at[state.id] = time.monotonic()
+        self.stats["timeouts" if status == "timeout" else "finished"] += 1
+        self._wake.set()
+
+    def sweep(self, now: Optional[float] = None) -> None:
+        """Завершить простаивающие бои, выгрузить давно завершённые и записанные."""
+        now = time.monotonic() if now is None else now
+        for state in list(self.sessions.values()):
+            if state.status == "active" and now - state.last_action >= self.idle_timeout:
+                self._finish(state, "timeout")
+        for combat_id, ended in list(self._finished_at.items()):
+            state = self.sessions.get(combat_id)
+            if state is None:
+                self._finished_at.pop(combat_id, None)
+            elif not state.final_pending and now - ended >= FINISHED_TTL:
+                del self.sessions[combat_id]
+                del self._finished_at[combat_id]
+
+    async def expire_stored(self) -> int:
+        """Timeout для активных в БД боёв, которых нет в памяти (остались от прошлого процесса)."""
+        try:
+            n = await self.store.expire_idle(self.idle_timeout, list(self.sessions))
+        except Exception as e:
+            logger.warning("combat expire_idle failed: %s", e)
+            return 0
+        if n:
+            self.stats["expired_stored"] += n
+            logger.info("combat: %d брошенных боёв завершены по timeout", n)
+        return n
+
+    # ——— Запись ———
+
+    async def flush(self) -> int:
+        """Записать новые действия и контрольные точки одной транзакцией. Возвращает число действий."""
+        dirty = [s for s in self.sessions.values() if s.dirty]
+        if not dirty:
+            return 0
+        batch = []
+        for s in dirty:
+            new = s.log[-(s.seq - s.flushed_seq):] if s.seq > s.flushed_seq else []
+            actions = [(s.id, a.seq, a.actor_id, a.skill_id, a.delta, a.attacker_hp, a.defender_hp, a.ts) for a in new]
+            row = (s.id, s.attacker_hp, s.defender_hp, s.seq, s.status, s.winner_id, s.ended_at)
+            batch.append((s, s.seq, s.status, actions, row))
+            s.dirty = False
+        try:
+            await self.store.write([a for b in batch for a in b[3]], [b[4] for b in batch])
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning("combat flush failed (%d sessions): %s", len(batch), e)
+            if not is_permanent_error(e):
+                # Вернуть пометки — следующий flush повторит пачку (вставка журнала идемпотентна)
+                for s, _, _, _, _ in batch:
+                    s.dirty = True
+                return 0
+            # Ошибка данных в одном из боёв: пишем по одному, чтобы он не держал остальные
+            return await self._flush_each(batch)
+        self._mark_flushed(batch)
+        return sum(len(b[3]) for b in batch)
+
+    async def _flush_each(self, batch: list) -> int:
+        written = []
+        for item in batch:
+            s = item[0]
+            try:
+                await self.store.write(item[3], [item[4]])
+            except Exception as e:
+                if is_permanent_error(e):
+                    # Повтор не поможет — отбрасываем запись этого боя (состояние в памяти остаётся)
+                    self.stats["dropped"] += 1
+                    logger.error("combat %s: запись отброшена (%d действий): %s", s.id, len(item[3]), e)
+                    s.flushed_seq = max(s.flushed_seq, item[1])
+                    if not s.dirty:
+                        s.final_pending = False
+                else:
+                    s.dirty = True
+                    logger.warning("combat %s flush failed: %s", s.id, e)
+                continue
+            written.append(item)
+        self._mark_flushed(written)
+        return sum(len(b[3]) for b in written)
+
+    def _mark_flushed(self, batch: list) -> None:
+        for s, seq, status, _, _ in batch:
+            s.flushed_seq = max(s.flushed_seq, seq)
+            if status != "active" and not s.dirty:
+                s.final_pending = False
+        self.stats["flushes"] += 1
+        self.stats["flushed_actions"] += sum(len(b[3]) for b in batch)
+
+    def metrics(self) -> Dict[str, Any]:
+        active = sum(1 for s in self.sessions.values() if s.status == "active")
+        return {"active": active, "in_memory": len(self.sessions), **self.stats}
@@ -0,0 +1,129 @@
+"""
+Нагрузочная симуляция боевого движка: тысячи одновременных дуэлей в одном процессе.
+
+Каждая дуэль — два бойца, которые шлют действия параллельно (конкурируют за один бой),
+пока кто-то не упадёт. Печатает пропускную способность (действий/с), число пачек записи
+и проверяет инварианты: HP в [0, 100], журнал без пропусков seq, итог записан один раз.
+
+Запуск без БД (хранилище в памяти):  python combat_sim.py --duels 5000
+С Postgres (DATABASE_URL, миграции применены):  python combat_sim.py --duels 1000 --pg
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_root = Path(__file__).resolve().parents[1]
+_backend = Path(__file__).resolve().parent
+for _p in (_root, _backend):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from combat_engine import ActionRow, CombatEngine, CombatError, PgCombatStore, SessionRow  # noqa: E402
+
+
+class MemoryCombatStore:
+    """Хранилище симуляции: те же вызовы, что у PgCombatStore, плюс счётчики записей."""
+
+    def __init__(self, write_latency: float = 0.0):
+        self.write_latency = write_latency
+        self.next_id = 0
+        self.sessions: Dict[int, Dict[str, Any]] = {}
+        self.actions: Dict[int, List[ActionRow]] = {}
+        self.final_writes: Dict[int, int] = {}
+        self.writes = 0
+
+    async def create(self, attacker_id: int, defender_id: int, location_id: Optional[str]) -> int:
+        self.next_id += 1
+        self.sessions[self.next_id] = {"status": "active"}
+        self.actions[self.next_id] = []
+        return self.next_id
+
+    async def load(self, combat_id: int) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        return None
+
+    async def expire_idle(self, idle_timeout: float, skip_ids: List[int]) -> int:
+        return 0
+
+    async def write(self, actions: List[ActionRow], sessions: List[SessionRow]) -> None:
+        if self.write_latency:
+            await asyncio.sleep(self.write_latency)
+        self.writes += 1
+        for row in actions:
+            self.actions[row[0]].append(row)
+        for combat_id, _, _, _, status, _, _ in sessions:
+            if self.sessions[combat_id]["status"] != "active":
+                continue
+            self.sessions[combat_id]["status"] = status
+            if status != "active":
+                self.final_writes[combat_id] = self.final_writes.get(combat_id, 0) + 1
+
+
+async def _fighter(engine: CombatEngine, combat_id: int, user_id: int, rng: random.Random) -> int:
+    done = 0
+    while True:
+        skill = rng.choices(("attack", "dash", "heal"), weights=(6, 3, 1))[0]
+        try:
+            await engine.act(combat_id, user_id, skill)
+        except CombatError as e:
+            if e.status == 400:
+                return done
+            raise
+        done += 1
+        await asyncio.sleep(0)
+
+
+async def _duel(engine: CombatEngine, n: int, rng: random.Random) -> int:
+    attacker, defender = 2 * n + 1, 2 * n + 2
+    state = await engine.start_combat(attacker, defender)
+    counts = await asyncio.gather(
+        _fighter(engine, state.id, attacker, rng),
+        _fighter(engine, state.id, defender, rng),
+    )
+    return sum(counts)
+
+
+async def run(duels: int, flush_interval: float, write_latency: float, pg: bool, seed: int) -> None:
+    store = PgCombatStore() if pg else MemoryCombatStore(write_latency)
+    engine = CombatEngine(store, flush_interval=flush_interval, rng=random.Random(seed))
+    rng = random.Random(seed)
+    await engine.start()
+    t0 = time.perf_counter()
+    totals = await asyncio.gather(*(_duel(engine, i, rng) for i in range(duels)))
+    elapsed = time.perf_counter() - t0
+    await engine.stop()
+
+    actions = sum(totals)
+    print(f"дуэлей: {duels}, действий: {actions}, время: {elapsed:.2f} с, "
+          f"{actions / elapsed:,.0f} действий/с")
+    print(f"пачек записи: {engine.stats['flushes']}, записано действий: {engine.stats['flushed_actions']}, "
+          f"ошибок: {engine.stats['errors']}")
+
+    for state in engine.sessions.values():
+        assert state.status != "active", f"бой {state.id} не завершён"
+        assert 0 <= state.attacker_hp <= 100 and 0 <= state.defender_hp <= 100
+        assert [a.seq for a in state.log] == list(range(1, state.seq + 1)), f"бой {state.id}: дыры в seq"
+    if isinstance(store, MemoryCombatStore):
+        assert all(len(store.actions[cid]) == s.seq for cid, s in engine.sessions.items()), "журнал записан не полностью"
+        assert all(v == 1 for v in store.final_writes.values()) and len(store.final_writes) == duels, \
+            "итог боя записан не ровно один раз"
+    print("инварианты: ok")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duels", type=int, default=2000)
+    parser.add_argument("--flush-interval", type=float, default=0.2)
+    parser.add_argument("--write-latency", type=float, default=0.005,
+                        help="искусственная задержка записи пачки в хранилище в памяти, с")
+    parser.add_argument("--pg", action="store_true", help="писать в Postgres по DATABASE_URL")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.duels, args.flush_interval, args.write_latency, args.pg, args.seed))
+
+
+if __name__ == "__main__":
+    main()
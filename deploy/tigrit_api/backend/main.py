@@ -1,8 +1,7 @@
 """
 Веб-API Тигрит: данные из PostgreSQL через tigrit_shared (village, users, events).
-Карта и ассеты — из JSON в backend/data/.
+Карта — чанковое хранилище backend/data/map/ (map_store.py), ассеты — из JSON в backend/data/.
 """
-import asyncio
 import json
 import logging
 import os
@@ -11,7 +10,7 @@ from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, field_validator
@@ -31,6 +30,7 @@ EDITOR_API_KEY = os.environ.get("EDITOR_API_KEY", "").strip()
 limiter = Limiter(key_func=get_remote_address)
 API_RATE_LIMIT = "120/minute"
 API_RATE_LIMIT_STRICT = "10/minute"  # для PUT /api/map
+API_RATE_LIMIT_EDIT = "60/minute"    # для PATCH /api/map
 
 # Импорт tigrit_shared и backend-модулей: добавляем оба пути в sys.path
 _root    = Path(__file__).resolve().parents[1]   # /app
@@ -49,7 +49,14 @@ from tigrit_shared.read import (
 from admin_routes import router as admin_router
 from survival_routes import router as survival_router
 from survival_routes import admin_router as survival_admin_router
-from survival_cron import run_periodic_jobs
+from survival_routes import combat_engine, travel_scheduler
+from maintenance_cron import register_jobs as register_maintenance_jobs
+from survival_cron import register_jobs
+from tigrit_shared.http_client import close_http, start_http
+from tigrit_shared.scheduler import Scheduler
+from tigrit_shared.presence import get_zone_presence, touch_zone_member
+from static_assets import StaticAssets, asset_response
+from map_store import CHUNK_SIZE, MAX_MAP_SIDE, MapConflict, MapStore
 
 DATA_DIR = Path(__file__).resolve().parent / "data"
 
@@ -63,34 +70,57 @@ class MapTilePayload(BaseModel):
 
 
 class MapPayload(BaseModel):
-    width: int = Field(..., ge=1, le=128)
-    height: int = Field(..., ge=1, le=128)
-    tiles: list[MapTilePayload] = Field(..., max_length=2000)
+    width: int = Field(..., ge=1, le=MAX_MAP_SIDE)
+    height: int = Field(..., ge=1, le=MAX_MAP_SIDE)
+    tiles: list[MapTilePayload] = Field(..., max_length=200_000)
 
 
-def _load_json(name: str, default: dict):
-    """Читает JSON из data/ по фиксированному имени. Не подставлять пользовательский ввод в name; при чтении по query — whitelist имён."""
-    p = DATA_DIR / name
-    if p.exists():
-        with open(p, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return default
+class MapCell(BaseModel):
+    x: int = Field(..., ge=0)
+    y: int = Field(..., ge=0)
+
+
+class MapPatchPayload(BaseModel):
+    """Дельта карты: tiles — поставить/заменить, remove — очистить клетки.
+    base_version — версия, от которой считал редактор (иначе 409)."""
+    tiles: list[MapTilePayload] = Field(default_factory=list, max_length=5000)
+    remove: list[MapCell] = Field(default_factory=list, max_length=5000)
+    base_version: Optional[int] = None
+
+
+# Максимальная площадь одного запроса по viewport
+MAP_VIEWPORT_MAX_AREA = 256 * 256
+
+
+def _build_assets(tiles_data, buildings_data, chars_data) -> Dict[str, Any]:
+    tiles_data = tiles_data or {"tiles": []}
+    buildings_data = buildings_data or {"buildings": []}
+    chars_data = chars_data or {"characters": [], "races": [], "classes": []}
+    characters = chars_data.get("characters", [])
+    if not characters and (chars_data.get("races") or chars_data.get("classes")):
+        for r in chars_data.get("races", []):
+            characters.append({"id": r["id"], "name": r["name"], "color": r.get("base_color", "#888")})
+        for c in chars_data.get("classes", []):
+            characters.append({"id": c["id"], "name": c["name"], "color": c.get("color", "#888")})
+    return {
+        "tiles": tiles_data.get("tiles", []),
+        "buildings": buildings_data.get("buildings", []),
+        "characters": characters,
+    }
+
 
+# Статические JSON из data/ — снимки в памяти (фиксированные имена файлов, без пользовательского ввода)
+static_assets = StaticAssets(DATA_DIR)
+static_assets.register("items_catalog", ("items-catalog.json",),
+                       lambda c: (c or {}).get("items", []))
+static_assets.register("assets", ("tile_data.json", "building_data.json", "character_data.json"), _build_assets)
 
-def _save_json(name: str, data: dict) -> None:
-    """Атомарная запись JSON в data/. Только фиксированные имена (whitelist)."""
-    if name != "village_map.json":
-        raise ValueError("Разрешено только village_map.json")
-    path = DATA_DIR / name
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(".tmp")
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    tmp.replace(path)
+# Карта — чанки в data/map/ (импорт из village_map.json)
+map_store = MapStore(DATA_DIR)
 
 
 async def verify_editor_key(x_api_key: Optional[str] = Header(None, alias="X-API-Key")) -> None:
-    """Проверка ключа редактора для PUT /api/map."""
+    """Проверка ключа редактора для PUT/PATCH /api/map."""
     if not EDITOR_API_KEY:
         raise HTTPException(status_code=503, detail="Сохранение карты отключено (EDITOR_API_KEY не задан)")
     if not x_api_key or x_api_key.strip() != EDITOR_API_KEY:
@@ -136,11 +166,14 @@ class ChatMessagePayload(BaseModel):
         return v
 
 
+scheduler = Scheduler(shared_db.get_pool)
+register_jobs(scheduler)
+register_maintenance_jobs(scheduler)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Запускает миграции при старте, закрывает пул при остановке."""
-    stop_event = asyncio.Event()
-    bg_task: Optional[asyncio.Task] = None
+    """Запускает миграции, HTTP-клиент, планировщик, боевой движок и прибытия путешествий при старте, закрывает их и пул при остановке."""
     try:
         from run_migrations import run_migrations
         await run_migrations()
@@ -148,22 +181,24 @@ async def lifespan(app: FastAPI):
         logger.warning("run_migrations.py не найден — миграции пропущены")
     except Exception as e:
         logger.error("Ошибка миграций при старте: %s", e)
+    await start_http()
     try:
-        bg_task = asyncio.create_task(run_periodic_jobs(stop_event))
+        await scheduler.start()
     except Exception as e:
-        logger.warning("survival_cron не запущен: %s", e)
+        logger.warning("Планировщик не запущен: %s", e)
+    await combat_engine.start()
+    await travel_scheduler.start()
     yield
-    stop_event.set()
-    if bg_task:
-        try:
-            await asyncio.wait_for(bg_task, timeout=3)
-        except Exception:
-            pass
+    await travel_scheduler.stop()
+    await combat_engine.stop()
+    await scheduler.stop(timeout=3)
+    await close_http()
     await shared_db.close_pool()
 
 
 app = FastAPI(title="Tigrit Village API", lifespan=lifespan)
 app.state.limiter = limiter
+app.state.scheduler = scheduler
 from slowapi.errors import RateLimitExceeded
 app.add_exception_handler(RateLimitExceeded, lambda r, e: JSONResponse(status_code=429, content={"detail": "Слишком много запросов"}))
 
@@ -232,27 +267,88 @@ async def api_events_active(request: Request, limit: int = 20):
 
 @app.get("/api/map")
 @limiter.limit(API_RATE_LIMIT)
-async def api_map(request: Request):
-    """Карта деревни из village_map.json."""
-    data = _load_json("village_map.json", {"width": 32, "height": 32, "tiles": []})
-    return data
+async def api_map(
+    request: Request,
+    x0: Optional[int] = None,
+    y0: Optional[int] = None,
+    x1: Optional[int] = None,
+    y1: Optional[int] = None,
+):
+    """Карта деревни. Без параметров — вся карта {width, height, tiles} (ETag/304, gzip).
+    С x0, y0, x1, y1 — только тайлы прямоугольника (границы включительно) и версии его чанков."""
+    bbox = (x0, y0, x1, y1)
+    if all(v is None for v in bbox):
+        return asset_response(request, map_store.full_snapshot())
+    if any(v is None for v in bbox):
+        raise HTTPException(status_code=400, detail="Нужны все параметры x0, y0, x1, y1")
+    if x1 < x0 or y1 < y0:
+        raise HTTPException(status_code=400, detail="x1/y1 должны быть не меньше x0/y0")
+    if (x1 - x0 + 1) * (y1 - y0 + 1) > MAP_VIEWPORT_MAX_AREA:
+        raise HTTPException(status_code=400, detail=f"Слишком большая область (макс. {MAP_VIEWPORT_MAX_AREA} клеток)")
+    return map_store.viewport(x0, y0, x1, y1)
+
+
+@app.get("/api/map/meta")
+@limiter.limit(API_RATE_LIMIT)
+async def api_map_meta(request: Request):
+    """Размер, палитра типов, общая версия и версии чанков ("cx:cy" → version)."""
+    return map_store.meta()
+
+
+@app.get("/api/map/chunks/{cx}/{cy}")
+@limiter.limit(API_RATE_LIMIT)
+async def api_map_chunk(request: Request, cx: int, cy: int):
+    """Тайлы одного чанка CHUNK_SIZE×CHUNK_SIZE; ETag по версии чанка, If-None-Match → 304."""
+    map_store.ensure_loaded()
+    if cx < 0 or cy < 0 or cx * CHUNK_SIZE >= map_store.width or cy * CHUNK_SIZE >= map_store.height:
+        raise HTTPException(status_code=404, detail="Чанк вне карты")
+    doc, etag = map_store.chunk(cx, cy)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    inm = request.headers.get("if-none-match")
+    if inm and etag in [t.strip().removeprefix("W/") for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(doc, headers=headers)
 
 
 @app.put("/api/map")
 @limiter.limit(API_RATE_LIMIT_STRICT)
 async def api_map_put(
-    request,
+    request: Request,
     body: MapPayload,
     _: None = Depends(verify_editor_key),
 ):
-    """Сохранение карты редактором. Требуется заголовок X-API-Key = EDITOR_API_KEY."""
-    payload = body.model_dump(exclude_none=True)
+    """Полная замена карты редактором. Требуется заголовок X-API-Key = EDITOR_API_KEY."""
+    tiles = [t.model_dump(exclude_none=True) for t in body.tiles]
+    try:
+        version = map_store.replace(body.width, body.height, tiles)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.exception("Ошибка записи карты: %s", e)
+        raise HTTPException(status_code=500, detail="Ошибка записи карты")
+    return {"ok": True, "version": version, "etag": map_store.full_snapshot().etag}
+
+
+@app.patch("/api/map")
+@limiter.limit(API_RATE_LIMIT_EDIT)
+async def api_map_patch(
+    request: Request,
+    body: MapPatchPayload,
+    _: None = Depends(verify_editor_key),
+):
+    """Правка отдельных тайлов: переписываются только затронутые чанки.
+    Ответ — новая версия карты и версии изменённых чанков."""
+    tiles = [t.model_dump(exclude_none=True) for t in body.tiles]
     try:
-        _save_json("village_map.json", payload)
+        chunks = map_store.patch(tiles, [(c.x, c.y) for c in body.remove], body.base_version)
+    except MapConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.exception("Ошибка записи карты: %s", e)
         raise HTTPException(status_code=500, detail="Ошибка записи карты")
-    return {"ok": True}
+    return {"ok": True, "version": map_store.version, "chunks": chunks}
 
 
 @app.get("/api/items-catalog")
@@ -260,34 +356,20 @@ async def api_map_put(
 async def api_items_catalog(request: Request):
     """Единый каталог предметов (реликвии, бафы, проклятия, артефакты, яйца).
     Используется Tigrit-web и Village Era. Каждый предмет содержит поле stat с числовыми значениями."""
-    data = _load_json("items-catalog.json", {"items": []})
-    return data.get("items", [])
+    return asset_response(request, static_assets.get("items_catalog"))
 
 
 @app.get("/api/assets")
 @limiter.limit(API_RATE_LIMIT)
 async def api_assets(request: Request):
     """Полные данные ассетов из tile_data, building_data, character_data."""
-    tiles_data = _load_json("tile_data.json", {"tiles": []})
-    buildings_data = _load_json("building_data.json", {"buildings": []})
-    chars_data = _load_json("character_data.json", {"characters": [], "races": [], "classes": []})
-    characters = chars_data.get("characters", [])
-    if not characters and (chars_data.get("races") or chars_data.get("classes")):
-        for r in chars_data.get("races", []):
-            characters.append({"id": r["id"], "name": r["name"], "color": r.get("base_color", "#888")})
-        for c in chars_data.get("classes", []):
-            characters.append({"id": c["id"], "name": c["name"], "color": c.get("color", "#888")})
-    return {
-        "tiles": tiles_data.get("tiles", []),
-        "buildings": buildings_data.get("buildings", []),
-        "characters": characters,
-    }
+    return asset_response(request, static_assets.get("assets"))
 
 
 @app.get("/api/zones")
 @limiter.limit(API_RATE_LIMIT)
 async def api_zones(request: Request):
-    """Список игровых зон. Источник — таблица zones, fallback к статике."""
+    """Список игровых зон. Источник — таблица zones, fallback к статике. Счётчики игроков — zone_presence/zone_members."""
     import copy
     zones = copy.deepcopy(STATIC_ZONES)
     try:
@@ -308,47 +390,11 @@ async def api_zones(request: Request):
                 z.setdefault("total_players", 0)
                 zones.append(z)
 
-            online_rows = await shared_db.query_all(
-                """
-                SELECT zone_id, COUNT(DISTINCT actor_id) AS online_cnt
-                FROM (
-                    SELECT actor_id,
-                           CASE
-                               WHEN payload ~ '^\s*\{' THEN (payload::jsonb->>'zone_id')
-                               ELSE NULL
-                           END AS zone_id
-                    FROM tigrit_interactions
-                    WHERE kind='msg'
-                      AND ts > NOW() - INTERVAL '15 minutes'
-                      AND payload IS NOT NULL
-                ) q
-                WHERE zone_id IS NOT NULL
-                GROUP BY zone_id
-                """
-            )
-            total_rows = await shared_db.query_all(
-                """
-                SELECT zone_id, COUNT(DISTINCT actor_id) AS total_cnt
-                FROM (
-                    SELECT actor_id,
-                           CASE
-                               WHEN payload ~ '^\s*\{' THEN (payload::jsonb->>'zone_id')
-                               ELSE NULL
-                           END AS zone_id
-                    FROM tigrit_interactions
-                    WHERE kind='msg'
-                      AND payload IS NOT NULL
-                ) q
-                WHERE zone_id IS NOT NULL
-                GROUP BY zone_id
-                """
-            )
-            online_map = {str(r["zone_id"]): int(r["online_cnt"] or 0) for r in online_rows}
-            total_map = {str(r["zone_id"]): int(r["total_cnt"] or 0) for r in total_rows}
+            presence = await get_zone_presence()
             for z in zones:
-                zid = str(z.get("id", ""))
-                z["players_online"] = online_map.get(zid, 0)
-                z["total_players"] = total_map.get(zid, 0)
+                counts = presence.get(str(z.get("id", "")), {})
+                z["players_online"] = counts.get("online", 0)
+                z["total_players"] = counts.get("total", 0)
     except Exception as e:
         logger.warning("api_zones: БД недоступна, возвращаем статику: %s", e)
     return zones
@@ -366,18 +412,25 @@ async def api_chat_message(request: Request, body: ChatMessagePayload):
     try:
         actor_id = int(body.user_id or 0)
         inserted_id = await shared_db.fetchval(
-            "INSERT INTO tigrit_interactions (ts, kind, actor_id, payload) "
-            "VALUES (now(), 'msg', $1, $2) RETURNING id",
+            "INSERT INTO tigrit_interactions (ts, kind, actor_id, payload, zone_id) "
+            "VALUES (now(), 'msg', $1, $2, $3) RETURNING id",
             actor_id,
             payload_json,
+            body.zone_id,
         )
+        if body.user_id and body.zone_id:
+            try:
+                await touch_zone_member(body.zone_id, actor_id)
+            except Exception as e:
+                logger.warning("zone presence update failed: %s", e)
         if body.user_id:
             try:
                 await shared_db.execute(
                     """
                     UPDATE tigrit_user_profile
                     SET home_zone_first_activity_at = COALESCE(home_zone_first_activity_at, NOW()),
-                        trust_score = GREATEST(-100, LEAST(100, COALESCE(trust_score, 50) + 2))
+                        trust_score = GREATEST(-100, LEAST(100, tigrit_effective_trust(trust_score, trust_updated_at) + 2)),
+                        trust_updated_at = tigrit_trust_anchor(trust_updated_at)
                     WHERE user_id = $1
                       AND home_zone_id = $2
                     """,
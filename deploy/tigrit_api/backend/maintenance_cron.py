@@ -0,0 +1,46 @@
+"""
+Обслуживание tigrit_interactions (партиции по месяцам, миграция 010):
+- создание партиций на месяцы вперёд
+- retention: партиции старше TIGRIT_INTERACTIONS_KEEP_MONTHS отрезаются
+  (TIGRIT_INTERACTIONS_ARCHIVE=1 — отсоединяются в tigrit_interactions_archive_YYYYmMM вместо удаления)
+"""
+from __future__ import annotations
+
+import logging
+import os
+
+from tigrit_shared import db
+from tigrit_shared.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+INTERACTIONS_MONTHS_AHEAD = 2
+INTERACTIONS_KEEP_MONTHS = int(os.environ.get("TIGRIT_INTERACTIONS_KEEP_MONTHS", "6"))
+INTERACTIONS_ARCHIVE = os.environ.get("TIGRIT_INTERACTIONS_ARCHIVE", "").strip().lower() in ("1", "true", "yes")
+
+
+async def maintain_interactions() -> int:
+    """Партиции вперёд + retention. Возвращает число отрезанных партиций."""
+    try:
+        removed = await db.fetchval(
+            "SELECT tigrit_interactions_maintain($1, $2, $3)",
+            INTERACTIONS_MONTHS_AHEAD,
+            INTERACTIONS_KEEP_MONTHS,
+            INTERACTIONS_ARCHIVE,
+        )
+        if removed:
+            logger.info(
+                "tigrit_interactions: %s партиции %s",
+                "архивированы" if INTERACTIONS_ARCHIVE else "удалены",
+                ", ".join(removed),
+            )
+        return len(removed or [])
+    except Exception as e:
+        logger.warning("maintain_interactions failed: %s", e)
+        return 0
+
+
+def register_jobs(scheduler: Scheduler) -> None:
+    """Обслуживание партиций — раз в сутки (00:15 UTC), один инстанс на кластер."""
+    scheduler.add_job("tigrit_interactions_maintenance", maintain_interactions,
+                      cron="15 0 * * *", jitter=60, timeout=10 * 60)
@@ -0,0 +1,435 @@
+"""
+Чанковое хранилище карты деревни.
+
+Карта режется на чанки CHUNK_SIZE×CHUNK_SIZE. В чанке — упакованный массив id типов тайлов
+(uint16, 0 — пусто, иначе индекс в палитре meta.palette + 1) и необязательные поля тайлов
+(name, owner_id). На диске: data/map/meta.json + по файлу на непустой чанк (c_{cx}_{cy}.json,
+типы — base64 от little-endian uint16). Правка тайлов переписывает только затронутые чанки.
+
+У каждого чанка своя версия (растёт при правке) — по ней ETag и дельта-обновления клиента.
+Если meta.json нет или data/village_map.json новее импортированного — карта импортируется
+из village_map.json (формат редактора и sync_from_cabzda.sh).
+"""
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from static_assets import AssetSnapshot
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16
+MAX_MAP_SIDE = 1024
+DEFAULT_MAP = {"width": 32, "height": 32, "tiles": []}
+# Дополнительные поля тайла, кроме x/y/type
+TILE_EXTRA_FIELDS = ("name", "owner_id")
+_CHECK_INTERVAL = 1.0
+
+
+class MapConflict(Exception):
+    """base_version правки не совпадает с текущей версией карты."""
+
+
+class MapChunk:
+    __slots__ = ("cx", "cy", "types", "extra", "version")
+
+    def __init__(self, cx: int, cy: int, version: int = 0):
+        self.cx = cx
+        self.cy = cy
+        self.types = array("H", bytes(2 * CHUNK_SIZE * CHUNK_SIZE))
+        self.extra: Dict[int, Dict[str, Any]] = {}
+        self.version = version
+
+    def is_empty(self) -> bool:
+        return not any(self.types)
+
+    def copy(self) -> "MapChunk":
+        chunk = MapChunk(self.cx, self.cy, self.version)
+        chunk.types = array("H", self.types)
+        chunk.extra = {i: dict(e) for i, e in self.extra.items()}
+        return chunk
+
+    def to_file(self) -> Dict[str, Any]:
+        packed = self.types if sys.byteorder == "little" else array("H", self.types)
+        if sys.byteorder != "little":
+            packed.byteswap()
+        return {
+            "cx": self.cx,
+            "cy": self.cy,
+            "version": self.version,
+            "types": base64.b64encode(packed.tobytes()).decode("ascii"),
+            "extra": {str(i): e for i, e in self.extra.items()},
+        }
+
+    @classmethod
+    def from_file(cls, doc: Dict[str, Any]) -> "MapChunk":
+        chunk = cls(int(doc["cx"]), int(doc["cy"]), int(doc.get("version", 0)))
+        types = array("H")
+        types.frombytes(base64.b64decode(doc["types"]))
+        if sys.byteorder != "little":
+            types.byteswap()
+        if len(types) != CHUNK_SIZE * CHUNK_SIZE:
+            raise ValueError(f"chunk {chunk.cx},{chunk.cy}: bad size {len(types)}")
+        chunk.types = types
+        chunk.extra = {int(i): e for i, e in (doc.get("extra") or {}).items()}
+        return chunk
+
+
+class MapStore:
+    def __init__(self, data_dir: Path):
+        self.data_dir = data_dir
+        self.store_dir = data_dir / "map"
+        self.legacy_file = data_dir / "village_map.json"
+        self.width = DEFAULT_MAP["width"]
+        self.height = DEFAULT_MAP["height"]
+        self.palette: List[str] = []
+        self._type_ids: Dict[str, int] = {}
+        self.chunks: Dict[Tuple[int, int], MapChunk] = {}
+        # Общая версия карты: растёт при любой правке; epoch меняется при полной замене
+        self.version = 0
+        self.epoch = 0
+        self._source_mtime_ns = 0
+        self._meta_mtime_ns = 0
+        self._checked_at = 0.0
+        self._full: Optional[AssetSnapshot] = None
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    # ——— Загрузка ———
+
+    def ensure_loaded(self) -> None:
+        """Ленивая загрузка и перечитывание, если meta.json или village_map.json сменились на диске."""
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < _CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            legacy_mtime = _mtime_ns(self.legacy_file)
+            meta_mtime = _mtime_ns(self.store_dir / "meta.json")
+            if not meta_mtime:
+                self._import_legacy(legacy_mtime)
+            elif legacy_mtime and legacy_mtime != self._read_source_mtime():
+                self._import_legacy(legacy_mtime)
+            elif not self._loaded or meta_mtime != self._meta_mtime_ns:
+                self._load_store()
+            self._loaded = True
+
+    def _read_source_mtime(self) -> int:
+        if self._loaded:
+            return self._source_mtime_ns
+        try:
+            with open(self.store_dir / "meta.json", "r", encoding="utf-8") as f:
+                return int(json.load(f).get("source_mtime_ns", 0))
+        except (OSError, ValueError):
+            return 0
+
+    def _import_legacy(self, legacy_mtime: int) -> None:
+        doc = DEFAULT_MAP
+        if legacy_mtime:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        self._replace(int(doc.get("width", 32)), int(doc.get("height", 32)), doc.get("tiles") or [])
+        self._source_mtime_ns = legacy_mtime
+        self._persist(self.chunks.values(), full=True)
+        logger.info("map_store: импортирована карта %sx%s из %s", self.width, self.height, self.legacy_file.name)
+
+    def _load_store(self) -> None:
+        with open(self.store_dir / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        chunks: Dict[Tuple[int, int], MapChunk] = {}
+        for p in self.store_dir.glob("c_*.json"):
+            with open(p, "r", encoding="utf-8") as f:
+                chunk = MapChunk.from_file(json.load(f))
+            chunks[(chunk.cx, chunk.cy)] = chunk
+        self.width = int(meta["width"])
+        self.height = int(meta["height"])
+        self.palette = list(meta.get("palette") or [])
+        self._type_ids = {t: i + 1 for i, t in enumerate(self.palette)}
+        self.version = int(meta.get("version", 0))
+        self.epoch = int(meta.get("epoch", 0))
+        self._source_mtime_ns = int(meta.get("source_mtime_ns", 0))
+        self.chunks = chunks
+        self._meta_mtime_ns = _mtime_ns(self.store_dir / "meta.json")
+        self._full = None
+
+    # ——— Запись ———
+
+    def _persist(self, touched: Iterable[MapChunk], full: bool = False) -> None:
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        if full:
+            for p in self.store_dir.glob("c_*.json"):
+                p.unlink()
+        for chunk in touched:
+            path = self.store_dir / f"c_{chunk.cx}_{chunk.cy}.json"
+            if chunk.is_empty():
+                if path.exists():
+                    path.unlink()
+                continue
+            _write_json(path, chunk.to_file())
+        _write_json(self.store_dir / "meta.json", {
+            "format": 1,
+            "width": self.width,
+            "height": self.height,
+            "chunk_size": CHUNK_SIZE,
+            "palette": self.palette,
+            "version": self.version,
+            "epoch": self.epoch,
+            "source_mtime_ns": self._source_mtime_ns,
+        })
+        self._meta_mtime_ns = _mtime_ns(self.store_dir / "meta.json")
+        self._full = None
+
+    def _type_id(self, type_: str) -> int:
+        tid = self._type_ids.get(type_)
+        if tid is None:
+            if len(self.palette) >= 0xFFFF:
+                raise ValueError("Слишком много типов тайлов")
+            self.palette.append(type_)
+            tid = self._type_ids[type_] = len(self.palette)
+        return tid
+
+    def _prepare(
+        self, tiles: List[Dict[str, Any]], width: int, height: int, palette: int, known: Dict[str, int],
+    ) -> List[Tuple[int, int, str, Dict[str, Any]]]:
+        """
+        Проверить все тайлы до любых изменений: координаты в пределах карты, тип задан,
+        палитра (palette уже занятых типов + новые) не переполнится. ValueError — правка отклоняется целиком.
+        """
+        out = []
+        new_types = set()
+        for t in tiles:
+            try:
+                x, y, type_ = int(t["x"]), int(t["y"]), str(t["type"])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"Некорректный тайл: {t!r}")
+            if not (0 <= x < width and 0 <= y < height):
+                raise ValueError(f"Тайл ({x}, {y}) вне карты {width}x{height}")
+            if type_ not in known:
+                new_types.add(type_)
+            out.append((x, y, type_, {k: t[k] for k in TILE_EXTRA_FIELDS if t.get(k) is not None}))
+        if palette + len(new_types) > 0xFFFF:
+            raise ValueError("Слишком много типов тайлов")
+        return out
+
+    def _chunk_for(self, x: int, y: int, create: bool) -> Optional[MapChunk]:
+        key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+        chunk = self.chunks.get(key)
+        if chunk is None and create:
+            chunk = self.chunks[key] = MapChunk(*key, version=self.version)
+        return chunk
+
+    def _set(self, x: int, y: int, type_: str, extra: Dict[str, Any]) -> MapChunk:
+        """Поставить проверенный (_prepare) тайл."""
+        chunk = self._chunk_for(x, y, create=True)
+        i = (y % CHUNK_SIZE) * CHUNK_SIZE + (x % CHUNK_SIZE)
+        chunk.types[i] = self._type_id(type_)
+        if extra:
+            chunk.extra[i] = extra
+        else:
+            chunk.extra.pop(i, None)
+        return chunk
+
+    def _clear(self, x: int, y: int) -> Optional[MapChunk]:
+        chunk = self._chunk_for(x, y, create=False)
+        if chunk is None:
+            return None
+        i = (y % CHUNK_SIZE) * CHUNK_SIZE + (x % CHUNK_SIZE)
+        if not chunk.types[i]:
+            return None
+        chunk.types[i] = 0
+        chunk.extra.pop(i, None)
+        return chunk
+
+    def _snapshot(self) -> tuple:
+        return (self.width, self.height, self.palette, self._type_ids, dict(self.chunks), self.version, self.epoch)
+
+    def _restore(self, snap: tuple) -> None:
+        self.width, self.height, self.palette, self._type_ids, self.chunks, self.version, self.epoch = snap
+        self._full = None
+
+    def _replace(self, width: int, height: int, tiles: List[Dict[str, Any]]) -> None:
+        """Собрать новую карту во временных структурах и подменить текущую только после проверки всех тайлов."""
+        if not (1 <= width <= MAX_MAP_SIDE and 1 <= height <= MAX_MAP_SIDE):
+            raise ValueError(f"Размер карты от 1 до {MAX_MAP_SIDE}")
+        prepared = self._prepare(tiles, width, height, 0, {})
+        self.width, self.height = width, height
+        self.palette, self._type_ids, self.chunks = [], {}, {}
+        self.version += 1
+        self.epoch = time.time_ns() // 1_000_000
+        for x, y, type_, extra in prepared:
+            self._set(x, y, type_, extra)
+
+    def replace(self, width: int, height: int, tiles: List[Dict[str, Any]]) -> int:
+        """Полная замена карты (PUT). Возвращает новую версию. При ошибке карта и версия не меняются."""
+        with self._lock:
+            self.ensure_loaded()
+            snap = self._snapshot()
+            try:
+                self._replace(width, height, tiles)
+                self._persist(self.chunks.values(), full=True)
+            except Exception:
+                self._restore(snap)
+                raise
+            return self.version
+
+    def patch(
+        self,
+        tiles: List[Dict[str, Any]],
+        remove: List[Tuple[int, int]],
+        base_version: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Правка тайлов: tiles — поставить/заменить, remove — очистить клетки.
+        Пишутся только затронутые чанки. Возвращает {"cx:cy": версия} изменённых чанков.
+        Все тайлы проверяются до изменений; затронутые чанки правятся в копиях — при ошибке
+        (в том числе записи на диск) карта и версия остаются прежними.
+        """
+        with self._lock:
+            self.ensure_loaded()
+            if base_version is not None and base_version != self.version:
+                raise MapConflict(f"Карта изменилась: версия {self.version}, ожидалась {base_version}")
+            prepared = self._prepare(tiles, self.width, self.height, len(self.palette), self._type_ids)
+            try:
+                cells = [(int(x), int(y)) for x, y in remove]
+            except (TypeError, ValueError):
+                raise ValueError("Некорректные координаты remove")
+            snap = self._snapshot()
+            self.palette, self._type_ids = list(self.palette), dict(self._type_ids)
+            for x, y in cells + [(x, y) for x, y, _, _ in prepared]:
+                key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+                if key in self.chunks and self.chunks[key] is snap[4].get(key):
+                    self.chunks[key] = self.chunks[key].copy()
+            try:
+                touched: Dict[Tuple[int, int], MapChunk] = {}
+                for x, y in cells:
+                    chunk = self._clear(x, y)
+                    if chunk is not None:
+                        touched[(chunk.cx, chunk.cy)] = chunk
+                for x, y, type_, extra in prepared:
+                    chunk = self._set(x, y, type_, extra)
+                    touched[(chunk.cx, chunk.cy)] = chunk
+                if not touched:
+                    self._restore(snap)
+                    return {}
+                self.version += 1
+                for chunk in touched.values():
+                    chunk.version = self.version
+                self._persist(touched.values())
+            except Exception:
+                self._restore(snap)
+                raise
+            for key, chunk in list(touched.items()):
+                if chunk.is_empty():
+                    del self.chunks[key]
+            return {f"{cx}:{cy}": self.version for cx, cy in touched}
+
+    # ——— Чтение ———
+
+    def _chunk_tiles(self, chunk: MapChunk, bbox: Optional[Tuple[int, int, int, int]] = None) -> List[Dict[str, Any]]:
+        out = []
+        ox, oy = chunk.cx * CHUNK_SIZE, chunk.cy * CHUNK_SIZE
+        palette = self.palette
+        for i, tid in enumerate(chunk.types):
+            if not tid:
+                continue
+            x, y = ox + i % CHUNK_SIZE, oy + i // CHUNK_SIZE
+            if bbox and not (bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]):
+                continue
+            tile = {"x": x, "y": y, "type": palette[tid - 1]}
+            extra = chunk.extra.get(i)
+            if extra:
+                tile.update(extra)
+            out.append(tile)
+        return out
+
+    def chunk_etag(self, chunk_version: int, cx: int, cy: int) -> str:
+        return f'"map-{self.epoch}-{cx}-{cy}-{chunk_version}"'
+
+    def meta(self) -> Dict[str, Any]:
+        """Размеры, палитра и версии непустых чанков — клиент перезапрашивает только изменившиеся."""
+        self.ensure_loaded()
+        return {
+            "width": self.width,
+            "height": self.height,
+            "chunk_size": CHUNK_SIZE,
+            "version": self.version,
+            "epoch": self.epoch,
+            "palette": list(self.palette),
+            "chunks": {f"{cx}:{cy}": c.version for (cx, cy), c in self.chunks.items()},
+        }
+
+    def chunk(self, cx: int, cy: int) -> Tuple[Dict[str, Any], str]:
+        self.ensure_loaded()
+        chunk = self.chunks.get((cx, cy))
+        version = chunk.version if chunk else 0
+        doc = {
+            "cx": cx,
+            "cy": cy,
+            "chunk_size": CHUNK_SIZE,
+            "version": version,
+            "tiles": self._chunk_tiles(chunk) if chunk else [],
+        }
+        return doc, self.chunk_etag(version, cx, cy)
+
+    def viewport(self, x0: int, y0: int, x1: int, y1: int) -> Dict[str, Any]:
+        """Тайлы в прямоугольнике [x0..x1]×[y0..y1] (включительно) + версии попавших чанков."""
+        self.ensure_loaded()
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        tiles: List[Dict[str, Any]] = []
+        versions: Dict[str, int] = {}
+        if x0 <= x1 and y0 <= y1:
+            for cy in range(y0 // CHUNK_SIZE, y1 // CHUNK_SIZE + 1):
+                for cx in range(x0 // CHUNK_SIZE, x1 // CHUNK_SIZE + 1):
+                    chunk = self.chunks.get((cx, cy))
+                    versions[f"{cx}:{cy}"] = chunk.version if chunk else 0
+                    if chunk:
+                        tiles.extend(self._chunk_tiles(chunk, (x0, y0, x1, y1)))
+        return {
+            "width": self.width,
+            "height": self.height,
+            "chunk_size": CHUNK_SIZE,
+            "version": self.version,
+            "bbox": [x0, y0, x1, y1],
+            "tiles": tiles,
+            "chunks": versions,
+        }
+
+    def full_snapshot(self) -> AssetSnapshot:
+        """Вся карта в прежнем формате {width, height, tiles} — снимок с телом/gzip/ETag до следующей правки."""
+        self.ensure_loaded()
+        snap = self._full
+        if snap is None:
+            with self._lock:
+                tiles: List[Dict[str, Any]] = []
+                for key in sorted(self.chunks, key=lambda k: (k[1], k[0])):
+                    tiles.extend(self._chunk_tiles(self.chunks[key]))
+                snap = self._full = AssetSnapshot(
+                    {"width": self.width, "height": self.height, "tiles": tiles},
+                    (self.epoch, self.version),
+                )
+        return snap
+
+
+def _mtime_ns(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _write_json(path: Path, data: Any) -> None:
+    """Атомарная запись: tmp + replace."""
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
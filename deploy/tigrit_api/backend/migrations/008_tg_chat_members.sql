@@ -0,0 +1,11 @@
+-- Кэш membership Telegram (chat_id, user_id): пишет бот из апдейтов chat_member
+-- и API после живого getChatMember. Свежесть определяется по updated_at.
+
+CREATE TABLE IF NOT EXISTS tg_chat_members (
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    status TEXT NOT NULL,
+    in_chat BOOLEAN NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (chat_id, user_id)
+);
@@ -0,0 +1,40 @@
+-- Присутствие в зонах: участники (last_seen) и свёртка итогов по зоне.
+-- /api/zones читает отсюда вместо COUNT(DISTINCT) по payload::jsonb всей истории tigrit_interactions.
+
+CREATE TABLE IF NOT EXISTS zone_members (
+    zone_id TEXT NOT NULL,
+    user_id BIGINT NOT NULL,
+    first_seen TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_seen TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (zone_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_zone_members_zone_last_seen ON zone_members(zone_id, last_seen DESC);
+
+CREATE TABLE IF NOT EXISTS zone_presence (
+    zone_id TEXT PRIMARY KEY,
+    total_members BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Однократное заполнение из истории (только пока zone_members пуста)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM zone_members) THEN
+        INSERT INTO zone_members (zone_id, user_id, first_seen, last_seen)
+        SELECT zone_id, actor_id, MIN(ts), MAX(ts)
+        FROM (
+            SELECT ts, actor_id,
+                   CASE WHEN payload ~ '^\s*\{' THEN (payload::jsonb->>'zone_id') END AS zone_id
+            FROM tigrit_interactions
+            WHERE kind = 'msg' AND payload IS NOT NULL AND actor_id IS NOT NULL AND actor_id <> 0
+        ) q
+        WHERE zone_id IS NOT NULL
+        GROUP BY zone_id, actor_id
+        ON CONFLICT DO NOTHING;
+
+        INSERT INTO zone_presence (zone_id, total_members, updated_at)
+        SELECT zone_id, COUNT(*), NOW() FROM zone_members GROUP BY zone_id
+        ON CONFLICT (zone_id) DO UPDATE SET total_members = EXCLUDED.total_members, updated_at = NOW();
+    END IF;
+END $$;
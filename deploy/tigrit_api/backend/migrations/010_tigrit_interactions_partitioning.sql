@@ -0,0 +1,159 @@
+-- tigrit_interactions: типизированная колонка zone_id (вместо payload::jsonb->>'zone_id')
+-- и помесячные range-партиции по ts. Старые месяцы отрезаются задачей tigrit_interactions_maintenance
+-- (см. maintenance_cron.py) — DROP/DETACH партиции вместо DELETE по всей таблице.
+-- Повторный запуск безопасен: конвертация выполняется, только пока таблица не партиционирована.
+
+ALTER TABLE tigrit_interactions ADD COLUMN IF NOT EXISTS zone_id TEXT;
+
+-- zone_id из JSON-payload; битый JSON → NULL (нужна для бэкфилла)
+CREATE OR REPLACE FUNCTION tigrit_payload_zone_id(p TEXT) RETURNS TEXT AS $$
+BEGIN
+    IF p IS NULL OR p !~ '^\s*\{' THEN
+        RETURN NULL;
+    END IF;
+    RETURN NULLIF(p::jsonb->>'zone_id', '');
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END $$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Партиция месяца month_start (UTC) для parent.
+-- Если строки этого месяца уже попали в DEFAULT, CREATE … PARTITION OF упал бы: DEFAULT отсоединяется,
+-- месяц создаётся, его строки переносятся из DEFAULT, и DEFAULT подключается обратно.
+CREATE OR REPLACE FUNCTION tigrit_interactions_create_partition(parent TEXT, month_start DATE) RETURNS VOID AS $$
+DECLARE
+    part TEXT := 'tigrit_interactions_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM');
+    lo TIMESTAMPTZ := month_start::timestamp AT TIME ZONE 'UTC';
+    hi TIMESTAMPTZ := (month_start + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+    def REGCLASS;
+    stray BOOLEAN := FALSE;
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    SELECT NULLIF(partdefid, 0)::regclass INTO def FROM pg_partitioned_table WHERE partrelid = parent::regclass;
+    IF def IS NOT NULL THEN
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %s WHERE ts >= %L AND ts < %L)', def, lo, hi) INTO stray;
+    END IF;
+    IF stray THEN
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %s', parent, def);
+    END IF;
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)', part, parent, lo, hi);
+    IF stray THEN
+        EXECUTE format('INSERT INTO %I SELECT * FROM %s WHERE ts >= %L AND ts < %L', part, def, lo, hi);
+        EXECUTE format('DELETE FROM %s WHERE ts >= %L AND ts < %L', def, lo, hi);
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %s DEFAULT', parent, def);
+    END IF;
+END $$ LANGUAGE plpgsql;
+
+-- Партиции на months_ahead месяцев вперёд; партиции старше keep_months месяцев
+-- отсоединяются и удаляются (archive = TRUE — остаются отдельными таблицами tigrit_interactions_archive_YYYYmMM).
+-- Ошибка на одной партиции пишется в WARNING и не останавливает остальные (и retention).
+-- Возвращает имена отрезанных партиций.
+CREATE OR REPLACE FUNCTION tigrit_interactions_maintain(months_ahead INT, keep_months INT, archive BOOLEAN DEFAULT FALSE)
+RETURNS TEXT[] AS $$
+DECLARE
+    cur_month DATE := date_trunc('month', NOW() AT TIME ZONE 'UTC')::date;
+    cutoff DATE;
+    part RECORD;
+    removed TEXT[] := '{}';
+BEGIN
+    FOR i IN 0..GREATEST(months_ahead, 0) LOOP
+        BEGIN
+            PERFORM tigrit_interactions_create_partition('tigrit_interactions', (cur_month + make_interval(months => i))::date);
+        EXCEPTION WHEN others THEN
+            RAISE WARNING 'tigrit_interactions: партиция +% мес. не создана: %', i, SQLERRM;
+        END;
+    END LOOP;
+    IF keep_months IS NULL OR keep_months <= 0 THEN
+        RETURN removed;
+    END IF;
+    cutoff := (cur_month - make_interval(months => keep_months))::date;
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'tigrit_interactions'::regclass
+          AND c.relname ~ '^tigrit_interactions_y[0-9]{4}m[0-9]{2}$'
+        ORDER BY c.relname
+    LOOP
+        IF to_date(right(part.relname, 7), 'YYYY"m"MM') < cutoff THEN
+            BEGIN
+                EXECUTE format('ALTER TABLE tigrit_interactions DETACH PARTITION %I', part.relname);
+                IF archive THEN
+                    EXECUTE format('ALTER TABLE %I RENAME TO %I', part.relname,
+                                   'tigrit_interactions_archive_' || right(part.relname, 7));
+                ELSE
+                    EXECUTE format('DROP TABLE %I', part.relname);
+                END IF;
+                removed := removed || part.relname;
+            EXCEPTION WHEN others THEN
+                RAISE WARNING 'tigrit_interactions: партиция % не отрезана: %', part.relname, SQLERRM;
+            END;
+        END IF;
+    END LOOP;
+    RETURN removed;
+END $$ LANGUAGE plpgsql;
+
+-- Однократная конвертация в партиционированную таблицу
+DO $$
+DECLARE
+    seq TEXT;
+    m DATE;
+    last_month DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'tigrit_interactions'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    LOCK TABLE tigrit_interactions IN EXCLUSIVE MODE;
+
+    seq := pg_get_serial_sequence('tigrit_interactions', 'id');
+    IF seq IS NULL THEN
+        CREATE SEQUENCE IF NOT EXISTS tigrit_interactions_id_seq;
+        PERFORM setval('tigrit_interactions_id_seq', COALESCE((SELECT MAX(id) FROM tigrit_interactions), 0) + 1, FALSE);
+        seq := 'tigrit_interactions_id_seq';
+    END IF;
+
+    EXECUTE format(
+        $f$CREATE TABLE tigrit_interactions_partitioned (
+            id        BIGINT       NOT NULL DEFAULT nextval(%L::regclass),
+            ts        TIMESTAMPTZ  NOT NULL DEFAULT now(),
+            kind      TEXT         NOT NULL,
+            actor_id  BIGINT       DEFAULT 0,
+            target_id BIGINT,
+            payload   TEXT,
+            zone_id   TEXT,
+            PRIMARY KEY (id, ts)
+        ) PARTITION BY RANGE (ts)$f$,
+        seq
+    );
+    -- Страховка: строки вне созданных месяцев не ломают вставку
+    CREATE TABLE tigrit_interactions_default PARTITION OF tigrit_interactions_partitioned DEFAULT;
+
+    m := COALESCE(date_trunc('month', (SELECT MIN(ts) FROM tigrit_interactions) AT TIME ZONE 'UTC')::date,
+                  date_trunc('month', NOW() AT TIME ZONE 'UTC')::date);
+    last_month := (date_trunc('month', NOW() AT TIME ZONE 'UTC') + INTERVAL '2 months')::date;
+    WHILE m <= last_month LOOP
+        PERFORM tigrit_interactions_create_partition('tigrit_interactions_partitioned', m);
+        m := (m + INTERVAL '1 month')::date;
+    END LOOP;
+
+    INSERT INTO tigrit_interactions_partitioned (id, ts, kind, actor_id, target_id, payload, zone_id)
+    SELECT id, ts, kind, actor_id, target_id, payload, COALESCE(zone_id, tigrit_payload_zone_id(payload))
+    FROM tigrit_interactions;
+
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY tigrit_interactions_partitioned.id', seq);
+    DROP TABLE tigrit_interactions;
+    ALTER TABLE tigrit_interactions_partitioned RENAME TO tigrit_interactions;
+END $$;
+
+-- Индексы на родителе (наследуются партициями):
+-- get_recent_events — ORDER BY ts DESC; выборки по типу — (kind, ts); активность зон — (zone_id, ts) по сообщениям
+CREATE INDEX IF NOT EXISTS tigrit_interactions_ts_idx ON tigrit_interactions (ts DESC);
+CREATE INDEX IF NOT EXISTS tigrit_interactions_kind_ts_idx ON tigrit_interactions (kind, ts DESC);
+CREATE INDEX IF NOT EXISTS tigrit_interactions_zone_ts_idx
+    ON tigrit_interactions (zone_id, ts DESC)
+    WHERE kind = 'msg' AND zone_id IS NOT NULL;
+
+-- Текущий и два следующих месяца всегда существуют
+SELECT tigrit_interactions_maintain(2, NULL);
@@ -0,0 +1,26 @@
+-- Бот держит zones (tg_chat_id → zone_id) и tigrit_settings в памяти (routing.py)
+-- и перечитывает их по NOTIFY tigrit_config. Служебные ключи, которые бот пишет сам
+-- часто (build_xp_accum, invite_link_*), уведомлений не шлют.
+
+CREATE OR REPLACE FUNCTION tigrit_config_notify() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('tigrit_config', TG_TABLE_NAME);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS zones_config_notify ON zones;
+CREATE TRIGGER zones_config_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON zones
+    FOR EACH STATEMENT EXECUTE FUNCTION tigrit_config_notify();
+
+DROP TRIGGER IF EXISTS tigrit_settings_config_notify ON tigrit_settings;
+CREATE TRIGGER tigrit_settings_config_notify
+    AFTER INSERT OR UPDATE ON tigrit_settings
+    FOR EACH ROW
+    WHEN (NEW.k <> 'build_xp_accum' AND NEW.k NOT LIKE 'invite\_link\_%')
+    EXECUTE FUNCTION tigrit_config_notify();
+
+DROP TRIGGER IF EXISTS tigrit_settings_config_notify_delete ON tigrit_settings;
+CREATE TRIGGER tigrit_settings_config_notify_delete
+    AFTER DELETE ON tigrit_settings
+    FOR EACH STATEMENT EXECUTE FUNCTION tigrit_config_notify();
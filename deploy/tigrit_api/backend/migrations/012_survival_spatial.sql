@@ -0,0 +1,28 @@
+-- Пространственный индекс survival без PostGIS: ячейки сетки GRID_CELL (5 единиц карты).
+-- cell_x/cell_y вычисляются из map_x/map_y; индекс (cell_x, cell_y) — запросы по bbox и ближайшим
+-- (см. survival_spatial.py). Размер ячейки совпадает с CELL_SIZE в survival_spatial.py.
+
+ALTER TABLE player_bases
+    ADD COLUMN IF NOT EXISTS cell_x INTEGER GENERATED ALWAYS AS (floor(map_x / 5)::int) STORED,
+    ADD COLUMN IF NOT EXISTS cell_y INTEGER GENERATED ALWAYS AS (floor(map_y / 5)::int) STORED,
+    ADD COLUMN IF NOT EXISTS slot INTEGER;
+
+ALTER TABLE locations
+    ADD COLUMN IF NOT EXISTS cell_x INTEGER GENERATED ALWAYS AS (floor(map_x / 5)::int) STORED,
+    ADD COLUMN IF NOT EXISTS cell_y INTEGER GENERATED ALWAYS AS (floor(map_y / 5)::int) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_player_bases_cell ON player_bases(cell_x, cell_y);
+CREATE INDEX IF NOT EXISTS idx_locations_cell ON locations(cell_x, cell_y) WHERE active = TRUE;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_player_bases_slot ON player_bases(slot) WHERE slot IS NOT NULL;
+
+-- Номер слота раскладки баз: nextval вместо COUNT(*) — параллельные привязки не получают одну позицию
+CREATE SEQUENCE IF NOT EXISTS player_bases_slot_seq;
+
+-- Однократно: продолжить нумерацию после уже выданных баз (раньше слот = COUNT(*) + 1)
+DO $$
+BEGIN
+    IF NOT (SELECT is_called FROM player_bases_slot_seq) THEN
+        PERFORM setval('player_bases_slot_seq', GREATEST((SELECT COUNT(*) FROM player_bases), 1),
+                       (SELECT COUNT(*) FROM player_bases) > 0);
+    END IF;
+END $$;
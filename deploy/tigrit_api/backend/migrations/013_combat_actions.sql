@@ -0,0 +1,22 @@
+-- Боевые сессии: журнал действий и контрольная точка для боёв, которые ведёт combat_engine.py в памяти.
+-- Журнал пишется пачками; итог боя (status, winner_id, ended_at) — один раз.
+
+ALTER TABLE combat_sessions
+    ADD COLUMN IF NOT EXISTS winner_id BIGINT,
+    ADD COLUMN IF NOT EXISTS last_seq INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS last_action_at TIMESTAMPTZ;
+
+CREATE TABLE IF NOT EXISTS combat_actions (
+    combat_id BIGINT NOT NULL REFERENCES combat_sessions(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    actor_id BIGINT NOT NULL,
+    skill_id TEXT NOT NULL,
+    delta INTEGER NOT NULL,
+    attacker_hp SMALLINT NOT NULL,
+    defender_hp SMALLINT NOT NULL,
+    ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (combat_id, seq)
+);
+
+-- Выборка активных боёв без полного скана истории
+CREATE INDEX IF NOT EXISTS idx_combat_sessions_active ON combat_sessions(id) WHERE status = 'active';
@@ -0,0 +1,16 @@
+-- Путешествия: прибытие завершает сервер (travel_scheduler.py) пачкой по arrive_ts.
+
+ALTER TABLE travels ADD COLUMN IF NOT EXISTS arrived_at TIMESTAMPTZ;
+
+-- Не больше одного активного путешествия на игрока: лишние старые (гонка двойного старта) закрываем
+UPDATE travels t
+SET status = 'cancelled'
+WHERE t.status = 'in_progress'
+  AND EXISTS (
+      SELECT 1 FROM travels n
+      WHERE n.user_id = t.user_id AND n.status = 'in_progress' AND n.id > t.id
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_travels_user_in_progress ON travels(user_id) WHERE status = 'in_progress';
+-- Выборка наступивших прибытий без скана завершённой истории
+CREATE INDEX IF NOT EXISTS idx_travels_due ON travels(arrive_ts) WHERE status = 'in_progress';
@@ -0,0 +1,29 @@
+-- Survival cron без полных сканов tigrit_user_profile:
+-- частичный индекс кандидатов на смерть от скуки и ленивое выравнивание trust.
+
+-- Только живые с привязанной зоной и без активности в ней — размер не растёт с числом игроков
+CREATE INDEX IF NOT EXISTS idx_tigrit_user_profile_boredom
+    ON tigrit_user_profile(home_zone_bound_at)
+    WHERE character_state = 'alive' AND home_zone_id IS NOT NULL AND home_zone_first_activity_at IS NULL;
+
+-- trust_score хранится на момент trust_updated_at; выравнивание к 50 (±1 в сутки) считается при чтении
+ALTER TABLE tigrit_user_profile ADD COLUMN IF NOT EXISTS trust_updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+-- Целых суток с trust_updated_at
+CREATE OR REPLACE FUNCTION tigrit_trust_decay_days(updated TIMESTAMPTZ) RETURNS INTEGER AS $$
+    SELECT GREATEST(0, floor(extract(epoch FROM NOW() - COALESCE(updated, NOW())) / 86400))::int
+$$ LANGUAGE sql STABLE;
+
+-- Текущий trust: хранимое значение, сдвинутое к 50 на число прошедших суток
+CREATE OR REPLACE FUNCTION tigrit_effective_trust(score INTEGER, updated TIMESTAMPTZ) RETURNS INTEGER AS $$
+    SELECT CASE
+        WHEN COALESCE(score, 50) > 50 THEN GREATEST(50, score - tigrit_trust_decay_days(updated))
+        WHEN COALESCE(score, 50) < 50 THEN LEAST(50, score + tigrit_trust_decay_days(updated))
+        ELSE 50
+    END
+$$ LANGUAGE sql STABLE;
+
+-- Новая отметка при записи trust: сдвиг на учтённые целые сутки (остаток суток не теряется)
+CREATE OR REPLACE FUNCTION tigrit_trust_anchor(updated TIMESTAMPTZ) RETURNS TIMESTAMPTZ AS $$
+    SELECT COALESCE(updated, NOW()) + make_interval(days => tigrit_trust_decay_days(updated))
+$$ LANGUAGE sql STABLE;
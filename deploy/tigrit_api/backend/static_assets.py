@@ -0,0 +1,120 @@
+"""
+Статические JSON из data/ (каталог предметов, ассеты) в памяти.
+
+Каждое представление (view) собирается из одного или нескольких файлов один раз и хранится
+неизменяемым снимком: готовое тело ответа, его gzip и ETag. Пересборка — при смене mtime
+любого исходного файла (проверка не чаще CHECK_INTERVAL) или после invalidate().
+Отдача — копия байтов из памяти, If-None-Match → 304.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 1.0
+# Меньше — gzip не окупается
+_GZIP_MIN_BYTES = 512
+
+
+class AssetSnapshot:
+    """Неизменяемый снимок представления: данные, сериализованное тело, gzip и ETag."""
+
+    __slots__ = ("data", "body", "gzip_body", "etag", "mtimes")
+
+    def __init__(self, data: Any, mtimes: Tuple[int, ...]):
+        self.data = data
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, compresslevel=6) if len(self.body) >= _GZIP_MIN_BYTES else None
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+        self.mtimes = mtimes
+
+
+class StaticAssets:
+    def __init__(self, data_dir: Path, check_interval: float = CHECK_INTERVAL):
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self._views: Dict[str, Tuple[Tuple[str, ...], Callable[..., Any]]] = {}
+        self._snapshots: Dict[str, AssetSnapshot] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def register(self, view: str, files: Tuple[str, ...], build: Callable[..., Any]) -> None:
+        """build получает разобранные файлы (или None, если файла нет) в порядке files."""
+        self._views[view] = (files, build)
+
+    def _mtimes(self, files: Tuple[str, ...]) -> Tuple[int, ...]:
+        out = []
+        for name in files:
+            try:
+                out.append((self.data_dir / name).stat().st_mtime_ns)
+            except FileNotFoundError:
+                out.append(0)
+        return tuple(out)
+
+    def _build(self, view: str) -> AssetSnapshot:
+        files, build = self._views[view]
+        # mtime до чтения: если файл сменится во время чтения, следующая проверка пересоберёт снимок
+        mtimes = self._mtimes(files)
+        parsed = []
+        for name in files:
+            p = self.data_dir / name
+            if p.exists():
+                with open(p, "r", encoding="utf-8") as f:
+                    parsed.append(json.load(f))
+            else:
+                parsed.append(None)
+        return AssetSnapshot(build(*parsed), mtimes)
+
+    def get(self, view: str) -> AssetSnapshot:
+        snap = self._snapshots.get(view)
+        now = time.monotonic()
+        if snap is not None and now - self._checked_at.get(view, 0.0) < self.check_interval:
+            return snap
+        files, _ = self._views[view]
+        if snap is not None and self._mtimes(files) == snap.mtimes:
+            self._checked_at[view] = now
+            return snap
+        with self._lock:
+            snap = self._snapshots.get(view)
+            if snap is None or self._mtimes(files) != snap.mtimes:
+                try:
+                    snap = self._build(view)
+                except (OSError, ValueError) as e:
+                    if snap is None:
+                        raise
+                    # Битый файл посреди записи — отдаём прошлый снимок
+                    logger.warning("static asset %s reload failed: %s", view, e)
+                else:
+                    self._snapshots[view] = snap
+            self._checked_at[view] = now
+        return snap
+
+    def invalidate(self, file_name: Optional[str] = None) -> None:
+        """Сбросить снимки, зависящие от file_name (или все)."""
+        with self._lock:
+            for view, (files, _) in self._views.items():
+                if file_name is None or file_name in files:
+                    self._snapshots.pop(view, None)
+                    self._checked_at.pop(view, None)
+
+
+def asset_response(request: Request, snap: AssetSnapshot) -> Response:
+    """200 с готовым телом (gzip, если клиент принимает) или 304 по If-None-Match."""
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or snap.etag in [t.strip().removeprefix("W/") for t in inm.split(",")]):
+        return Response(status_code=304, headers=headers)
+    if snap.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snap.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
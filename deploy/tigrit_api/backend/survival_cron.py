@@ -1,107 +1,79 @@
 """
 Крон-задачи survival-слоя:
 - смерть от скуки (72 часа без появления в домашней зоне)
-- медленное выравнивание trust
+
+Выравнивание trust к 50 отдельной задачей больше не нужно: оно считается при чтении
+(tigrit_effective_trust, миграция 015) от отметки trust_updated_at.
 """
 from __future__ import annotations
 
-import asyncio
 import logging
-from datetime import datetime, timezone
 
 from tigrit_shared import db
+from tigrit_shared.scheduler import Scheduler
 
 logger = logging.getLogger(__name__)
 
+BOREDOM_BATCH = 5000
+
 
 async def check_boredom_deaths() -> int:
     """
     Если игрок привязан к home_zone, но 72ч не проявлялся в зоне,
     переводим в состояние dead_boredom.
+
+    Один оператор на пачку: UPDATE ... RETURNING в CTE и INSERT событий ровно для изменённых
+    строк. Кандидаты — по частичному индексу idx_tigrit_user_profile_boredom.
     """
     try:
         pool = await db.get_pool()
         if not pool:
             return 0
+        changed = 0
         async with pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                UPDATE tigrit_user_profile
-                SET character_state = 'dead_boredom'
-                WHERE character_state = 'alive'
-                  AND home_zone_id IS NOT NULL
-                  AND home_zone_bound_at IS NOT NULL
-                  AND home_zone_first_activity_at IS NULL
-                  AND home_zone_bound_at < NOW() - INTERVAL '72 hours'
-                RETURNING user_id
-                """
-            )
-            changed = len(rows)
-            if changed:
-                await conn.execute(
-                    """
-                    INSERT INTO game_events (user_id, event_type, reason_code, payload, created_at)
-                    SELECT user_id, 'survival_state', 'dead_boredom', '{}'::jsonb, NOW()
-                    FROM tigrit_user_profile
-                    WHERE character_state = 'dead_boredom'
-                      AND home_zone_bound_at < NOW() - INTERVAL '72 hours'
+            while True:
+                n = await conn.fetchval(
                     """
+                    WITH due AS (
+                        SELECT user_id
+                        FROM tigrit_user_profile
+                        WHERE character_state = 'alive'
+                          AND home_zone_id IS NOT NULL
+                          AND home_zone_first_activity_at IS NULL
+                          AND home_zone_bound_at < NOW() - INTERVAL '72 hours'
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                    ),
+                    changed AS (
+                        UPDATE tigrit_user_profile p
+                        SET character_state = 'dead_boredom'
+                        FROM due
+                        WHERE p.user_id = due.user_id
+                        RETURNING p.user_id, p.home_zone_id, p.home_zone_bound_at
+                    ),
+                    events AS (
+                        INSERT INTO game_events (user_id, event_type, reason_code, payload, created_at)
+                        SELECT user_id, 'survival_state', 'dead_boredom',
+                               jsonb_build_object('home_zone_id', home_zone_id, 'bound_at', home_zone_bound_at),
+                               NOW()
+                        FROM changed
+                    )
+                    SELECT COUNT(*) FROM changed
+                    """,
+                    BOREDOM_BATCH,
                 )
-            return changed
+                changed += int(n or 0)
+                if not n or n < BOREDOM_BATCH:
+                    return changed
     except Exception as e:
         logger.warning("check_boredom_deaths failed: %s", e)
         return 0
 
 
-async def trust_decay() -> int:
-    """
-    Медленно тянем trust к нейтральному значению 50:
-    - trust > 50 -> -1
-    - trust < 50 -> +1
+def register_jobs(scheduler: Scheduler) -> None:
     """
-    try:
-        pool = await db.get_pool()
-        if not pool:
-            return 0
-        async with pool.acquire() as conn:
-            rows_up = await conn.fetch(
-                """
-                UPDATE tigrit_user_profile
-                SET trust_score = trust_score + 1
-                WHERE trust_score < 50
-                RETURNING user_id
-                """
-            )
-            rows_down = await conn.fetch(
-                """
-                UPDATE tigrit_user_profile
-                SET trust_score = trust_score - 1
-                WHERE trust_score > 50
-                RETURNING user_id
-                """
-            )
-            return len(rows_up) + len(rows_down)
-    except Exception as e:
-        logger.warning("trust_decay failed: %s", e)
-        return 0
-
-
-async def run_periodic_jobs(stop_event: asyncio.Event) -> None:
-    """
-    Фоновый цикл survival-задач.
+    Регистрирует survival-задачи в планировщике (один инстанс на кластер).
     - boredom-check: каждые 6 часов
-    - trust-decay: 1 раз в сутки
     """
-    last_trust_day = None
-    while not stop_event.is_set():
-        await check_boredom_deaths()
-
-        now = datetime.now(timezone.utc).date()
-        if now != last_trust_day:
-            await trust_decay()
-            last_trust_day = now
-
-        try:
-            await asyncio.wait_for(stop_event.wait(), timeout=6 * 60 * 60)
-        except asyncio.TimeoutError:
-            continue
+    scheduler.add_job("survival_boredom_check", check_boredom_deaths,
+                      interval=6 * 60 * 60, jitter=60, timeout=10 * 60)
@@ -1,29 +1,36 @@
 """
 Survival MMO API:
 - зоны, привязка home_zone, trust
-- travel / arrivals
+- travel / arrivals (прибытие по таймеру — travel_scheduler, SSE-события)
 - лут локаций
-- базы и кланы
+- базы и кланы, поиск по карте (survival_spatial)
 - репорты и модерация
-- серверные боевые сессии
+- серверные боевые сессии (combat_engine)
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import math
 import os
-import random
+import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Optional
 
-import httpx
-from fastapi import APIRouter, Depends, Header, HTTPException, Query
+import asyncpg
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from tigrit_shared import db as shared_db
+from tigrit_shared.chat_members import get_chat_member, member_in_chat, member_ttl, upsert_chat_member
+from tigrit_shared.http_client import get_http
+from combat_engine import CombatEngine, CombatError
 from loot_tables import roll_loot
+from travel_scheduler import TravelScheduler
+from survival_spatial import bases_in_bbox, nearby_bases, nearest_locations, parse_bbox
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +38,13 @@ router = APIRouter(prefix="/api/survival", tags=["survival"])
 admin_router = APIRouter(prefix="/api/admin/survival", tags=["survival-admin"])
 
 ADMIN_KEY = os.environ.get("TIGRIT_ADMIN_API_KEY", "").strip()
+
+# Активные бои в памяти процесса; запускается/останавливается в lifespan main.py
+combat_engine = CombatEngine()
+# Прибытия путешествий по таймеру; запускается/останавливается в lifespan main.py
+travel_scheduler = TravelScheduler()
+# Пинг SSE-потока, чтобы прокси не закрывали простаивающее соединение
+SSE_PING_INTERVAL = 15.0
 BOT_TOKEN = (os.environ.get("TELEGRAM_BOT_TOKEN", "") or os.environ.get("BOT_TOKEN", "")).strip()
 
 
@@ -90,7 +104,8 @@ async def _adjust_trust(user_id: int, delta: int, reason: str) -> int:
     row = await shared_db.query_one(
         """
         UPDATE tigrit_user_profile
-        SET trust_score = GREATEST(-100, LEAST(100, COALESCE(trust_score, 50) + $2))
+        SET trust_score = GREATEST(-100, LEAST(100, tigrit_effective_trust(trust_score, trust_updated_at) + $2)),
+            trust_updated_at = tigrit_trust_anchor(trust_updated_at)
         WHERE user_id = $1
         RETURNING trust_score
         """,
@@ -132,30 +147,63 @@ async def _deduct_phoex(user_id: int, amount: int) -> None:
     await _write_ledger(user_id, "survival_spend", -amount, "PHOEX", {"reason": "survival_action"})
 
 
+# (chat_id, user_id) -> (ok, status, expires_at по monotonic)
+_member_cache: Dict[tuple[int, int], tuple[bool, str, float]] = {}
+_MEMBER_CACHE_MAX = 20_000
+
+
+def _remember_member(chat_id: int, user_id: int, ok: bool, status: str, ttl: float) -> None:
+    if len(_member_cache) >= _MEMBER_CACHE_MAX:
+        _member_cache.clear()
+    _member_cache[(chat_id, user_id)] = (ok, status, time.monotonic() + ttl)
+
+
 async def _check_user_in_chat(chat_id: int, user_id: int) -> tuple[bool, str]:
-    """Проверка membership через Telegram getChatMember."""
+    """
+    Проверка membership: кэш процесса → tg_chat_members (бот пишет из chat_member) → getChatMember.
+    TTL раздельные для «в чате» и «не в чате»; ошибки Telegram не кэшируются.
+    """
+    hit = _member_cache.get((chat_id, user_id))
+    if hit and hit[2] > time.monotonic():
+        return hit[0], hit[1]
+    try:
+        row = await get_chat_member(chat_id, user_id)
+    except Exception:
+        row = None
+    if row:
+        left = member_ttl(bool(row["in_chat"])) - float(row["age"])
+        if left > 0:
+            _remember_member(chat_id, user_id, bool(row["in_chat"]), row["status"], left)
+            return bool(row["in_chat"]), row["status"]
+
     if not BOT_TOKEN:
         return False, "BOT_TOKEN не задан"
     url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(url, params={"chat_id": chat_id, "user_id": user_id})
-            data = r.json()
+        r = await get_http().get(url, params={"chat_id": chat_id, "user_id": user_id}, timeout=10.0, upstream="telegram")
+        data = r.json()
         if not data.get("ok"):
             return False, data.get("description", "telegram api error")
-        status = (data.get("result") or {}).get("status", "")
-        return status in {"creator", "administrator", "member", "restricted"}, status
+        member = data.get("result") or {}
+        status = member.get("status", "")
+        ok = member_in_chat(status, member.get("is_member"))
     except Exception as e:
         return False, str(e)
+    _remember_member(chat_id, user_id, ok, status, member_ttl(ok))
+    try:
+        await upsert_chat_member(chat_id, user_id, status, ok)
+    except Exception as e:
+        logger.warning("tg_chat_members upsert failed: %s", e)
+    return ok, status
 
 
-def _allocate_base_position(players_count: int) -> tuple[float, float]:
+def _allocate_base_position(slot: int) -> tuple[float, float]:
     """
     Золотой угол + растущий радиус:
-    равномерная раскладка баз вокруг центра.
+    равномерная раскладка баз вокруг центра. slot — из player_bases_slot_seq.
     """
-    angle = players_count * 137.5
-    radius = 3 * math.sqrt(max(players_count, 1))
+    angle = slot * 137.5
+    radius = 3 * math.sqrt(max(slot, 1))
     x = 50 + radius * math.cos(math.radians(angle))
     y = 50 + radius * math.sin(math.radians(angle))
     return round(x, 2), round(y, 2)
@@ -312,14 +360,19 @@ async def survival_zone_bind(
     # Автовыделение базы при первой привязке
     existing_base = await shared_db.query_one("SELECT user_id FROM player_bases WHERE user_id = $1", user_id)
     if not existing_base:
-        cnt = await shared_db.fetchval("SELECT COUNT(*) FROM player_bases")
-        x, y = _allocate_base_position(int(cnt or 0) + 1)
+        # Слот из последовательности: параллельные привязки получают разные позиции
+        slot = int(await shared_db.fetchval("SELECT nextval('player_bases_slot_seq')"))
+        x, y = _allocate_base_position(slot)
         await shared_db.execute(
-            "INSERT INTO player_bases (user_id, zone_id, map_x, map_y) VALUES ($1, $2, $3, $4) ON CONFLICT (user_id) DO NOTHING",
+            """
+            INSERT INTO player_bases (user_id, zone_id, map_x, map_y, slot) VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (user_id) DO NOTHING
+            """,
             user_id,
             body.zone_id,
             x,
             y,
+            slot,
         )
 
     await _write_ledger(user_id, "zone_bind", 0, "PHOEX", {"zone_id": body.zone_id})
@@ -376,7 +429,7 @@ async def survival_player_status(
     row = await shared_db.query_one(
         """
         SELECT p.user_id, p.home_zone_id, p.home_zone_bound_at, p.home_zone_first_activity_at,
-               p.character_state, COALESCE(p.trust_score, 50) AS trust_score,
+               p.character_state, tigrit_effective_trust(p.trust_score, p.trust_updated_at) AS trust_score,
                p.clan_id, p.betrayal_flag, p.betrayal_expires_at,
                b.map_x AS base_x, b.map_y AS base_y, b.base_level, b.base_name
         FROM tigrit_user_profile p
@@ -420,13 +473,16 @@ async def survival_travel_start(
     user_id = _extract_user_id(x_user_id, body.user_id)
     await _ensure_profile_exists(user_id)
     active = await shared_db.query_one(
-        "SELECT id FROM travels WHERE user_id = $1 AND status = 'in_progress' ORDER BY id DESC LIMIT 1",
+        "SELECT id FROM travels WHERE user_id = $1 AND status = 'in_progress'",
         user_id,
     )
     if active:
         raise HTTPException(status_code=409, detail="У игрока уже есть активное путешествие")
 
-    profile = await shared_db.query_one("SELECT trust_score FROM tigrit_user_profile WHERE user_id=$1", user_id)
+    profile = await shared_db.query_one(
+        "SELECT tigrit_effective_trust(trust_score, trust_updated_at) AS trust_score FROM tigrit_user_profile WHERE user_id=$1",
+        user_id,
+    )
     trust_score = int((profile["trust_score"] if profile else 50) or 50)
 
     loc = await shared_db.query_one(
@@ -443,17 +499,22 @@ async def survival_travel_start(
         raise HTTPException(status_code=403, detail="Недостаточный trust для рейд-локации")
 
     arrive_ts = _now() + timedelta(seconds=int(loc["travel_seconds"]))
-    travel_id = await shared_db.fetchval(
-        """
-        INSERT INTO travels (user_id, from_id, to_id, start_ts, arrive_ts, status)
-        VALUES ($1, COALESCE((SELECT home_zone_id FROM tigrit_user_profile WHERE user_id = $1), 'zone_1'),
-                $2, NOW(), $3, 'in_progress')
-        RETURNING id
-        """,
-        user_id,
-        body.to_id,
-        arrive_ts,
-    )
+    try:
+        travel_id = await shared_db.fetchval(
+            """
+            INSERT INTO travels (user_id, from_id, to_id, start_ts, arrive_ts, status)
+            VALUES ($1, COALESCE((SELECT home_zone_id FROM tigrit_user_profile WHERE user_id = $1), 'zone_1'),
+                    $2, NOW(), $3, 'in_progress')
+            RETURNING id
+            """,
+            user_id,
+            body.to_id,
+            arrive_ts,
+        )
+    except asyncpg.UniqueViolationError:
+        # Параллельный старт: idx_travels_user_in_progress пропускает только одно активное путешествие
+        raise HTTPException(status_code=409, detail="У игрока уже есть активное путешествие")
+    travel_scheduler.schedule(travel_id, arrive_ts)
     await _write_ledger(user_id, "travel_start", 0, "PHOEX", {"to_id": body.to_id, "energy_cost": int(loc["energy_cost"])})
     return {"ok": True, "travel_id": travel_id, "arrive_ts": arrive_ts.isoformat()}
 
@@ -469,8 +530,6 @@ async def survival_travel_current(
         SELECT id, user_id, from_id, to_id, start_ts, arrive_ts, status
         FROM travels
         WHERE user_id = $1 AND status = 'in_progress'
-        ORDER BY id DESC
-        LIMIT 1
         """,
         uid,
     )
@@ -482,6 +541,7 @@ async def survival_travel_arrive(
     body: ArrivePayload,
     x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
 ):
+    """Подтверждение прибытия клиентом. Обычно путешествие уже завершил travel_scheduler — тогда ответ тот же."""
     user_id = _extract_user_id(x_user_id, body.user_id)
     row = await shared_db.query_one(
         "SELECT id, to_id, arrive_ts, status FROM travels WHERE id = $1 AND user_id = $2",
@@ -490,15 +550,67 @@ async def survival_travel_arrive(
     )
     if not row:
         raise HTTPException(status_code=404, detail="Путешествие не найдено")
+    if row["status"] == "arrived":
+        return {"ok": True, "location_id": row["to_id"], "loot_available": True}
     if row["status"] != "in_progress":
         raise HTTPException(status_code=400, detail="Путешествие уже завершено")
     if row["arrive_ts"] > _now():
         raise HTTPException(status_code=400, detail="Ещё не время прибытия")
 
-    await shared_db.execute("UPDATE travels SET status='arrived' WHERE id = $1", body.travel_id)
+    await shared_db.execute(
+        "UPDATE travels SET status='arrived', arrived_at = NOW() WHERE id = $1 AND status = 'in_progress'",
+        body.travel_id,
+    )
     return {"ok": True, "location_id": row["to_id"], "loot_available": True}
 
 
+@router.get("/travel/events")
+async def survival_travel_events(
+    request: Request,
+    user_id: Optional[int] = Query(None),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """
+    SSE-поток событий путешествий игрока (event: arrived). Первое событие — текущее путешествие
+    (event: current), дальше — прибытия от travel_scheduler и ping каждые SSE_PING_INTERVAL.
+    """
+    uid = _extract_user_id(x_user_id, user_id)
+    current = await shared_db.query_one(
+        """
+        SELECT id, to_id, arrive_ts FROM travels
+        WHERE user_id = $1 AND status = 'in_progress'
+        """,
+        uid,
+    )
+    queue = travel_scheduler.subscribe(uid)
+
+    def _sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def _stream():
+        try:
+            yield _sse("current", {
+                "travel_id": int(current["id"]),
+                "location_id": current["to_id"],
+                "arrive_ts": current["arrive_ts"].isoformat(),
+            } if current else {"travel_id": None})
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(event.get("type", "message"), event)
+        finally:
+            travel_scheduler.unsubscribe(uid, queue)
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/location/loot")
 async def survival_location_loot(
     body: LocationLootPayload,
@@ -563,7 +675,16 @@ async def survival_location_loot(
 
 
 @router.get("/bases")
-async def survival_bases():
+async def survival_bases(
+    bbox: Optional[str] = Query(None, max_length=128, description="x0,y0,x1,y1 — только базы в прямоугольнике"),
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+):
+    if bbox is not None:
+        try:
+            box = parse_bbox(bbox)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return await bases_in_bbox(box, limit or 1000)
     rows = await shared_db.query_all(
         """
         SELECT b.user_id, b.zone_id, b.map_x, b.map_y, b.base_level, b.base_name,
@@ -571,11 +692,45 @@ async def survival_bases():
         FROM player_bases b
         LEFT JOIN tigrit_user_profile p ON p.user_id = b.user_id
         ORDER BY b.user_id
-        """
+        LIMIT $1
+        """,
+        limit,
     )
     return [dict(r) for r in rows]
 
 
+@router.get("/bases/nearby")
+async def survival_bases_nearby(
+    x: Optional[float] = None,
+    y: Optional[float] = None,
+    radius: Optional[float] = Query(None, gt=0, le=1000),
+    limit: int = Query(10, ge=1, le=100),
+    user_id: Optional[int] = None,
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Ближайшие базы других игроков к точке (x, y) или к базе игрока (цели для боя)."""
+    exclude = None
+    if x is None or y is None:
+        uid = _extract_user_id(x_user_id, user_id)
+        base = await shared_db.query_one("SELECT map_x, map_y FROM player_bases WHERE user_id = $1", uid)
+        if not base:
+            raise HTTPException(status_code=404, detail="База не найдена")
+        x, y, exclude = float(base["map_x"]), float(base["map_y"]), uid
+    return await nearby_bases(x, y, limit, radius, exclude)
+
+
+@router.get("/locations/nearest")
+async def survival_locations_nearest(
+    x: float,
+    y: float,
+    type: Optional[str] = Query(None, max_length=32),
+    radius: Optional[float] = Query(None, gt=0, le=1000),
+    limit: int = Query(1, ge=1, le=50),
+):
+    """Ближайшие активные локации к точке (x, y), опционально только типа type."""
+    return await nearest_locations(x, y, limit, radius, type)
+
+
 @router.post("/clan/create")
 async def survival_clan_create(
     body: ClanCreatePayload,
@@ -614,7 +769,10 @@ async def survival_clan_join(
     tg_user_id = int(body.tg_user_id or user_id)
     await _ensure_profile_exists(user_id)
 
-    trust = await shared_db.fetchval("SELECT COALESCE(trust_score,50) FROM tigrit_user_profile WHERE user_id=$1", user_id)
+    trust = await shared_db.fetchval(
+        "SELECT tigrit_effective_trust(trust_score, trust_updated_at) FROM tigrit_user_profile WHERE user_id=$1",
+        user_id,
+    )
     if int(trust or 50) < 0:
         raise HTTPException(status_code=403, detail="С отрицательным trust вступление в клан запрещено")
 
@@ -683,7 +841,8 @@ async def survival_clan_info(clan_id: int):
         raise HTTPException(status_code=404, detail="Клан не найден")
     members = await shared_db.query_all(
         """
-        SELECT m.user_id, m.role, m.joined_at, p.username, COALESCE(p.trust_score,50) AS trust_score
+        SELECT m.user_id, m.role, m.joined_at, p.username,
+               tigrit_effective_trust(p.trust_score, p.trust_updated_at) AS trust_score
         FROM clan_members m
         LEFT JOIN tigrit_user_profile p ON p.user_id = m.user_id
         WHERE m.clan_id = $1
@@ -769,17 +928,8 @@ async def survival_combat_start(
     await _ensure_profile_exists(body.defender_id)
     if attacker_id == body.defender_id:
         raise HTTPException(status_code=400, detail="Нельзя атаковать себя")
-    combat_id = await shared_db.fetchval(
-        """
-        INSERT INTO combat_sessions (attacker_id, defender_id, location_id, attacker_hp, defender_hp, status, started_at)
-        VALUES ($1, $2, $3, 100, 100, 'active', NOW())
-        RETURNING id
-        """,
-        attacker_id,
-        body.defender_id,
-        body.location_id,
-    )
-    return {"ok": True, "combat_id": combat_id, "attacker_hp": 100, "defender_hp": 100}
+    state = await combat_engine.start_combat(attacker_id, body.defender_id, body.location_id)
+    return {"ok": True, "combat_id": state.id, "attacker_hp": state.attacker_hp, "defender_hp": state.defender_hp}
 
 
 @router.post("/combat/action")
@@ -788,69 +938,51 @@ async def survival_combat_action(
     x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
 ):
     user_id = _extract_user_id(x_user_id, body.user_id)
-    session = await shared_db.query_one(
-        """
-        SELECT id, attacker_id, defender_id, attacker_hp, defender_hp, status
-        FROM combat_sessions
-        WHERE id = $1
-        """,
-        body.combat_id,
-    )
-    if not session:
-        raise HTTPException(status_code=404, detail="Combat session not found")
-    if session["status"] != "active":
-        raise HTTPException(status_code=400, detail="Combat session already ended")
-    if user_id not in (session["attacker_id"], session["defender_id"]):
-        raise HTTPException(status_code=403, detail="Доступ к этой боевой сессии запрещён")
-
-    base_damage = {"attack": 14, "dash": 8, "heal": -12}.get(body.skill_id, 10)
-    roll = random.uniform(0.9, 1.1)
-    delta = int(round(base_damage * roll))
-
-    attacker_hp = int(session["attacker_hp"])
-    defender_hp = int(session["defender_hp"])
-    actor_is_attacker = user_id == session["attacker_id"]
-
-    if body.skill_id == "heal":
-        if actor_is_attacker:
-            attacker_hp = min(100, attacker_hp - delta)  # delta отрицательный
-        else:
-            defender_hp = min(100, defender_hp - delta)
-        log_entry = "Лечение"
-    else:
-        if actor_is_attacker:
-            defender_hp = max(0, defender_hp - max(delta, 1))
-        else:
-            attacker_hp = max(0, attacker_hp - max(delta, 1))
-        log_entry = f"Удар {body.skill_id}"
-
-    status = "active"
-    ended_at = None
-    if attacker_hp <= 0 or defender_hp <= 0:
-        status = "finished"
-        ended_at = _now()
-
-    await shared_db.execute(
-        """
-        UPDATE combat_sessions
-        SET attacker_hp=$2, defender_hp=$3, status=$4, ended_at=$5
-        WHERE id=$1
-        """,
-        body.combat_id,
-        attacker_hp,
-        defender_hp,
-        status,
-        ended_at,
-    )
+    try:
+        state, action, log_entry = await combat_engine.act(body.combat_id, user_id, body.skill_id)
+    except CombatError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
     return {
         "ok": True,
-        "attacker_hp": attacker_hp,
-        "defender_hp": defender_hp,
-        "status": status,
+        "attacker_hp": action.attacker_hp,
+        "defender_hp": action.defender_hp,
+        "status": state.status,
+        "winner_id": state.winner_id,
+        "seq": action.seq,
         "log_entry": log_entry,
     }
 
 
+@router.get("/combat/{combat_id}")
+async def survival_combat_state(
+    combat_id: int,
+    after_seq: int = Query(0, ge=0),
+    user_id: Optional[int] = None,
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Состояние боя и действия после after_seq — для переподключения клиента."""
+    uid = _extract_user_id(x_user_id, user_id)
+    try:
+        state = await combat_engine.get(combat_id)
+    except CombatError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
+    if uid not in (state.attacker_id, state.defender_id):
+        raise HTTPException(status_code=403, detail="Доступ к этой боевой сессии запрещён")
+    return state.view(after_seq)
+
+
+@admin_router.get("/combat/metrics", dependencies=[Depends(_require_admin)])
+async def survival_admin_combat_metrics():
+    """Счётчики боевого движка этого процесса: активные бои, действия, записи в БД."""
+    return combat_engine.metrics()
+
+
+@admin_router.get("/travel/metrics", dependencies=[Depends(_require_admin)])
+async def survival_admin_travel_metrics():
+    """Планировщик прибытий этого процесса: таймеры, пачки завершений, SSE-подписчики."""
+    return travel_scheduler.metrics()
+
+
 @router.get("/telegram/health")
 async def survival_telegram_health():
     """
@@ -877,9 +1009,10 @@ async def survival_telegram_health():
         try:
             url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
             bot_id = BOT_TOKEN.split(":")[0]
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                r = await client.get(url, params={"chat_id": int(z["tg_chat_id"]), "user_id": int(bot_id)})
-                data = r.json()
+            r = await get_http().get(
+                url, params={"chat_id": int(z["tg_chat_id"]), "user_id": int(bot_id)}, timeout=10.0, upstream="telegram"
+            )
+            data = r.json()
             if not data.get("ok"):
                 item["ok"] = False
                 item["reason"] = data.get("description", "telegram api error")
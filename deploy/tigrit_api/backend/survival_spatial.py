@@ -0,0 +1,134 @@
+"""
+Пространственные запросы survival по сетке ячеек (без PostGIS).
+
+player_bases и locations хранят cell_x/cell_y = floor(map / CELL_SIZE) с индексом (cell_x, cell_y)
+(миграция 012). Выборка по bbox — диапазон ячеек по индексу + точный фильтр координат.
+Ближайшие — квадрат ячеек вокруг точки с удвоением радиуса: O(log R) раундов по индексу,
+каждый раунд читает только ячейки квадрата.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from tigrit_shared import db as shared_db
+
+# Совпадает с делителем в generated-колонках миграции 012
+CELL_SIZE = 5.0
+# Дальше квадрат не растёт — запрос без ограничения по ячейкам
+_MAX_RING = 1 << 12
+
+_BASE_COLUMNS = """
+    b.user_id, b.zone_id, b.map_x, b.map_y, b.base_level, b.base_name, p.username
+"""
+_LOCATION_COLUMNS = """
+    location_id, zone_id, type, name, map_x AS "mapX", map_y AS "mapY",
+    energy_cost, travel_seconds, loot_table_key, active
+"""
+
+
+def cell_of(v: float) -> int:
+    return math.floor(v / CELL_SIZE)
+
+
+def cell_range(x0: float, y0: float, x1: float, y1: float) -> Tuple[int, int, int, int]:
+    return cell_of(min(x0, x1)), cell_of(min(y0, y1)), cell_of(max(x0, x1)), cell_of(max(y0, y1))
+
+
+def parse_bbox(raw: str) -> Tuple[float, float, float, float]:
+    """"x0,y0,x1,y1" → кортеж; ValueError при неверном формате."""
+    parts = [p.strip() for p in raw.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox: ожидается x0,y0,x1,y1")
+    x0, y0, x1, y1 = (float(p) for p in parts)
+    if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+        raise ValueError("bbox: координаты должны быть числами")
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+
+async def bases_in_bbox(bbox: Tuple[float, float, float, float], limit: int) -> List[Dict[str, Any]]:
+    x0, y0, x1, y1 = bbox
+    cx0, cy0, cx1, cy1 = cell_range(x0, y0, x1, y1)
+    rows = await shared_db.query_all(
+        f"""
+        SELECT {_BASE_COLUMNS}
+        FROM player_bases b
+        LEFT JOIN tigrit_user_profile p ON p.user_id = b.user_id
+        WHERE b.cell_x BETWEEN $1 AND $2 AND b.cell_y BETWEEN $3 AND $4
+          AND b.map_x BETWEEN $5 AND $6 AND b.map_y BETWEEN $7 AND $8
+        ORDER BY b.user_id
+        LIMIT $9
+        """,
+        cx0, cx1, cy0, cy1, x0, x1, y0, y1, limit,
+    )
+    return [dict(r) for r in rows]
+
+
+async def _nearest(
+    sql: str,
+    x: float,
+    y: float,
+    limit: int,
+    max_distance: Optional[float],
+    x_key: str,
+    y_key: str,
+    *params: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Ближайшие к (x, y) строки sql. sql получает $1..$4 — диапазон ячеек (cx0, cx1, cy0, cy1),
+    дальше — params. Квадрат радиуса ring ячеек гарантированно содержит все точки ближе
+    ring * CELL_SIZE, поэтому как только limit-я найденная точка не дальше этого — ответ готов.
+    """
+    cx, cy = cell_of(x), cell_of(y)
+    ring = 1
+    max_ring = _MAX_RING
+    if max_distance is not None:
+        max_ring = min(max_ring, math.ceil(max_distance / CELL_SIZE) + 1)
+    while True:
+        ring = min(ring, max_ring)
+        rows = await shared_db.query_all(sql, cx - ring, cx + ring, cy - ring, cy + ring, *params)
+        found = []
+        for r in rows:
+            d = dict(r)
+            d["distance"] = round(math.hypot(float(d[x_key]) - x, float(d[y_key]) - y), 2)
+            if max_distance is None or d["distance"] <= max_distance:
+                found.append(d)
+        found.sort(key=lambda d: d["distance"])
+        covered = ring * CELL_SIZE
+        if ring >= max_ring or (len(found) >= limit and found[limit - 1]["distance"] <= covered):
+            return found[:limit]
+        ring *= 2
+
+
+async def nearby_bases(
+    x: float,
+    y: float,
+    limit: int,
+    max_distance: Optional[float] = None,
+    exclude_user_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    sql = f"""
+        SELECT {_BASE_COLUMNS}
+        FROM player_bases b
+        LEFT JOIN tigrit_user_profile p ON p.user_id = b.user_id
+        WHERE b.cell_x BETWEEN $1 AND $2 AND b.cell_y BETWEEN $3 AND $4
+          AND ($5::bigint IS NULL OR b.user_id <> $5)
+    """
+    return await _nearest(sql, x, y, limit, max_distance, "map_x", "map_y", exclude_user_id)
+
+
+async def nearest_locations(
+    x: float,
+    y: float,
+    limit: int,
+    max_distance: Optional[float] = None,
+    location_type: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    sql = f"""
+        SELECT {_LOCATION_COLUMNS}
+        FROM locations
+        WHERE active = TRUE
+          AND cell_x BETWEEN $1 AND $2 AND cell_y BETWEEN $3 AND $4
+          AND ($5::text IS NULL OR type = $5)
+    """
+    return await _nearest(sql, x, y, limit, max_distance, "mapX", "mapY", location_type)
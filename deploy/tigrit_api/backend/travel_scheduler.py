@@ -0,0 +1,168 @@
+"""
+Планировщик прибытий survival-путешествий.
+
+Вместо опроса /travel/arrive каждым клиентом: куча (heapq) сроков прибытия в памяти будит цикл
+ровно к ближайшему arrive_ts, и все наступившие путешествия завершаются одним UPDATE
+(частичный индекс по arrive_ts WHERE status = 'in_progress', миграция 014). Раз в RESYNC_INTERVAL
+тот же UPDATE выполняется и без будильника — подхватывает путешествия, созданные другим
+процессом или до перезапуска.
+
+События прибытия рассылаются подписчикам процесса (SSE /api/survival/travel/events).
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from tigrit_shared import db as shared_db
+
+logger = logging.getLogger(__name__)
+
+RESYNC_INTERVAL = 30.0
+BATCH_SIZE = 1000
+# Очередь событий одного подписчика; медленный клиент теряет старые события, а не тормозит рассылку
+SUBSCRIBER_QUEUE = 100
+
+
+class TravelScheduler:
+    def __init__(self, resync_interval: float = RESYNC_INTERVAL, batch_size: int = BATCH_SIZE):
+        self.resync_interval = resync_interval
+        self.batch_size = batch_size
+        # (arrive_ts epoch, travel_id)
+        self._heap: List[Tuple[float, int]] = []
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self.stats = {"scheduled": 0, "batches": 0, "arrived": 0, "events": 0, "dropped_events": 0, "errors": 0}
+
+    # ——— Жизненный цикл ———
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            try:
+                await self._load_pending()
+            except Exception as e:
+                logger.warning("travel scheduler: pending load failed: %s", e)
+            self._task = asyncio.create_task(self._loop(), name="travel-scheduler")
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    async def _load_pending(self) -> None:
+        rows = await shared_db.query_all(
+            """
+            SELECT id, arrive_ts FROM travels
+            WHERE status = 'in_progress'
+            ORDER BY arrive_ts
+            LIMIT $1
+            """,
+            self.batch_size * 10,
+        )
+        for r in rows:
+            heapq.heappush(self._heap, (r["arrive_ts"].timestamp(), int(r["id"])))
+
+    def schedule(self, travel_id: int, arrive_ts: datetime) -> None:
+        """Добавить путешествие; если оно раньше ближайшего — разбудить цикл."""
+        due = arrive_ts.timestamp()
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (due, int(travel_id)))
+        self.stats["scheduled"] += 1
+        if earliest is None or due < earliest:
+            self._wake.set()
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            now = datetime.now(timezone.utc).timestamp()
+            timeout = self.resync_interval
+            if self._heap:
+                timeout = min(timeout, max(self._heap[0][0] - now, 0.0))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._stopping:
+                return
+            now = datetime.now(timezone.utc).timestamp()
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+            try:
+                # Пачками, пока в БД есть наступившие (больше batch_size за раз — следующая итерация)
+                while await self.complete_due() >= self.batch_size:
+                    pass
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning("travel scheduler: complete_due failed: %s", e)
+
+    # ——— Прибытие ———
+
+    async def complete_due(self) -> int:
+        """Завершить все наступившие путешествия одним UPDATE и разослать события."""
+        rows = await shared_db.query_all(
+            """
+            WITH due AS (
+                SELECT id FROM travels
+                WHERE status = 'in_progress' AND arrive_ts <= NOW()
+                ORDER BY arrive_ts
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE travels t
+            SET status = 'arrived', arrived_at = NOW()
+            FROM due
+            WHERE t.id = due.id
+            RETURNING t.id, t.user_id, t.to_id, t.arrive_ts
+            """,
+            self.batch_size,
+        )
+        if rows:
+            self.stats["batches"] += 1
+            self.stats["arrived"] += len(rows)
+            for r in rows:
+                self.publish(int(r["user_id"]), {
+                    "type": "arrived",
+                    "travel_id": int(r["id"]),
+                    "location_id": r["to_id"],
+                    "arrive_ts": r["arrive_ts"].isoformat(),
+                    "loot_available": True,
+                })
+        return len(rows)
+
+    # ——— Подписки ———
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self._subscribers.setdefault(user_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id: int, q: asyncio.Queue) -> None:
+        subs = self._subscribers.get(user_id)
+        if subs is not None:
+            subs.discard(q)
+            if not subs:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event: Dict[str, Any]) -> None:
+        for q in self._subscribers.get(user_id, ()):
+            if q.full():
+                q.get_nowait()
+                self.stats["dropped_events"] += 1
+            q.put_nowait(event)
+            self.stats["events"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pending_timers": len(self._heap),
+            "next_due": datetime.fromtimestamp(self._heap[0][0], timezone.utc).isoformat() if self._heap else None,
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            **self.stats,
+        }
@@ -0,0 +1,53 @@
+"""
+Membership в чатах Telegram (tg_chat_members, миграция 008): бот пишет из апдейтов chat_member,
+API читает при проверке подписки и дописывает результат getChatMember.
+Правило «в чате» и TTL сохранённого статуса задаются только здесь.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from . import db
+
+# Сколько доверять сохранённому статусу, секунды: «в чате» / «не в чате»
+MEMBER_TTL_POSITIVE = int(os.environ.get("TG_MEMBER_TTL_POSITIVE", "600"))
+MEMBER_TTL_NEGATIVE = int(os.environ.get("TG_MEMBER_TTL_NEGATIVE", "60"))
+
+IN_CHAT_STATUSES = ("creator", "administrator", "member")
+
+
+def member_in_chat(status: str, is_member: Optional[bool] = None) -> bool:
+    """restricted — в чате только с is_member=True (без флага — ограниченный, который уже вышел)."""
+    if status == "restricted":
+        return bool(is_member)
+    return status in IN_CHAT_STATUSES
+
+
+def member_ttl(in_chat: bool) -> int:
+    return MEMBER_TTL_POSITIVE if in_chat else MEMBER_TTL_NEGATIVE
+
+
+async def get_chat_member(chat_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """Сохранённый статус: {status, in_chat, age (секунды с обновления)} или None."""
+    return await db.query_one(
+        """
+        SELECT status, in_chat, EXTRACT(EPOCH FROM (NOW() - updated_at)) AS age
+        FROM tg_chat_members WHERE chat_id = $1 AND user_id = $2
+        """,
+        chat_id,
+        user_id,
+    )
+
+
+async def upsert_chat_member(chat_id: int, user_id: int, status: str, in_chat: bool) -> None:
+    await db.execute(
+        """
+        INSERT INTO tg_chat_members (chat_id, user_id, status, in_chat, updated_at)
+        VALUES ($1, $2, $3, $4, NOW())
+        ON CONFLICT (chat_id, user_id) DO UPDATE SET
+          status = EXCLUDED.status, in_chat = EXCLUDED.in_chat, updated_at = NOW()
+        """,
+        chat_id,
+        user_id,
+        status or "",
+        in_chat,
+    )
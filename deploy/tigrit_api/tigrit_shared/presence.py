@@ -0,0 +1,73 @@
+"""
+Присутствие игроков в зонах: zone_members (кто и когда последний раз писал в чате зоны)
+и свёртка zone_presence (всего участников по зоне). Пишет бот на каждое сообщение,
+читает /api/zones — без сканирования истории tigrit_interactions.
+"""
+from typing import Dict, Iterable, Tuple
+
+from . import db
+
+# Окно «онлайн» для players_online
+ONLINE_WINDOW_MINUTES = 15
+# last_seen не переписывается чаще — меньше UPDATE на активных игроках
+_TOUCH_GRANULARITY_SEC = 30
+
+
+async def touch_zone_members(pairs: Iterable[Tuple[str, int]]) -> int:
+    """
+    Отметить активность (zone_id, user_id) одним запросом. Новые участники
+    увеличивают zone_presence.total_members. Возвращает число новых участников.
+    """
+    uniq = {(str(z), int(u)) for z, u in pairs if z and u}
+    if not uniq:
+        return 0
+    zones = [z for z, _ in uniq]
+    users = [u for _, u in uniq]
+    new_members = await db.fetchval(
+        f"""
+        WITH m AS (
+            INSERT INTO zone_members (zone_id, user_id, first_seen, last_seen)
+            SELECT z, u, NOW(), NOW() FROM unnest($1::text[], $2::bigint[]) AS t(z, u)
+            ON CONFLICT (zone_id, user_id) DO UPDATE SET last_seen = EXCLUDED.last_seen
+            WHERE zone_members.last_seen < EXCLUDED.last_seen - INTERVAL '{_TOUCH_GRANULARITY_SEC} seconds'
+            RETURNING zone_id, (xmax = 0) AS inserted
+        ), n AS (
+            SELECT zone_id, COUNT(*) AS cnt FROM m WHERE inserted GROUP BY zone_id
+        ), p AS (
+            INSERT INTO zone_presence (zone_id, total_members, updated_at)
+            SELECT zone_id, cnt, NOW() FROM n
+            ON CONFLICT (zone_id) DO UPDATE
+            SET total_members = zone_presence.total_members + EXCLUDED.total_members,
+                updated_at = NOW()
+            RETURNING 1
+        )
+        SELECT COALESCE(SUM(cnt), 0) FROM n
+        """,
+        zones,
+        users,
+    )
+    return int(new_members or 0)
+
+
+async def touch_zone_member(zone_id: str, user_id: int) -> int:
+    return await touch_zone_members([(zone_id, user_id)])
+
+
+async def get_zone_presence() -> Dict[str, Dict[str, int]]:
+    """
+    {zone_id: {"online": N, "total": M}} для активных зон.
+    total — из свёртки, online — index range по (zone_id, last_seen) в окне ONLINE_WINDOW_MINUTES.
+    """
+    rows = await db.query_all(
+        f"""
+        SELECT z.zone_id,
+               COALESCE(p.total_members, 0) AS total,
+               (SELECT COUNT(*) FROM zone_members m
+                 WHERE m.zone_id = z.zone_id
+                   AND m.last_seen > NOW() - INTERVAL '{ONLINE_WINDOW_MINUTES} minutes') AS online
+        FROM zones z
+        LEFT JOIN zone_presence p ON p.zone_id = z.zone_id
+        WHERE z.active = TRUE
+        """
+    )
+    return {str(r["zone_id"]): {"online": int(r["online"] or 0), "total": int(r["total"] or 0)} for r in rows}
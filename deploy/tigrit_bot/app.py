@@ -10,9 +10,7 @@ from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from db_async import (
     ensure_tigrit_profile,
     get_profile,
-    gain_xp_and_level,
     get_persona_prompt,
-    get_setting,
     set_setting,
     upsert_chat,
     execute,
@@ -23,8 +21,13 @@ from db_async import (
     get_village_row,
     get_feathers_balance,
     get_user_id,
+    get_pool,
 )
+from ingest import IncomingMessage, MessageIngestor
+from routing import REFRESH_INTERVAL, BotConfig
 from llm import chat
+from tigrit_shared.chat_members import member_in_chat, upsert_chat_member
+from tigrit_shared.scheduler import Scheduler
 
 # Загружаем .env из корня проекта (если есть) и из папки скрипта
 load_dotenv()  # ./.env
@@ -62,9 +65,9 @@ def themed(text: str) -> str:
 MSG_UNAVAILABLE = "Сервис игры временно недоступен. Попробуйте позже."
 
 async def _ensure_home_chat(chat_id: int):
-    home = await get_setting("home_chat_id")
+    home = await config.get("home_chat_id")
     if not home:
-        await set_setting("home_chat_id", str(chat_id))
+        await config.set("home_chat_id", str(chat_id))
 
 @dp.message(CommandStart())
 async def start(m: types.Message):
@@ -95,7 +98,7 @@ async def bind_here(m: types.Message):
 
 @dp.message(Command("home"))
 async def set_home_chat(m: types.Message):
-    await set_setting("home_chat_id", str(m.chat.id))
+    await config.set("home_chat_id", str(m.chat.id))
     await upsert_chat(chat_id=m.chat.id, type_=m.chat.type, title=m.chat.title or m.chat.full_name or "")
     await m.answer("Этот чат привязан как домашний. Фоновые события и диалоги будут публиковаться здесь.")
 
@@ -227,56 +230,15 @@ async def on_msg(m: types.Message):
     except Exception:
         pass
 
-    user_id = await ensure_tigrit_profile(m.from_user.id, m.from_user.username)
-    if user_id is None:
-        return
-    try:
-        zone_row = await query_one(
-            "SELECT zone_id FROM zones WHERE tg_chat_id = $1 LIMIT 1",
-            int(m.chat.id),
-        )
-        zone_id = zone_row["zone_id"] if zone_row else None
-        payload = json.dumps(
-            {
-                "text": (m.text or "")[:200],
-                "zone_id": zone_id,
-                "chat_id": int(m.chat.id),
-                "username": m.from_user.username or "",
-            },
-            ensure_ascii=False,
-        )
-        await execute(
-            "INSERT INTO tigrit_interactions(kind, actor_id, target_id, payload) VALUES ($1,$2,$3,$4)",
-            "msg", user_id, None, payload,
-        )
-        if zone_id:
-            await execute(
-                """
-                UPDATE tigrit_user_profile
-                SET home_zone_first_activity_at = COALESCE(home_zone_first_activity_at, NOW()),
-                    trust_score = GREATEST(-100, LEAST(100, COALESCE(trust_score, 50) + 2))
-                WHERE user_id = $1
-                  AND home_zone_id = $2
-                """,
-                user_id,
-                zone_id,
-            )
-            await execute(
-                """
-                INSERT INTO game_events(user_id, event_type, reason_code, payload, created_at)
-                VALUES ($1, 'trust_change', 'zone_chat_activity', $2, NOW())
-                """,
-                user_id,
-                json.dumps({"delta": 2, "zone_id": zone_id}, ensure_ascii=False),
-            )
-        await upsert_chat(chat_id=m.chat.id, type_=m.chat.type, title=m.chat.title or m.chat.full_name or "")
-    except Exception:
-        pass
-    res = await gain_xp_and_level(m.from_user.id)
-    if res:
-        xp, lvl = res
-        if xp % 250 == 0:
-            await m.answer(f"✨ Прогресс @{m.from_user.username}: XP={xp}, уровень={lvl}")
+    # Профиль, сообщение, trust, XP и стройка — пачкой в ingestor (см. ingest.py)
+    ingestor.submit(IncomingMessage(
+        telegram_id=m.from_user.id,
+        username=m.from_user.username or "",
+        chat_id=int(m.chat.id),
+        chat_type=m.chat.type,
+        chat_title=m.chat.title or m.chat.full_name or "",
+        text=m.text,
+    ))
 
     if random.random() < AGENT_REPLY_CHANCE:
         persona = await get_persona_prompt(m.from_user.id)
@@ -290,13 +252,13 @@ def _today_key() -> str:
 
 async def _reset_daily_event_counters_if_needed():
     today = _today_key()
-    cur = await get_setting("daily_events_date")
+    cur = await config.get("daily_events_date")
     if cur != today:
-        await set_setting("daily_events_date", today)
+        await config.set("daily_events_date", today)
         target = random.randint(DAILY_EVENTS_MIN, DAILY_EVENTS_MAX)
-        await set_setting("daily_events_target", str(target))
-        await set_setting("daily_events_done", "0")
-        await set_setting("last_event_created_ts", "0")
+        await config.set("daily_events_target", str(target))
+        await config.set("daily_events_done", "0")
+        await config.set("last_event_created_ts", "0")
 
 async def _spawn_interactive_event(chat_id: int):
     """Создаёт интерактивный ивент и публикует сообщение с кнопками участия."""
@@ -345,9 +307,9 @@ async def _spawn_interactive_event(chat_id: int):
         return
 
     await execute("UPDATE tigrit_events SET message_id=$1 WHERE id=$2", int(msg.message_id), int(event_id))
-    await set_setting("last_event_created_ts", str(start_ts))
-    done = int(await get_setting("daily_events_done") or 0)
-    await set_setting("daily_events_done", str(done + 1))
+    await config.set("last_event_created_ts", str(start_ts))
+    done = int(await config.get("daily_events_done") or 0)
+    await config.set("daily_events_done", str(done + 1))
 
 async def _finalize_event(event_row):
     """Закрывает ивент по окончании окна участия и применяет эффекты участникам."""
@@ -427,14 +389,25 @@ async def spawn_event_command(m: types.Message):
     except Exception as e:
         log.warning(f"spawn_event: can't verify admin rights in chat {m.chat.id}: {e}. Proceeding anyway.")
 
-    home_chat = await get_setting("home_chat_id")
+    home_chat = await config.get("home_chat_id")
     if not home_chat:
-        await set_setting("home_chat_id", str(m.chat.id))
+        await config.set("home_chat_id", str(m.chat.id))
         home_chat = str(m.chat.id)
 
     await _spawn_interactive_event(int(home_chat))
     await m.answer("✅ Ивент создан и отправлен в домашний чат.")
 
+@dp.chat_member()
+async def on_chat_member(upd: types.ChatMemberUpdated):
+    """Смена статуса участника (бот — админ чата): обновляем кэш membership для API."""
+    member = upd.new_chat_member
+    status = str(getattr(member.status, "value", member.status))
+    in_chat = member_in_chat(status, getattr(member, "is_member", None))
+    try:
+        await upsert_chat_member(upd.chat.id, member.user.id, status, in_chat)
+    except Exception as e:
+        log.warning(f"chat_member cache fail: {e}")
+
 @dp.callback_query()
 async def on_event_callback(c: types.CallbackQuery):
     """Обработка нажатий на кнопки ивента (участие/пропуск) с валидацией и логированием."""
@@ -505,52 +478,72 @@ async def on_event_callback(c: types.CallbackQuery):
         log.error(f"save decision failed: event_id={event_id}, uid={c.from_user.id}, err={e}")
         await c.answer("Не удалось сохранить", show_alert=False)
 
-async def village_loop():
-    while True:
-        await asyncio.sleep(TICK_SECONDS)
+async def village_tick():
+    # Сообщения от деревенских событий и диалоги между жителями.
+    # Заполняются при реализации village_tick и simulate_agents (Фаза расширения Тигрит).
+    msgs: list = []
+    meetings: list = []
 
-        # Сообщения от деревенских событий и диалоги между жителями.
-        # Заполняются при реализации village_tick и simulate_agents (Фаза расширения Тигрит).
-        msgs: list = []
-        meetings: list = []
+    home_chat = await config.get("home_chat_id")
+    if not home_chat:
+        return
+
+    try:
+        await _finalize_expired_events()
+
+        await _reset_daily_event_counters_if_needed()
+        target = int(await config.get("daily_events_target") or DAILY_EVENTS_MIN)
+        done = int(await config.get("daily_events_done") or 0)
+        last_created = int(await config.get("last_event_created_ts") or 0)
+        hours_since_last = (int(time.time()) - last_created) / 3600 if last_created else 999
+        if done < target and hours_since_last >= 2:
+            # шансы по часу ~40% спавна при невыполненной квоте
+            if random.random() < 0.4:
+                await _spawn_interactive_event(int(home_chat))
+
+        for text in msgs:
+            await bot.send_message(int(home_chat), text)
+            await asyncio.sleep(1)
+
+        for kind, a, b, lines in meetings:
+            if kind == "solo":
+                await bot.send_message(int(home_chat), f"💬 <i>{lines[0]}</i>")
+            else:
+                await bot.send_message(int(home_chat), f"🤝 <i>{lines[0]}</i>")
+                if len(lines) > 1:
+                    await asyncio.sleep(1)
+                    await bot.send_message(int(home_chat), f"🤝 <i>{lines[1]}</i>")
+            await asyncio.sleep(1)
+    except Exception as e:
+        log.error(f"publish fail: {e}")
 
-        home_chat = await get_setting("home_chat_id")
-        if not home_chat:
-            continue
+async def _notify_progress(chat_id: int, username: str, xp: int, level: int):
+    await bot.send_message(chat_id, f"✨ Прогресс @{username}: XP={xp}, уровень={level}")
 
-        try:
-            await _finalize_expired_events()
-
-            await _reset_daily_event_counters_if_needed()
-            target = int(await get_setting("daily_events_target") or DAILY_EVENTS_MIN)
-            done = int(await get_setting("daily_events_done") or 0)
-            last_created = int(await get_setting("last_event_created_ts") or 0)
-            hours_since_last = (int(time.time()) - last_created) / 3600 if last_created else 999
-            if done < target and hours_since_last >= 2:
-                # шансы по часу ~40% спавна при невыполненной квоте
-                if random.random() < 0.4:
-                    await _spawn_interactive_event(int(home_chat))
-
-            for text in msgs:
-                await bot.send_message(int(home_chat), text)
-                await asyncio.sleep(1)
-
-            for kind, a, b, lines in meetings:
-                if kind == "solo":
-                    await bot.send_message(int(home_chat), f"💬 <i>{lines[0]}</i>")
-                else:
-                    await bot.send_message(int(home_chat), f"🤝 <i>{lines[0]}</i>")
-                    if len(lines) > 1:
-                        await asyncio.sleep(1)
-                        await bot.send_message(int(home_chat), f"🤝 <i>{lines[1]}</i>")
-                await asyncio.sleep(1)
-        except Exception as e:
-            log.error(f"publish fail: {e}")
+# Чат → зона и tigrit_settings — из памяти (см. routing.py)
+config = BotConfig()
+ingestor = MessageIngestor(on_progress=_notify_progress, zone_for_chat=config.zone_for_chat,
+                           routing_ready=config.is_loaded)
+
+# Тик деревни — через планировщик с advisory lock: при нескольких копиях бота выполняется один раз
+scheduler = Scheduler(get_pool)
+scheduler.add_job("tigrit_village_tick", village_tick, interval=TICK_SECONDS,
+                  initial_delay=TICK_SECONDS, timeout=max(TICK_SECONDS * 5, 60))
+scheduler.add_job("tigrit_config_refresh", config.periodic, interval=REFRESH_INTERVAL,
+                  initial_delay=REFRESH_INTERVAL, timeout=30, leader=False)
 
 async def main():
-    asyncio.create_task(village_loop())
+    await config.start()
+    await ingestor.start()
+    await scheduler.start()
     log.info("Бот запущен (общая БД с Игра).")
-    await dp.start_polling(bot)
+    try:
+        # chat_member не приходит по умолчанию — запрашиваем все используемые типы апдейтов
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await scheduler.stop()
+        await ingestor.stop()
+        await config.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -32,11 +32,19 @@ GAME_API_BASE = os.environ.get("GAME_API_BASE", "http://app:8000").rstrip("/")
 INTERNAL_API_SECRET = os.environ.get("INTERNAL_API_SECRET", "")
 
 
+# telegram_id -> user_id: соответствие не меняется, ensure-user вызывается один раз на игрока
+_user_ids: Dict[int, int] = {}
+_USER_IDS_MAX = 100_000
+
+
 async def get_user_id(telegram_id: int) -> Optional[int]:
     """
     Возвращает user_id (users.id) по telegram_id через ensure-user API Игра.
     При недоступности бэкенда (таймаут, 5xx) возвращает None — бот не падает, вызывающий может сообщить пользователю.
     """
+    cached = _user_ids.get(telegram_id)
+    if cached is not None:
+        return cached
     try:
         async with httpx.AsyncClient(timeout=10.0) as client:
             r = await client.post(
@@ -46,9 +54,13 @@ async def get_user_id(telegram_id: int) -> Optional[int]:
             )
             r.raise_for_status()
             data = r.json()
-            return int(data["user_id"])
+            user_id = int(data["user_id"])
     except (httpx.HTTPError, ValueError, KeyError):
         return None
+    if len(_user_ids) >= _USER_IDS_MAX:
+        _user_ids.clear()
+    _user_ids[telegram_id] = user_id
+    return user_id
 
 
 async def ensure_tigrit_profile(telegram_id: int, username: Optional[str] = None) -> Optional[int]:
@@ -154,64 +166,11 @@ async def get_feathers_balance(telegram_id: int) -> int:
     return int(row["balance"]) if row and row["balance"] is not None else 0
 
 
+# XP за сообщение и кулдаун (сек) — начисляет ingest.MessageIngestor пачками
 XP_COOLDOWN = 4
 XP_PER_MSG = 5
 
 
-async def can_gain_xp(user_id: int) -> bool:
-    now = _ts()
-    row = await query_one("SELECT last_xp_at FROM tigrit_cooldowns WHERE user_id = $1", user_id)
-    last = int(row["last_xp_at"]) if row and row["last_xp_at"] else 0
-    if now - last >= XP_COOLDOWN:
-        await execute(
-            """INSERT INTO tigrit_cooldowns (user_id, last_xp_at) VALUES ($1, $2)
-               ON CONFLICT (user_id) DO UPDATE SET last_xp_at = EXCLUDED.last_xp_at""",
-            user_id, now,
-        )
-        return True
-    return False
-
-
-async def gain_xp_and_level(telegram_id: int) -> Optional[Tuple[int, int]]:
-    """Начисляет XP за сообщение. Возвращает (new_xp, new_level) или None если кулдаун или ensure-user недоступен."""
-    import math
-    user_id = await get_user_id(telegram_id)
-    if user_id is None:
-        return None
-    if not await can_gain_xp(user_id):
-        return None
-    row = await query_one(
-        "SELECT xp, level FROM tigrit_user_profile WHERE user_id = $1", user_id
-    )
-    old_xp = int(row["xp"]) if row and row["xp"] is not None else 0
-    old_level = int(row["level"]) if row and row["level"] is not None else 0
-    new_xp = old_xp + XP_PER_MSG
-    new_level = int(math.floor(math.sqrt(new_xp / 50)))
-    house_inc = 1 if new_level > old_level else 0
-    now = _ts()
-    await execute(
-        """UPDATE tigrit_user_profile SET
-               xp = $2, level = $3, house = house + $4,
-               last_activity = $5, activity_count = activity_count + 1
-           WHERE user_id = $1""",
-        user_id, new_xp, new_level, house_inc, now,
-    )
-    await execute("UPDATE tigrit_village SET activity = activity + 1 WHERE id = 1")
-    # Прогресс стройки
-    acc_row = await get_setting("build_xp_accum")
-    acc = int(acc_row) if acc_row and str(acc_row).isdigit() else 0
-    acc += XP_PER_MSG
-    inc = acc // 400
-    acc = acc % 400
-    await set_setting("build_xp_accum", str(acc))
-    if inc > 0:
-        prog_row = await query_one("SELECT build_progress FROM tigrit_village WHERE id = 1")
-        prog = int(prog_row["build_progress"]) if prog_row else 0
-        new_prog = min(100, prog + int(inc))
-        await execute("UPDATE tigrit_village SET build_progress = $1 WHERE id = 1", new_prog)
-    return (new_xp, new_level)
-
-
 async def top_users(limit: int = 10) -> List[Tuple[str, int]]:
     """Топ игроков по XP. Возвращает [(username, xp), ...]."""
     rows = await query_all(
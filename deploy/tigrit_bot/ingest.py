@@ -0,0 +1,370 @@
+"""
+Пакетная обработка сообщений групповых чатов.
+
+on_msg только кладёт сообщение в очередь; раз в FLUSH_INTERVAL (или при заполнении буфера)
+пачка пишется одной транзакцией:
+- профили новых игроков — один multi-row INSERT;
+- tigrit_interactions — один multi-row INSERT;
+- trust за активность в домашней зоне и game_events — агрегатом по (user_id, zone_id);
+- XP с учётом кулдауна — агрегатом по игроку;
+- tigrit_chats — по уникальным чатам пачки;
+- активность деревни и накопитель стройки build_xp_accum — одним атомарным UPDATE на пачку.
+Если транзакция не прошла, пачка возвращается в начало очереди (очередь не длиннее MAX_QUEUE)
+и повторяется в следующий flush; сообщение, не записанное MAX_ATTEMPTS раз, отбрасывается.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from db_async import XP_COOLDOWN, XP_PER_MSG, get_pool, get_user_id
+from prompts import CLASSES, RACES
+from tigrit_shared.presence import touch_zone_members
+
+log = logging.getLogger("tigrit.ingest")
+
+FLUSH_INTERVAL = 0.3
+MAX_BATCH = 500
+MAX_QUEUE = 20_000
+# Сколько раз пытаться записать сообщение, прежде чем отбросить его
+MAX_ATTEMPTS = 5
+TRUST_PER_MSG = 2
+BUILD_XP_PER_STEP = 400
+XP_NOTIFY_EVERY = 250
+
+# (chat_id, username, xp, level) — уведомление о прогрессе, когда XP пересёк кратное XP_NOTIFY_EVERY
+ProgressCallback = Callable[[int, str, int, int], Awaitable[None]]
+
+
+class IncomingMessage:
+    __slots__ = ("telegram_id", "username", "chat_id", "chat_type", "chat_title", "text", "ts", "attempts")
+
+    def __init__(self, telegram_id: int, username: str, chat_id: int, chat_type: str, chat_title: str, text: str):
+        self.telegram_id = telegram_id
+        self.username = username or ""
+        self.chat_id = chat_id
+        self.chat_type = chat_type or ""
+        self.chat_title = chat_title or ""
+        self.text = text
+        self.ts = time.time()
+        self.attempts = 0
+
+
+class MessageIngestor:
+    def __init__(self, on_progress: Optional[ProgressCallback] = None,
+                 zone_for_chat: Optional[Callable[[int], Optional[str]]] = None,
+                 routing_ready: Optional[Callable[[], bool]] = None,
+                 flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH):
+        self.on_progress = on_progress
+        # Маршрутизация чат → зона из памяти (routing.BotConfig); без неё или пока снимок
+        # не загружен (routing_ready() = False) — запрос к zones на пачку
+        self.zone_for_chat = zone_for_chat
+        self.routing_ready = routing_ready
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._buf: List[IncomingMessage] = []
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"received": 0, "dropped": 0, "flushed": 0, "batches": 0, "errors": 0, "requeued": 0}
+
+    def submit(self, msg: IncomingMessage) -> None:
+        if len(self._buf) >= MAX_QUEUE:
+            self._buf.pop(0)
+            self.stats["dropped"] += 1
+        self._buf.append(msg)
+        self.stats["received"] += 1
+        if len(self._buf) >= self.max_batch:
+            self._wake.set()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop(), name="tigrit-ingest")
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._task:
+            await self._task
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._buf:
+                batch, self._buf = self._buf[:self.max_batch], self._buf[self.max_batch:]
+                if not await self._flush_safe(batch):
+                    # БД недоступна — остаток ждёт следующего цикла, без горячего повтора
+                    break
+            if self._stopping:
+                return
+
+    async def _flush_safe(self, batch: List[IncomingMessage]) -> bool:
+        try:
+            await self.flush(batch)
+            self.stats["flushed"] += len(batch)
+            self.stats["batches"] += 1
+            return True
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning(f"ingest flush fail ({len(batch)} msgs): {e}")
+            self._requeue(batch)
+            return False
+
+    def _requeue(self, batch: List[IncomingMessage]) -> None:
+        """Вернуть пачку в начало очереди: MAX_ATTEMPTS попыток на сообщение, очередь не длиннее MAX_QUEUE."""
+        retry = []
+        for m in batch:
+            m.attempts += 1
+            if m.attempts < MAX_ATTEMPTS:
+                retry.append(m)
+        dropped = len(batch) - len(retry)
+        self._buf = retry + self._buf
+        if len(self._buf) > MAX_QUEUE:
+            # Лишнее — самые старые, как в submit
+            dropped += len(self._buf) - MAX_QUEUE
+            self._buf = self._buf[-MAX_QUEUE:]
+        self.stats["requeued"] += len(retry)
+        if dropped:
+            self.stats["dropped"] += dropped
+            log.warning(f"ingest: dropped {dropped} msgs after failed flush")
+
+    async def flush(self, batch: List[IncomingMessage]) -> None:
+        tg_ids = list({m.telegram_id for m in batch})
+        resolved = await asyncio.gather(*(get_user_id(t) for t in tg_ids))
+        uid_by_tg = {t: u for t, u in zip(tg_ids, resolved) if u is not None}
+        msgs = [(uid_by_tg[m.telegram_id], m) for m in batch if m.telegram_id in uid_by_tg]
+        if not msgs:
+            return
+
+        pool = await get_pool()
+        progress: List[Tuple[int, str, int, int]] = []
+        presence: List[Tuple[str, int]] = []
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                chat_ids = {m.chat_id for _, m in msgs}
+                if self.zone_for_chat is not None and (self.routing_ready is None or self.routing_ready()):
+                    zone_by_chat = {c: z for c in chat_ids if (z := self.zone_for_chat(c))}
+                else:
+                    zone_by_chat = await self._zones_for_chats(conn, chat_ids)
+                await self._upsert_profiles(conn, msgs)
+                await self._insert_interactions(conn, msgs, zone_by_chat)
+                await self._apply_trust(conn, msgs, zone_by_chat)
+                xp_total = await self._apply_xp(conn, msgs, progress)
+                await self._upsert_chats(conn, msgs)
+                if xp_total:
+                    await self._apply_village(conn, xp_total)
+
+        for uid, m in msgs:
+            zone_id = zone_by_chat.get(m.chat_id)
+            if zone_id:
+                presence.append((zone_id, uid))
+        # После коммита ошибки не пробрасываются — иначе пачка повторилась бы целиком
+        if presence:
+            try:
+                await touch_zone_members(presence)
+            except Exception as e:
+                log.warning(f"zone presence fail: {e}")
+        if self.on_progress:
+            for chat_id, username, xp, level in progress:
+                try:
+                    await self.on_progress(chat_id, username, xp, level)
+                except Exception as e:
+                    log.warning(f"progress notify fail: {e}")
+
+    @staticmethod
+    async def _zones_for_chats(conn, chat_ids) -> Dict[int, str]:
+        rows = await conn.fetch(
+            "SELECT tg_chat_id, zone_id FROM zones WHERE tg_chat_id = ANY($1::bigint[])",
+            list(chat_ids),
+        )
+        return {int(r["tg_chat_id"]): r["zone_id"] for r in rows}
+
+    @staticmethod
+    async def _upsert_profiles(conn, msgs) -> None:
+        """Профиль на игрока: username — последний в пачке; новые получают расу/класс и +1 к населению."""
+        latest: Dict[int, str] = {}
+        for uid, m in msgs:
+            latest[uid] = m.username
+        uids = list(latest)
+        rows = await conn.fetch(
+            """
+            INSERT INTO tigrit_user_profile (user_id, username, race, clazz)
+            SELECT * FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[])
+            ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
+            WHERE tigrit_user_profile.username IS DISTINCT FROM EXCLUDED.username
+            RETURNING (xmax = 0) AS inserted
+            """,
+            uids,
+            [latest[u] for u in uids],
+            [random.choice(RACES)[0] for _ in uids],
+            [random.choice(CLASSES) for _ in uids],
+        )
+        created = sum(1 for r in rows if r["inserted"])
+        if created:
+            await conn.execute("UPDATE tigrit_village SET population = population + $1 WHERE id = 1", created)
+
+    @staticmethod
+    async def _insert_interactions(conn, msgs, zone_by_chat) -> None:
+        actors, payloads, zones, stamps = [], [], [], []
+        for uid, m in msgs:
+            zone_id = zone_by_chat.get(m.chat_id)
+            actors.append(uid)
+            zones.append(zone_id)
+            stamps.append(m.ts)
+            payloads.append(json.dumps(
+                {"text": m.text[:200], "zone_id": zone_id, "chat_id": m.chat_id, "username": m.username},
+                ensure_ascii=False,
+            ))
+        await conn.execute(
+            """
+            INSERT INTO tigrit_interactions (ts, kind, actor_id, target_id, payload, zone_id)
+            SELECT to_timestamp(t), 'msg', a, NULL, p, z
+            FROM unnest($1::float8[], $2::bigint[], $3::text[], $4::text[]) AS u(t, a, p, z)
+            """,
+            stamps, actors, payloads, zones,
+        )
+
+    @staticmethod
+    async def _apply_trust(conn, msgs, zone_by_chat) -> None:
+        """Trust +TRUST_PER_MSG за сообщение в домашней зоне — одной дельтой на (user_id, zone_id)."""
+        counts: Dict[Tuple[int, str], int] = {}
+        for uid, m in msgs:
+            zone_id = zone_by_chat.get(m.chat_id)
+            if zone_id:
+                counts[(uid, zone_id)] = counts.get((uid, zone_id), 0) + 1
+        if not counts:
+            return
+        keys = list(counts)
+        uids = [k[0] for k in keys]
+        zones = [k[1] for k in keys]
+        deltas = [counts[k] * TRUST_PER_MSG for k in keys]
+        await conn.execute(
+            """
+            UPDATE tigrit_user_profile p
+            SET home_zone_first_activity_at = COALESCE(p.home_zone_first_activity_at, NOW()),
+                trust_score = GREATEST(-100, LEAST(100, tigrit_effective_trust(p.trust_score, p.trust_updated_at) + d.delta)),
+                trust_updated_at = tigrit_trust_anchor(p.trust_updated_at)
+            FROM unnest($1::bigint[], $2::text[], $3::int[]) AS d(user_id, zone_id, delta)
+            WHERE p.user_id = d.user_id AND p.home_zone_id = d.zone_id
+            """,
+            uids, zones, deltas,
+        )
+        await conn.execute(
+            """
+            INSERT INTO game_events (user_id, event_type, reason_code, payload, created_at)
+            SELECT d.user_id, 'trust_change', 'zone_chat_activity',
+                   jsonb_build_object('delta', d.delta, 'zone_id', d.zone_id, 'messages', d.delta / $4), NOW()
+            FROM unnest($1::bigint[], $2::text[], $3::int[]) AS d(user_id, zone_id, delta)
+            """,
+            uids, zones, deltas, TRUST_PER_MSG,
+        )
+
+    @staticmethod
+    async def _apply_xp(conn, msgs, progress: List[Tuple[int, str, int, int]]) -> int:
+        """
+        XP_PER_MSG за сообщение не чаще раза в XP_COOLDOWN сек на игрока.
+        Возвращает начисленный XP пачки; в progress — игроки, пересёкшие кратное XP_NOTIFY_EVERY.
+        """
+        by_user: Dict[int, List[IncomingMessage]] = {}
+        for uid, m in msgs:
+            by_user.setdefault(uid, []).append(m)
+        uids = list(by_user)
+        rows = await conn.fetch(
+            "SELECT user_id, last_xp_at FROM tigrit_cooldowns WHERE user_id = ANY($1::bigint[])",
+            uids,
+        )
+        last_xp = {int(r["user_id"]): int(r["last_xp_at"] or 0) for r in rows}
+
+        gain_uids, gains, counts, last_ts = [], [], [], []
+        last_msg: Dict[int, IncomingMessage] = {}
+        for uid, items in by_user.items():
+            last = last_xp.get(uid, 0)
+            n = 0
+            for m in sorted(items, key=lambda x: x.ts):
+                if m.ts - last >= XP_COOLDOWN:
+                    n += 1
+                    last = m.ts
+            if n:
+                gain_uids.append(uid)
+                gains.append(n * XP_PER_MSG)
+                counts.append(n)
+                last_ts.append(int(last))
+                last_msg[uid] = items[-1]
+        if not gain_uids:
+            return 0
+
+        await conn.execute(
+            """
+            INSERT INTO tigrit_cooldowns (user_id, last_xp_at)
+            SELECT * FROM unnest($1::bigint[], $2::bigint[])
+            ON CONFLICT (user_id) DO UPDATE SET last_xp_at = EXCLUDED.last_xp_at
+            """,
+            gain_uids, last_ts,
+        )
+        rows = await conn.fetch(
+            """
+            UPDATE tigrit_user_profile p
+            SET xp = COALESCE(p.xp, 0) + d.gain,
+                level = floor(sqrt((COALESCE(p.xp, 0) + d.gain) / 50.0))::int,
+                house = house + GREATEST(floor(sqrt((COALESCE(p.xp, 0) + d.gain) / 50.0))::int - COALESCE(p.level, 0), 0),
+                last_activity = d.ts,
+                activity_count = activity_count + d.cnt
+            FROM unnest($1::bigint[], $2::int[], $3::int[], $4::bigint[]) AS d(user_id, gain, cnt, ts)
+            WHERE p.user_id = d.user_id
+            RETURNING p.user_id, p.xp - d.gain AS old_xp, p.xp, p.level
+            """,
+            gain_uids, gains, counts, last_ts,
+        )
+        for r in rows:
+            if int(r["xp"]) // XP_NOTIFY_EVERY > int(r["old_xp"]) // XP_NOTIFY_EVERY:
+                m = last_msg[int(r["user_id"])]
+                progress.append((m.chat_id, m.username, int(r["xp"]), int(r["level"])))
+        return sum(gains)
+
+    @staticmethod
+    async def _apply_village(conn, xp_total: int) -> None:
+        """Активность деревни и накопитель стройки: одно атомарное изменение на пачку вместо get/set на сообщение."""
+        await conn.execute(
+            """
+            WITH prev AS (
+                SELECT CASE WHEN v ~ '^[0-9]+$' THEN v::bigint ELSE 0 END AS acc
+                FROM tigrit_settings WHERE k = 'build_xp_accum' FOR UPDATE
+            ), total AS (
+                SELECT COALESCE((SELECT acc FROM prev), 0) + $1::bigint AS acc
+            ), saved AS (
+                INSERT INTO tigrit_settings (k, v)
+                SELECT 'build_xp_accum', (acc % $3::bigint)::text FROM total
+                ON CONFLICT (k) DO UPDATE SET v = EXCLUDED.v
+            )
+            UPDATE tigrit_village
+            SET activity = activity + $2::int,
+                build_progress = LEAST(100, build_progress + ((SELECT acc FROM total) / $3::bigint)::int)
+            WHERE id = 1
+            """,
+            xp_total, xp_total // XP_PER_MSG, BUILD_XP_PER_STEP,
+        )
+
+    @staticmethod
+    async def _upsert_chats(conn, msgs) -> None:
+        chats: Dict[int, IncomingMessage] = {}
+        for _, m in msgs:
+            chats[m.chat_id] = m
+        ids = list(chats)
+        await conn.execute(
+            """
+            INSERT INTO tigrit_chats (chat_id, type, title, invite_link, owner_user_id)
+            SELECT c, t, n, '', NULL FROM unnest($1::bigint[], $2::text[], $3::text[]) AS u(c, t, n)
+            ON CONFLICT (chat_id) DO UPDATE SET
+              type = EXCLUDED.type,
+              title = COALESCE(NULLIF(EXCLUDED.title, ''), tigrit_chats.title)
+            """,
+            ids, [chats[c].chat_type for c in ids], [chats[c].chat_title for c in ids],
+        )
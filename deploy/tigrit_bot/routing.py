@@ -0,0 +1,115 @@
+"""
+Снимок конфигурации бота в памяти: маршрутизация чат → зона (zones.tg_chat_id)
+и tigrit_settings. На пути обработки сообщения и в тике деревни — ноль запросов.
+
+Обновление: периодически (задача tigrit_config_refresh в каждом процессе) и по
+NOTIFY tigrit_config — его шлют триггеры на zones/tigrit_settings (миграция 011)
+и POST /api/admin/bot/reload-config. Записи самого бота (set) идут write-through.
+Пока снимок ни разу не загрузился (БД была недоступна при старте), чтения идут прямо в БД:
+get() — SELECT из tigrit_settings (так же при промахе ключа), зоны — запрос ingest на пачку (is_loaded).
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import asyncpg
+
+from db_async import get_setting, query_all, set_setting
+from tigrit_shared import db as shared_db
+
+log = logging.getLogger("tigrit.routing")
+
+NOTIFY_CHANNEL = "tigrit_config"
+REFRESH_INTERVAL = 60
+# Пауза перед перечитыванием после NOTIFY: серия изменений — одно чтение
+_NOTIFY_DEBOUNCE = 0.5
+
+
+class BotConfig:
+    def __init__(self):
+        self.zone_by_chat: Dict[int, str] = {}
+        self.settings: Dict[str, str] = {}
+        self.refreshes = 0
+        self.loaded = False
+        self._listen_conn: Optional[asyncpg.Connection] = None
+        self._pending: Optional[asyncio.Task] = None
+
+    def zone_for_chat(self, chat_id: int) -> Optional[str]:
+        return self.zone_by_chat.get(int(chat_id))
+
+    def is_loaded(self) -> bool:
+        return self.loaded
+
+    async def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Настройка из снимка; при промахе или незагруженном снимке — чтение из БД."""
+        if self.loaded and key in self.settings:
+            return self.settings[key]
+        try:
+            value = await get_setting(key)
+        except Exception as e:
+            log.warning(f"setting {key} read fail: {e}")
+            return self.settings.get(key, default)
+        if value is None:
+            return default
+        self.settings[key] = value
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        await set_setting(key, value)
+        self.settings[key] = value
+
+    async def refresh(self) -> None:
+        zones = await query_all("SELECT tg_chat_id, zone_id FROM zones WHERE tg_chat_id IS NOT NULL AND active = TRUE")
+        settings = await query_all(
+            "SELECT k, v FROM tigrit_settings WHERE k <> 'build_xp_accum' AND k NOT LIKE 'invite\\_link\\_%'"
+        )
+        # Подмена целиком — читатели видят либо старый, либо новый снимок
+        self.zone_by_chat = {int(r["tg_chat_id"]): r["zone_id"] for r in zones}
+        self.settings = {r["k"]: r["v"] for r in settings if r["v"] is not None}
+        self.refreshes += 1
+        self.loaded = True
+
+    async def start(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            log.warning(f"config refresh fail: {e}")
+        await self._listen()
+
+    async def stop(self) -> None:
+        if self._pending:
+            self._pending.cancel()
+        if self._listen_conn is not None:
+            try:
+                await self._listen_conn.close()
+            except Exception:
+                pass
+            self._listen_conn = None
+
+    async def periodic(self) -> None:
+        """Задача планировщика: перечитать снимок и восстановить LISTEN, если соединение упало."""
+        await self.refresh()
+        if self._listen_conn is None or self._listen_conn.is_closed():
+            await self._listen()
+
+    async def _listen(self) -> None:
+        if not shared_db.DATABASE_URL:
+            return
+        try:
+            conn = await asyncpg.connect(shared_db.DATABASE_URL)
+            await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+            self._listen_conn = conn
+        except Exception as e:
+            self._listen_conn = None
+            log.warning(f"LISTEN {NOTIFY_CHANNEL} fail: {e}")
+
+    def _on_notify(self, conn, pid, channel, payload) -> None:
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.get_running_loop().create_task(self._refresh_soon())
+
+    async def _refresh_soon(self) -> None:
+        await asyncio.sleep(_NOTIFY_DEBOUNCE)
+        try:
+            await self.refresh()
+        except Exception as e:
+            log.warning(f"config refresh fail: {e}")
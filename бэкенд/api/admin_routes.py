@@ -41,7 +41,8 @@ from infrastructure.database import (
     mark_penalty_notified,
     get_penalties_for_user,
 )
-from infrastructure.telegram_chat import check_user_in_chat, get_bot_chats
+from infrastructure.http_client import get_http
+from infrastructure.telegram_chat import check_user_in_chat, check_users_in_chats, get_bot_chats
 from infrastructure.telegram_notify import notify_user_penalty
 
 logger = logging.getLogger(__name__)
@@ -628,15 +629,46 @@ async def admin_remove_channel(
 async def admin_check_user_in_chat(
     chat_id: int,
     user_id: int,
+    fresh: bool = False,
     x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
     x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
 ):
-    """Проверить, состоит ли пользователь в чате/канале. Бот должен быть админом в чате. BOT_TOKEN в env."""
+    """Проверить, состоит ли пользователь в чате/канале. Бот должен быть админом в чате. BOT_TOKEN в env. fresh=true — мимо кэша."""
     _require_admin(_get_telegram_id(x_telegram_user_id, x_user_id))
-    in_chat, status = await check_user_in_chat(chat_id, user_id)
+    in_chat, status = await check_user_in_chat(chat_id, user_id, fresh=fresh)
     return {"in_chat": in_chat, "status": status}
 
 
+CHECK_MEMBERS_MAX_USERS = 500
+
+
+@router.post("/channels/check-members")
+async def admin_check_members(
+    body: Dict[str, Any],
+    x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """
+    Пакетная проверка подписок: body { user_ids: [...], chat_ids?: [...], project_id?, fresh? }.
+    Без chat_ids — все активные каналы проекта (admin_channels). Ответ: { results: { user_id: { chat_id: {in_chat, status} } } }.
+    """
+    _require_admin(_get_telegram_id(x_telegram_user_id, x_user_id))
+    try:
+        user_ids = [int(u) for u in body.get("user_ids") or body.get("userIds") or []]
+        chat_ids = [int(c) for c in body.get("chat_ids") or body.get("chatIds") or []]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="user_ids and chat_ids must be integers")
+    if not user_ids:
+        raise HTTPException(status_code=400, detail="user_ids required")
+    if len(user_ids) > CHECK_MEMBERS_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"Too many user_ids (max {CHECK_MEMBERS_MAX_USERS})")
+    if not chat_ids:
+        project_id = int(body.get("project_id", body.get("projectId", 1)))
+        chat_ids = [c["chat_id"] for c in await admin_get_channels(project_id=project_id, active_only=True)]
+    results = await check_users_in_chats(user_ids, chat_ids, fresh=bool(body.get("fresh")))
+    return {"chat_ids": chat_ids, "results": results}
+
+
 # ——— Активность (мониторинг: сообщения, реакции, где и когда) ———
 
 @router.post("/activity")
@@ -844,6 +876,33 @@ async def admin_nft_holders_sync(
     return {"ok": True, **stats}
 
 
+# ——— Фоновые задачи ———
+
+@router.get("/jobs")
+async def admin_jobs(
+    limit: int = 50,
+    x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Метрики планировщика этого процесса и последние запуски по кластеру (job_runs)."""
+    _require_admin(_get_telegram_id(x_telegram_user_id, x_user_id))
+    from api.main import scheduler
+    return {
+        "metrics": scheduler.metrics(),
+        "runs": await scheduler.recent_runs(limit=min(max(limit, 1), 200)),
+    }
+
+
+@router.get("/upstreams")
+async def admin_upstreams(
+    x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Исходящие API этого процесса: состояние circuit breaker, ошибки, гистограмма латентности."""
+    _require_admin(_get_telegram_id(x_telegram_user_id, x_user_id))
+    return get_http().metrics()
+
+
 # ——— Участники (для выбора в переводах/штрафах) ———
 
 @router.get("/participants")
@@ -893,7 +952,6 @@ async def admin_transfer(
     """Перевод пользователю через iCryptoCheck (награда). body: telegram_id, amount, currency, description."""
     _require_admin(_get_telegram_id(x_telegram_user_id, x_user_id))
     from config import ICRYPTOCHECK_API_KEY, ICRYPTOCHECK_API_URL
-    import httpx
     telegram_id_raw = body.get("telegram_id")
     if telegram_id_raw is None:
         raise HTTPException(status_code=400, detail="telegram_id required")
@@ -921,12 +979,15 @@ async def admin_transfer(
         "description": description,
     }
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(
-                f"{ICRYPTOCHECK_API_URL}/app/transfer",
-                headers={"iCryptoCheck-Key": ICRYPTOCHECK_API_KEY, "Content-Type": "application/json"},
-                json=payload,
-            )
+        # Перевод денег — без повторов: повтор после таймаута может задвоить выплату
+        r = await get_http().post(
+            f"{ICRYPTOCHECK_API_URL}/app/transfer",
+            headers={"iCryptoCheck-Key": ICRYPTOCHECK_API_KEY, "Content-Type": "application/json"},
+            json=payload,
+            timeout=30.0,
+            upstream="icryptocheck",
+            retries=0,
+        )
     except Exception as e:
         logger.exception("admin transfer request failed: %s", e)
         raise HTTPException(status_code=502, detail=str(e))
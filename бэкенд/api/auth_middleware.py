@@ -7,9 +7,9 @@
 import os
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-import httpx
 
 from infrastructure.database import get_telegram_id_by_user_id
+from infrastructure.http_client import get_http
 
 AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "").rstrip("/")
 
@@ -29,11 +29,13 @@ class AuthInitMiddleware(BaseHTTPMiddleware):
         if not init_data:
             return await call_next(request)
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                r = await client.post(
-                    f"{AUTH_SERVICE_URL}/verify",
-                    json={"init_data": init_data.strip()},
-                )
+            r = await get_http().post(
+                f"{AUTH_SERVICE_URL}/verify",
+                json={"init_data": init_data.strip()},
+                timeout=5.0,
+                upstream="auth_service",
+                retries=0,
+            )
             if r.status_code != 200:
                 return await call_next(request)
             data = r.json()
@@ -14,7 +14,10 @@ from api.internal_routes import router as internal_router
 from api.routes import router
 from api.auth_middleware import AuthInitMiddleware
 from api.session_middleware import SessionResolveMiddleware
-from infrastructure.database import init_db, close_db
+from infrastructure.database import init_db, close_db, get_pool
+from infrastructure.http_client import close_http, start_http
+from infrastructure.scheduler import Scheduler
+from config import WALLET_VERIFY_POLL_SEC
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -37,62 +40,66 @@ async def _broadcast_online_count():
         _online_ws.discard(ws)
 
 
-async def _ws_heartbeat_loop():
-    """Фоновая задача: пинг всех WS-клиентов каждые 30 секунд для обнаружения мёртвых."""
-    while True:
-        await asyncio.sleep(30)
-        dead: list = []
-        for ws in list(_online_ws):
-            try:
-                await ws.send_text(json.dumps({"ping": True}))
-            except Exception:
-                dead.append(ws)
-        if dead:
-            for ws in dead:
-                _online_ws.discard(ws)
-            await _broadcast_online_count()
+async def _ws_heartbeat():
+    """Пинг всех WS-клиентов процесса для обнаружения мёртвых (каждые 30 секунд, в каждом воркере)."""
+    dead: list = []
+    for ws in list(_online_ws):
+        try:
+            await ws.send_text(json.dumps({"ping": True}))
+        except Exception:
+            dead.append(ws)
+    if dead:
+        for ws in dead:
+            _online_ws.discard(ws)
+        await _broadcast_online_count()
 
 # Интервал фоновой синхронизации NFT (секунды). По умолчанию 30 мин.
 NFT_SYNC_INTERVAL = 30 * 60
 
 
-async def _nft_sync_loop():
-    """Фоновая задача: периодическая синхронизация NFT-каталога + холдеров."""
-    from infrastructure.nft_sync import run_full_sync, sync_nft_holders
-    # Первый запуск через 10 сек после старта (дать БД проинициализироваться)
-    await asyncio.sleep(10)
-    while True:
-        try:
-            logger.info("nft_sync_loop: starting periodic sync")
-            stats = await run_full_sync()
-            logger.info("nft_sync_loop: nft done — %s", stats)
-            # Sync holder analytics after NFT sync
-            holder_stats = await sync_nft_holders()
-            logger.info("nft_sync_loop: holders done — %s", holder_stats)
-        except asyncio.CancelledError:
-            break
-        except Exception as e:
-            logger.warning("nft_sync_loop error: %s", e)
-        await asyncio.sleep(NFT_SYNC_INTERVAL)
+async def _nft_sync():
+    """Периодическая синхронизация NFT-каталога + холдеров (один инстанс на кластер)."""
+    from infrastructure.nft_sync import run_scheduled_sync, sync_nft_holders
+    logger.info("nft_sync job: starting periodic sync")
+    stats = await run_scheduled_sync()
+    logger.info("nft_sync job: nft done — %s", stats)
+    holder_stats = await sync_nft_holders()
+    logger.info("nft_sync job: holders done — %s", holder_stats)
+
+
+async def _wallet_verify_watch():
+    """Индексация входящих переводов verify:… на кошелёк проекта (один инстанс на кластер)."""
+    from infrastructure.wallet_verify_watch import poll_verify_transfers
+    stats = await poll_verify_transfers()
+    if stats["inserted"] or stats["errors"]:
+        logger.info("wallet_verify_watch job: %s", stats)
+
+
+async def _price_feed():
+    """Заранее обновить курсы, у которых подходит срок (один инстанс пишет в Redis, остальные подхватывают)."""
+    from infrastructure.price import refresh_due
+    await refresh_due()
+
+
+scheduler = Scheduler(get_pool)
+# Первый запуск через 10 сек после старта (дать БД проинициализироваться)
+scheduler.add_job("nft_sync", _nft_sync, interval=NFT_SYNC_INTERVAL, initial_delay=10, jitter=30,
+                  timeout=NFT_SYNC_INTERVAL - 60)
+scheduler.add_job("wallet_verify_watch", _wallet_verify_watch, interval=WALLET_VERIFY_POLL_SEC, initial_delay=5,
+                  timeout=max(WALLET_VERIFY_POLL_SEC * 4, 60))
+scheduler.add_job("price_feed", _price_feed, interval=60, initial_delay=3, timeout=50)
+# WS-сокеты живут в памяти процесса — heartbeat без выбора лидера
+scheduler.add_job("ws_heartbeat", _ws_heartbeat, interval=30, initial_delay=30, leader=False, timeout=25)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
-    # Запускаем фоновую синхронизацию NFT
-    sync_task = asyncio.create_task(_nft_sync_loop())
-    heartbeat_task = asyncio.create_task(_ws_heartbeat_loop())
+    await start_http()
+    await scheduler.start()
     yield
-    sync_task.cancel()
-    heartbeat_task.cancel()
-    try:
-        await sync_task
-    except asyncio.CancelledError:
-        pass
-    try:
-        await heartbeat_task
-    except asyncio.CancelledError:
-        pass
+    await scheduler.stop()
+    await close_http()
     await close_db()
 
 
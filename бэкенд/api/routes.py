@@ -1,9 +1,11 @@
+import hashlib
+import hmac
 import logging
 import random
 import time
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Body, Header, HTTPException, Request
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Request, Response
 
 from config import (
     get_eggs_config,
@@ -31,7 +33,7 @@ async def _quest_min_age():
 async def _quest_rate_limit():
     return await get_setting("quest.submit_rate_limit_sec", PHOENIX_QUEST_SUBMIT_RATE_LIMIT_SEC)
 from core.checkin_mine import do_checkin, do_mine_create, do_mine_dig
-from core.craft import craft_merge, craft_reroll, craft_upgrade, craft_furnace_upgrade
+from core.craft import craft_merge, craft_merge_batch, craft_reroll, craft_upgrade, craft_furnace_upgrade
 from core.game_engine import (
     RUS_ALPHABET,
     apply_burn,
@@ -75,9 +77,13 @@ from infrastructure.database import (
     get_visit_log,
     perform_attack,
     do_furnace_hatch,
+    do_furnace_hatch_batch,
     get_state,
     get_user_balances,
+    get_inventory_version,
     get_user_inventory,
+    get_user_inventory_page,
+    get_user_inventory_summary,
     get_user_letter_items,
     get_withdraw_eligibility,
     get_leaderboards,
@@ -86,12 +92,12 @@ from infrastructure.database import (
     list_user_wallet_bindings,
     add_user_wallet_binding,
     delete_user_wallet_binding,
-    get_user_wallet_binding_by_code,
-    set_wallet_binding_verified,
-    update_wallet_binding_address,
-    delete_pending_wallet_bindings_by_code,
+    verify_wallet_binding_by_transfer,
     MAX_WALLETS_PER_USER,
     phoenix_submit_word,
+    get_user_badges,
+    get_badge_holders,
+    BADGE_KEYS,
     set_state,
     demolish_building,
     donate_to_profile,
@@ -104,11 +110,15 @@ from infrastructure.database import (
     get_dev_profile_stats,
     get_all_dev_nfts,
 )
-from infrastructure.price import get_rates
+from infrastructure.price import get_rates, refresh_prices
 from infrastructure.telegram_notify import notify_admin_phoenix_quest
-from infrastructure.nft_check import check_user_has_project_nft
-from infrastructure.ton_address import raw_to_friendly
-from infrastructure.ton_verify import find_verification_tx
+from infrastructure.nft_ownership import (
+    catalog_item as nft_catalog_item,
+    check_project_nfts,
+    handle_account_event as handle_nft_account_event,
+    index_synced_at as nft_index_synced_at,
+)
+from infrastructure.ton_address import raw_to_friendly_many
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/game", tags=["game"])
@@ -351,12 +361,47 @@ async def api_balances(
 
 @router.get("/inventory")
 async def api_inventory(
+    response: Response,
+    view: Optional[str] = Query(None, description="full (по умолчанию) | page | summary"),
+    cursor: Optional[str] = Query(None, max_length=20),
+    limit: int = Query(100, ge=1, le=500),
+    item_type: Optional[str] = Query(None, max_length=64),
+    rarity: Optional[str] = Query(None, max_length=32),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
     x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
     x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
 ):
-    """Инвентарь: предметы (реликвии, амулеты и т.д.) и яйца."""
+    """Инвентарь: предметы (реликвии, амулеты и т.д.) и яйца.
+    view=page — компактные строки с item_def_id (name/rarity — из /items-catalog), cursor/limit, фильтры item_type/rarity.
+    view=summary — количество по item_def_id и state (кэш по версии инвентаря).
+    ETag = версия инвентаря + нормализованные параметры запроса; при совпадении If-None-Match — 304."""
     telegram_id = _get_telegram_id(x_telegram_user_id, x_user_id)
     user_id = await ensure_user(telegram_id)
+    paged = view != "summary" and (view == "page" or cursor is not None or bool(item_type) or bool(rarity))
+    cursor_id: Optional[int] = None
+    if paged and cursor:
+        try:
+            cursor_id = int(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    if view == "summary":
+        variant = "summary"
+    elif paged:
+        variant = f"page:{cursor_id or ''}:{limit}:{item_type or ''}:{rarity or ''}"
+    else:
+        variant = "full"
+    version = await get_inventory_version(user_id)
+    etag = f'W/"inv-{user_id}-{version}-{hashlib.sha1(variant.encode()).hexdigest()[:12]}"'
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if view == "summary":
+        return await get_user_inventory_summary(user_id, version)
+    if paged:
+        page = await get_user_inventory_page(user_id, cursor_id, limit, item_type, rarity)
+        page["version"] = version
+        return page
     return await get_user_inventory(user_id)
 
 
@@ -415,6 +460,31 @@ async def api_phoenix_submit(
     return result
 
 
+@router.get("/badges")
+async def api_badges(
+    x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Бейджи пользователя (маска из кэша)."""
+    telegram_id = _get_telegram_id(x_telegram_user_id, x_user_id)
+    user_id = await ensure_user(telegram_id)
+    return {"badges": await get_user_badges(user_id)}
+
+
+@router.get("/badges/{badge_key}/holders")
+async def api_badge_holders(badge_key: str, limit: int = 100, after_user_id: int = 0):
+    """Обладатели бейджа: ранние первыми. Курсор — after_user_id (user_id последнего в предыдущей странице)."""
+    if badge_key not in BADGE_KEYS:
+        raise HTTPException(status_code=404, detail="badge_not_found")
+    limit = max(1, min(limit, 500))
+    holders = await get_badge_holders(badge_key, limit=limit, after_user_id=after_user_id)
+    return {
+        "badge_key": badge_key,
+        "holders": holders,
+        "next_after_user_id": holders[-1]["user_id"] if len(holders) == limit else None,
+    }
+
+
 @router.post("/mine/dig")
 async def api_mine_dig(
     body: Dict[str, Any],
@@ -637,6 +707,34 @@ async def api_furnace_hatch(
     return result
 
 
+@router.post("/furnace/hatch-batch")
+async def api_furnace_hatch_batch(
+    body: Dict[str, Any],
+    x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Пакетное вылупление одной транзакцией. body: sets [{furnace_user_item_id, egg_ids}, ...]."""
+    telegram_id = _get_telegram_id(x_telegram_user_id, x_user_id)
+    user_id = await ensure_user(telegram_id)
+    raw_sets = body.get("sets")
+    if not isinstance(raw_sets, list) or not raw_sets:
+        raise HTTPException(status_code=400, detail="sets required")
+    try:
+        sets = [
+            (int(s.get("furnace_user_item_id", 0)), [int(x) for x in (s.get("egg_ids") or [])])
+            for s in raw_sets
+        ]
+    except (AttributeError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="sets must be [{furnace_user_item_id, egg_ids}, ...]")
+    result = await do_furnace_hatch_batch(user_id, sets)
+    if not result.get("ok"):
+        detail = result.get("message", "hatch_failed")
+        if result.get("set_index") is not None:
+            detail = f"{detail}:{result['set_index']}"
+        raise HTTPException(status_code=400, detail=detail)
+    return result
+
+
 # ——— Фаза 3: крафт ———
 
 @router.post("/craft/furnace-upgrade")
@@ -676,6 +774,32 @@ async def api_craft_merge(
     return result
 
 
+@router.post("/craft/merge-batch")
+async def api_craft_merge_batch(
+    body: Dict[str, Any],
+    x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Пакетное слияние одной транзакцией. body: triples [[id1, id2, id3], ...] или rarity (все дубликаты), limit."""
+    telegram_id = _get_telegram_id(x_telegram_user_id, x_user_id)
+    user_id = await ensure_user(telegram_id)
+    triples = body.get("triples")
+    rarity = body.get("rarity")
+    if triples is not None and not isinstance(triples, list):
+        raise HTTPException(status_code=400, detail="triples must be a list of [id1, id2, id3]")
+    if rarity is not None and not isinstance(rarity, str):
+        raise HTTPException(status_code=400, detail="rarity must be a string")
+    try:
+        parsed = [[int(x) for x in t] for t in triples] if triples is not None else None
+        limit = int(body.get("limit", 200))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="triples must be a list of [id1, id2, id3]")
+    result = await craft_merge_batch(user_id, triples=parsed, rarity=rarity, limit=limit)
+    if not result.get("ok"):
+        raise HTTPException(status_code=400, detail=result.get("error", "craft_failed"))
+    return result
+
+
 @router.post("/craft/upgrade")
 async def api_craft_upgrade(
     body: Dict[str, Any],
@@ -955,9 +1079,18 @@ async def api_pnl_wallet_state(
 
 
 @router.get("/rates")
-async def api_rates(force_refresh: bool = False):
-    """Курсы для отображения цен: phxpw_price_ton (цена 1 PHXPW в TON), опционально phxpw_price_usd. Публичный, без авторизации."""
-    return await get_rates(force_refresh=force_refresh)
+async def api_rates(
+    force_refresh: bool = False,
+    x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
+    x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
+):
+    """Курсы для отображения цен: phxpw_price_ton (цена 1 PHXPW в TON), опционально phxpw_price_usd. Публичный, без авторизации; ответ из ленты курсов, без ожидания upstream. force_refresh — только админ."""
+    if force_refresh:
+        from config import GAME_ADMIN_TG_ID
+        if _get_telegram_id(x_telegram_user_id, x_user_id) != GAME_ADMIN_TG_ID:
+            raise HTTPException(status_code=403, detail="admin_only")
+        return await refresh_prices()
+    return await get_rates()
 
 
 @router.get("/stats")
@@ -988,10 +1121,9 @@ async def api_wallets_list(
     user_id = await ensure_user(telegram_id)
     rows = await list_user_wallet_bindings(user_id, telegram_id=telegram_id)
     wallets = []
-    for w in rows:
-        addr = w.get("wallet_address")
-        if addr:
-            friendly = await raw_to_friendly(addr)
+    friendlies = raw_to_friendly_many(w.get("wallet_address") or "" for w in rows)
+    for w, friendly in zip(rows, friendlies):
+        if friendly:
             masked = friendly[:8] + "…" + friendly[-4:] if len(friendly) > 14 else friendly
         else:
             friendly = None
@@ -1034,33 +1166,14 @@ async def api_wallet_verify(
     x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
     x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
 ):
-    """Проверить привязку кошелька: ищет входящую tx 0.1 TON или 4500 PHXPW с комментарием verify:telegram_id."""
+    """Проверить привязку кошелька: входящая tx 0.1 TON или 4500 PHXPW с комментарием verify:telegram_id, отправленная после создания привязки с ещё не привязанного кошелька — поиск по индексу wallet_verify_transfers (его наполняет фоновый wallet_verify_watch)."""
     telegram_id = _get_telegram_id(x_telegram_user_id, x_user_id)
     user_id = await ensure_user(telegram_id)
     verify_comment = f"verify:{telegram_id}"
     project_wallet = (PROJECT_WALLET_ADDRESS or "").strip()
     if not project_wallet:
         return {"ok": False, "reason": "project_wallet_not_configured"}
-    tx = await find_verification_tx(project_wallet, verify_comment)
-    if not tx:
-        return {"ok": False, "reason": "tx_not_found"}
-    binding = await get_user_wallet_binding_by_code(verify_comment)
-    if not binding:
-        return {"ok": False, "reason": "binding_not_found"}
-    wallet_address_raw = (tx.get("sender") or "").strip()
-    if not wallet_address_raw:
-        return {"ok": False, "reason": "sender_empty"}
-    # Конвертируем raw → friendly (UQ…) через Ton Center; при ошибке сохраняем raw
-    wallet_address = await raw_to_friendly(wallet_address_raw)
-    binding_id = binding["id"]
-    await update_wallet_binding_address(binding_id, wallet_address)
-    await set_wallet_binding_verified(binding_id)
-    await delete_pending_wallet_bindings_by_code(user_id, verify_comment)
-    return {
-        "ok": True,
-        "wallet_address": wallet_address,
-        "method": tx.get("method") or "ton",
-    }
+    return await verify_wallet_binding_by_transfer(user_id, verify_comment)
 
 
 @router.get("/nft/check")
@@ -1068,41 +1181,12 @@ async def api_nft_check(
     x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
     x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
 ):
-    """Проверить и вернуть список NFT от проекта (сминчены с кошелька разработчика). По привязанным верифицированным кошелькам. items — массив с полями address, name, image, collection_name для отображения в PnL."""
+    """Проверить и вернуть список NFT от проекта по привязанным верифицированным кошелькам — из локального индекса dev_nfts. items — массив с полями address, name, image, collection_name для отображения в PnL. TonAPI — только если индекс устарел."""
     telegram_id = _get_telegram_id(x_telegram_user_id, x_user_id)
     user_id = await ensure_user(telegram_id)
     rows = await list_user_wallet_bindings(user_id, telegram_id=telegram_id)
-    total_count = 0
-    has_any = False
-    wallets_checked = 0
-    all_items: List[Dict[str, Any]] = []
-    seen_addresses: set = set()
-    for w in rows:
-        if not w.get("verified_at") or not w.get("wallet_address"):
-            continue
-        addr = (w.get("wallet_address") or "").strip()
-        if not addr:
-            continue
-        try:
-            out = await check_user_has_project_nft(addr, return_items=True)
-        except Exception as e:
-            logger.warning("nft/check wallet %s: %s", addr[:16], e)
-            continue
-        wallets_checked += 1
-        if out.get("has_project_nft"):
-            has_any = True
-        total_count += out.get("count") or 0
-        for it in out.get("items") or []:
-            a = (it.get("address") or "").strip()
-            if a and a not in seen_addresses:
-                seen_addresses.add(a)
-                all_items.append(it)
-    return {
-        "has_project_nft": has_any,
-        "count": total_count,
-        "wallets_checked": wallets_checked,
-        "items": all_items,
-    }
+    wallets = [w["wallet_address"] for w in rows if w.get("verified_at") and w.get("wallet_address")]
+    return await check_project_nfts(wallets)
 
 
 @router.delete("/wallet/{binding_id}")
@@ -1235,42 +1319,22 @@ async def api_nft_user_nfts(
     x_telegram_user_id: Optional[str] = Header(None, alias="X-Telegram-User-Id"),
     x_user_id: Optional[str] = Header(None, alias="X-User-Id"),
 ):
-    """NFT из коллекций разработчика, принадлежащие текущему пользователю (по его привязанным кошелькам)."""
+    """NFT из коллекций разработчика, принадлежащие текущему пользователю (по его привязанным кошелькам). Только локальный индекс dev_nfts."""
     telegram_id = _get_telegram_id(x_telegram_user_id, x_user_id)
     user_id = await ensure_user(telegram_id)
     rows = await list_user_wallet_bindings(user_id, telegram_id=telegram_id)
-    wallet_addresses = []
-    for w in rows:
-        if not w.get("verified_at") or not w.get("wallet_address"):
-            continue
-        addr = (w["wallet_address"] or "").strip()
-        if addr:
-            friendly = await raw_to_friendly(addr)
-            wallet_addresses.append(friendly)
+    wallet_addresses = [
+        a for a in raw_to_friendly_many(
+            w["wallet_address"] for w in rows if w.get("verified_at") and w.get("wallet_address")
+        ) if a
+    ]
     nfts = await get_dev_nfts_for_user(wallet_addresses)
-    items = []
-    for n in nfts:
-        attrs = n.get("attributes") or []
-        if isinstance(attrs, str):
-            import json as _json
-            try:
-                attrs = _json.loads(attrs)
-            except Exception:
-                attrs = []
-        items.append({
-            "nft_address": n["nft_address"],
-            "collection_address": n["collection_address"],
-            "collection_name": n.get("collection_name") or "",
-            "name": n["name"],
-            "description": n.get("description") or "",
-            "image": n["image"],
-            "attributes": attrs,
-            "nft_index": n.get("nft_index") or 0,
-        })
+    synced_at = await nft_index_synced_at()
     return {
-        "count": len(items),
+        "count": len(nfts),
         "wallets_checked": len(wallet_addresses),
-        "items": items,
+        "items": [nft_catalog_item(n) for n in nfts],
+        "synced_at": synced_at.isoformat() if synced_at else None,
     }
 
 
@@ -1344,3 +1408,22 @@ async def api_nft_sync_trigger(
     from infrastructure.nft_sync import run_full_sync
     stats = await run_full_sync()
     return {"ok": True, **stats}
+
+
+@router.post("/nft/webhook")
+async def api_nft_webhook(
+    body: Dict[str, Any],
+    token: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None),
+):
+    """Вебхук TonAPI (account_tx): обновить индекс владельцев NFT. Включается NFT_WEBHOOK_SECRET."""
+    from config import NFT_WEBHOOK_SECRET
+    if not NFT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="webhook_disabled")
+    given = token or (authorization or "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(given.encode(), NFT_WEBHOOK_SECRET.encode()):
+        raise HTTPException(status_code=403, detail="bad_token")
+    account_id = (body.get("account_id") or "").strip()
+    if not account_id:
+        raise HTTPException(status_code=400, detail="account_id_required")
+    return {"ok": True, **await handle_nft_account_event(account_id)}
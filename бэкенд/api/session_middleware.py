@@ -6,8 +6,8 @@ Middleware: при наличии X-Session-Id и отсутствии X-Telegra
 import os
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-import httpx
 from infrastructure.database import get_telegram_id_by_user_id
+from infrastructure.http_client import get_http
 
 
 SESSIONS_SERVICE_URL = os.environ.get("SESSIONS_SERVICE_URL", "").rstrip("/")
@@ -20,11 +20,13 @@ class SessionResolveMiddleware(BaseHTTPMiddleware):
         if not SESSIONS_SERVICE_URL or not session_id or has_tg:
             return await call_next(request)
         try:
-            async with httpx.AsyncClient(timeout=3.0) as client:
-                r = await client.get(
-                    f"{SESSIONS_SERVICE_URL}/session/validate",
-                    params={"session_id": session_id.strip()},
-                )
+            r = await get_http().get(
+                f"{SESSIONS_SERVICE_URL}/session/validate",
+                params={"session_id": session_id.strip()},
+                timeout=3.0,
+                upstream="sessions_service",
+                retries=0,
+            )
             if r.status_code != 200:
                 return await call_next(request)
             data = r.json()
@@ -69,10 +69,24 @@ TON_API_URL = _env("TON_API_URL", "https://tonapi.io/v2")
 TON_API_KEY = _env("TON_API_KEY", "")
 PHOEX_TOKEN_ADDRESS = _env("PHOEX_TOKEN_ADDRESS", "EQABtSLSzrAOISWPfIjBl2VmeStkM1eHaPrUxRTj8mY-9h43")
 PROJECT_WALLET_ADDRESS = _env("PROJECT_WALLET_ADDRESS", "")
+# Как часто фоновый читатель забирает новые события кошелька проекта (переводы verify:…), секунды
+WALLET_VERIFY_POLL_SEC = int(_env("WALLET_VERIFY_POLL_SEC", "15"))
 # Кошелёк разработчика: все NFT проекта сминчены с него; по нему проверяем, есть ли у юзера NFT от проекта
 NFT_DEV_WALLET = _env("NFT_DEV_WALLET", "UQCFBaCdPYEnNVrk9BcplNWGzxXxd2JSOTKDFm4pU0PmxySD").strip()
 # Адреса коллекций Phoenix Paw (опционально): через запятую; если заданы, NFT из этих коллекций считаются «от проекта» без запроса owner по API
 NFT_DEV_COLLECTIONS = [a.strip() for a in _env("NFT_DEV_COLLECTIONS", "").strip().split(",") if a.strip()]
+# Лимиты TonAPI под тарифный план: запросов в секунду, размер всплеска, одновременных запросов
+TON_API_RPS = float(_env("TON_API_RPS", "1"))
+TON_API_BURST = int(_env("TON_API_BURST", "1"))
+TON_API_CONCURRENCY = int(_env("TON_API_CONCURRENCY", "4"))
+# Как часто делать полный синк NFT (часы); между ними — инкрементальный по изменившимся коллекциям
+NFT_FULL_SYNC_INTERVAL_HOURS = float(_env("NFT_FULL_SYNC_INTERVAL_HOURS", "6"))
+# Индекс владельцев NFT (dev_nfts) считается устаревшим, если успешного синка не было дольше (сек); тогда /nft/check идёт в TonAPI
+NFT_INDEX_MAX_AGE_SEC = int(_env("NFT_INDEX_MAX_AGE_SEC", "3600"))
+# Сколько секунд помнить живой ответ TonAPI по кошельку при устаревшем индексе (не чаще одного запроса на кошелёк)
+NFT_LIVE_FALLBACK_TTL_SEC = int(_env("NFT_LIVE_FALLBACK_TTL_SEC", "600"))
+# Секрет вебхука TonAPI для POST /api/game/nft/webhook (?token=… или Authorization: Bearer …); пусто — вебхук выключен
+NFT_WEBHOOK_SECRET = _env("NFT_WEBHOOK_SECRET", "").strip()
 GAME_ADMIN_TG_ID = int(_env("GAME_ADMIN_TG_ID", "496560064"))
 GAME_NOTIFY_BOT_TOKEN = _env("GAME_NOTIFY_BOT_TOKEN", "")
 PHOENIX_QUEST_REWARD_AMOUNT = int(_env("PHOENIX_QUEST_REWARD_AMOUNT", "100000"))
@@ -86,6 +100,12 @@ PHOENIX_QUEST_SUBMIT_RATE_LIMIT_SEC = int(_env("PHOENIX_QUEST_SUBMIT_RATE_LIMIT_
 BURN_DIMINISHING_AFTER = int(_env("BURN_DIMINISHING_AFTER", "50"))
 # Telegram bot (для проверки пользователя в чате/канале getChatMember)
 BOT_TOKEN = _env("BOT_TOKEN", "")
+# Кэш membership (chat_id, user_id): TTL «в чате» / «не в чате», сек
+TG_MEMBER_TTL_POSITIVE = int(_env("TG_MEMBER_TTL_POSITIVE", "600"))
+TG_MEMBER_TTL_NEGATIVE = int(_env("TG_MEMBER_TTL_NEGATIVE", "60"))
+# Лимиты Bot API для пакетных проверок: запросов/сек и параллельных запросов
+TG_API_RPS = float(_env("TG_API_RPS", "25"))
+TG_API_CONCURRENCY = int(_env("TG_API_CONCURRENCY", "8"))
 
 # iCryptoCheck (переводы/вывод)
 ICRYPTOCHECK_API_URL = _env("ICRYPTOCHECK_API_URL", "https://api.icryptocheck.com/api/v1").rstrip("/")
@@ -1,20 +1,20 @@
 """
 Крафт: merge, upgrade, reroll по 05_Крафт_и_слияние (схема B: COINS + STARS).
+
+Каждый крафт — одна транзакция на одном соединении:
+1. списание COINS и STARS одним UPDATE (нехватка любой валюты — откат);
+2. входные предметы одним SELECT ... FOR UPDATE;
+3. новые предметы одним INSERT ... SELECT unnest;
+4. удаления, повышение уровня, item_events и crafting_log — одним запросом с CTE.
+Списки определений по редкости — из справочника в памяти (infrastructure.catalog).
 """
 import json
 import random
-from typing import Any, Dict, List, Optional
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from infrastructure.database import (
-    add_user_item,
-    deduct_balance,
-    ensure_balance_row,
-    get_item_def_id_by_key,
-    get_item_def_ids_by_rarity,
-    get_user_buildings,
-    get_user_balances,
-    record_item_event,
-)
+from infrastructure.catalog import ItemCatalog, get_item_catalog
+from infrastructure.database import get_pool
 
 
 # Схема B: стоимость и шансы
@@ -35,153 +35,260 @@ REROLL_STARS = 500
 REROLL_SUCCESS = 0.85
 REROLL_BREAK = 0.15
 
+MAX_ITEM_LEVEL = 5
+# Пакетное слияние: максимум троек за один запрос
+MERGE_BATCH_MAX = 200
 
-async def _get_item(user_id: int, item_id: int) -> Optional[Dict[str, Any]]:
-    from infrastructure.database import get_pool
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """SELECT ui.id, ui.user_id, ui.item_def_id, ui.state, ui.item_level, ui.meta,
-                      id.rarity, id.item_type, id.key AS item_key, id.subtype
-               FROM user_items ui JOIN item_defs id ON id.id = ui.item_def_id
-               WHERE ui.user_id = $1 AND ui.id = $2 AND ui.state = 'inventory'""",
-            user_id, item_id,
-        )
-    if not row:
-        return None
-    return dict(row)
 
+class CraftAbort(Exception):
+    """Крафт отклонён: транзакция откатывается, клиенту уходит {"ok": False, "error": error}."""
 
-async def _delete_item(item_id: int) -> None:
-    from infrastructure.database import get_pool
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute("DELETE FROM user_items WHERE id = $1", item_id)
+    def __init__(self, error: str):
+        super().__init__(error)
+        self.error = error
 
 
-async def _log_craft(
-    user_id: int, action: str, input_ids: List[int],
-    output_item_id: Optional[int], dust_spent: int, result: Dict[str, Any],
-) -> None:
-    from infrastructure.database import get_pool
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """INSERT INTO crafting_log (user_id, action, input_item_ids, output_item_id, dust_spent, result_json)
-               VALUES ($1, $2, $3, $4, $5, $6)""",
-            user_id, action, input_ids, output_item_id, dust_spent, json.dumps(result),
-        )
+class CraftChanges:
+    """Изменения одной транзакции крафта (одного или пачки): применяются set-based в _apply."""
 
+    def __init__(self) -> None:
+        self.delete_ids: List[int] = []
+        self.level_ups: List[int] = []
+        # (item_def_id, item_level, meta)
+        self.new_items: List[Tuple[int, int, Dict[str, Any]]] = []
+        # (item_def_id, event_type, ref_type, ref_id, индекс нового предмета для ref_id)
+        self.events: List[Tuple[int, str, Optional[str], Optional[int], Optional[int]]] = []
+        # (action, input_ids, output_item_id, индекс нового предмета, dust_spent, result)
+        self.logs: List[Tuple[str, List[int], Optional[int], Optional[int], int, Dict[str, Any]]] = []
 
-async def craft_merge(user_id: int, item_ids: List[int]) -> Dict[str, Any]:
+    def add_item(self, item_def_id: int, item_level: int, meta: Optional[Dict[str, Any]] = None) -> int:
+        self.new_items.append((item_def_id, item_level, meta or {}))
+        return len(self.new_items) - 1
+
+    def event(self, item_def_id: int, event_type: str, ref_type: Optional[str] = None,
+              ref_id: Optional[int] = None, new_idx: Optional[int] = None) -> None:
+        self.events.append((item_def_id, event_type, ref_type, ref_id, new_idx))
+
+    def log(self, action: str, input_ids: List[int], output_item_id: Optional[int], dust_spent: int,
+            result: Dict[str, Any], new_idx: Optional[int] = None) -> None:
+        self.logs.append((action, list(input_ids), output_item_id, new_idx, dust_spent, result))
+
+
+async def lock_items(conn, user_id: int, item_ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """Предметы игрока в инвентаре одним SELECT ... FOR UPDATE (чужие/занятые — просто не вернутся)."""
+    rows = await conn.fetch(
+        """SELECT id, item_def_id, item_level, meta
+           FROM user_items
+           WHERE user_id = $1 AND id = ANY($2::int[]) AND state = 'inventory'
+           ORDER BY id
+           FOR UPDATE""",
+        user_id, list(item_ids),
+    )
+    return {int(r["id"]): dict(r) for r in rows}
+
+
+async def debit(conn, user_id: int, coins: int, stars: int) -> bool:
+    """Списать COINS и STARS одним UPDATE. False — не хватило хотя бы одной валюты (строки не тронуты только при откате)."""
+    need = [(c, a) for c, a in (("COINS", coins), ("STARS", stars)) if a > 0]
+    if not need:
+        return True
+    rows = await conn.fetch(
+        """UPDATE user_balances b
+           SET balance = b.balance - c.amount, updated_at = NOW()
+           FROM unnest($2::text[], $3::bigint[]) AS c(currency, amount)
+           WHERE b.user_id = $1 AND b.currency = c.currency AND b.balance >= c.amount
+           RETURNING b.currency""",
+        user_id, [c for c, _ in need], [a for _, a in need],
+    )
+    return len(rows) == len(need)
+
+
+async def lock_balances(conn, user_id: int) -> None:
     """
-    Merge 3 реликвий одного типа. Стоимость 900 COINS + 1800 STARS.
-    Результат: 80% обычный, 17% +1 уровень, 3% слом.
+    Заблокировать строки COINS/STARS пользователя. Порядок блокировок во всех операциях крафта:
+    сначала баланс, потом предметы — иначе параллельные вызовы ловят дедлок.
     """
-    if len(item_ids) != 3:
-        return {"ok": False, "error": "need_3_items"}
-    await ensure_balance_row(user_id, "COINS")
-    await ensure_balance_row(user_id, "STARS")
-    balances = await get_user_balances(user_id)
-    if balances.get("COINS", 0) < MERGE3_COINS or balances.get("STARS", 0) < MERGE3_STARS:
-        return {"ok": False, "error": "insufficient_balance"}
-    items = [await _get_item(user_id, iid) for iid in item_ids]
-    if any(x is None for x in items):
-        return {"ok": False, "error": "item_not_found"}
-    rarities = [x["rarity"] for x in items]
-    if len(set(rarities)) != 1:
-        return {"ok": False, "error": "same_type_required"}
-    rarity = rarities[0]
-    avg_level = sum(x["item_level"] for x in items) // 3
-    await deduct_balance(user_id, "COINS", MERGE3_COINS)
-    await deduct_balance(user_id, "STARS", MERGE3_STARS)
+    await conn.execute(
+        """SELECT 1 FROM user_balances
+           WHERE user_id = $1 AND currency IN ('COINS', 'STARS')
+           ORDER BY currency
+           FOR UPDATE""",
+        user_id,
+    )
+
+
+async def apply_changes(conn, user_id: int, ch: CraftChanges) -> List[int]:
+    """Применить изменения: INSERT новых предметов, затем одним запросом удаления, уровни, события, лог."""
+    new_ids: List[int] = []
+    if ch.new_items:
+        rows = await conn.fetch(
+            """INSERT INTO user_items (user_id, item_def_id, state, item_level, meta)
+               SELECT $1, t.def_id, 'inventory', t.lvl, t.meta::jsonb
+               FROM unnest($2::int[], $3::int[], $4::text[]) WITH ORDINALITY AS t(def_id, lvl, meta, ord)
+               ORDER BY t.ord
+               RETURNING id""",
+            user_id,
+            [d for d, _, _ in ch.new_items],
+            [lvl for _, lvl, _ in ch.new_items],
+            [json.dumps(m) for _, _, m in ch.new_items],
+        )
+        # id из SERIAL выдаются в порядке вставки — сортировка восстанавливает порядок new_items
+        new_ids = sorted(int(r["id"]) for r in rows)
+
+    def _ref(ref_id: Optional[int], new_idx: Optional[int]) -> Optional[int]:
+        return new_ids[new_idx] if new_idx is not None else ref_id
+
+    await conn.execute(
+        """WITH del AS (
+               DELETE FROM user_items WHERE user_id = $1 AND id = ANY($2::int[]) RETURNING id
+           ),
+           lvl AS (
+               UPDATE user_items SET item_level = item_level + 1
+               WHERE user_id = $1 AND id = ANY($3::int[]) RETURNING id
+           ),
+           ev AS (
+               INSERT INTO item_events (item_def_id, event_type, user_id, quantity, ref_type, ref_id, meta)
+               SELECT e.def_id, e.event_type, $1, 1, e.ref_type, e.ref_id, '{}'::jsonb
+               FROM unnest($4::int[], $5::text[], $6::text[], $7::bigint[]) AS e(def_id, event_type, ref_type, ref_id)
+           )
+           INSERT INTO crafting_log (user_id, action, input_item_ids, output_item_id, dust_spent, result_json)
+           SELECT $1, l.action, l.inputs::int[], l.output_id, l.dust, l.result::jsonb
+           FROM unnest($8::text[], $9::text[], $10::int[], $11::bigint[], $12::text[])
+                AS l(action, inputs, output_id, dust, result)""",
+        user_id,
+        ch.delete_ids,
+        ch.level_ups,
+        [e[0] for e in ch.events],
+        [e[1] for e in ch.events],
+        [e[2] for e in ch.events],
+        [_ref(e[3], e[4]) for e in ch.events],
+        [lg[0] for lg in ch.logs],
+        ["{" + ",".join(str(i) for i in lg[1]) + "}" for lg in ch.logs],
+        [_ref(lg[2], lg[3]) for lg in ch.logs],
+        [lg[4] for lg in ch.logs],
+        [json.dumps(lg[5]) for lg in ch.logs],
+    )
+    return new_ids
+
+
+# ——— Правила крафта: решают исход по заблокированным строкам и пишут в CraftChanges ———
+# Все plan_* принимают список заблокированных входов (items) и CraftChanges.
+
+def plan_merge(items: List[Dict[str, Any]], ch: CraftChanges, cat: ItemCatalog, rng=random) -> Dict[str, Any]:
+    """Исход слияния 3 предметов. В результате "_new_idx" — индекс нового предмета в ch.new_items."""
+    item_ids = [it["id"] for it in items]
+    defs = [cat.get(it["item_def_id"]) for it in items]
+    if any(d is None for d in defs) or len({d.rarity for d in defs}) != 1:
+        raise CraftAbort("same_type_required")
+    rarity = defs[0].rarity
+    avg_level = sum(it["item_level"] for it in items) // 3
+    dust = MERGE3_COINS + MERGE3_STARS
     for it in items:
-        await record_item_event(it["item_def_id"], "merge_input", user_id, 1, ref_type="craft", ref_id=it["id"])
-    for iid in item_ids:
-        await _delete_item(iid)
-    r = random.random()
-    if r < MERGE3_BREAK:
-        for it in items:
-            await record_item_event(it["item_def_id"], "merge_break", user_id, 1)
-        await _log_craft(user_id, "merge", item_ids, None, MERGE3_COINS + MERGE3_STARS, {"result": "break"})
-        return {"ok": True, "result": "break", "output_item_id": None}
-    new_level = avg_level if r < MERGE3_NORMAL else min(5, avg_level + 1)
-    if r >= MERGE3_NORMAL + MERGE3_UP:
-        new_level = min(5, avg_level + 2)
-    def_ids = await get_item_def_ids_by_rarity(rarity)
+        ch.event(it["item_def_id"], "merge_input", "craft", it["id"])
+    ch.delete_ids.extend(item_ids)
+    r = rng.random()
+    def_ids = cat.def_ids_by_rarity(rarity) if r >= MERGE3_BREAK else []
     if not def_ids:
         for it in items:
-            await record_item_event(it["item_def_id"], "merge_break", user_id, 1)
-        await _log_craft(user_id, "merge", item_ids, None, MERGE3_COINS + MERGE3_STARS, {"result": "break"})
+            ch.event(it["item_def_id"], "merge_break")
+        ch.log("merge", item_ids, None, dust, {"result": "break"})
         return {"ok": True, "result": "break", "output_item_id": None}
-    new_item_def_id = random.choice(def_ids)
-    new_id = await add_user_item(user_id, new_item_def_id, item_level=new_level)
-    await record_item_event(new_item_def_id, "merge_output", user_id, 1, ref_type="craft", ref_id=new_id)
-    await _log_craft(user_id, "merge", item_ids, new_id, MERGE3_COINS + MERGE3_STARS, {"result": "ok", "level": new_level})
-    return {"ok": True, "result": "ok", "output_item_id": new_id, "level": new_level}
+    new_level = avg_level if r < MERGE3_NORMAL else min(MAX_ITEM_LEVEL, avg_level + 1)
+    if r >= MERGE3_NORMAL + MERGE3_UP:
+        new_level = min(MAX_ITEM_LEVEL, avg_level + 2)
+    new_def_id = rng.choice(def_ids)
+    idx = ch.add_item(new_def_id, new_level)
+    ch.event(new_def_id, "merge_output", "craft", new_idx=idx)
+    ch.log("merge", item_ids, None, dust, {"result": "ok", "level": new_level}, new_idx=idx)
+    return {"ok": True, "result": "ok", "output_item_id": None, "level": new_level, "_new_idx": idx}
 
 
-async def craft_upgrade(user_id: int, item_id: int) -> Dict[str, Any]:
-    """Upgrade 1 предмет. Стоимость 1200 COINS + 2500 STARS. 75% +1, 20% без изменений, 5% слом."""
-    await ensure_balance_row(user_id, "COINS")
-    await ensure_balance_row(user_id, "STARS")
-    balances = await get_user_balances(user_id)
-    if balances.get("COINS", 0) < UPGRADE_COINS or balances.get("STARS", 0) < UPGRADE_STARS:
-        return {"ok": False, "error": "insufficient_balance"}
-    item = await _get_item(user_id, item_id)
-    if not item:
-        return {"ok": False, "error": "item_not_found"}
-    level = item["item_level"]
-    if level >= 5:
-        return {"ok": False, "error": "max_level"}
-    await deduct_balance(user_id, "COINS", UPGRADE_COINS)
-    await deduct_balance(user_id, "STARS", UPGRADE_STARS)
-    await record_item_event(item["item_def_id"], "upgrade_input", user_id, 1, ref_type="craft", ref_id=item_id)
-    r = random.random()
+def plan_upgrade(items: List[Dict[str, Any]], ch: CraftChanges, rng=random) -> Dict[str, Any]:
+    item = items[0]
+    item_id, level = item["id"], item["item_level"]
+    if level >= MAX_ITEM_LEVEL:
+        raise CraftAbort("max_level")
+    dust = UPGRADE_COINS + UPGRADE_STARS
+    ch.event(item["item_def_id"], "upgrade_input", "craft", item_id)
+    r = rng.random()
     if r < UPGRADE_BREAK:
-        await _delete_item(item_id)
-        await record_item_event(item["item_def_id"], "upgrade_break", user_id, 1)
-        await _log_craft(user_id, "upgrade", [item_id], None, UPGRADE_COINS + UPGRADE_STARS, {"result": "break"})
+        ch.delete_ids.append(item_id)
+        ch.event(item["item_def_id"], "upgrade_break")
+        ch.log("upgrade", [item_id], None, dust, {"result": "break"})
         return {"ok": True, "result": "break", "output_item_id": None}
     if r < UPGRADE_SUCCESS + UPGRADE_BREAK:
-        from infrastructure.database import get_pool
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            await conn.execute(
-                "UPDATE user_items SET item_level = item_level + 1 WHERE id = $1",
-                item_id,
-            )
-        await record_item_event(item["item_def_id"], "upgrade_ok", user_id, 1)
-        await _log_craft(user_id, "upgrade", [item_id], item_id, UPGRADE_COINS + UPGRADE_STARS, {"result": "ok", "level": level + 1})
+        ch.level_ups.append(item_id)
+        ch.event(item["item_def_id"], "upgrade_ok")
+        ch.log("upgrade", [item_id], item_id, dust, {"result": "ok", "level": level + 1})
         return {"ok": True, "result": "ok", "output_item_id": item_id, "level": level + 1}
-    await _log_craft(user_id, "upgrade", [item_id], item_id, UPGRADE_COINS + UPGRADE_STARS, {"result": "same"})
+    ch.log("upgrade", [item_id], item_id, dust, {"result": "same"})
     return {"ok": True, "result": "same", "output_item_id": item_id, "level": level}
 
 
-async def craft_reroll(user_id: int, item_id: int) -> Dict[str, Any]:
-    """Reroll: новый эффект 85%, поломка 15%. Стоимость 500 COINS + 500 STARS."""
-    await ensure_balance_row(user_id, "COINS")
-    await ensure_balance_row(user_id, "STARS")
-    balances = await get_user_balances(user_id)
-    if balances.get("COINS", 0) < REROLL_COINS or balances.get("STARS", 0) < REROLL_STARS:
-        return {"ok": False, "error": "insufficient_balance"}
-    item = await _get_item(user_id, item_id)
-    if not item:
-        return {"ok": False, "error": "item_not_found"}
-    await deduct_balance(user_id, "COINS", REROLL_COINS)
-    await deduct_balance(user_id, "STARS", REROLL_STARS)
-    await record_item_event(item["item_def_id"], "reroll_input", user_id, 1, ref_type="craft", ref_id=item_id)
-    r = random.random()
-    if r < REROLL_BREAK:
-        await _delete_item(item_id)
-        await record_item_event(item["item_def_id"], "reroll_break", user_id, 1)
-        await _log_craft(user_id, "reroll", [item_id], None, REROLL_COINS + REROLL_STARS, {"result": "break"})
+def plan_reroll(items: List[Dict[str, Any]], ch: CraftChanges, rng=random) -> Dict[str, Any]:
+    item = items[0]
+    item_id = item["id"]
+    dust = REROLL_COINS + REROLL_STARS
+    ch.event(item["item_def_id"], "reroll_input", "craft", item_id)
+    if rng.random() < REROLL_BREAK:
+        ch.delete_ids.append(item_id)
+        ch.event(item["item_def_id"], "reroll_break")
+        ch.log("reroll", [item_id], None, dust, {"result": "break"})
         return {"ok": True, "result": "break", "output_item_id": None}
-    await record_item_event(item["item_def_id"], "reroll_ok", user_id, 1)
-    await _log_craft(user_id, "reroll", [item_id], item_id, REROLL_COINS + REROLL_STARS, {"result": "ok"})
+    ch.event(item["item_def_id"], "reroll_ok")
+    ch.log("reroll", [item_id], item_id, dust, {"result": "ok"})
     return {"ok": True, "result": "ok", "output_item_id": item_id}
 
 
+def resolve_outputs(results: List[Dict[str, Any]], new_ids: List[int]) -> None:
+    """Подставить id созданных предметов вместо "_new_idx"."""
+    for res in results:
+        idx = res.pop("_new_idx", None)
+        if idx is not None:
+            res["output_item_id"] = new_ids[idx]
+
+
+async def _run_craft(user_id: int, item_ids: List[int], coins: int, stars: int, plan) -> Dict[str, Any]:
+    """Общий каркас: одна транзакция — списание, блокировка входов, план plan(items, ch), применение."""
+    pool = await get_pool()
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if not await debit(conn, user_id, coins, stars):
+                    raise CraftAbort("insufficient_balance")
+                locked = await lock_items(conn, user_id, item_ids)
+                if len(locked) != len(set(item_ids)) or len(set(item_ids)) != len(item_ids):
+                    raise CraftAbort("item_not_found")
+                ch = CraftChanges()
+                result = plan([locked[i] for i in item_ids], ch)
+                new_ids = await apply_changes(conn, user_id, ch)
+    except CraftAbort as e:
+        return {"ok": False, "error": e.error}
+    resolve_outputs([result], new_ids)
+    return result
+
+
+async def craft_merge(user_id: int, item_ids: List[int]) -> Dict[str, Any]:
+    """
+    Merge 3 реликвий одного типа. Стоимость 900 COINS + 1800 STARS.
+    Результат: 80% обычный, 17% +1 уровень, 3% слом.
+    """
+    if len(item_ids) != 3:
+        return {"ok": False, "error": "need_3_items"}
+    cat = await get_item_catalog()
+    return await _run_craft(user_id, item_ids, MERGE3_COINS, MERGE3_STARS, partial(plan_merge, cat=cat))
+
+
+async def craft_upgrade(user_id: int, item_id: int) -> Dict[str, Any]:
+    """Upgrade 1 предмет. Стоимость 1200 COINS + 2500 STARS. 75% +1, 20% без изменений, 5% слом."""
+    return await _run_craft(user_id, [item_id], UPGRADE_COINS, UPGRADE_STARS, plan_upgrade)
+
+
+async def craft_reroll(user_id: int, item_id: int) -> Dict[str, Any]:
+    """Reroll: новый эффект 85%, поломка 15%. Стоимость 500 COINS + 500 STARS."""
+    return await _run_craft(user_id, [item_id], REROLL_COINS, REROLL_STARS, plan_reroll)
+
+
 async def craft_furnace_upgrade(
     user_id: int,
     furnace_item_id_1: int,
@@ -193,28 +300,123 @@ async def craft_furnace_upgrade(
     Апгрейд печки в мастерской: 2 печки одного цвета + 1 любой предмет + просмотр рекламы.
     Результат: 1 печка того же цвета с улучшенным шансом (meta improved).
     """
-    buildings = await get_user_buildings(user_id)
-    if "workshop" not in buildings:
-        return {"ok": False, "error": "workshop_required"}
-    if not ad_watched:
-        return {"ok": False, "error": "ad_watched_required"}
-    f1 = await _get_item(user_id, furnace_item_id_1)
-    f2 = await _get_item(user_id, furnace_item_id_2)
-    extra = await _get_item(user_id, extra_item_id)
-    if not f1 or not f2 or not extra:
-        return {"ok": False, "error": "item_not_found"}
-    if f1["item_type"] != "furnace" or f2["item_type"] != "furnace":
-        return {"ok": False, "error": "need_two_furnaces"}
-    if f1["item_def_id"] != f2["item_def_id"]:
-        return {"ok": False, "error": "same_furnace_color_required"}
-    color = f1.get("subtype") or (f1.get("item_key") or "").replace("furnace_", "")
-    for iid in (furnace_item_id_1, furnace_item_id_2, extra_item_id):
-        await _delete_item(iid)
-    meta = {"improved": True}
-    new_id = await add_user_item(user_id, f1["item_def_id"], item_level=1, meta=meta)
-    await _log_craft(
-        user_id, "furnace_upgrade",
-        [furnace_item_id_1, furnace_item_id_2, extra_item_id],
-        new_id, 0, {"color": color, "improved": True},
-    )
-    return {"ok": True, "result": "ok", "output_item_id": new_id, "furnace_color": color}
+    item_ids = [furnace_item_id_1, furnace_item_id_2, extra_item_id]
+    cat = await get_item_catalog()
+    pool = await get_pool()
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                has_workshop = await conn.fetchval(
+                    "SELECT EXISTS(SELECT 1 FROM user_buildings WHERE user_id = $1 AND building_key = 'workshop')",
+                    user_id,
+                )
+                if not has_workshop:
+                    raise CraftAbort("workshop_required")
+                if not ad_watched:
+                    raise CraftAbort("ad_watched_required")
+                locked = await lock_items(conn, user_id, item_ids)
+                if len(set(item_ids)) != 3 or len(locked) != 3:
+                    raise CraftAbort("item_not_found")
+                f1, f2 = locked[furnace_item_id_1], locked[furnace_item_id_2]
+                d1, d2 = cat.get(f1["item_def_id"]), cat.get(f2["item_def_id"])
+                if not d1 or not d2 or d1.item_type != "furnace" or d2.item_type != "furnace":
+                    raise CraftAbort("need_two_furnaces")
+                if f1["item_def_id"] != f2["item_def_id"]:
+                    raise CraftAbort("same_furnace_color_required")
+                color = d1.subtype or (d1.key or "").replace("furnace_", "")
+                ch = CraftChanges()
+                ch.delete_ids.extend(item_ids)
+                idx = ch.add_item(f1["item_def_id"], 1, {"improved": True})
+                ch.log("furnace_upgrade", item_ids, None, 0, {"color": color, "improved": True}, new_idx=idx)
+                new_ids = await apply_changes(conn, user_id, ch)
+    except CraftAbort as e:
+        return {"ok": False, "error": e.error}
+    return {"ok": True, "result": "ok", "output_item_id": new_ids[idx], "furnace_color": color}
+
+
+def _duplicate_triples(items: List[Dict[str, Any]], limit: int) -> List[List[Dict[str, Any]]]:
+    """Тройки дубликатов (один item_def_id): сначала предметы высокого уровня, остаток < 3 не трогаем."""
+    by_def: Dict[int, List[Dict[str, Any]]] = {}
+    for it in items:
+        by_def.setdefault(it["item_def_id"], []).append(it)
+    triples: List[List[Dict[str, Any]]] = []
+    for def_id in sorted(by_def):
+        group = sorted(by_def[def_id], key=lambda it: (-it["item_level"], it["id"]))
+        for i in range(0, len(group) - 2, 3):
+            if len(triples) >= limit:
+                return triples
+            triples.append(group[i:i + 3])
+    return triples
+
+
+async def craft_merge_batch(
+    user_id: int,
+    triples: Optional[List[List[int]]] = None,
+    rarity: Optional[str] = None,
+    limit: int = MERGE_BATCH_MAX,
+) -> Dict[str, Any]:
+    """
+    Пакетный merge: список троек item_ids или все дубликаты реликвий/амулетов редкости rarity
+    (тройки одного item_def_id). Пачка проверяется и оплачивается целиком (N × 900 COINS + N × 1800 STARS),
+    исходы — из одного генератора, запись — одной транзакцией. Любая ошибка отменяет всю пачку.
+    """
+    limit = max(1, min(int(limit), MERGE_BATCH_MAX))
+    if triples is not None:
+        if not triples or any(len(t) != 3 for t in triples):
+            return {"ok": False, "error": "need_3_items"}
+        if len(triples) > MERGE_BATCH_MAX:
+            return {"ok": False, "error": "batch_too_large"}
+        flat = [int(i) for t in triples for i in t]
+        if len(set(flat)) != len(flat):
+            return {"ok": False, "error": "duplicate_item_ids"}
+    elif not rarity:
+        return {"ok": False, "error": "triples_or_rarity_required"}
+
+    cat = await get_item_catalog()
+    if triples is None and not cat.def_ids_by_rarity(rarity):
+        return {"ok": False, "error": "unknown_rarity"}
+    rng = random.Random()
+    pool = await get_pool()
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # Стоимость зависит от числа троек, которое известно только после выборки предметов,
+                # поэтому баланс блокируется заранее — тот же порядок, что в _run_craft
+                await lock_balances(conn, user_id)
+                if triples is not None:
+                    locked = await lock_items(conn, user_id, flat)
+                    if len(locked) != len(flat):
+                        raise CraftAbort("item_not_found")
+                    groups = [[locked[int(i)] for i in t] for t in triples]
+                else:
+                    rows = await conn.fetch(
+                        """SELECT id, item_def_id, item_level, meta
+                           FROM user_items
+                           WHERE user_id = $1 AND item_def_id = ANY($2::int[]) AND state = 'inventory'
+                           ORDER BY id
+                           FOR UPDATE""",
+                        user_id, cat.def_ids_by_rarity(rarity),
+                    )
+                    groups = _duplicate_triples([dict(r) for r in rows], limit)
+                    if not groups:
+                        raise CraftAbort("no_duplicates")
+                n = len(groups)
+                if not await debit(conn, user_id, n * MERGE3_COINS, n * MERGE3_STARS):
+                    raise CraftAbort("insufficient_balance")
+                ch = CraftChanges()
+                results = [plan_merge(g, ch, cat, rng) for g in groups]
+                new_ids = await apply_changes(conn, user_id, ch)
+    except CraftAbort as e:
+        return {"ok": False, "error": e.error}
+    resolve_outputs(results, new_ids)
+    for g, res in zip(groups, results):
+        res["input_item_ids"] = [it["id"] for it in g]
+    return {
+        "ok": True,
+        "merges": n,
+        "coins_spent": n * MERGE3_COINS,
+        "stars_spent": n * MERGE3_STARS,
+        "ok_count": sum(1 for r in results if r["result"] == "ok"),
+        "break_count": sum(1 for r in results if r["result"] == "break"),
+        "results": results,
+    }
@@ -0,0 +1,101 @@
+"""
+Справочник item_defs, eggs_def, egg_hatch_pool и familiars_def в памяти процесса.
+
+Эти таблицы меняются только сидом в init_db, поэтому крафт и вылупление не ходят за ними
+в БД на каждый запрос: снимок перечитывается раз в CATALOG_TTL секунд (или после invalidate_catalog()).
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from infrastructure.database import get_pool
+
+CATALOG_TTL = 300
+# Типы, которые выпадают результатом слияния (как в get_item_def_ids_by_rarity)
+MERGE_OUTPUT_TYPES = ("relic_slot", "amulet")
+
+
+class ItemDef:
+    __slots__ = ("id", "key", "item_type", "subtype", "name", "rarity")
+
+    def __init__(self, id: int, key: str, item_type: str, subtype: str, name: str, rarity: str):
+        self.id = id
+        self.key = key
+        self.item_type = item_type
+        self.subtype = subtype
+        self.name = name
+        self.rarity = rarity
+
+
+class ItemCatalog:
+    """Неизменяемый снимок: item_defs по id и key, id реликвий/амулетов по редкости, яйца, пулы вылупления, фамильяры."""
+
+    def __init__(
+        self,
+        defs: List[ItemDef],
+        egg_rarities: Optional[Dict[str, str]] = None,
+        hatch_pools: Optional[Dict[Tuple[str, str], List[Tuple[str, int]]]] = None,
+        familiar_def_ids: Optional[List[int]] = None,
+    ):
+        self.by_id: Dict[int, ItemDef] = {d.id: d for d in defs}
+        self.by_key: Dict[str, ItemDef] = {d.key: d for d in defs}
+        by_rarity: Dict[str, List[int]] = {}
+        for d in defs:
+            if d.item_type in MERGE_OUTPUT_TYPES:
+                by_rarity.setdefault(d.rarity, []).append(d.id)
+        self.merge_pool: Dict[str, List[int]] = {r: sorted(ids) for r, ids in by_rarity.items()}
+        self.egg_rarities: Dict[str, str] = egg_rarities or {}
+        self.hatch_pools: Dict[Tuple[str, str], List[Tuple[str, int]]] = hatch_pools or {}
+        self.familiar_def_ids: List[int] = sorted(familiar_def_ids or [])
+        self.loaded_at = time.monotonic()
+
+    def get(self, item_def_id: int) -> Optional[ItemDef]:
+        return self.by_id.get(item_def_id)
+
+    def def_ids_by_rarity(self, rarity: str) -> List[int]:
+        return self.merge_pool.get(rarity, [])
+
+    def egg_rarity(self, color: str) -> str:
+        """Редкость яйца по цвету (как get_eggs_def_rarity: неизвестный цвет — common)."""
+        return self.egg_rarities.get(color, "common")
+
+    def hatch_outcomes(self, color: str, rarity: str) -> List[Tuple[str, int]]:
+        """(outcome_type, weight) для вылупления; пустой пул — только ресурсы."""
+        return self.hatch_pools.get((color, rarity)) or [("resource", 100)]
+
+
+_catalog: Optional[ItemCatalog] = None
+_lock = asyncio.Lock()
+
+
+async def get_item_catalog() -> ItemCatalog:
+    global _catalog
+    cat = _catalog
+    if cat is not None and time.monotonic() - cat.loaded_at < CATALOG_TTL:
+        return cat
+    async with _lock:
+        cat = _catalog
+        if cat is None or time.monotonic() - cat.loaded_at >= CATALOG_TTL:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                rows = await conn.fetch("SELECT id, key, item_type, subtype, name, rarity FROM item_defs")
+                eggs = await conn.fetch("SELECT color, rarity FROM eggs_def")
+                hatch = await conn.fetch(
+                    "SELECT egg_color, egg_rarity, outcome_type, weight FROM egg_hatch_pool ORDER BY id"
+                )
+                familiars = await conn.fetch("SELECT id FROM familiars_def")
+            hatch_pools: Dict[Tuple[str, str], List[Tuple[str, int]]] = {}
+            for r in hatch:
+                hatch_pools.setdefault((r["egg_color"], r["egg_rarity"]), []).append((r["outcome_type"], int(r["weight"])))
+            cat = _catalog = ItemCatalog(
+                [ItemDef(int(r["id"]), r["key"], r["item_type"], r["subtype"], r["name"], r["rarity"]) for r in rows],
+                egg_rarities={r["color"]: r["rarity"] for r in eggs},
+                hatch_pools=hatch_pools,
+                familiar_def_ids=[int(r["id"]) for r in familiars],
+            )
+    return cat
+
+
+def invalidate_catalog() -> None:
+    global _catalog
+    _catalog = None
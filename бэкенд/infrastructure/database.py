@@ -2,7 +2,7 @@ import json
 import logging
 import random
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import asyncpg
 
@@ -216,6 +216,36 @@ async def init_db() -> None:
             )
         """)
         await conn.execute("CREATE INDEX IF NOT EXISTS idx_player_eggs_user ON player_eggs(user_id)")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_items_user_id_desc ON user_items(user_id, id DESC)")
+        # Версия инвентаря: растёт при любом изменении user_items/player_eggs (ETag/304, ключ кэша сводки)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_inventory_version (
+                user_id INTEGER PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 1
+            )
+        """)
+        await conn.execute("""
+            CREATE OR REPLACE FUNCTION bump_user_inventory_version() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    INSERT INTO user_inventory_version (user_id, version) VALUES (OLD.user_id, 1)
+                    ON CONFLICT (user_id) DO UPDATE SET version = user_inventory_version.version + 1;
+                END IF;
+                IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+                    INSERT INTO user_inventory_version (user_id, version) VALUES (NEW.user_id, 1)
+                    ON CONFLICT (user_id) DO UPDATE SET version = user_inventory_version.version + 1;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        for tbl in ("user_items", "player_eggs"):
+            await conn.execute(f"DROP TRIGGER IF EXISTS trg_{tbl}_inventory_version ON {tbl}")
+            await conn.execute(
+                f"""CREATE TRIGGER trg_{tbl}_inventory_version
+                    AFTER INSERT OR UPDATE OR DELETE ON {tbl}
+                    FOR EACH ROW EXECUTE FUNCTION bump_user_inventory_version()"""
+            )
 
         # Фаза 2: деревня и здания (18_Dev, 01)
         await conn.execute("""
@@ -286,6 +316,20 @@ async def init_db() -> None:
             )
         """)
         await conn.execute("CREATE INDEX IF NOT EXISTS idx_crafting_log_user ON crafting_log(user_id)")
+        # Лог не должен мешать удалению предмета, который раньше был результатом крафта
+        await conn.execute("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_constraint
+                    WHERE conname = 'crafting_log_output_item_id_fkey' AND confdeltype <> 'n'
+                ) THEN
+                    ALTER TABLE crafting_log DROP CONSTRAINT crafting_log_output_item_id_fkey;
+                    ALTER TABLE crafting_log ADD CONSTRAINT crafting_log_output_item_id_fkey
+                        FOREIGN KEY (output_item_id) REFERENCES user_items(id) ON DELETE SET NULL;
+                END IF;
+            END $$
+        """)
 
         # Статистика по предметам: события (дроп, сжигание, слияние, продажа и т.д.)
         await conn.execute("""
@@ -472,6 +516,33 @@ async def init_db() -> None:
             SELECT user_id, wallet_address, verified_at, created_at FROM user_wallets
             ON CONFLICT (wallet_address) DO NOTHING
         """)
+        # Входящие переводы с комментарием verify:… на кошелёк проекта (наполняет infrastructure/wallet_verify_watch.py)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS wallet_verify_transfers (
+                event_id TEXT NOT NULL,
+                comment TEXT NOT NULL,
+                sender TEXT NOT NULL,
+                amount NUMERIC NOT NULL DEFAULT 0,
+                method TEXT NOT NULL,
+                lt BIGINT NOT NULL DEFAULT 0,
+                event_at TIMESTAMPTZ,
+                indexed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (event_id, comment)
+            )
+        """)
+        # binding_id — привязка, которую подтвердил перевод (перевод погашен)
+        await conn.execute("ALTER TABLE wallet_verify_transfers ADD COLUMN IF NOT EXISTS binding_id INTEGER")
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_wallet_verify_transfers_comment ON wallet_verify_transfers(comment, lt DESC)"
+        )
+        # Курсоры фоновых читателей блокчейна: name → lt последнего обработанного события
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS chain_cursors (
+                name TEXT PRIMARY KEY,
+                lt BIGINT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS withdraw_gating (
                 user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
@@ -820,6 +891,55 @@ async def init_db() -> None:
             )
         """)
 
+        # Бинарный ключ TON-адреса (1 байт workchain + 32 байта хэша) из raw «wc:hex» и friendly (EQ/UQ/kQ/0Q):
+        # адреса хранятся в обоих видах, join по тексту промахивается. CRC friendly-адреса проверяет кодек
+        # в приложении (infrastructure/ton_address.py); здесь — только разбор. Нераспознанный адрес → NULL.
+        await conn.execute("""
+            CREATE OR REPLACE FUNCTION ton_addr_bin(addr TEXT) RETURNS BYTEA
+            LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+            DECLARE
+                a TEXT := btrim(coalesce(addr, ''));
+                wc INTEGER;
+                b BYTEA;
+            BEGIN
+                IF a ~ '^-?[0-9]{1,3}:[0-9a-fA-F]{64}$' THEN
+                    wc := split_part(a, ':', 1)::int;
+                    IF wc < -128 OR wc > 127 THEN
+                        RETURN NULL;
+                    END IF;
+                    RETURN set_byte('\\x00'::bytea, 0, (wc + 256) % 256) || decode(split_part(a, ':', 2), 'hex');
+                END IF;
+                IF a ~ '^[A-Za-z0-9_+/-]{48}$' THEN
+                    b := decode(translate(a, '-_', '+/'), 'base64');
+                    IF length(b) = 36 AND (get_byte(b, 0) & 127) IN (17, 81) THEN
+                        RETURN substring(b FROM 2 FOR 33);
+                    END IF;
+                END IF;
+                RETURN NULL;
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END $$
+        """)
+        # Генерируемые колонки: заполняются при каждой записи, существующие строки — при ADD COLUMN
+        for table, src, col, where in (
+            ("user_wallet_bindings", "wallet_address", "wallet_addr", "WHERE verified_at IS NOT NULL"),
+            ("dev_nfts", "owner_address", "owner_addr", ""),
+            ("nft_holder_snapshots", "owner_address", "owner_addr", ""),
+        ):
+            await conn.execute(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} BYTEA GENERATED ALWAYS AS (ton_addr_bin({src})) STORED"
+            )
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table}({col}) {where}")
+
+        # ——— price_feed: последнее удачное значение каждого курса (infrastructure/price.py) ———
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS price_feed (
+                symbol TEXT PRIMARY KEY,
+                value JSONB NOT NULL,
+                fetched_at TIMESTAMPTZ NOT NULL
+            )
+        """)
+
         # ——— game_settings: runtime-editable config (key-value) ———
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS game_settings (
@@ -965,12 +1085,36 @@ async def init_db() -> None:
             "ALTER TABLE user_profile ADD COLUMN IF NOT EXISTS furnace_bonus_until TIMESTAMPTZ",
             "ALTER TABLE dev_collections ADD COLUMN IF NOT EXISTS project_id INTEGER DEFAULT 1",
             "ALTER TABLE dev_nfts ADD COLUMN IF NOT EXISTS project_id INTEGER DEFAULT 1",
+            "ALTER TABLE dev_collections ADD COLUMN IF NOT EXISTS last_activity BIGINT NOT NULL DEFAULT 0",
         ):
             try:
                 await conn.execute(sql)
             except Exception as e:
                 if "already exists" not in str(e).lower() and "duplicate" not in str(e).lower():
                     logger.warning("Migration step: %s", e)
+        # Бейджи: отдельная таблица вместо user_profile.badges (JSONB-массив) — выдача идемпотентна,
+        # «у кого бейдж X» — по индексу. Старый массив переносится и очищается (повторный запуск ничего не делает).
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_badges (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                badge_key TEXT NOT NULL,
+                granted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (user_id, badge_key)
+            )
+        """)
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_badges_key ON user_badges(badge_key, granted_at, user_id)")
+        await conn.execute("""
+            WITH legacy AS (
+                UPDATE user_profile p SET badges = '[]'::jsonb
+                FROM (SELECT user_id, badges FROM user_profile
+                      WHERE jsonb_typeof(badges) = 'array' AND badges <> '[]'::jsonb FOR UPDATE) old
+                WHERE p.user_id = old.user_id
+                RETURNING old.user_id, old.badges
+            )
+            INSERT INTO user_badges (user_id, badge_key)
+            SELECT DISTINCT legacy.user_id, b.key FROM legacy, jsonb_array_elements_text(legacy.badges) AS b(key)
+            ON CONFLICT (user_id, badge_key) DO NOTHING
+        """)
         await _seed_item_defs_and_eggs(conn)
         await _seed_buildings_def(conn)
         await _seed_familiars_def(conn)
@@ -1688,32 +1832,64 @@ async def get_phoenix_quest_state() -> Dict[str, Any]:
     async with pool.acquire() as conn:
         row = await conn.fetchrow("SELECT current_word, submissions_count, word_index, updated_at FROM phoenix_quest_state WHERE id = 1")
     if not row:
-        return {"current_word": "ФЕНИКС", "submissions_count": 0, "word_index": 0, "max_submissions": 5}
+        return {"current_word": "ФЕНИКС", "submissions_count": 0, "word_index": 0, "max_submissions": PHOENIX_MAX_SUBMISSIONS}
     return {
         "current_word": row["current_word"],
         "submissions_count": row["submissions_count"],
         "word_index": row["word_index"],
-        "max_submissions": 5,
+        "max_submissions": PHOENIX_MAX_SUBMISSIONS,
         "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None,
     }
 
 
 PHOENIX_WORDS_LIST = ["ФЕНИКС", "СЛОВО", "ОГОНЬ", "ПОБЕДА", "МЕДАЛЬ", "ТОКЕН", "ИГРОК", "ЭРА"]
+PHOENIX_MAX_SUBMISSIONS = 5
 
 
 async def advance_phoenix_word() -> str:
     """После 5 сдач переключает на следующее слово. Возвращает новое current_word."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT word_index FROM phoenix_quest_state WHERE id = 1")
-        idx = int(row["word_index"]) if row else 0
-        next_idx = (idx + 1) % len(PHOENIX_WORDS_LIST)
-        next_word = PHOENIX_WORDS_LIST[next_idx]
-        await conn.execute(
-            """UPDATE phoenix_quest_state SET current_word = $1, submissions_count = 0, word_index = $2, updated_at = NOW() WHERE id = 1""",
-            next_word, next_idx,
+        row = await conn.fetchrow(
+            """UPDATE phoenix_quest_state SET
+                 word_index = (word_index + 1) % cardinality($1::text[]),
+                 current_word = ($1::text[])[(word_index + 1) % cardinality($1::text[]) + 1],
+                 submissions_count = 0,
+                 updated_at = NOW()
+               WHERE id = 1
+               RETURNING current_word""",
+            PHOENIX_WORDS_LIST,
         )
-    return next_word
+    return row["current_word"] if row else PHOENIX_WORDS_LIST[0]
+
+
+async def claim_phoenix_place(word: str) -> Tuple[int, Optional[str]]:
+    """
+    Атомарно занять место среди первых 5 отгадавших слово word (current_word как в БД).
+    Один UPDATE: счётчик растёт только пока слово текущее и мест < 5; пятое место в том же
+    UPDATE переключает слово. Конкурентные сдачи ждут блокировку строки лишь на время
+    этого оператора и перепроверяют WHERE по новой версии строки — победителей ровно 5.
+    Возвращает (place 1..5 или 0, next_word если слово сменилось).
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """UPDATE phoenix_quest_state SET
+                 submissions_count = CASE WHEN submissions_count + 1 >= $3 THEN 0 ELSE submissions_count + 1 END,
+                 word_index = CASE WHEN submissions_count + 1 >= $3
+                              THEN (word_index + 1) % cardinality($2::text[]) ELSE word_index END,
+                 current_word = CASE WHEN submissions_count + 1 >= $3
+                                THEN ($2::text[])[(word_index + 1) % cardinality($2::text[]) + 1] ELSE current_word END,
+                 updated_at = NOW()
+               WHERE id = 1 AND current_word = $1 AND submissions_count < $3
+               RETURNING submissions_count, current_word""",
+            word, PHOENIX_WORDS_LIST, PHOENIX_MAX_SUBMISSIONS,
+        )
+    if not row:
+        return 0, None
+    if row["submissions_count"] == 0:
+        return PHOENIX_MAX_SUBMISSIONS, row["current_word"]
+    return int(row["submissions_count"]), None
 
 
 async def get_user_letter_items(user_id: int) -> List[Dict[str, Any]]:
@@ -1728,59 +1904,140 @@ async def get_user_letter_items(user_id: int) -> List[Dict[str, Any]]:
                ORDER BY ui.id""",
             user_id,
         )
-    return [{"id": r["id"], "symbol": (r["meta"] or {}).get("symbol", "?")} for r in rows]
+    return [{"id": r["id"], "symbol": _json_dict(r["meta"]).get("symbol", "?")} for r in rows]
+
+
+class _Rollback(Exception):
+    """Отмена транзакции после проверки строк, возвращённых DELETE ... RETURNING."""
+
+    def __init__(self, message: str = ""):
+        super().__init__(message)
+        self.message = message
+
+
+def _json_dict(v: Any) -> Dict[str, Any]:
+    """jsonb из asyncpg (без кодека приходит строкой) → dict."""
+    if isinstance(v, dict):
+        return v
+    if isinstance(v, str):
+        try:
+            v = json.loads(v)
+        except ValueError:
+            return {}
+        return v if isinstance(v, dict) else {}
+    return {}
 
 
 async def consume_letter_items(user_id: int, item_ids: List[int], word: str) -> bool:
     """
     Списывает буквы по id. word — ожидаемое слово; для каждого символа должен быть ровно один id.
+    Один DELETE ... RETURNING в транзакции: не те буквы или не все найдены — откат.
     Возвращает True если списание прошло.
     """
     word_upper = word.strip().upper()
     if len(word_upper) != len(item_ids) or len(set(item_ids)) != len(item_ids):
         return False
     pool = await get_pool()
-    async with pool.acquire() as conn:
-        for i, char in enumerate(word_upper):
-            item_id = item_ids[i]
-            row = await conn.fetchrow(
-                """SELECT ui.id FROM user_items ui
-                   JOIN item_defs id ON id.id = ui.item_def_id
-                   WHERE ui.user_id = $1 AND ui.id = $2 AND id.item_type = 'letter' AND ui.state = 'inventory'""",
-                user_id, item_id,
-            )
-            if not row:
-                return False
-            meta = await conn.fetchrow("SELECT meta FROM user_items WHERE id = $1", item_id)
-            sym = (meta["meta"] or {}).get("symbol", "")
-            if sym.upper() != char:
-                return False
-        for item_id in item_ids:
-            await conn.execute("DELETE FROM user_items WHERE id = $1 AND user_id = $2", item_id, user_id)
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    """DELETE FROM user_items ui
+                       USING item_defs d
+                       WHERE ui.user_id = $1 AND ui.id = ANY($2::int[]) AND ui.state = 'inventory'
+                         AND d.id = ui.item_def_id AND d.item_type = 'letter'
+                       RETURNING ui.id, ui.meta""",
+                    user_id, item_ids,
+                )
+                symbols = {int(r["id"]): str(_json_dict(r["meta"]).get("symbol", "")).upper() for r in rows}
+                if len(symbols) != len(item_ids) or any(
+                    symbols.get(item_id) != char for item_id, char in zip(item_ids, word_upper)
+                ):
+                    raise _Rollback()
+    except _Rollback:
+        return False
     return True
 
 
-async def add_user_badge(user_id: int, badge_key: str) -> None:
-    """Добавляет бейдж в user_profile.badges (например 'букварь')."""
+# Бейджи: порядок задаёт бит в кэшируемой маске — новые ключи добавлять только в конец
+BADGE_KEYS = ("букварь",)
+_BADGE_BITS = {key: 1 << i for i, key in enumerate(BADGE_KEYS)}
+BADGES_CACHE_TTL = 3600
+
+
+def _badges_cache_key(user_id: int) -> str:
+    return f"badges:{user_id}"
+
+
+def badges_from_mask(mask: int) -> List[str]:
+    return [key for key in BADGE_KEYS if mask & _BADGE_BITS[key]]
+
+
+async def add_user_badge(user_id: int, badge_key: str) -> bool:
+    """Выдаёт бейдж (например 'букварь') одним INSERT ... ON CONFLICT DO NOTHING. True — выдан впервые."""
+    if badge_key not in _BADGE_BITS:
+        raise ValueError(f"Unknown badge: {badge_key}")
+    from infrastructure.cache import cache_delete
     pool = await get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT badges FROM user_profile WHERE user_id = $1", user_id)
-        badges = list(row["badges"]) if row and row["badges"] else []
-        if badge_key not in badges:
-            badges.append(badge_key)
-            await conn.execute(
-                "UPDATE user_profile SET badges = $1::jsonb, updated_at = NOW() WHERE user_id = $2",
-                json.dumps(badges), user_id,
-            )
+        row = await conn.fetchrow(
+            """INSERT INTO user_badges (user_id, badge_key) VALUES ($1, $2)
+               ON CONFLICT (user_id, badge_key) DO NOTHING RETURNING user_id""",
+            user_id, badge_key,
+        )
+    if row:
+        await cache_delete(_badges_cache_key(user_id))
+    return row is not None
+
+
+async def get_user_badge_mask(user_id: int) -> int:
+    """Битовая маска бейджей пользователя (биты по BADGE_KEYS); кэшируется в Redis."""
+    from infrastructure.cache import cache_get, cache_set
+    cached = await cache_get(_badges_cache_key(user_id))
+    if isinstance(cached, int):
+        return cached
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT badge_key FROM user_badges WHERE user_id = $1", user_id)
+    mask = 0
+    for r in rows:
+        mask |= _BADGE_BITS.get(r["badge_key"], 0)
+    await cache_set(_badges_cache_key(user_id), mask, ttl_sec=BADGES_CACHE_TTL)
+    return mask
+
+
+async def get_user_badges(user_id: int) -> List[str]:
+    """Ключи бейджей пользователя (для профиля)."""
+    return badges_from_mask(await get_user_badge_mask(user_id))
 
 
 async def has_user_badge(user_id: int, badge_key: str) -> bool:
     """Проверяет наличие бейджа у пользователя."""
+    bit = _BADGE_BITS.get(badge_key)
+    return bool(bit) and bool(await get_user_badge_mask(user_id) & bit)
+
+
+async def get_badge_holders(badge_key: str, limit: int = 100, after_user_id: int = 0) -> List[Dict[str, Any]]:
+    """
+    Обладатели бейджа по индексу (badge_key, granted_at): ранние первыми, курсор — user_id последнего.
+    Без telegram_id — список публичный.
+    """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT badges FROM user_profile WHERE user_id = $1", user_id)
-    badges = list(row["badges"]) if row and row.get("badges") else []
-    return badge_key in badges
+        rows = await conn.fetch(
+            """SELECT ub.user_id, ub.granted_at
+               FROM user_badges ub
+               WHERE ub.badge_key = $1
+                 AND ($3 = 0 OR (ub.granted_at, ub.user_id) > (
+                     SELECT granted_at, user_id FROM user_badges WHERE badge_key = $1 AND user_id = $3))
+               ORDER BY ub.granted_at, ub.user_id
+               LIMIT $2""",
+            badge_key, limit, after_user_id,
+        )
+    return [
+        {"user_id": r["user_id"], "granted_at": r["granted_at"].isoformat()}
+        for r in rows
+    ]
 
 
 async def phoenix_submit_word(
@@ -1804,27 +2061,15 @@ async def phoenix_submit_word(
         return {"success": False, "place": 0, "badge_granted": False, "message": "Не удалось списать буквы (нет в инвентаре или не совпадают)"}
     if word_upper != current:
         return {"success": True, "place": 0, "badge_granted": False, "message": "Слово принято, но это не загаданное слово"}
-    count = state["submissions_count"]
-    if count >= 5:
+    place, next_word = await claim_phoenix_place(state["current_word"])
+    if not place:
         return {"success": True, "place": 0, "badge_granted": False, "message": "Загаданное слово уже отгадано 5 раз"}
-    pool = await get_pool()
-    place = count + 1
-    next_word = None
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """UPDATE phoenix_quest_state SET submissions_count = submissions_count + 1, updated_at = NOW() WHERE id = 1"""
-        )
-        new_row = await conn.fetchrow("SELECT submissions_count FROM phoenix_quest_state WHERE id = 1")
-        new_count = int(new_row["submissions_count"]) if new_row else 0
-    if place <= 5:
-        await add_user_badge(user_id, "букварь")
-    if new_count >= 5:
-        next_word = await advance_phoenix_word()
+    await add_user_badge(user_id, "букварь")
     return {
         "success": True,
         "place": place,
-        "badge_granted": place <= 5,
-        "message": f"Правильно! Вы #{place} из 5. Бейдж «Букварь» выдан." if place <= 5 else "Правильно, но призы уже разыграны.",
+        "badge_granted": True,
+        "message": f"Правильно! Вы #{place} из 5. Бейдж «Букварь» выдан.",
         "next_word": next_word,
     }
 
@@ -1841,32 +2086,35 @@ async def add_player_egg(user_id: int, color: str) -> int:
 
 
 async def get_egg_hatch_pool(egg_color: str, egg_rarity: str) -> List[tuple]:
-    """Возвращает список (outcome_type, weight) для вылупления по цвету и редкости яйца."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT outcome_type, weight FROM egg_hatch_pool WHERE egg_color = $1 AND egg_rarity = $2",
-            egg_color, egg_rarity,
-        )
-    return [(r["outcome_type"], int(r["weight"])) for r in rows] if rows else [("resource", 100)]
+    """Возвращает список (outcome_type, weight) для вылупления по цвету и редкости яйца (из справочника в памяти)."""
+    from infrastructure.catalog import get_item_catalog
+    return (await get_item_catalog()).hatch_outcomes(egg_color, egg_rarity)
 
 
 async def get_eggs_def_rarity(color: str) -> str:
-    """Редкость яйца по цвету из eggs_def."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT rarity FROM eggs_def WHERE color = $1", color)
-    return row["rarity"] if row else "common"
+    """Редкость яйца по цвету из eggs_def (из справочника в памяти)."""
+    from infrastructure.catalog import get_item_catalog
+    return (await get_item_catalog()).egg_rarity(color)
 
 
 async def consume_player_eggs(user_id: int, egg_ids: List[int]) -> bool:
     """Удаляет яйца по id. Возвращает True если все id принадлежат юзеру и удалены."""
     if not egg_ids:
         return False
+    if len(set(egg_ids)) != len(egg_ids):
+        return False
     pool = await get_pool()
-    async with pool.acquire() as conn:
-        for eid in egg_ids:
-            await conn.execute("DELETE FROM player_eggs WHERE id = $1 AND user_id = $2", eid, user_id)
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    "DELETE FROM player_eggs WHERE user_id = $1 AND id = ANY($2::int[]) RETURNING id",
+                    user_id, egg_ids,
+                )
+                if len(rows) != len(egg_ids):
+                    raise _Rollback()
+    except _Rollback:
+        return False
     return True
 
 
@@ -1883,12 +2131,125 @@ async def add_user_familiar(user_id: int, familiar_def_id: int) -> int:
 
 async def get_familiar_defs_random_one() -> Optional[int]:
     """Случайный familiars_def.id по весу редкости (упрощённо: равновероятно)."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT id FROM familiars_def")
-    if not rows:
-        return None
-    return random.choice([int(r["id"]) for r in rows])
+    from infrastructure.catalog import get_item_catalog
+    ids = (await get_item_catalog()).familiar_def_ids
+    return random.choice(ids) if ids else None
+
+
+# Пакетное вылупление: максимум наборов (печка + яйца) за один запрос
+FURNACE_HATCH_BATCH_MAX = 50
+
+
+def _roll_hatch(cat: Any, color: str, egg_rarity: str, rng: random.Random) -> Dict[str, Any]:
+    """Исход одного вылупления по пулу из справочника: resource (монеты), relic (FIRE) или familiar."""
+    pool_outcomes = cat.hatch_outcomes(color, egg_rarity)
+    total_w = sum(w for _, w in pool_outcomes)
+    r = rng.randint(1, max(1, total_w))
+    outcome_type = "resource"
+    for ot, w in pool_outcomes:
+        r -= w
+        if r <= 0:
+            outcome_type = ot
+            break
+    coins_granted = 0
+    item_def_id = None
+    familiar_def_id = None
+    if outcome_type == "resource":
+        coins_granted = rng.randint(50, 200)
+    elif outcome_type == "relic":
+        ids = cat.def_ids_by_rarity("FIRE")
+        if ids:
+            item_def_id = rng.choice(ids)
+    elif outcome_type == "familiar":
+        if cat.familiar_def_ids:
+            familiar_def_id = rng.choice(cat.familiar_def_ids)
+    return {"ok": True, "outcome_type": outcome_type, "coins_granted": coins_granted, "item_def_id": item_def_id, "familiar_def_id": familiar_def_id, "message": "ok"}
+
+
+async def do_furnace_hatch_batch(
+    user_id: int,
+    sets: List[Tuple[int, List[int]]],
+) -> Dict[str, Any]:
+    """
+    Пакетное вылупление: наборы (furnace_user_item_id, egg_ids) одной транзакцией.
+    Печки и яйца удаляются двумя DELETE ... WHERE id = ANY RETURNING, проверки — по возвращённым строкам;
+    награды (монеты, реликвии, фамильяры) пишутся одним запросом. Ошибка в любом наборе откатывает всё.
+    Возвращает { ok, results: [...] } или { ok: False, message, set_index }.
+    """
+    if not sets:
+        return {"ok": False, "message": "no_sets", "set_index": None}
+    if len(sets) > FURNACE_HATCH_BATCH_MAX:
+        return {"ok": False, "message": "batch_too_large", "set_index": None}
+    furnace_ids = [int(f) for f, _ in sets]
+    egg_ids_all = [int(e) for _, eggs in sets for e in eggs]
+    if len(set(furnace_ids)) != len(furnace_ids) or len(set(egg_ids_all)) != len(egg_ids_all):
+        return {"ok": False, "message": "duplicate_ids", "set_index": None}
+    from infrastructure.catalog import get_item_catalog
+    cat = await get_item_catalog()
+    rng = random.Random()
+    results: List[Dict[str, Any]] = []
+    pool = await get_pool()
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                furnaces = await conn.fetch(
+                    """DELETE FROM user_items ui
+                       USING item_defs d
+                       WHERE ui.user_id = $1 AND ui.id = ANY($2::int[]) AND ui.state = 'inventory'
+                         AND d.id = ui.item_def_id AND d.item_type = 'furnace'
+                       RETURNING ui.id, d.key AS item_key""",
+                    user_id, furnace_ids,
+                )
+                eggs = await conn.fetch(
+                    "DELETE FROM player_eggs WHERE user_id = $1 AND id = ANY($2::int[]) RETURNING id, color",
+                    user_id, egg_ids_all,
+                ) if egg_ids_all else []
+                furnace_keys = {int(r["id"]): r["item_key"] or "" for r in furnaces}
+                egg_colors = {int(r["id"]): r["color"] for r in eggs}
+                for i, (furnace_id, egg_ids) in enumerate(sets):
+                    if int(furnace_id) not in furnace_keys:
+                        raise _Rollback(f"furnace_not_found:{i}")
+                    color = furnace_keys[int(furnace_id)].replace("furnace_", "")
+                    if not color or len(egg_ids) not in (1, 3):
+                        raise _Rollback(f"need_3_eggs_or_1_rare:{i}")
+                    if any(int(e) not in egg_colors for e in egg_ids):
+                        raise _Rollback(f"eggs_not_found:{i}")
+                    if any(egg_colors[int(e)] != color for e in egg_ids):
+                        raise _Rollback(f"eggs_color_mismatch:{i}")
+                    egg_rarity = cat.egg_rarity(color)
+                    if len(egg_ids) == 1 and egg_rarity == "common":
+                        raise _Rollback(f"need_3_common_or_1_rare:{i}")
+                    results.append(_roll_hatch(cat, color, egg_rarity, rng))
+                coins = [r["coins_granted"] for r in results if r["coins_granted"]]
+                relics = [r["item_def_id"] for r in results if r["item_def_id"]]
+                familiars = [r["familiar_def_id"] for r in results if r["familiar_def_id"]]
+                await conn.execute(
+                    """WITH ledger AS (
+                           INSERT INTO economy_ledger (user_id, kind, currency, amount, ref_type, ref_id)
+                           SELECT $1, 'credit', 'COINS', a, 'furnace_hatch', '' FROM unnest($2::bigint[]) AS a
+                       ),
+                       bal AS (
+                           INSERT INTO user_balances (user_id, currency, balance, updated_at)
+                           SELECT $1, 'COINS', $3::bigint, NOW() WHERE $3::bigint > 0
+                           ON CONFLICT (user_id, currency) DO UPDATE SET
+                             balance = user_balances.balance + EXCLUDED.balance, updated_at = NOW()
+                       ),
+                       items AS (
+                           INSERT INTO user_items (user_id, item_def_id, state, item_level, meta)
+                           SELECT $1, d, 'inventory', 1, '{}'::jsonb FROM unnest($4::int[]) AS d
+                       ),
+                       ev AS (
+                           INSERT INTO item_events (item_def_id, event_type, user_id, quantity, ref_type, ref_id, meta)
+                           SELECT d, 'drop', $1, 1, 'furnace_hatch', NULL, '{}'::jsonb FROM unnest($4::int[]) AS d
+                       )
+                       INSERT INTO user_familiars (user_id, familiar_def_id, equipped)
+                       SELECT $1, f, TRUE FROM unnest($5::int[]) AS f""",
+                    user_id, coins, sum(coins), relics, familiars,
+                )
+    except _Rollback as e:
+        message, _, index = e.message.partition(":")
+        return {"ok": False, "message": message, "set_index": int(index)}
+    return {"ok": True, "results": results}
 
 
 async def do_furnace_hatch(
@@ -1900,60 +2261,12 @@ async def do_furnace_hatch(
     Вылупление: 1 печка + 3 яйца одного цвета (или 1 редкое яйцо). Consume furnace and eggs, roll outcome (resource/relic/familiar).
     Возвращает { ok, outcome_type, coins_granted?, item_def_id?, familiar_def_id?, message }.
     """
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        furnace = await conn.fetchrow(
-            """SELECT ui.id, ui.item_def_id, id.key AS item_key
-               FROM user_items ui JOIN item_defs id ON id.id = ui.item_def_id
-               WHERE ui.id = $1 AND ui.user_id = $2 AND ui.state = 'inventory' AND id.item_type = 'furnace'""",
-            furnace_user_item_id, user_id,
-        )
-        if not furnace:
-            return {"ok": False, "outcome_type": None, "message": "furnace_not_found"}
-        color = furnace["item_key"].replace("furnace_", "") if furnace["item_key"] else ""
-        if not color or len(egg_ids) not in (1, 3):
-            return {"ok": False, "outcome_type": None, "message": "need_3_eggs_or_1_rare"}
-        eggs = await conn.fetch(
-            "SELECT id, color FROM player_eggs WHERE user_id = $1 AND id = ANY($2::int[])",
-            user_id, egg_ids,
-        )
-        if len(eggs) != len(egg_ids):
-            return {"ok": False, "outcome_type": None, "message": "eggs_not_found"}
-        if any(e["color"] != color for e in eggs):
-            return {"ok": False, "outcome_type": None, "message": "eggs_color_mismatch"}
-        egg_rarity = await get_eggs_def_rarity(color)
-        if len(egg_ids) == 1 and egg_rarity == "common":
-            return {"ok": False, "outcome_type": None, "message": "need_3_common_or_1_rare"}
-        pool_outcomes = await get_egg_hatch_pool(color, egg_rarity)
-        total_w = sum(w for _, w in pool_outcomes)
-        r = random.randint(1, max(1, total_w))
-        outcome_type = "resource"
-        for ot, w in pool_outcomes:
-            r -= w
-            if r <= 0:
-                outcome_type = ot
-                break
-        await conn.execute("DELETE FROM user_items WHERE id = $1 AND user_id = $2", furnace_user_item_id, user_id)
-        for eid in egg_ids:
-            await conn.execute("DELETE FROM player_eggs WHERE id = $1 AND user_id = $2", eid, user_id)
-    coins_granted = 0
-    item_def_id = None
-    familiar_def_id = None
-    if outcome_type == "resource":
-        coins_granted = random.randint(50, 200)
-        await add_coins_ledger(user_id, coins_granted, "furnace_hatch", ref_id="")
-    elif outcome_type == "relic":
-        ids = await get_item_def_ids_by_rarity("FIRE")
-        if ids:
-            item_def_id = random.choice(ids)
-            await add_user_item(user_id, item_def_id, item_level=1)
-            await record_item_event(item_def_id, "drop", user_id, 1, ref_type="furnace_hatch", ref_id=None)
-    elif outcome_type == "familiar":
-        fid = await get_familiar_defs_random_one()
-        if fid:
-            await add_user_familiar(user_id, fid)
-            familiar_def_id = fid
-    return {"ok": True, "outcome_type": outcome_type, "coins_granted": coins_granted, "item_def_id": item_def_id, "familiar_def_id": familiar_def_id, "message": "ok"}
+    if len(set(egg_ids)) != len(egg_ids):
+        return {"ok": False, "outcome_type": None, "message": "eggs_not_found"}
+    result = await do_furnace_hatch_batch(user_id, [(furnace_user_item_id, egg_ids)])
+    if not result["ok"]:
+        return {"ok": False, "outcome_type": None, "message": result["message"]}
+    return result["results"][0]
 
 
 async def get_user_balances(user_id: int) -> Dict[str, int]:
@@ -2027,6 +2340,129 @@ async def get_user_inventory(user_id: int) -> Dict[str, Any]:
     return {"items": items, "eggs": eggs_list}
 
 
+INVENTORY_PAGE_DEFAULT = 100
+INVENTORY_PAGE_MAX = 500
+INVENTORY_SUMMARY_TTL = 600
+
+
+async def get_inventory_version(user_id: int) -> int:
+    """Текущая версия инвентаря пользователя (0 — ещё не менялся)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        v = await conn.fetchval("SELECT version FROM user_inventory_version WHERE user_id = $1", user_id)
+    return int(v or 0)
+
+
+def _compact_meta(v: Any) -> Optional[dict]:
+    """meta строки инвентаря; пустой объект не передаём (None)."""
+    if isinstance(v, str):
+        try:
+            v = json.loads(v)
+        except (TypeError, ValueError):
+            return None
+    return v if isinstance(v, dict) and v else None
+
+
+async def get_user_inventory_page(
+    user_id: int,
+    cursor: Optional[int] = None,
+    limit: int = INVENTORY_PAGE_DEFAULT,
+    item_type: Optional[str] = None,
+    rarity: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Страница инвентаря: компактные строки (item_def_id без name/rarity — клиент берёт из каталога).
+    Keyset-пагинация по id DESC; cursor — id последней строки предыдущей страницы.
+    Яйца отдаются только на первой странице без фильтров."""
+    limit = max(1, min(int(limit or INVENTORY_PAGE_DEFAULT), INVENTORY_PAGE_MAX))
+    conds = ["ui.user_id = $1"]
+    args: List[Any] = [user_id]
+    if cursor is not None:
+        args.append(int(cursor))
+        conds.append(f"ui.id < ${len(args)}")
+    def_conds = []
+    if item_type:
+        args.append(item_type)
+        def_conds.append(f"d.item_type = ${len(args)}")
+    if rarity:
+        args.append(rarity)
+        def_conds.append(f"d.rarity = ${len(args)}")
+    if def_conds:
+        conds.append(f"ui.item_def_id IN (SELECT d.id FROM item_defs d WHERE {' AND '.join(def_conds)})")
+    args.append(limit + 1)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            f"""SELECT ui.id, ui.item_def_id, ui.state, ui.item_level, ui.meta, ui.acquired_at
+                FROM user_items ui
+                WHERE {' AND '.join(conds)}
+                ORDER BY ui.id DESC
+                LIMIT ${len(args)}""",
+            *args,
+        )
+        eggs = None
+        if cursor is None and not def_conds:
+            eggs = await conn.fetch(
+                "SELECT id, color, acquired_at FROM player_eggs WHERE user_id = $1 ORDER BY id DESC",
+                user_id,
+            )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [
+        {
+            "id": r["id"],
+            "item_def_id": r["item_def_id"],
+            "state": r["state"],
+            "item_level": r["item_level"],
+            "meta": _compact_meta(r["meta"]),
+            "acquired_at": r["acquired_at"].isoformat() if r["acquired_at"] else None,
+        }
+        for r in rows
+    ]
+    out: Dict[str, Any] = {
+        "items": items,
+        "next_cursor": str(rows[-1]["id"]) if has_more and rows else None,
+    }
+    if eggs is not None:
+        out["eggs"] = [
+            {"id": r["id"], "color": r["color"], "acquired_at": r["acquired_at"].isoformat() if r["acquired_at"] else None}
+            for r in eggs
+        ]
+    return out
+
+
+async def get_user_inventory_summary(user_id: int, version: Optional[int] = None) -> Dict[str, Any]:
+    """Сводка «моя сумка»: количество по (item_def_id, state) и яйца по цвету.
+    Кэшируется в Redis под ключом с версией инвентаря — при изменении старый ключ просто не читается."""
+    from infrastructure.cache import cache_get, cache_set
+    if version is None:
+        version = await get_inventory_version(user_id)
+    cache_key = f"inv_summary:{user_id}:{version}"
+    cached = await cache_get(cache_key)
+    if cached is not None:
+        return cached
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """SELECT item_def_id, state, COUNT(*) AS cnt
+               FROM user_items WHERE user_id = $1
+               GROUP BY item_def_id, state ORDER BY item_def_id, state""",
+            user_id,
+        )
+        eggs = await conn.fetch(
+            "SELECT color, COUNT(*) AS cnt FROM player_eggs WHERE user_id = $1 GROUP BY color ORDER BY color",
+            user_id,
+        )
+    summary = {
+        "version": version,
+        "items": [{"item_def_id": r["item_def_id"], "state": r["state"], "count": int(r["cnt"])} for r in rows],
+        "eggs": [{"color": r["color"], "count": int(r["cnt"])} for r in eggs],
+        "total_items": sum(int(r["cnt"]) for r in rows),
+        "total_eggs": sum(int(r["cnt"]) for r in eggs),
+    }
+    await cache_set(cache_key, summary, ttl_sec=INVENTORY_SUMMARY_TTL)
+    return summary
+
+
 async def pick_egg_color_by_weight() -> Optional[str]:
     """Выбирает цвет яйца по весам из eggs_def. Возвращает color или None."""
     pool = await get_pool()
@@ -2820,6 +3256,107 @@ async def get_user_wallet_binding_by_code(verify_code: str):
         )
 
 
+async def get_chain_cursors(names: List[str]) -> Dict[str, int]:
+    """lt курсоров фоновых читателей по именам; отсутствующих имён в ответе нет."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT name, lt FROM chain_cursors WHERE name = ANY($1::text[])", names)
+    return {r["name"]: int(r["lt"]) for r in rows}
+
+
+async def save_wallet_verify_transfers(transfers: List[Dict[str, Any]], cursors: Dict[str, Optional[int]]) -> int:
+    """
+    Записать найденные verify-переводы и курсоры одной транзакцией (повторная запись события — no-op).
+    cursors: name → lt (None — удалить курсор). Возвращает число новых строк.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            inserted = 0
+            if transfers:
+                inserted = await conn.fetchval(
+                    """WITH ins AS (
+                           INSERT INTO wallet_verify_transfers (event_id, comment, sender, amount, method, lt, event_at)
+                           SELECT t.event_id, t.comment, t.sender, t.amount, t.method, t.lt, to_timestamp(NULLIF(t.utime, 0))
+                           FROM unnest($1::text[], $2::text[], $3::text[], $4::numeric[], $5::text[], $6::bigint[], $7::bigint[])
+                                AS t(event_id, comment, sender, amount, method, lt, utime)
+                           ON CONFLICT (event_id, comment) DO NOTHING
+                           RETURNING 1
+                       ) SELECT COUNT(*) FROM ins""",
+                    [t["event_id"] for t in transfers],
+                    [t["comment"] for t in transfers],
+                    [t["sender"] for t in transfers],
+                    [t["amount"] for t in transfers],
+                    [t["method"] for t in transfers],
+                    [t["lt"] for t in transfers],
+                    [t.get("utime") or 0 for t in transfers],
+                )
+            for name, lt in cursors.items():
+                if lt is None:
+                    await conn.execute("DELETE FROM chain_cursors WHERE name = $1", name)
+                else:
+                    await conn.execute(
+                        """INSERT INTO chain_cursors (name, lt) VALUES ($1, $2)
+                           ON CONFLICT (name) DO UPDATE SET lt = EXCLUDED.lt, updated_at = NOW()""",
+                        name, lt,
+                    )
+    return int(inserted or 0)
+
+
+async def verify_wallet_binding_by_transfer(user_id: int, verify_code: str) -> Dict[str, Any]:
+    """
+    Подтвердить ожидающую привязку по проиндексированному переводу одной транзакцией.
+
+    Подходит только непогашенный перевод с комментарием verify_code, отправленный не раньше создания
+    привязки, с кошелька, который ещё ни к кому не привязан. Перевод гасится (binding_id), поэтому
+    старый перевод не подтвердит следующий кошелёк того же пользователя.
+    Возвращает {ok: True, wallet_address, method} или {ok: False, reason}.
+    """
+    from infrastructure.ton_address import canonical_address
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        try:
+            async with conn.transaction():
+                binding = await conn.fetchrow(
+                    """SELECT id, created_at FROM user_wallet_bindings
+                       WHERE user_id = $1 AND verify_code = $2 AND verified_at IS NULL
+                       ORDER BY created_at DESC LIMIT 1 FOR UPDATE""",
+                    user_id, verify_code,
+                )
+                if not binding:
+                    return {"ok": False, "reason": "binding_not_found"}
+                tx = await conn.fetchrow(
+                    """SELECT t.event_id, t.comment, t.sender, t.method FROM wallet_verify_transfers t
+                       WHERE t.comment = $1 AND t.binding_id IS NULL AND t.event_at >= $2
+                         AND NOT EXISTS (
+                             SELECT 1 FROM user_wallet_bindings b
+                             WHERE b.wallet_addr = ton_addr_bin(t.sender) AND b.verified_at IS NOT NULL
+                         )
+                       ORDER BY t.lt DESC LIMIT 1 FOR UPDATE OF t SKIP LOCKED""",
+                    verify_code, binding["created_at"],
+                )
+                if not tx:
+                    return {"ok": False, "reason": "tx_not_found"}
+                wallet_address = canonical_address(tx["sender"].strip())
+                await conn.execute(
+                    """UPDATE user_wallet_bindings SET wallet_address = $1, verified_at = NOW(), verify_code = NULL
+                       WHERE id = $2""",
+                    wallet_address, binding["id"],
+                )
+                await conn.execute(
+                    "UPDATE wallet_verify_transfers SET binding_id = $1 WHERE event_id = $2 AND comment = $3",
+                    binding["id"], tx["event_id"], tx["comment"],
+                )
+                await conn.execute(
+                    "DELETE FROM user_wallet_bindings WHERE user_id = $1 AND verify_code = $2 AND verified_at IS NULL",
+                    user_id, verify_code,
+                )
+        except asyncpg.UniqueViolationError:
+            # Адрес уже записан в другую (непроверенную) привязку
+            return {"ok": False, "reason": "wallet_already_bound"}
+    return {"ok": True, "wallet_address": wallet_address, "method": tx["method"] or "ton"}
+
+
 async def set_wallet_binding_verified(binding_id: int) -> None:
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -3922,7 +4459,7 @@ async def staking_contract_delete(contract_id: int) -> bool:
 
 async def get_pnl_wallet_state(user_id: int) -> Dict[str, Any]:
     """Состояние кошелька и стейкингов для экрана PnL: привязка, список кошельков (сокращённые), общая статистика, контракты стейкинга."""
-    from infrastructure.ton_address import raw_to_friendly
+    from infrastructure.ton_address import raw_to_friendly_many
 
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -3937,12 +4474,10 @@ async def get_pnl_wallet_state(user_id: int) -> Dict[str, Any]:
         contracts = await conn.fetch(
             "SELECT id, contract_address, label FROM staking_contract_addresses ORDER BY sort_order, id"
         )
-    # Конвертируем raw → friendly (UQ…) через Ton Center API
+    # Конвертируем raw → friendly (UQ…) локально, одним пакетом
     wallet_list = []
     first_friendly = None
-    for r in wallets:
-        addr = r["wallet_address"] or ""
-        friendly = await raw_to_friendly(addr)
+    for r, friendly in zip(wallets, raw_to_friendly_many(w["wallet_address"] or "" for w in wallets)):
         masked = friendly[:8] + "…" + friendly[-4:] if len(friendly) > 14 else friendly
         wallet_list.append({"id": r["id"], "wallet_address_masked": masked, "wallet_address_friendly": friendly})
         if first_friendly is None:
@@ -3967,72 +4502,6 @@ async def get_pnl_wallet_state(user_id: int) -> Dict[str, Any]:
 # Dev NFT collections & items (каталог NFT от разработчика)
 # ──────────────────────────────────────────────────────────────
 
-async def upsert_dev_collection(
-    collection_address: str,
-    name: str = "",
-    description: str = "",
-    image: str = "",
-    creator_address: str = "",
-    items_count: int = 0,
-) -> int:
-    """Upsert коллекции разработчика. Возвращает id."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """INSERT INTO dev_collections (collection_address, name, description, image, creator_address, items_count, synced_at)
-               VALUES ($1, $2, $3, $4, $5, $6, NOW())
-               ON CONFLICT (collection_address) DO UPDATE SET
-                 name = EXCLUDED.name,
-                 description = EXCLUDED.description,
-                 image = EXCLUDED.image,
-                 creator_address = EXCLUDED.creator_address,
-                 items_count = EXCLUDED.items_count,
-                 synced_at = NOW()
-               RETURNING id""",
-            collection_address, name, description, image, creator_address, items_count,
-        )
-        return row["id"]
-
-
-async def upsert_dev_nft(
-    nft_address: str,
-    collection_id: int,
-    collection_address: str = "",
-    nft_index: int = 0,
-    owner_address: str = "",
-    name: str = "",
-    description: str = "",
-    image: str = "",
-    metadata_url: str = "",
-    attributes: Any = None,
-    mint_timestamp: Any = None,
-) -> int:
-    """Upsert NFT из коллекции разработчика. Возвращает id."""
-    pool = await get_pool()
-    attrs = json.dumps(attributes or [])
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            """INSERT INTO dev_nfts (nft_address, collection_id, collection_address, nft_index, owner_address, name, description, image, metadata_url, attributes, mint_timestamp, synced_at)
-               VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10::jsonb, $11, NOW())
-               ON CONFLICT (nft_address) DO UPDATE SET
-                 collection_id = EXCLUDED.collection_id,
-                 collection_address = EXCLUDED.collection_address,
-                 owner_address = EXCLUDED.owner_address,
-                 name = EXCLUDED.name,
-                 description = EXCLUDED.description,
-                 image = EXCLUDED.image,
-                 metadata_url = EXCLUDED.metadata_url,
-                 attributes = EXCLUDED.attributes,
-                 mint_timestamp = EXCLUDED.mint_timestamp,
-                 synced_at = NOW()
-               RETURNING id""",
-            nft_address, collection_id, collection_address, nft_index,
-            owner_address, name, description, image, metadata_url,
-            attrs, mint_timestamp,
-        )
-        return row["id"]
-
-
 async def get_dev_collections() -> List[Dict[str, Any]]:
     """Все коллекции разработчика (items_count = реальное кол-во NFT в dev_nfts)."""
     pool = await get_pool()
@@ -4057,8 +4526,10 @@ async def get_dev_collections() -> List[Dict[str, Any]]:
 
 
 async def get_dev_nfts_for_user(user_wallet_addresses: List[str]) -> List[Dict[str, Any]]:
-    """NFT из коллекций разработчика, принадлежащие юзеру (по списку его кошельков)."""
-    if not user_wallet_addresses:
+    """NFT из коллекций разработчика, принадлежащие юзеру (по списку его кошельков, в любом формате адреса)."""
+    from infrastructure.ton_address import address_key
+    keys = [k for k in (address_key(a) for a in user_wallet_addresses) if k]
+    if not keys:
         return []
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -4066,9 +4537,9 @@ async def get_dev_nfts_for_user(user_wallet_addresses: List[str]) -> List[Dict[s
             """SELECT n.*, c.name AS collection_name, c.image AS collection_image
                FROM dev_nfts n
                JOIN dev_collections c ON c.id = n.collection_id
-               WHERE n.owner_address = ANY($1::text[])
+               WHERE n.owner_addr = ANY($1::bytea[])
                ORDER BY c.name, n.nft_index""",
-            user_wallet_addresses,
+            keys,
         )
     return [dict(r) for r in rows]
 
@@ -4124,12 +4595,159 @@ async def log_nft_sync(sync_type: str, collections_synced: int, nfts_synced: int
         )
 
 
-async def clear_dev_collections() -> None:
-    """Удалить все записи из dev_collections и dev_nfts (перед полным ресинком)."""
+async def get_last_nft_sync_at(sync_type: str) -> Optional[datetime]:
+    """Время завершения последнего синка NFT данного типа (full / incremental)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            "SELECT MAX(finished_at) FROM nft_sync_log WHERE sync_type = $1 AND finished_at IS NOT NULL",
+            sync_type,
+        )
+
+
+async def get_nft_index_synced_at() -> Optional[datetime]:
+    """Время последнего успешного синка NFT любого типа (хотя бы частично применённого) — свежесть индекса владельцев."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            """SELECT MAX(finished_at) FROM nft_sync_log
+               WHERE finished_at IS NOT NULL AND (errors = 0 OR nfts_synced > 0)"""
+        )
+
+
+async def find_dev_nft_account(addresses: List[str]) -> Optional[str]:
+    """Чей это аккаунт (адреса одного аккаунта в разных форматах): 'nft' — NFT из dev_nfts, 'collection' — коллекция разработчика, None — чужой."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute("DELETE FROM dev_nfts")
-        await conn.execute("DELETE FROM dev_collections")
+        return await conn.fetchval(
+            """SELECT CASE
+                 WHEN EXISTS (SELECT 1 FROM dev_nfts WHERE nft_address = ANY($1::text[])) THEN 'nft'
+                 WHEN EXISTS (SELECT 1 FROM dev_collections WHERE collection_address = ANY($1::text[])) THEN 'collection'
+               END""",
+            addresses,
+        )
+
+
+async def update_dev_nft_owner(addresses: List[str], owner_address: str) -> bool:
+    """Точечно обновить владельца NFT (адреса NFT в разных форматах). True — строка найдена и владелец сменился."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        status = await conn.execute(
+            """UPDATE dev_nfts SET owner_address = $2, synced_at = NOW()
+               WHERE nft_address = ANY($1::text[]) AND owner_address IS DISTINCT FROM $2""",
+            addresses, owner_address,
+        )
+    return status != "UPDATE 0"
+
+
+async def get_dev_collection_fingerprints() -> Dict[str, Tuple[int, int]]:
+    """collection_address → (items_count, last_activity) — для инкрементального синка."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT collection_address, items_count, last_activity FROM dev_collections")
+    return {r["collection_address"]: (int(r["items_count"] or 0), int(r["last_activity"] or 0)) for r in rows}
+
+
+async def apply_dev_nft_snapshot(
+    collections: List[Dict[str, Any]],
+    nfts: List[Dict[str, Any]],
+    refreshed_collections: List[str],
+    prune_collections: bool = False,
+    keep_collections: Optional[List[str]] = None,
+) -> Dict[str, int]:
+    """
+    Применить снимок NFT-каталога одной транзакцией (читатели видят старые данные до COMMIT).
+    Строки заливаются COPY во временные shadow-таблицы, затем переносятся в dev_collections/dev_nfts
+    одним INSERT ... SELECT ... ON CONFLICT.
+    refreshed_collections — коллекции, по которым получен полный список NFT: их NFT, отсутствующие в снимке, удаляются.
+    prune_collections — удалить коллекции, которых нет в снимке и в keep_collections (полный синк).
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                CREATE TEMP TABLE dev_collections_shadow (
+                    collection_address TEXT, name TEXT, description TEXT, image TEXT,
+                    creator_address TEXT, items_count INTEGER, last_activity BIGINT
+                ) ON COMMIT DROP
+            """)
+            await conn.execute("""
+                CREATE TEMP TABLE dev_nfts_shadow (
+                    nft_address TEXT, collection_address TEXT, nft_index INTEGER, owner_address TEXT,
+                    name TEXT, description TEXT, image TEXT, metadata_url TEXT, attributes TEXT
+                ) ON COMMIT DROP
+            """)
+            await conn.copy_records_to_table(
+                "dev_collections_shadow",
+                records=[
+                    (c["collection_address"], c.get("name") or "", c.get("description") or "", c.get("image") or "",
+                     c.get("creator_address") or "", int(c.get("items_count") or 0), int(c.get("last_activity") or 0))
+                    for c in collections
+                ],
+            )
+            await conn.copy_records_to_table(
+                "dev_nfts_shadow",
+                records=[
+                    (n["nft_address"], n["collection_address"], int(n.get("nft_index") or 0), n.get("owner_address") or "",
+                     n.get("name") or "", n.get("description") or "", n.get("image") or "", n.get("metadata_url") or "",
+                     json.dumps(n.get("attributes") or []))
+                    for n in nfts
+                ],
+            )
+            await conn.execute("""
+                INSERT INTO dev_collections (collection_address, name, description, image, creator_address,
+                                             items_count, last_activity, synced_at)
+                SELECT collection_address, name, description, image, creator_address, items_count, last_activity, NOW()
+                FROM dev_collections_shadow
+                ON CONFLICT (collection_address) DO UPDATE SET
+                  name = EXCLUDED.name,
+                  description = EXCLUDED.description,
+                  image = EXCLUDED.image,
+                  creator_address = EXCLUDED.creator_address,
+                  items_count = EXCLUDED.items_count,
+                  last_activity = EXCLUDED.last_activity,
+                  synced_at = NOW()
+            """)
+            status = await conn.execute("""
+                INSERT INTO dev_nfts (nft_address, collection_id, collection_address, nft_index, owner_address,
+                                      name, description, image, metadata_url, attributes, synced_at)
+                SELECT s.nft_address, c.id, s.collection_address, s.nft_index, s.owner_address,
+                       s.name, s.description, s.image, s.metadata_url, s.attributes::jsonb, NOW()
+                FROM dev_nfts_shadow s
+                JOIN dev_collections c ON c.collection_address = s.collection_address
+                ON CONFLICT (nft_address) DO UPDATE SET
+                  collection_id = EXCLUDED.collection_id,
+                  collection_address = EXCLUDED.collection_address,
+                  nft_index = EXCLUDED.nft_index,
+                  owner_address = EXCLUDED.owner_address,
+                  name = EXCLUDED.name,
+                  description = EXCLUDED.description,
+                  image = EXCLUDED.image,
+                  metadata_url = EXCLUDED.metadata_url,
+                  attributes = EXCLUDED.attributes,
+                  synced_at = NOW()
+            """)
+            upserted = int(status.split()[-1])
+            removed = 0
+            if refreshed_collections:
+                status = await conn.execute(
+                    """DELETE FROM dev_nfts n
+                       WHERE n.collection_address = ANY($1::text[])
+                         AND NOT EXISTS (SELECT 1 FROM dev_nfts_shadow s WHERE s.nft_address = n.nft_address)""",
+                    refreshed_collections,
+                )
+                removed += int(status.split()[-1])
+            pruned = 0
+            if prune_collections:
+                status = await conn.execute(
+                    """DELETE FROM dev_collections c
+                       WHERE NOT EXISTS (SELECT 1 FROM dev_collections_shadow s
+                                         WHERE s.collection_address = c.collection_address)
+                         AND NOT (c.collection_address = ANY($1::text[]))""",
+                    list(keep_collections or []),
+                )
+                pruned = int(status.split()[-1])
+    return {"nfts_upserted": upserted, "nfts_removed": removed, "collections_pruned": pruned}
 
 
 # ===================== game_settings (runtime config) =====================
@@ -4223,6 +4841,28 @@ async def set_setting(key: str, value: Any) -> None:
         )
 
 
+async def get_price_feed(symbol: str) -> Optional[Tuple[Dict[str, Any], datetime]]:
+    """Последнее удачное значение курса symbol: (value, fetched_at) или None."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("SELECT value, fetched_at FROM price_feed WHERE symbol = $1", symbol)
+    if row is None:
+        return None
+    return _json_dict(row["value"]), row["fetched_at"]
+
+
+async def save_price_feed(symbol: str, value: Dict[str, Any], fetched_at: datetime) -> None:
+    """Сохранить удачное значение курса (более старое значение не перезаписывает новое)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """INSERT INTO price_feed (symbol, value, fetched_at) VALUES ($1, $2::jsonb, $3)
+               ON CONFLICT (symbol) DO UPDATE SET value = EXCLUDED.value, fetched_at = EXCLUDED.fetched_at
+               WHERE price_feed.fetched_at < EXCLUDED.fetched_at""",
+            symbol, json.dumps(value), fetched_at,
+        )
+
+
 async def get_all_settings() -> Dict[str, Any]:
     """Return all game_settings as a flat dict."""
     pool = await get_pool()
@@ -4311,9 +4951,11 @@ async def get_nft_owners_with_links() -> List[Dict[str, Any]]:
     """Get unique NFT owners from dev_nfts joined with wallet bindings to find linked TG users."""
     pool = await get_pool()
     async with pool.acquire() as conn:
+        # Владелец — по бинарному ключу адреса: raw и friendly одного кошелька сливаются в одну строку,
+        # привязка кошелька находится по индексу idx_user_wallet_bindings_wallet_addr
         rows = await conn.fetch("""
             SELECT
-                n.owner_address,
+                MIN(n.owner_address) AS owner_address,
                 COUNT(*) AS nft_count,
                 ARRAY_AGG(DISTINCT c.name) FILTER (WHERE c.name IS NOT NULL) AS collection_names,
                 ARRAY_AGG(DISTINCT c.collection_address) FILTER (WHERE c.collection_address IS NOT NULL) AS collection_addresses,
@@ -4322,11 +4964,11 @@ async def get_nft_owners_with_links() -> List[Dict[str, Any]]:
                 gp.username AS linked_username
             FROM dev_nfts n
             JOIN dev_collections c ON c.id = n.collection_id
-            LEFT JOIN user_wallet_bindings wb ON wb.wallet_address = n.owner_address AND wb.verified_at IS NOT NULL
+            LEFT JOIN user_wallet_bindings wb ON wb.wallet_addr = n.owner_addr AND wb.verified_at IS NOT NULL
             LEFT JOIN users u ON u.id = wb.user_id
             LEFT JOIN game_players gp ON gp.telegram_id = u.telegram_id
-            WHERE n.owner_address != '' AND n.owner_address IS NOT NULL
-            GROUP BY n.owner_address, wb.user_id, u.telegram_id, gp.username
+            WHERE n.owner_addr IS NOT NULL
+            GROUP BY n.owner_addr, wb.user_id, u.telegram_id, gp.username
             ORDER BY COUNT(*) DESC
         """)
     return [dict(r) for r in rows]
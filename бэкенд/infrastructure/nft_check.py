@@ -6,10 +6,9 @@
 import logging
 from typing import Any, Dict, List, Optional
 
-import httpx
-
 from config import NFT_DEV_COLLECTIONS, NFT_DEV_WALLET, TON_API_KEY, TON_API_URL
-from infrastructure.ton_address import raw_to_friendly
+from infrastructure.http_client import get_http
+from infrastructure.ton_address import canonical_address
 
 logger = logging.getLogger(__name__)
 
@@ -37,8 +36,7 @@ async def _get_collection_owner(
     if ton_api_key:
         headers["Authorization"] = f"Bearer {ton_api_key}"
     try:
-        async with httpx.AsyncClient(timeout=8.0) as client:
-            r = await client.get(url, headers=headers or None)
+        r = await get_http().get(url, headers=headers or None, timeout=8.0, upstream="tonapi")
         if r.status_code != 200:
             return ""
         data = r.json()
@@ -110,8 +108,7 @@ async def check_user_has_project_nft(
     account_id = wallet_address.strip()
     url = f"{base}/accounts/{account_id}/nfts?limit=1000"
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            r = await client.get(url, headers=headers or None)
+        r = await get_http().get(url, headers=headers or None, timeout=15.0, upstream="tonapi")
     except Exception as e:
         logger.warning("nft_check request failed: %s", e)
         result["error"] = "request_failed"
@@ -129,15 +126,8 @@ async def check_user_has_project_nft(
         return result
 
     nft_items: List[Dict] = data.get("nft_items") or data.get("nfts") or []
-    dev_canonical = await raw_to_friendly(NFT_DEV_WALLET) or NFT_DEV_WALLET
-    dev_collections_canonical: set = set()
-    for a in NFT_DEV_COLLECTIONS:
-        try:
-            canon = await raw_to_friendly(a) or a
-            if canon:
-                dev_collections_canonical.add(canon)
-        except Exception:
-            dev_collections_canonical.add(a.strip())
+    dev_canonical = canonical_address(NFT_DEV_WALLET) or NFT_DEV_WALLET
+    dev_collections_canonical: set = {c for c in (canonical_address(a) for a in NFT_DEV_COLLECTIONS) if c}
 
     count = 0
     seen_collections: Dict[str, bool] = {}
@@ -163,18 +153,13 @@ async def check_user_has_project_nft(
                     items_out.append(_nft_item_display(item, coll_name))
             continue
 
-        coll_canonical = await raw_to_friendly(coll_addr) or coll_addr
+        coll_canonical = canonical_address(coll_addr) or coll_addr
         if dev_collections_canonical and coll_canonical in dev_collections_canonical:
             is_dev = True
         else:
-            owner_friendly = ""
-            if owner_raw:
-                owner_friendly = await raw_to_friendly(owner_raw) or owner_raw
-            else:
-                owner_friendly = await _get_collection_owner(coll_addr, ton_api_url=base, ton_api_key=key)
-                if owner_friendly:
-                    owner_friendly = await raw_to_friendly(owner_friendly) or owner_friendly
-            owner_canonical = await raw_to_friendly(owner_friendly) or owner_friendly if owner_friendly else ""
+            if not owner_raw:
+                owner_raw = await _get_collection_owner(coll_addr, ton_api_url=base, ton_api_key=key)
+            owner_canonical = canonical_address(owner_raw) if owner_raw else ""
             is_dev = bool(owner_canonical and owner_canonical == dev_canonical)
         seen_collections[coll_addr] = is_dev
         if is_dev:
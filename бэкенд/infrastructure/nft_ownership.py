@@ -0,0 +1,193 @@
+"""
+Локальный индекс владения NFT проекта: кошелёк → NFT из dev_nfts (owner_addr).
+
+/nft/check и /nft/user-nfts отвечают из индекса без обращений к TonAPI. Индекс обновляет
+периодический nft_sync (api/main.py) и, если задан NFT_WEBHOOK_SECRET, вебхук TonAPI:
+смена владельца NFT — точечный refresh_nft_owner, событие коллекции — внеочередной инкрементальный синк.
+Живой запрос check_user_has_project_nft — только запасной путь, когда успешного синка не было
+дольше NFT_INDEX_MAX_AGE_SEC; ответ по кошельку запоминается на NFT_LIVE_FALLBACK_TTL_SEC.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import NFT_INDEX_MAX_AGE_SEC, NFT_LIVE_FALLBACK_TTL_SEC
+from infrastructure.database import find_dev_nft_account, get_dev_nfts_for_user, get_nft_index_synced_at
+from infrastructure.nft_check import check_user_has_project_nft
+from infrastructure.nft_sync import refresh_nft_owner, run_incremental_sync
+from infrastructure.ton_address import address_forms, address_key, canonical_address
+
+logger = logging.getLogger(__name__)
+
+# Время последнего синка перечитывается из nft_sync_log не чаще раза в SYNCED_AT_TTL секунд
+SYNCED_AT_TTL = 30.0
+LIVE_MEMO_MAX = 10_000
+
+_synced_at: Tuple[Optional[datetime], float] = (None, 0.0)
+# canonical кошелька → (monotonic истечения, items)
+_live_memo: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+_collection_sync: Optional[asyncio.Task] = None
+_collection_sync_again = False
+
+
+async def index_synced_at() -> Optional[datetime]:
+    global _synced_at
+    value, checked = _synced_at
+    if time.monotonic() - checked > SYNCED_AT_TTL:
+        value = await get_nft_index_synced_at()
+        _synced_at = (value, time.monotonic())
+    return value
+
+
+def invalidate_synced_at() -> None:
+    global _synced_at
+    _synced_at = (None, 0.0)
+
+
+def is_fresh(synced_at: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    if synced_at is None:
+        return False
+    now = now or datetime.now(timezone.utc)
+    return (now - synced_at).total_seconds() <= NFT_INDEX_MAX_AGE_SEC
+
+
+def index_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка dev_nfts → элемент ответа /nft/check (поля как у _nft_item_display)."""
+    return {
+        "address": row["nft_address"],
+        "name": (row.get("name") or "NFT").strip(),
+        "image": (row.get("image") or "").strip(),
+        "collection_name": (row.get("collection_name") or "").strip(),
+        "collection_address": row.get("collection_address") or "",
+    }
+
+
+def catalog_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка dev_nfts → элемент ответа /nft/user-nfts (с описанием и атрибутами)."""
+    attrs = row.get("attributes") or []
+    if isinstance(attrs, str):
+        try:
+            attrs = json.loads(attrs)
+        except ValueError:
+            attrs = []
+    return {
+        "nft_address": row["nft_address"],
+        "collection_address": row["collection_address"],
+        "collection_name": row.get("collection_name") or "",
+        "name": row["name"],
+        "description": row.get("description") or "",
+        "image": row["image"],
+        "attributes": attrs,
+        "nft_index": row.get("nft_index") or 0,
+    }
+
+
+async def _live_items(wallet: str) -> Optional[List[Dict[str, Any]]]:
+    """NFT проекта на кошельке из TonAPI с памятью на NFT_LIVE_FALLBACK_TTL_SEC; None — запрос не удался."""
+    key = canonical_address(wallet)
+    now = time.monotonic()
+    hit = _live_memo.get(key)
+    if hit and hit[0] > now:
+        return hit[1]
+    try:
+        out = await check_user_has_project_nft(wallet, return_items=True)
+    except Exception as e:
+        logger.warning("nft_ownership live %s: %s", wallet[:16], e)
+        return None
+    if out.get("error"):
+        return None
+    if len(_live_memo) >= LIVE_MEMO_MAX:
+        for k in [k for k, (exp, _) in _live_memo.items() if exp <= now]:
+            del _live_memo[k]
+        if len(_live_memo) >= LIVE_MEMO_MAX:
+            _live_memo.clear()
+    items = out.get("items") or []
+    _live_memo[key] = (now + NFT_LIVE_FALLBACK_TTL_SEC, items)
+    return items
+
+
+async def check_project_nfts(wallets: List[str]) -> Dict[str, Any]:
+    """
+    Ответ /nft/check по кошелькам пользователя: {has_project_nft, count, wallets_checked, items, source, synced_at}.
+    source = "index" — из dev_nfts; "live" — индекс устарел и хотя бы один кошелёк проверен через TonAPI
+    (кошельки, для которых TonAPI не ответил, берутся из индекса).
+    """
+    wallets = [w for w in dict.fromkeys((w or "").strip() for w in wallets) if w]
+    synced_at = await index_synced_at()
+    rows = await get_dev_nfts_for_user(wallets) if wallets else []
+    by_owner: Dict[bytes, List[Dict[str, Any]]] = {}
+    for r in rows:
+        by_owner.setdefault(bytes(r["owner_addr"]), []).append(r)
+
+    stale = not is_fresh(synced_at)
+    source = "index"
+    items: List[Dict[str, Any]] = []
+    seen: set = set()
+    for w in wallets:
+        wallet_items = None
+        if stale:
+            wallet_items = await _live_items(w)
+            if wallet_items is not None:
+                source = "live"
+        if wallet_items is None:
+            wallet_items = [index_item(r) for r in by_owner.get(address_key(w) or b"", [])]
+        for it in wallet_items:
+            a = (it.get("address") or "").strip()
+            if a and a not in seen:
+                seen.add(a)
+                items.append(it)
+    return {
+        "has_project_nft": bool(items),
+        "count": len(items),
+        "wallets_checked": len(wallets),
+        "items": items,
+        "source": source,
+        "synced_at": synced_at.isoformat() if synced_at else None,
+    }
+
+
+# ——— Вебхук TonAPI ———
+
+async def _collection_sync_loop() -> None:
+    """Инкрементальный синк; события, пришедшие во время синка, схлопываются в один повторный прогон."""
+    global _collection_sync_again
+    while True:
+        _collection_sync_again = False
+        try:
+            stats = await run_incremental_sync()
+            logger.info("nft_ownership: webhook incremental sync — %s", stats)
+        except Exception as e:
+            logger.warning("nft_ownership: webhook incremental sync failed: %s", e)
+        invalidate_synced_at()
+        if not _collection_sync_again:
+            return
+
+
+def request_collection_sync() -> bool:
+    """Запустить внеочередной инкрементальный синк в фоне. False — синк уже идёт (будет повтор после него)."""
+    global _collection_sync, _collection_sync_again
+    if _collection_sync is not None and not _collection_sync.done():
+        _collection_sync_again = True
+        return False
+    _collection_sync = asyncio.create_task(_collection_sync_loop())
+    return True
+
+
+async def handle_account_event(account_id: str) -> Dict[str, Any]:
+    """
+    Событие account_tx от TonAPI. NFT из dev_nfts — точечно обновить владельца;
+    коллекция разработчика — инкрементальный синк в фоне; прочие аккаунты игнорируются.
+    """
+    forms = address_forms(account_id)
+    if not forms:
+        return {"kind": None}
+    kind = await find_dev_nft_account(forms)
+    if kind == "nft":
+        owner = await refresh_nft_owner(forms[0])
+        return {"kind": kind, "owner_changed": owner is not None}
+    if kind == "collection":
+        return {"kind": kind, "sync_started": request_collection_sync()}
+    return {"kind": None}
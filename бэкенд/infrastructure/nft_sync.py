@@ -10,33 +10,47 @@
 5. Для поиска NFT, уже переданных юзерам, используем search endpoint:
    GET /v2/accounts/{DEV_WALLET}/nfts?collection={coll_addr}&indirect_ownership=true
    или просто GET /v2/nfts/collections/{addr}/items (с fallback если 404).
+6. Запросы к TonAPI идут параллельно через общий token bucket (TON_API_RPS/TON_API_BURST)
+   и семафор TON_API_CONCURRENCY; снимок пишется одной транзакцией через COPY в shadow-таблицы.
 
 Запуск:
-  - Фоновая задача при старте приложения.
-  - Периодически каждые 30 мин.
-  - Вручную через POST /api/game/nft/sync (admin).
+  - Планировщик (api/main.py): каждые 30 мин, полный синк раз в NFT_FULL_SYNC_INTERVAL_HOURS,
+    между ними — инкрементальный (только коллекции с изменившимся next_item_index/last_activity).
+  - Вручную через POST /api/game/nft/sync (admin) — полный.
+  - Вебхук TonAPI (POST /api/game/nft/webhook): смена владельца NFT — refresh_nft_owner,
+    событие коллекции — внеочередной инкрементальный синк (infrastructure/nft_ownership.py).
 """
 import asyncio
 import logging
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Optional, Set
 
-import httpx
-
-from config import NFT_DEV_COLLECTIONS, NFT_DEV_WALLET, PHOEX_TOKEN_ADDRESS, TON_API_KEY, TON_API_URL
+from config import (
+    NFT_DEV_COLLECTIONS,
+    NFT_DEV_WALLET,
+    NFT_FULL_SYNC_INTERVAL_HOURS,
+    PHOEX_TOKEN_ADDRESS,
+    TON_API_BURST,
+    TON_API_CONCURRENCY,
+    TON_API_KEY,
+    TON_API_RPS,
+    TON_API_URL,
+)
 from infrastructure.database import (
-    clear_dev_collections,
+    apply_dev_nft_snapshot,
+    get_dev_collection_fingerprints,
+    get_last_nft_sync_at,
     get_nft_owners_with_links,
     log_nft_sync,
-    upsert_dev_collection,
-    upsert_dev_nft,
+    update_dev_nft_owner,
     upsert_holder_snapshot,
 )
-from infrastructure.ton_address import raw_to_friendly
+from infrastructure.http_client import HttpClient, TokenBucket, get_http
+from infrastructure.ton_address import address_forms, canonical_address
 
 logger = logging.getLogger(__name__)
 
-_API_DELAY = 1.0  # секунд между запросами (rate-limit TonAPI)
-
 
 def _addr(obj: Any) -> str:
     """Извлечь адрес из строки или dict(address=...)."""
@@ -97,15 +111,22 @@ def _extract_metadata(item: Dict) -> Dict[str, Any]:
     }
 
 
-async def _api_get(client: httpx.AsyncClient, path: str, params: Optional[Dict] = None) -> Optional[Dict]:
-    """GET-запрос к TonAPI v2 с авторизацией."""
+_limiter = TokenBucket(TON_API_RPS, TON_API_BURST)
+_concurrency = asyncio.Semaphore(max(TON_API_CONCURRENCY, 1))
+_ITEMS_PAGE = 1000
+
+
+async def _api_get(client: HttpClient, path: str, params: Optional[Dict] = None) -> Optional[Dict]:
+    """GET-запрос к TonAPI v2 с авторизацией через общий лимитер (429/5xx повторяет общий HTTP-клиент)."""
     base = TON_API_URL.rstrip("/")
     url = f"{base}{path}"
     headers = {}
     if TON_API_KEY:
         headers["Authorization"] = f"Bearer {TON_API_KEY}"
     try:
-        r = await client.get(url, headers=headers or None, params=params)
+        async with _concurrency:
+            await _limiter.acquire()
+            r = await client.get(url, headers=headers or None, params=params, timeout=20.0, upstream="tonapi")
         if r.status_code == 200:
             return r.json()
         if r.status_code != 404:
@@ -115,14 +136,14 @@ async def _api_get(client: httpx.AsyncClient, path: str, params: Optional[Dict]
     return None
 
 
-async def _canonical(addr: str) -> str:
-    """Привести адрес к каноническому виду (UQ...) для сравнения."""
+def _canonical(addr: str) -> str:
+    """Привести адрес к каноническому виду (UQ...) для сравнения (локально, LRU-кэш)."""
     if not addr:
         return ""
-    return await raw_to_friendly(addr) or addr
+    return canonical_address(addr) or addr
 
 
-async def _get_collection_meta(client: httpx.AsyncClient, coll_addr_raw: str) -> Optional[Dict]:
+async def _get_collection_meta(client: HttpClient, coll_addr_raw: str) -> Optional[Dict]:
     """Получить метаданные коллекции: name, description, image, next_item_index, owner."""
     data = await _api_get(client, f"/nfts/collections/{coll_addr_raw}")
     if not data:
@@ -146,9 +167,101 @@ async def _get_collection_meta(client: httpx.AsyncClient, coll_addr_raw: str) ->
     }
 
 
+async def _get_last_activity(client: HttpClient, addr_raw: str) -> int:
+    """last_activity аккаунта коллекции (unix) — часть отпечатка для инкрементального синка; 0 при ошибке."""
+    data = await _api_get(client, f"/accounts/{addr_raw}")
+    if not data:
+        return 0
+    try:
+        return int(data.get("last_activity") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def _get_collection_items(client: HttpClient, coll_addr_raw: str) -> Optional[List[Dict]]:
+    """Все NFT коллекции постранично. None — если хотя бы одна страница не получена (список неполный)."""
+    items: List[Dict] = []
+    offset = 0
+    while True:
+        data = await _api_get(
+            client,
+            f"/nfts/collections/{coll_addr_raw}/items",
+            {"limit": str(_ITEMS_PAGE), "offset": str(offset)},
+        )
+        if not data:
+            return None
+        page = data.get("nft_items") or data.get("nfts") or []
+        items.extend(page)
+        if len(page) < _ITEMS_PAGE:
+            return items
+        offset += _ITEMS_PAGE
+
+
+async def _discover_owner_collections(client: HttpClient) -> List[str]:
+    """Автообнаружение коллекций по owner через TonCenter v3 (коллекции, все NFT которых уже у юзеров)."""
+    try:
+        r = await client.get(
+            "https://toncenter.com/api/v3/nft/collections",
+            params={"owner_address": NFT_DEV_WALLET, "limit": "50"},
+            timeout=20.0,
+            upstream="toncenter",
+        )
+        if r.status_code != 200:
+            logger.warning("nft_sync: TonCenter v3 collections → %s", r.status_code)
+            return []
+        tc_collections = r.json().get("nft_collections", [])
+        logger.info("nft_sync: TonCenter v3 вернул %d коллекций owner=%s", len(tc_collections), NFT_DEV_WALLET[:20])
+        return [(c.get("address") or "").strip() for c in tc_collections if (c.get("address") or "").strip()]
+    except Exception as e:
+        logger.warning("nft_sync: TonCenter v3 discovery error: %s", e)
+        return []
+
+
+def _nft_row(item: Dict, coll_canonical: str, default_owner: str = "") -> Optional[Dict[str, Any]]:
+    """Строка dev_nfts из NFT item TonAPI."""
+    nft_addr = _addr(item.get("address"))
+    if not nft_addr:
+        return None
+    owner = _addr(item.get("owner")) or _addr(item.get("owner_address"))
+    if owner:
+        owner = _canonical(owner)
+    meta = _extract_metadata(item)
+    nft_index = item.get("index") or 0
+    if isinstance(nft_index, str):
+        try:
+            nft_index = int(nft_index)
+        except ValueError:
+            nft_index = 0
+    return {
+        "nft_address": nft_addr,
+        "collection_address": coll_canonical,
+        "nft_index": nft_index,
+        "owner_address": owner or default_owner,
+        **{k: meta[k] for k in ("name", "description", "image", "metadata_url", "attributes")},
+    }
+
+
 async def run_full_sync() -> Dict[str, Any]:
+    """Полная синхронизация: все коллекции разработчика, удаление исчезнувших."""
+    return await _run_sync(incremental=False)
+
+
+async def run_incremental_sync() -> Dict[str, Any]:
+    """Инкрементальная синхронизация: NFT перечитываются только у коллекций с изменившимся отпечатком."""
+    return await _run_sync(incremental=True)
+
+
+async def run_scheduled_sync() -> Dict[str, Any]:
+    """Для планировщика: полный синк раз в NFT_FULL_SYNC_INTERVAL_HOURS, между ними — инкрементальный."""
+    last_full = await get_last_nft_sync_at("full")
+    if last_full is None or datetime.now(timezone.utc) - last_full > timedelta(hours=NFT_FULL_SYNC_INTERVAL_HOURS):
+        return await run_full_sync()
+    return await run_incremental_sync()
+
+
+async def _run_sync(incremental: bool) -> Dict[str, Any]:
     """
-    Полная синхронизация NFT-каталога разработчика.
+    Синхронизация NFT-каталога разработчика.
 
     Алгоритм:
     1. GET /accounts/{DEV_WALLET}/nfts → все NFT на кошельке
@@ -157,338 +270,255 @@ async def run_full_sync() -> Dict[str, Any]:
     4. Автообнаружение: TonCenter v3 /nft/collections?owner_address=DEV_WALLET
        (находит коллекции, у которых все NFT уже переданы юзерам)
     5. Для каждой уникальной коллекции → GET /nfts/collections/{addr} → проверяем owner == DEV_WALLET
-    6. Только коллекции, созданные разработчиком, попадают в dev_collections
-    7. NFT из этих коллекций → dev_nfts
+       (параллельно, в пределах TON_API_CONCURRENCY и token bucket TON_API_RPS)
+    6. Отпечаток коллекции (next_item_index, last_activity); в инкрементальном режиме
+       NFT перечитываются только у коллекций, чей отпечаток изменился
+    7. Снимок применяется одной транзакцией (apply_dev_nft_snapshot) — каталог не пустеет во время синка
     """
-    stats = {"collections_synced": 0, "nfts_synced": 0, "errors": 0}
+    sync_type = "incremental" if incremental else "full"
+    stats = {"collections_synced": 0, "collections_refreshed": 0, "nfts_synced": 0, "nfts_removed": 0, "errors": 0}
 
     if not NFT_DEV_WALLET:
         logger.info("nft_sync: NFT_DEV_WALLET не задан — пропуск")
-        await log_nft_sync("full", 0, 0, 0)
+        await log_nft_sync(sync_type, 0, 0, 0)
         return stats
 
-    dev_canonical = await _canonical(NFT_DEV_WALLET)
-    logger.info("nft_sync: starting, dev_wallet=%s (canonical=%s)", NFT_DEV_WALLET, dev_canonical)
+    dev_canonical = _canonical(NFT_DEV_WALLET)
+    logger.info("nft_sync[%s]: starting, dev_wallet=%s (canonical=%s)", sync_type, NFT_DEV_WALLET, dev_canonical)
+    t0 = time.monotonic()
 
-    # Очищаем старые данные перед полным ресинком
-    await clear_dev_collections()
+    client = get_http()
+    # ── Шаг 1: получить все NFT с кошелька разработчика ──
+    data = await _api_get(client, f"/accounts/{NFT_DEV_WALLET}/nfts", {"limit": "1000"})
+    if not data:
+        logger.warning("nft_sync: не удалось получить NFT кошелька разработчика")
+        await log_nft_sync(sync_type, 0, 0, 1)
+        stats["errors"] = 1
+        return stats
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        # ── Шаг 1: получить все NFT с кошелька разработчика ──
-        data = await _api_get(client, f"/accounts/{NFT_DEV_WALLET}/nfts", {"limit": "1000"})
-        if not data:
-            logger.warning("nft_sync: не удалось получить NFT кошелька разработчика")
-            await log_nft_sync("full", 0, 0, 1)
-            stats["errors"] = 1
-            return stats
-
-        all_wallet_nfts = data.get("nft_items") or data.get("nfts") or []
-        logger.info("nft_sync: получено %d NFT с кошелька", len(all_wallet_nfts))
-
-        # ── Шаг 2: собрать уникальные коллекции ──
-        # raw_addr → { nft_items: [...], coll_info_from_nft: {...} }
-        collections_raw: Dict[str, Dict] = {}
-        for item in all_wallet_nfts:
-            coll = item.get("collection") or {}
-            if isinstance(coll, str):
-                coll_addr_raw = coll.strip()
-                coll_name = ""
-            elif isinstance(coll, dict):
-                coll_addr_raw = _addr(coll.get("address"))
-                coll_name = (coll.get("name") or "").strip()
-            else:
-                continue
-            if not coll_addr_raw:
-                continue
-            if coll_addr_raw not in collections_raw:
-                collections_raw[coll_addr_raw] = {
-                    "name": coll_name,
-                    "nft_items": [],
-                }
-            collections_raw[coll_addr_raw]["nft_items"].append(item)
-
-        logger.info("nft_sync: найдено %d уникальных коллекций на кошельке", len(collections_raw))
-
-        # ── Принудительный список из .env ──
-        forced_addrs: Set[str] = set()
-        if NFT_DEV_COLLECTIONS:
-            for a in NFT_DEV_COLLECTIONS:
-                a = a.strip()
-                if a:
-                    forced_addrs.add(a)
-                    if a not in collections_raw:
-                        collections_raw[a] = {"name": "", "nft_items": []}
-
-        # ── Автообнаружение коллекций по owner через TonCenter v3 ──
-        try:
-            tc_url = "https://toncenter.com/api/v3/nft/collections"
-            tc_params = {"owner_address": NFT_DEV_WALLET, "limit": "50"}
-            r = await client.get(tc_url, params=tc_params)
-            if r.status_code == 200:
-                tc_data = r.json()
-                tc_collections = tc_data.get("nft_collections", [])
-                for c in tc_collections:
-                    tc_addr = (c.get("address") or "").strip()
-                    if tc_addr and tc_addr not in collections_raw:
-                        collections_raw[tc_addr] = {"name": "", "nft_items": []}
-                        forced_addrs.add(tc_addr)
-                        logger.info("nft_sync: автообнаружена коллекция %s (TonCenter)", tc_addr[:20])
-                logger.info("nft_sync: TonCenter v3 вернул %d коллекций owner=%s",
-                            len(tc_collections), NFT_DEV_WALLET[:20])
-            else:
-                logger.warning("nft_sync: TonCenter v3 collections → %s", r.status_code)
-        except Exception as e:
-            logger.warning("nft_sync: TonCenter v3 discovery error: %s", e)
-
-        # ── Шаг 3: для каждой коллекции проверяем owner ──
-        dev_coll_ids: Dict[str, int] = {}  # raw_addr → db id
-
-        for coll_addr_raw, coll_data in collections_raw.items():
-            try:
-                await asyncio.sleep(_API_DELAY)
-                meta = await _get_collection_meta(client, coll_addr_raw)
-
-                # Проверяем: разработчик ли владелец?
-                is_dev_collection = coll_addr_raw in forced_addrs
-                if not is_dev_collection and meta and meta.get("owner_raw"):
-                    owner_canonical = await _canonical(meta["owner_raw"])
-                    is_dev_collection = (owner_canonical == dev_canonical)
-
-                if not is_dev_collection:
-                    continue
-
-                # Это коллекция разработчика — сохраняем
-                coll_canonical = await _canonical(coll_addr_raw)
-                coll_name = ""
-                coll_desc = ""
-                coll_image = ""
-                items_count = 0
-                if meta:
-                    coll_name = meta["name"]
-                    coll_desc = meta["description"]
-                    coll_image = meta["image"]
-                    items_count = meta["items_count"]
-                if not coll_name:
-                    coll_name = coll_data.get("name") or ""
-
-                coll_id = await upsert_dev_collection(
-                    collection_address=coll_canonical,
-                    name=coll_name,
-                    description=coll_desc,
-                    image=coll_image,
-                    creator_address=dev_canonical,
-                    items_count=items_count,
-                )
-                dev_coll_ids[coll_addr_raw] = coll_id
-                stats["collections_synced"] += 1
-                logger.info("nft_sync: коллекция «%s» (%s) — %d items", coll_name, coll_canonical[:20], items_count)
-
-            except Exception as e:
-                logger.warning("nft_sync: ошибка коллекции %s: %s", coll_addr_raw[:20], e)
-                stats["errors"] += 1
-
-        if not dev_coll_ids:
-            logger.info("nft_sync: не найдено коллекций разработчика")
-            await log_nft_sync("full", 0, 0, stats["errors"])
-            return stats
-
-        # ── Шаг 4: сохраняем NFT из коллекций разработчика ──
-        # a) NFT, найденные на кошельке разработчика
-        for coll_addr_raw, coll_id in dev_coll_ids.items():
-            coll_data = collections_raw.get(coll_addr_raw, {})
-            coll_canonical = await _canonical(coll_addr_raw)
-            for item in coll_data.get("nft_items", []):
-                try:
-                    nft_addr = _addr(item.get("address"))
-                    if not nft_addr:
-                        continue
-                    owner = _addr(item.get("owner")) or _addr(item.get("owner_address"))
-                    if owner:
-                        owner = await _canonical(owner)
-                    meta = _extract_metadata(item)
-                    nft_index = item.get("index") or 0
-                    if isinstance(nft_index, str):
-                        try:
-                            nft_index = int(nft_index)
-                        except ValueError:
-                            nft_index = 0
-
-                    await upsert_dev_nft(
-                        nft_address=nft_addr,
-                        collection_id=coll_id,
-                        collection_address=coll_canonical,
-                        nft_index=nft_index,
-                        owner_address=owner or dev_canonical,
-                        name=meta["name"],
-                        description=meta["description"],
-                        image=meta["image"],
-                        metadata_url=meta["metadata_url"],
-                        attributes=meta["attributes"],
-                    )
-                    stats["nfts_synced"] += 1
-                except Exception as e:
-                    logger.warning("nft_sync: ошибка NFT %s: %s", _addr(item.get("address"))[:20], e)
-                    stats["errors"] += 1
-
-        # b) Попытка загрузить ВСЕ NFT каждой коллекции (включая переданные юзерам)
-        for coll_addr_raw, coll_id in dev_coll_ids.items():
-            try:
-                await asyncio.sleep(_API_DELAY)
-                coll_canonical = await _canonical(coll_addr_raw)
-                # Пробуем /nfts/collections/{addr}/items
-                items_data = await _api_get(
-                    client,
-                    f"/nfts/collections/{coll_addr_raw}/items",
-                    {"limit": "1000", "offset": "0"},
-                )
-                if not items_data:
-                    # Fallback: пробуем без /items (некоторые версии API)
-                    continue
-                items = items_data.get("nft_items") or items_data.get("nfts") or []
-                for item in items:
-                    try:
-                        nft_addr = _addr(item.get("address"))
-                        if not nft_addr:
-                            continue
-                        owner = _addr(item.get("owner")) or _addr(item.get("owner_address"))
-                        if owner:
-                            owner = await _canonical(owner)
-                        meta = _extract_metadata(item)
-                        nft_index = item.get("index") or 0
-                        if isinstance(nft_index, str):
-                            try:
-                                nft_index = int(nft_index)
-                            except ValueError:
-                                nft_index = 0
-                        await upsert_dev_nft(
-                            nft_address=nft_addr,
-                            collection_id=coll_id,
-                            collection_address=coll_canonical,
-                            nft_index=nft_index,
-                            owner_address=owner,
-                            name=meta["name"],
-                            description=meta["description"],
-                            image=meta["image"],
-                            metadata_url=meta["metadata_url"],
-                            attributes=meta["attributes"],
-                        )
-                        stats["nfts_synced"] += 1
-                    except Exception as e:
-                        stats["errors"] += 1
-            except Exception as e:
-                logger.warning("nft_sync: items fetch error %s: %s", coll_addr_raw[:20], e)
-
-    await log_nft_sync("full", stats["collections_synced"], stats["nfts_synced"], stats["errors"])
+    all_wallet_nfts = data.get("nft_items") or data.get("nfts") or []
+    logger.info("nft_sync: получено %d NFT с кошелька", len(all_wallet_nfts))
+
+    # ── Шаг 2: собрать уникальные коллекции ──
+    # raw_addr → { name, nft_items: [...] }
+    collections_raw: Dict[str, Dict] = {}
+    for item in all_wallet_nfts:
+        coll = item.get("collection") or {}
+        if isinstance(coll, str):
+            coll_addr_raw = coll.strip()
+            coll_name = ""
+        elif isinstance(coll, dict):
+            coll_addr_raw = _addr(coll.get("address"))
+            coll_name = (coll.get("name") or "").strip()
+        else:
+            continue
+        if not coll_addr_raw:
+            continue
+        if coll_addr_raw not in collections_raw:
+            collections_raw[coll_addr_raw] = {"name": coll_name, "nft_items": []}
+        collections_raw[coll_addr_raw]["nft_items"].append(item)
+
+    logger.info("nft_sync: найдено %d уникальных коллекций на кошельке", len(collections_raw))
+
+    # ── Принудительный список из .env + автообнаружение по owner ──
+    forced_addrs: Set[str] = set(a.strip() for a in NFT_DEV_COLLECTIONS if a.strip())
+    for a in await _discover_owner_collections(client):
+        if a not in collections_raw:
+            forced_addrs.add(a)
+            logger.info("nft_sync: автообнаружена коллекция %s (TonCenter)", a[:20])
+    for a in forced_addrs:
+        collections_raw.setdefault(a, {"name": "", "nft_items": []})
+
+    # ── Шаг 3: метаданные и owner всех коллекций — параллельно ──
+    addrs = list(collections_raw)
+    metas = await asyncio.gather(*(_get_collection_meta(client, a) for a in addrs))
+
+    dev_colls: Dict[str, Dict[str, Any]] = {}  # raw_addr → строка dev_collections
+    unknown_collections: List[str] = []        # метаданные не получены — не удаляем при полном синке
+    for coll_addr_raw, meta in zip(addrs, metas):
+        is_dev_collection = coll_addr_raw in forced_addrs
+        if not is_dev_collection and meta and meta.get("owner_raw"):
+            is_dev_collection = _canonical(meta["owner_raw"]) == dev_canonical
+        if meta is None:
+            stats["errors"] += 1
+            unknown_collections.append(_canonical(coll_addr_raw))
+        if not is_dev_collection:
+            continue
+        dev_colls[coll_addr_raw] = {
+            "collection_address": _canonical(coll_addr_raw),
+            "name": (meta or {}).get("name") or collections_raw[coll_addr_raw].get("name") or "",
+            "description": (meta or {}).get("description") or "",
+            "image": (meta or {}).get("image") or "",
+            "creator_address": dev_canonical,
+            "items_count": (meta or {}).get("items_count") or 0,
+        }
+
+    if not dev_colls:
+        logger.info("nft_sync: не найдено коллекций разработчика")
+        await log_nft_sync(sync_type, 0, 0, stats["errors"])
+        return stats
+
+    # ── Шаг 4: отпечаток коллекций, выбор изменившихся ──
+    dev_addrs = list(dev_colls)
+    activities = await asyncio.gather(*(_get_last_activity(client, a) for a in dev_addrs))
+    known = await get_dev_collection_fingerprints() if incremental else {}
+    changed: List[str] = []
+    for a, last_activity in zip(dev_addrs, activities):
+        row = dev_colls[a]
+        row["last_activity"] = last_activity
+        fp = (int(row["items_count"] or 0), last_activity)
+        if not incremental or not last_activity or known.get(row["collection_address"]) != fp:
+            changed.append(a)
+    logger.info("nft_sync[%s]: %d коллекций разработчика, к перечитке %d", sync_type, len(dev_colls), len(changed))
+
+    # ── Шаг 5: NFT — с кошелька разработчика и полные списки изменившихся коллекций ──
+    nfts: Dict[str, Dict[str, Any]] = {}
+    for coll_addr_raw, row in dev_colls.items():
+        for item in collections_raw.get(coll_addr_raw, {}).get("nft_items", []):
+            nft = _nft_row(item, row["collection_address"], default_owner=dev_canonical)
+            if nft:
+                nfts[nft["nft_address"]] = nft
+
+    item_lists = await asyncio.gather(*(_get_collection_items(client, a) for a in changed))
+    refreshed: List[str] = []
+    for coll_addr_raw, items in zip(changed, item_lists):
+        row = dev_colls[coll_addr_raw]
+        if items is None:
+            # список неполный: NFT коллекции не удаляем, отпечаток сбрасываем — перечитаем в следующий раз
+            logger.warning("nft_sync: items fetch error %s", coll_addr_raw[:20])
+            row["last_activity"] = 0
+            stats["errors"] += 1
+            continue
+        for item in items:
+            nft = _nft_row(item, row["collection_address"])
+            if nft:
+                nfts[nft["nft_address"]] = nft
+        refreshed.append(row["collection_address"])
+
+    # ── Шаг 6: одна транзакция — каталог без «пустого» окна ──
+    applied = await apply_dev_nft_snapshot(
+        collections=list(dev_colls.values()),
+        nfts=list(nfts.values()),
+        refreshed_collections=refreshed,
+        prune_collections=not incremental,
+        keep_collections=unknown_collections,
+    )
+    stats["collections_synced"] = len(dev_colls)
+    stats["collections_refreshed"] = len(refreshed)
+    stats["nfts_synced"] = applied["nfts_upserted"]
+    stats["nfts_removed"] = applied["nfts_removed"]
+
+    await log_nft_sync(sync_type, stats["collections_synced"], stats["nfts_synced"], stats["errors"])
     logger.info(
-        "nft_sync complete: %d collections, %d nfts, %d errors",
-        stats["collections_synced"], stats["nfts_synced"], stats["errors"],
+        "nft_sync[%s] complete in %.1fs: %d collections (%d refreshed), %d nfts, %d removed, %d errors",
+        sync_type, time.monotonic() - t0, stats["collections_synced"], stats["collections_refreshed"],
+        stats["nfts_synced"], stats["nfts_removed"], stats["errors"],
     )
     return stats
 
 
+async def refresh_nft_owner(nft_address: str) -> Optional[str]:
+    """
+    Точечное обновление владельца одного NFT из dev_nfts (для вебхука TonAPI): GET /nfts/{address}.
+    Возвращает нового владельца (UQ…), если он сменился; None — не изменился или запрос не удался.
+    """
+    data = await _api_get(get_http(), f"/nfts/{nft_address}")
+    if not data:
+        return None
+    owner = _canonical(_addr(data.get("owner")) or _addr(data.get("owner_address")))
+    if not owner:
+        return None
+    if await update_dev_nft_owner(address_forms(nft_address), owner):
+        logger.info("nft_sync: owner of %s → %s", nft_address[:20], owner[:20])
+        return owner
+    return None
+
+
 # ===================== NFT Holders Sync =====================
 
+async def _sync_holder(client: HttpClient, owner_row: Dict[str, Any], jetton_master: str) -> bool:
+    """Баланс и история PHXPW одного холдера → nft_holder_snapshots."""
+    addr = owner_row["owner_address"]
+    addr_canonical = _canonical(addr)
+    coll_names = owner_row.get("collection_names") or []
+    coll_addrs = owner_row.get("collection_addresses") or []
+    collections = [
+        {"name": n, "address": a}
+        for n, a in zip(coll_names, coll_addrs)
+    ] if coll_names else []
+
+    phxpw_balance = 0.0
+    total_received = 0.0
+    total_sent = 0.0
+
+    if jetton_master:
+        # Fetch PHXPW balance and jetton transfer history (через общий лимитер TonAPI)
+        balance_data, history_data = await asyncio.gather(
+            _api_get(client, f"/accounts/{addr}/jettons/{jetton_master}"),
+            _api_get(client, f"/accounts/{addr}/jettons/{jetton_master}/history", {"limit": 100}),
+        )
+        if balance_data:
+            raw_balance = balance_data.get("balance") or "0"
+            # PHXPW has 9 decimals
+            try:
+                phxpw_balance = int(raw_balance) / 1_000_000_000
+            except (ValueError, TypeError):
+                phxpw_balance = 0.0
+        for ev in (history_data or {}).get("events") or []:
+            for action in ev.get("actions") or []:
+                jt = action.get("JettonTransfer") or {}
+                amount_raw = jt.get("amount") or "0"
+                try:
+                    amount = int(amount_raw) / 1_000_000_000
+                except (ValueError, TypeError):
+                    amount = 0.0
+                sender = _addr(jt.get("sender")) or ""
+                recipient = _addr(jt.get("recipient")) or ""
+                # raw и friendly одного кошелька совпадают после канонизации
+                if sender and _canonical(sender) == addr_canonical:
+                    total_sent += amount
+                elif recipient and _canonical(recipient) == addr_canonical:
+                    total_received += amount
+
+    try:
+        await upsert_holder_snapshot(
+            owner_address=addr,
+            nft_count=owner_row["nft_count"],
+            collections=collections,
+            phxpw_balance=phxpw_balance,
+            total_received=total_received,
+            total_sent=total_sent,
+            staking_rewards=0,  # TODO: integrate with staking system
+            linked_telegram_id=owner_row.get("linked_telegram_id"),
+            linked_username=owner_row.get("linked_username"),
+        )
+        return True
+    except Exception as e:
+        logger.warning("sync_holders: upsert error %s: %s", addr[:16], e)
+        return False
+
+
 async def sync_nft_holders() -> Dict[str, Any]:
     """
     Sync NFT holder analytics:
     1. Get unique owners from dev_nfts
     2. For each owner, fetch PHXPW balance and transfer history from TonAPI
+       (concurrently, bounded by the shared TonAPI token bucket)
     3. Cross-reference with wallet bindings for linked TG users
     4. Upsert into nft_holder_snapshots
     """
     stats = {"holders_synced": 0, "errors": 0}
-    owners = await get_nft_owners_with_links()
+    owners = [o for o in await get_nft_owners_with_links() if o["owner_address"]]
     if not owners:
         logger.info("sync_nft_holders: no NFT owners found")
         return stats
 
     jetton_master = PHOEX_TOKEN_ADDRESS or ""
-    headers = {}
-    if TON_API_KEY:
-        headers["Authorization"] = f"Bearer {TON_API_KEY}"
-
     try:
-        async with httpx.AsyncClient(timeout=15.0, headers=headers) as client:
-            for owner_row in owners:
-                addr = owner_row["owner_address"]
-                if not addr:
-                    continue
-                nft_count = owner_row["nft_count"]
-                coll_names = owner_row.get("collection_names") or []
-                coll_addrs = owner_row.get("collection_addresses") or []
-                collections = [
-                    {"name": n, "address": a}
-                    for n, a in zip(coll_names, coll_addrs)
-                ] if coll_names else []
-                linked_tg_id = owner_row.get("linked_telegram_id")
-                linked_username = owner_row.get("linked_username")
-
-                phxpw_balance = 0.0
-                total_received = 0.0
-                total_sent = 0.0
-
-                # Fetch PHXPW balance from TonAPI
-                if jetton_master:
-                    try:
-                        await asyncio.sleep(1.2)  # rate limit
-                        r = await client.get(
-                            f"{TON_API_URL}/accounts/{addr}/jettons/{jetton_master}"
-                        )
-                        if r.status_code == 200:
-                            data = r.json()
-                            raw_balance = data.get("balance") or "0"
-                            # PHXPW has 9 decimals
-                            try:
-                                phxpw_balance = int(raw_balance) / 1_000_000_000
-                            except (ValueError, TypeError):
-                                phxpw_balance = 0.0
-                    except Exception as e:
-                        logger.warning("sync_holders: balance fetch %s: %s", addr[:16], e)
-
-                    # Fetch jetton transfer history
-                    try:
-                        await asyncio.sleep(1.2)
-                        r = await client.get(
-                            f"{TON_API_URL}/accounts/{addr}/jettons/{jetton_master}/history",
-                            params={"limit": 100},
-                        )
-                        if r.status_code == 200:
-                            events = r.json().get("events") or []
-                            for ev in events:
-                                for action in ev.get("actions") or []:
-                                    jt = action.get("JettonTransfer") or {}
-                                    amount_raw = jt.get("amount") or "0"
-                                    try:
-                                        amount = int(amount_raw) / 1_000_000_000
-                                    except (ValueError, TypeError):
-                                        amount = 0.0
-                                    sender = _addr(jt.get("sender")) or ""
-                                    recipient = _addr(jt.get("recipient")) or ""
-                                    # Normalize addresses for comparison
-                                    if sender and sender.lower() == addr.lower():
-                                        total_sent += amount
-                                    elif recipient and recipient.lower() == addr.lower():
-                                        total_received += amount
-                    except Exception as e:
-                        logger.warning("sync_holders: history fetch %s: %s", addr[:16], e)
-
-                try:
-                    await upsert_holder_snapshot(
-                        owner_address=addr,
-                        nft_count=nft_count,
-                        collections=collections,
-                        phxpw_balance=phxpw_balance,
-                        total_received=total_received,
-                        total_sent=total_sent,
-                        staking_rewards=0,  # TODO: integrate with staking system
-                        linked_telegram_id=linked_tg_id,
-                        linked_username=linked_username,
-                    )
-                    stats["holders_synced"] += 1
-                except Exception as e:
-                    logger.warning("sync_holders: upsert error %s: %s", addr[:16], e)
-                    stats["errors"] += 1
-
+        client = get_http()
+        results = await asyncio.gather(*(_sync_holder(client, o, jetton_master) for o in owners))
+        stats["holders_synced"] = sum(1 for ok in results if ok)
+        stats["errors"] = len(results) - stats["holders_synced"]
     except Exception as e:
         logger.exception("sync_nft_holders failed: %s", e)
 
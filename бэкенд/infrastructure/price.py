@@ -1,21 +1,57 @@
 """
 Курсы для конвертации цен: PHXPW/PHOEX в TON и USD, TON в USD.
-Используется DYOR API (api.dyor.io) и CoinGecko для TON/USD. Кэш 5 минут.
+Источники: DYOR API (api.dyor.io) для PHXPW, CoinGecko для TON/USD.
+
+Лента курсов: у каждого символа свой TTL (FEED_TTL_SEC) и своё время получения.
+Запрос никогда не ждёт upstream: отдаётся последнее удачное значение (память процесса →
+Redis price:{symbol} → таблица price_feed), а если оно старше REFRESH_AHEAD·TTL — в фоне
+запускается обновление. Обновление одного символа — single-flight в процессе; если другой
+инстанс уже положил свежее значение в Redis, upstream не вызывается. Заранее обновляет
+задача планировщика price_feed (refresh_due). Принудительное обновление — только админ (refresh_prices).
 """
+import asyncio
 import logging
 import time
-from typing import Any, Dict, Optional
-
-import httpx
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 from config import PHOEX_TOKEN_ADDRESS
+from infrastructure.cache import cache_get, cache_set
+from infrastructure.database import get_price_feed, save_price_feed
+from infrastructure.http_client import get_http
 
 logger = logging.getLogger(__name__)
 
 DYOR_JETTON_URL = "https://api.dyor.io/v1/jettons/{token}"
 COINGECKO_TON_USD_URL = "https://api.coingecko.com/api/v3/simple/price?ids=ton&vs_currencies=usd"
-_CACHE: Dict[str, Any] = {}
-_CACHE_TTL_SEC = 300  # 5 минут
+# TTL курса по символу, секунды
+FEED_TTL_SEC = {"phxpw": 300, "ton_usd": 600}
+# Доля TTL, после которой значение обновляется заранее (в фоне), продолжая отдаваться
+REFRESH_AHEAD = 0.8
+UPSTREAM_TIMEOUT = 8.0
+# Сколько хранить последнее удачное значение в Redis (в БД — бессрочно)
+LKG_REDIS_TTL = 7 * 24 * 3600
+PHXPW_FALLBACK_TON = 0.000024
+# Пауза между неудачными попытками обновления одного символа, секунды
+RETRY_AFTER_SEC = 30.0
+
+
+class PriceEntry:
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value: Dict[str, Any], fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at  # unix-время получения из upstream
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.fetched_at
+
+
+_entries: Dict[str, PriceEntry] = {}
+_inflight: Dict[str, asyncio.Task] = {}
+_started: Dict[str, float] = {}
+_lkg_loaded: set = set()
+_lkg_tasks: Dict[str, asyncio.Task] = {}
 
 
 def _format_small_decimal(value: float, decimals: int = 8) -> str:
@@ -24,97 +60,190 @@ def _format_small_decimal(value: float, decimals: int = 8) -> str:
     return s if s else "0"
 
 
-async def get_phxpw_price_ton(force_refresh: bool = False) -> float:
-    """
-    Цена 1 PHXPW в TON (сколько TON за 1 токен).
-    При ошибке возвращает fallback 0.000024 (примерно актуально).
-    """
-    now = time.monotonic()
-    if not force_refresh and _CACHE.get("phxpw_price_ton") is not None:
-        if now - (_CACHE.get("_ts") or 0) < _CACHE_TTL_SEC:
-            return float(_CACHE["phxpw_price_ton"])
+# ——— Источники ———
+
+async def _fetch_phxpw() -> Optional[Dict[str, Any]]:
+    """DYOR: {"ton": цена 1 PHXPW в TON, "usd": в USD или None}; None — курс не получен."""
     token = (PHOEX_TOKEN_ADDRESS or "").strip()
     if not token:
-        return 0.000024
+        return None
+    url = DYOR_JETTON_URL.format(token=token)
+    r = await get_http().get(url, headers={"Accept": "application/json"}, timeout=UPSTREAM_TIMEOUT, upstream="dyor")
+    if r.status_code != 200:
+        logger.warning("DYOR jetton status %s", r.status_code)
+        return None
+    details = r.json().get("details") or {}
+    if not isinstance(details, dict):
+        return None
+    p = details.get("price") or {}
+    if not isinstance(p, dict) or p.get("value") is None:
+        return None
+    value: Dict[str, Any] = {"ton": int(p["value"]) / (10 ** int(p.get("decimals", 9))), "usd": None}
+    pu = details.get("priceUsd") or {}
+    if isinstance(pu, dict) and pu.get("value") is not None:
+        value["usd"] = int(pu["value"]) / (10 ** int(pu.get("decimals", 7)))
+    return value
+
+
+async def _fetch_ton_usd() -> Optional[Dict[str, Any]]:
+    """CoinGecko: {"usd": цена 1 TON в USD}; None — курс не получен."""
+    r = await get_http().get(COINGECKO_TON_USD_URL, timeout=UPSTREAM_TIMEOUT, upstream="coingecko")
+    if r.status_code != 200:
+        return None
+    data = r.json()
+    ton_data = data.get("ton") or data.get("the-open-network") or {}
+    if isinstance(ton_data, dict) and ton_data.get("usd") is not None:
+        return {"usd": float(ton_data["usd"])}
+    return None
+
+
+FETCHERS: Dict[str, Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = {
+    "phxpw": _fetch_phxpw,
+    "ton_usd": _fetch_ton_usd,
+}
+
+
+# ——— Последнее удачное значение (Redis / БД) ———
+
+def _is_due(symbol: str, entry: Optional[PriceEntry]) -> bool:
+    return entry is None or entry.age() >= FEED_TTL_SEC[symbol] * REFRESH_AHEAD
+
+
+def _adopt(symbol: str, entry: Optional[PriceEntry]) -> Optional[PriceEntry]:
+    """Принять значение, если оно новее того, что в памяти."""
+    current = _entries.get(symbol)
+    if entry is not None and (current is None or entry.fetched_at > current.fetched_at):
+        _entries[symbol] = entry
+        return entry
+    return current
+
+
+async def _load_shared(symbol: str) -> Optional[PriceEntry]:
+    """Значение из Redis (общее для инстансов); None — нет или Redis недоступен."""
+    cached = await cache_get(f"price:{symbol}")
+    if isinstance(cached, dict) and isinstance(cached.get("value"), dict):
+        return PriceEntry(cached["value"], float(cached.get("fetched_at") or 0))
+    return None
+
+
+async def _load_lkg(symbol: str) -> bool:
+    """Последнее удачное значение: Redis, затем таблица price_feed. False — БД недоступна, загрузку повторить."""
+    entry = await _load_shared(symbol)
+    if entry is None:
+        try:
+            row = await get_price_feed(symbol)
+        except Exception as e:
+            logger.warning("price_feed %s: db read failed: %s", symbol, e)
+            return False
+        entry = PriceEntry(row[0], row[1].timestamp()) if row else None
+    _adopt(symbol, entry)
+    _lkg_loaded.add(symbol)
+    return True
+
+
+async def _ensure_lkg(symbol: str) -> None:
+    """Single-flight загрузка последнего удачного значения: все первые запросы ждут одну задачу."""
+    if symbol in _lkg_loaded:
+        return
+    task = _lkg_tasks.get(symbol)
+    if task is None:
+        task = _lkg_tasks[symbol] = asyncio.create_task(_load_lkg(symbol))
+        task.add_done_callback(lambda _t: _lkg_tasks.pop(symbol, None))
+    await asyncio.shield(task)
+
+
+async def _store(symbol: str, entry: PriceEntry) -> None:
+    await cache_set(f"price:{symbol}", {"value": entry.value, "fetched_at": entry.fetched_at}, ttl_sec=LKG_REDIS_TTL)
     try:
-        url = DYOR_JETTON_URL.format(token=token)
-        async with httpx.AsyncClient(timeout=8.0) as client:
-            r = await client.get(url, headers={"Accept": "application/json"})
-        if r.status_code != 200:
-            logger.warning("DYOR jetton status %s", r.status_code)
-            return _CACHE.get("phxpw_price_ton") or 0.000024
-        data = r.json()
-        details = data.get("details") or {}
-        if isinstance(details, dict):
-            p = details.get("price") or {}
-            if isinstance(p, dict) and p.get("value") is not None:
-                dec = int(p.get("decimals", 9))
-                price = int(p["value"]) / (10 ** dec)
-                _CACHE["phxpw_price_ton"] = price
-                _CACHE["_ts"] = now
-                return float(price)
+        await save_price_feed(symbol, entry.value, datetime.fromtimestamp(entry.fetched_at, timezone.utc))
     except Exception as e:
-        logger.warning("get_phxpw_price_ton: %s", e)
-    return _CACHE.get("phxpw_price_ton") or 0.000024
+        logger.warning("price_feed %s: db write failed: %s", symbol, e)
 
 
-async def _get_ton_price_usd(force_refresh: bool = False) -> Optional[float]:
-    """Цена 1 TON в USD. Кэш общий с get_rates."""
-    now = time.monotonic()
-    if not force_refresh and _CACHE.get("ton_price_usd") is not None:
-        if now - (_CACHE.get("_ts") or 0) < _CACHE_TTL_SEC:
-            return float(_CACHE["ton_price_usd"])
+# ——— Обновление ———
+
+async def _refresh(symbol: str, force: bool) -> Optional[PriceEntry]:
+    if not force:
+        entry = _adopt(symbol, await _load_shared(symbol))
+        if not _is_due(symbol, entry):
+            return entry
     try:
-        async with httpx.AsyncClient(timeout=8.0) as client:
-            r = await client.get(COINGECKO_TON_USD_URL)
-        if r.status_code != 200:
-            return _CACHE.get("ton_price_usd")
-        data = r.json()
-        ton_data = data.get("ton") or data.get("the-open-network") or {}
-        if isinstance(ton_data, dict) and ton_data.get("usd") is not None:
-            val = float(ton_data["usd"])
-            _CACHE["ton_price_usd"] = val
-            _CACHE["_ts"] = now
-            return val
+        value = await FETCHERS[symbol]()
     except Exception as e:
-        logger.warning("_get_ton_price_usd: %s", e)
-    return _CACHE.get("ton_price_usd")
+        logger.warning("price_feed %s: %s", symbol, e)
+        value = None
+    if value is None:
+        return _entries.get(symbol)
+    entry = _adopt(symbol, PriceEntry(value, time.time()))
+    await _store(symbol, entry)
+    return entry
+
+
+def _start_refresh(symbol: str, force: bool = False) -> asyncio.Task:
+    """
+    Single-flight: одно обновление символа на процесс; параллельные вызовы получают ту же задачу.
+    Без force новая попытка — не раньше RETRY_AFTER_SEC после предыдущей (upstream лежит — не долбим его).
+    """
+    task = _inflight.get(symbol)
+    now = time.monotonic()
+    if task is not None and (not task.done() or (not force and now - _started.get(symbol, 0.0) < RETRY_AFTER_SEC)):
+        return task
+    task = asyncio.create_task(_refresh(symbol, force))
+    _inflight[symbol] = task
+    _started[symbol] = now
+    return task
+
 
+async def get_price(symbol: str) -> Optional[Dict[str, Any]]:
+    """Текущее значение курса без ожидания upstream (при устаревании — обновление в фоне); None — курса ещё нет."""
+    if symbol not in _entries:
+        await _ensure_lkg(symbol)
+    entry = _entries.get(symbol)
+    if _is_due(symbol, entry):
+        _start_refresh(symbol)
+    return entry.value if entry else None
 
-async def get_rates(force_refresh: bool = False) -> Dict[str, Any]:
+
+async def refresh_due() -> Dict[str, bool]:
+    """Для планировщика: обновить символы, у которых подошёл срок (REFRESH_AHEAD·TTL). symbol → обновлён ли."""
+    out = {}
+    for symbol in FETCHERS:
+        before = _entries.get(symbol)
+        if _is_due(symbol, before):
+            entry = await asyncio.shield(_start_refresh(symbol))
+            out[symbol] = entry is not None and entry is not before
+    return out
+
+
+async def refresh_prices() -> Dict[str, Any]:
+    """Принудительно перечитать все курсы из upstream (только для админа) и вернуть get_rates()."""
+    await asyncio.gather(*(asyncio.shield(_start_refresh(symbol, force=True)) for symbol in FETCHERS))
+    return await get_rates()
+
+
+async def get_phxpw_price_ton() -> float:
+    """Цена 1 PHXPW в TON (сколько TON за 1 токен). Пока курса нет — fallback 0.000024 (примерно актуально)."""
+    value = await get_price("phxpw")
+    return float(value["ton"]) if value else PHXPW_FALLBACK_TON
+
+
+async def get_rates() -> Dict[str, Any]:
     """
     Возвращает курсы для фронта в читаемом виде (без научной нотации):
     - phxpw_price_ton: строка, например "0.000024" (цена 1 PHXPW в TON)
     - phxpw_price_usd: строка, например "0.0000349" (цена 1 PHXPW в USD)
     - ton_price_usd: число или строка, например 1.46 (цена 1 TON в USD)
+    - updated_at: когда получен курс PHXPW (ISO) или null
     Для расчётов на фронте использовать parseFloat(phxpw_price_ton).
     """
-    phxpw_ton = await get_phxpw_price_ton(force_refresh=force_refresh)
-    ton_usd = await _get_ton_price_usd(force_refresh=force_refresh)
-
+    phxpw, ton_usd = await asyncio.gather(get_price("phxpw"), get_price("ton_usd"))
     result: Dict[str, Any] = {
-        "phxpw_price_ton": _format_small_decimal(phxpw_ton),
+        "phxpw_price_ton": _format_small_decimal(float(phxpw["ton"]) if phxpw else PHXPW_FALLBACK_TON),
     }
     if ton_usd is not None:
-        result["ton_price_usd"] = round(ton_usd, 2)
-
-    token = (PHOEX_TOKEN_ADDRESS or "").strip()
-    if not token:
-        return result
-    try:
-        url = DYOR_JETTON_URL.format(token=token)
-        async with httpx.AsyncClient(timeout=8.0) as client:
-            r = await client.get(url, headers={"Accept": "application/json"})
-        if r.status_code != 200:
-            return result
-        data = r.json()
-        details = data.get("details") or {}
-        if isinstance(details, dict):
-            pu = details.get("priceUsd") or {}
-            if isinstance(pu, dict) and pu.get("value") is not None:
-                dec = int(pu.get("decimals", 7))
-                phxpw_usd = int(pu["value"]) / (10 ** dec)
-                result["phxpw_price_usd"] = _format_small_decimal(phxpw_usd, 7)
-    except Exception:
-        pass
+        result["ton_price_usd"] = round(float(ton_usd["usd"]), 2)
+    if phxpw and phxpw.get("usd") is not None:
+        result["phxpw_price_usd"] = _format_small_decimal(float(phxpw["usd"]), 7)
+    entry = _entries.get("phxpw")
+    result["updated_at"] = datetime.fromtimestamp(entry.fetched_at, timezone.utc).isoformat() if entry else None
     return result
@@ -0,0 +1,395 @@
+"""
+Планировщик фоновых задач с выбором лидера через advisory lock PostgreSQL.
+
+Задача (Job) запускается по интервалу или cron-выражению (UTC). Перед запуском инстанс
+берёт pg_try_advisory_lock(ключ задачи) и сверяет job_schedule.next_run_at — при N воркерах
+задача выполняется один раз на слот по всему кластеру. История — в job_runs,
+время выполнения — в памяти процесса (Scheduler.metrics()).
+Задачи с leader=False (например, пинг WS-клиентов своего процесса) выполняются в каждом процессе.
+Без пула (get_pool вернул None) все задачи выполняются локально — режим разработки.
+
+Источник модуля — бэкенд/infrastructure/scheduler.py; копии в deploy/*/tigrit_shared
+обновляются bash deploy/sync_shared.sh (совпадение проверяет tests/test_shared_copies.py).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранить историю запусков в job_runs
+JOB_RUNS_RETENTION_DAYS = 30
+
+_SCHEMA_SQL = (
+    """
+    CREATE TABLE IF NOT EXISTS job_schedule (
+        job_name TEXT PRIMARY KEY,
+        next_run_at TIMESTAMPTZ,
+        last_run_at TIMESTAMPTZ,
+        last_status TEXT,
+        last_instance TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id BIGSERIAL PRIMARY KEY,
+        job_name TEXT NOT NULL,
+        instance_id TEXT NOT NULL,
+        started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        finished_at TIMESTAMPTZ,
+        status TEXT NOT NULL DEFAULT 'running',
+        duration_ms INTEGER,
+        error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_job_runs_name_started ON job_runs(job_name, started_at DESC)",
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lock_key(name: str) -> int:
+    """Стабильный между процессами 64-битный ключ advisory lock (hash() в Python рандомизирован)."""
+    return int.from_bytes(hashlib.blake2b(f"job:{name}".encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class CronSpec:
+    """Cron из 5 полей: минута час день месяц день_недели (UTC).
+    Поддерживает *, */n, a-b, a-b/n, a/n и списки через запятую; воскресенье — 0 или 7."""
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron: нужно 5 полей, получено {len(parts)}: {expr!r}")
+        fields = [self._parse(p, lo, hi) for p, (lo, hi) in zip(parts, self._RANGES)]
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months = fields[:4]
+        self.weekdays: FrozenSet[int] = frozenset(d % 7 for d in fields[4])
+        self._dom_any = parts[2] == "*"
+        self._dow_any = parts[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, lo: int, hi: int) -> FrozenSet[int]:
+        out = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, s = part.split("/", 1)
+                step = int(s)
+            if part == "*":
+                a, b = lo, hi
+            elif "-" in part:
+                a, b = (int(x) for x in part.split("-", 1))
+            else:
+                a = int(part)
+                b = hi if step > 1 else a
+            if step < 1 or a < lo or b > hi or a > b:
+                raise ValueError(f"cron: значение вне диапазона {lo}-{hi}: {field!r}")
+            out.update(range(a, b + 1, step))
+        return frozenset(out)
+
+    def _day_matches(self, t: datetime) -> bool:
+        dom = t.day in self.days
+        dow = t.isoweekday() % 7 in self.weekdays
+        if self._dom_any and self._dow_any:
+            return True
+        if self._dom_any:
+            return dow
+        if self._dow_any:
+            return dom
+        return dom or dow  # классическая семантика cron: любое из двух
+
+    def next_after(self, dt: datetime) -> datetime:
+        """Ближайший момент строго после dt (с точностью до минуты)."""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron: нет подходящего времени для {self.expr!r}")
+
+
+class Job:
+    """Описание периодической задачи. Ровно одно из interval (сек) / cron."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        *,
+        interval: Optional[float] = None,
+        cron: Optional[str] = None,
+        jitter: float = 0.0,
+        timeout: Optional[float] = None,
+        initial_delay: float = 0.0,
+        leader: bool = True,
+    ):
+        if (interval is None) == (cron is None):
+            raise ValueError(f"job {name}: задайте interval или cron")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = CronSpec(cron) if cron else None
+        self.jitter = max(0.0, jitter)
+        self.timeout = timeout
+        self.initial_delay = max(0.0, initial_delay)
+        self.leader = leader
+
+    def next_due(self, now: datetime) -> datetime:
+        if self.cron:
+            return self.cron.next_after(now)
+        return now + timedelta(seconds=self.interval)
+
+    def schedule_grace(self) -> float:
+        """Допуск при записи next_run_at: чтобы проснувшийся по своему таймеру инстанс не пропустил слот."""
+        if self.cron:
+            return 1.0
+        return min(30.0, self.interval * 0.1)
+
+
+class JobStats:
+    """Счётчики и время выполнения задачи в этом процессе."""
+
+    def __init__(self) -> None:
+        self.runs = 0
+        self.ok = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.last_status: Optional[str] = None
+        self.last_started_at: Optional[str] = None
+        self.last_duration_sec: Optional[float] = None
+        self.max_duration_sec = 0.0
+        self.total_duration_sec = 0.0
+
+    def record(self, status: str, started: datetime, duration: float) -> None:
+        self.runs += 1
+        if status == "ok":
+            self.ok += 1
+        elif status == "timeout":
+            self.timeouts += 1
+        else:
+            self.failed += 1
+        self.last_status = status
+        self.last_started_at = started.isoformat()
+        self.last_duration_sec = round(duration, 3)
+        self.max_duration_sec = max(self.max_duration_sec, duration)
+        self.total_duration_sec += duration
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "ok": self.ok,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "last_status": self.last_status,
+            "last_started_at": self.last_started_at,
+            "last_duration_sec": self.last_duration_sec,
+            "avg_duration_sec": round(self.total_duration_sec / self.runs, 3) if self.runs else None,
+            "max_duration_sec": round(self.max_duration_sec, 3),
+        }
+
+
+class Scheduler:
+    """Запускает зарегистрированные задачи; start() в lifespan, stop() при остановке."""
+
+    def __init__(self, get_pool: Callable[[], Awaitable[Any]], instance_id: Optional[str] = None):
+        self._get_pool = get_pool
+        self._jobs: Dict[str, Job] = {}
+        self._stats: Dict[str, JobStats] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stop: Optional[asyncio.Event] = None
+        self._schema_ready = False
+        self.instance_id = instance_id or f"{socket.gethostname()}:{os.getpid()}"
+
+    def add_job(self, name: str, func: Callable[[], Awaitable[Any]], **kwargs: Any) -> Job:
+        if name in self._jobs:
+            raise ValueError(f"job {name} уже зарегистрирована")
+        job = Job(name, func, **kwargs)
+        self._jobs[name] = job
+        self._stats[name] = JobStats()
+        return job
+
+    async def start(self) -> None:
+        self._stop = asyncio.Event()
+        for job in self._jobs.values():
+            self._tasks.append(asyncio.create_task(self._job_loop(job), name=f"job:{job.name}"))
+        logger.info("scheduler: started %d jobs (instance %s)", len(self._jobs), self.instance_id)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        if self._stop:
+            self._stop.set()
+        for t in self._tasks:
+            t.cancel()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        self._tasks = []
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "instance_id": self.instance_id,
+            "jobs": {
+                name: {
+                    "leader": job.leader,
+                    "schedule": job.cron.expr if job.cron else f"every {job.interval:g}s",
+                    **self._stats[name].as_dict(),
+                }
+                for name, job in self._jobs.items()
+            },
+        }
+
+    async def recent_runs(self, limit: int = 50, job_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Последние запуски из job_runs (всех инстансов)."""
+        pool = await self._pool()
+        if pool is None:
+            return []
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """SELECT job_name, instance_id, started_at, finished_at, status, duration_ms, error
+                   FROM job_runs WHERE ($1::text IS NULL OR job_name = $1)
+                   ORDER BY started_at DESC LIMIT $2""",
+                job_name, limit,
+            )
+        return [
+            {
+                **dict(r),
+                "started_at": r["started_at"].isoformat() if r["started_at"] else None,
+                "finished_at": r["finished_at"].isoformat() if r["finished_at"] else None,
+            }
+            for r in rows
+        ]
+
+    # ——— внутреннее ———
+
+    async def _pool(self) -> Any:
+        try:
+            pool = await self._get_pool()
+        except Exception as e:
+            logger.warning("scheduler: pool unavailable: %s", e)
+            return None
+        if pool is not None and not self._schema_ready:
+            async with pool.acquire() as conn:
+                for sql in _SCHEMA_SQL:
+                    await conn.execute(sql)
+            self._schema_ready = True
+        return pool
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Прерываемый сон; True — пришёл stop."""
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=max(0.0, seconds))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _job_loop(self, job: Job) -> None:
+        if job.initial_delay and await self._sleep(job.initial_delay):
+            return
+        due = job.next_due(_utcnow()) if job.cron else _utcnow()
+        while not self._stop.is_set():
+            wait = (due - _utcnow()).total_seconds() + random.uniform(0, job.jitter)
+            if wait > 0 and await self._sleep(wait):
+                return
+            try:
+                if job.leader:
+                    due = await self._run_as_leader(job)
+                else:
+                    await self._execute(job)
+                    due = job.next_due(_utcnow())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("scheduler: job %s bookkeeping failed: %s", job.name, e)
+                due = job.next_due(_utcnow())
+
+    async def _execute(self, job: Job) -> tuple:
+        started = _utcnow()
+        t0 = time.monotonic()
+        status, error = "ok", None
+        try:
+            if job.timeout:
+                await asyncio.wait_for(job.func(), timeout=job.timeout)
+            else:
+                await job.func()
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"timeout after {job.timeout}s"
+            logger.warning("scheduler: job %s timed out after %ss", job.name, job.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status, error = "error", str(e)[:500]
+            logger.warning("scheduler: job %s failed: %s", job.name, e)
+        duration = time.monotonic() - t0
+        self._stats[job.name].record(status, started, duration)
+        return status, error, duration
+
+    async def _run_as_leader(self, job: Job) -> datetime:
+        """Выполнить задачу, если этот инстанс взял lock и слот ещё не отработан. Возвращает следующий срок."""
+        pool = await self._pool()
+        if pool is None:
+            await self._execute(job)
+            return job.next_due(_utcnow())
+        key = _lock_key(job.name)
+        async with pool.acquire() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", key):
+                self._stats[job.name].skipped += 1
+                return job.next_due(_utcnow())
+            try:
+                next_at = await conn.fetchval("SELECT next_run_at FROM job_schedule WHERE job_name = $1", job.name)
+                now = _utcnow()
+                if next_at is not None and next_at > now:
+                    # слот уже отработал другой инстанс — просыпаемся к его next_run_at
+                    self._stats[job.name].skipped += 1
+                    return next_at
+                run_id = await conn.fetchval(
+                    "INSERT INTO job_runs (job_name, instance_id) VALUES ($1, $2) RETURNING id",
+                    job.name, self.instance_id,
+                )
+                try:
+                    status, error, duration = await self._execute(job)
+                except asyncio.CancelledError:
+                    await conn.execute(
+                        "UPDATE job_runs SET finished_at = NOW(), status = 'cancelled' WHERE id = $1", run_id
+                    )
+                    raise
+                due = job.next_due(_utcnow())
+                await conn.execute(
+                    """UPDATE job_runs SET finished_at = NOW(), status = $2, duration_ms = $3, error = $4
+                       WHERE id = $1""",
+                    run_id, status, int(duration * 1000), error,
+                )
+                await conn.execute(
+                    """INSERT INTO job_schedule (job_name, next_run_at, last_run_at, last_status, last_instance)
+                       VALUES ($1, $2, NOW(), $3, $4)
+                       ON CONFLICT (job_name) DO UPDATE SET
+                         next_run_at = EXCLUDED.next_run_at, last_run_at = EXCLUDED.last_run_at,
+                         last_status = EXCLUDED.last_status, last_instance = EXCLUDED.last_instance""",
+                    job.name, due - timedelta(seconds=job.schedule_grace()), status, self.instance_id,
+                )
+                await conn.execute(
+                    f"""DELETE FROM job_runs WHERE job_name = $1
+                        AND started_at < NOW() - INTERVAL '{JOB_RUNS_RETENTION_DAYS} days'""",
+                    job.name,
+                )
+                return due
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", key)
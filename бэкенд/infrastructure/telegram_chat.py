@@ -1,12 +1,24 @@
 """
 Проверка нахождения пользователя в чате/канале через Telegram Bot API getChatMember.
 Бот должен быть добавлен в чат как администратор.
+
+Результаты кэшируются по (chat_id, user_id): в процессе и в Redis, с отдельными TTL
+для «в чате» и «не в чате»; ошибки Telegram не кэшируются. Пакетная проверка — check_users_in_chats.
 """
+import asyncio
 import logging
 import time
-from typing import Dict, List, Optional, Tuple
-
-from config import BOT_TOKEN
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    BOT_TOKEN,
+    TG_API_CONCURRENCY,
+    TG_API_RPS,
+    TG_MEMBER_TTL_NEGATIVE,
+    TG_MEMBER_TTL_POSITIVE,
+)
+from infrastructure.cache import cache_get, cache_set
+from infrastructure.http_client import TokenBucket, get_http
 
 logger = logging.getLogger(__name__)
 
@@ -20,31 +32,128 @@ _bot_chats_cache: List[Dict] = []
 _bot_chats_cache_ts: float = 0.0
 _BOT_CHATS_CACHE_TTL = 300  # seconds
 
+# ——— Кэш membership ———
+
+# (chat_id, user_id) -> (in_chat, status, expires_at по monotonic)
+_member_cache: Dict[Tuple[int, int], Tuple[bool, str, float]] = {}
+_MEMBER_CACHE_MAX = 50_000
+# Общий лимит getChatMember на процесс (Bot API режет ~30 запросов/сек на бота)
+_tg_limiter = TokenBucket(TG_API_RPS, max(int(TG_API_RPS), 1))
+_tg_concurrency = asyncio.Semaphore(max(TG_API_CONCURRENCY, 1))
+
+
+def _member_key(chat_id: int, user_id: int) -> str:
+    return f"tg_member:{chat_id}:{user_id}"
+
+
+def _is_in_chat(member: Dict[str, Any]) -> bool:
+    status = member.get("status", "")
+    # restricted без is_member — ограниченный пользователь, который уже вышел из чата
+    if status == "restricted":
+        return bool(member.get("is_member", False))
+    return status in MEMBER_STATUSES_IN
+
+
+def _remember(chat_id: int, user_id: int, in_chat: bool, status: str, ttl: int) -> None:
+    if len(_member_cache) >= _MEMBER_CACHE_MAX:
+        now = time.monotonic()
+        for k in [k for k, v in _member_cache.items() if v[2] <= now]:
+            del _member_cache[k]
+        if len(_member_cache) >= _MEMBER_CACHE_MAX:
+            _member_cache.clear()
+    _member_cache[(chat_id, user_id)] = (in_chat, status, time.monotonic() + ttl)
+
 
-async def check_user_in_chat(chat_id: int, user_id: int) -> Tuple[bool, Optional[str]]:
+async def _store_member(chat_id: int, user_id: int, member: Dict[str, Any]) -> Tuple[bool, str]:
+    in_chat = _is_in_chat(member)
+    status = member.get("status", "")
+    ttl = TG_MEMBER_TTL_POSITIVE if in_chat else TG_MEMBER_TTL_NEGATIVE
+    _remember(chat_id, user_id, in_chat, status, ttl)
+    await cache_set(_member_key(chat_id, user_id), {"in_chat": in_chat, "status": status}, ttl_sec=ttl)
+    return in_chat, status
+
+
+async def _cached_member(chat_id: int, user_id: int) -> Optional[Tuple[bool, str]]:
+    hit = _member_cache.get((chat_id, user_id))
+    if hit and hit[2] > time.monotonic():
+        return hit[0], hit[1]
+    data = await cache_get(_member_key(chat_id, user_id))
+    if not isinstance(data, dict):
+        return None
+    in_chat, status = bool(data.get("in_chat")), str(data.get("status", ""))
+    # Остаток TTL в Redis неизвестен — в процессе держим не дольше короткого TTL
+    _remember(chat_id, user_id, in_chat, status, min(TG_MEMBER_TTL_NEGATIVE, TG_MEMBER_TTL_POSITIVE))
+    return in_chat, status
+
+
+async def _fetch_member(chat_id: int, user_id: int) -> Tuple[bool, Optional[str]]:
+    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
+    try:
+        async with _tg_concurrency:
+            await _tg_limiter.acquire()
+            r = await get_http().get(url, params={"chat_id": chat_id, "user_id": user_id}, timeout=10.0, upstream="telegram")
+        data = r.json()
+        if not data.get("ok"):
+            return False, data.get("description", "unknown error")
+        return await _store_member(chat_id, user_id, data.get("result") or {})
+    except Exception as e:
+        logger.warning("check_user_in_chat(%s, %s) failed: %s", chat_id, user_id, e)
+        return False, str(e)
+
+
+async def check_user_in_chat(chat_id: int, user_id: int, fresh: bool = False) -> Tuple[bool, Optional[str]]:
     """
     Проверить, состоит ли пользователь в чате/канале.
     Возвращает (True, status) если в чате, (False, status или error) если нет или ошибка.
+    Ответ берётся из кэша, если он свежий; fresh=True — всегда спросить Telegram.
     Требуется BOT_TOKEN; бот должен быть админом в чате.
     """
     if not BOT_TOKEN:
         return False, "BOT_TOKEN not set"
-    try:
-        import httpx
-    except ImportError:
-        return False, "httpx not installed"
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember"
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(url, params={"chat_id": chat_id, "user_id": user_id})
-            data = r.json()
-        if not data.get("ok"):
-            return False, data.get("description", "unknown error")
-        status = (data.get("result") or {}).get("status", "")
-        return status in MEMBER_STATUSES_IN, status
-    except Exception as e:
-        logger.exception("check_user_in_chat failed")
-        return False, str(e)
+    if not fresh:
+        cached = await _cached_member(chat_id, user_id)
+        if cached is not None:
+            return cached
+    return await _fetch_member(chat_id, user_id)
+
+
+async def check_users_in_chats(
+    user_ids: Iterable[int],
+    chat_ids: Iterable[int],
+    fresh: bool = False,
+) -> Dict[int, Dict[int, Dict[str, Any]]]:
+    """
+    Пакетная проверка: каждый пользователь в каждом чате.
+    Промахи кэша запрашиваются параллельно в пределах TG_API_CONCURRENCY и TG_API_RPS.
+    Возвращает {user_id: {chat_id: {"in_chat": bool, "status": str}}}.
+    """
+    users = list(dict.fromkeys(int(u) for u in user_ids))
+    chats = list(dict.fromkeys(int(c) for c in chat_ids))
+    result: Dict[int, Dict[int, Dict[str, Any]]] = {u: {} for u in users}
+    if not users or not chats:
+        return result
+    if not BOT_TOKEN:
+        for u in users:
+            for c in chats:
+                result[u][c] = {"in_chat": False, "status": "BOT_TOKEN not set"}
+        return result
+
+    pairs = [(c, u) for u in users for c in chats]
+    if fresh:
+        cached_all: List[Optional[Tuple[bool, str]]] = [None] * len(pairs)
+    else:
+        cached_all = await asyncio.gather(*(_cached_member(c, u) for c, u in pairs))
+    misses: List[Tuple[int, int]] = []
+    for (c, u), cached in zip(pairs, cached_all):
+        if cached is None:
+            misses.append((c, u))
+        else:
+            result[u][c] = {"in_chat": cached[0], "status": cached[1]}
+
+    fetched = await asyncio.gather(*(_fetch_member(c, u) for c, u in misses))
+    for (c, u), (in_chat, status) in zip(misses, fetched):
+        result[u][c] = {"in_chat": in_chat, "status": status}
+    return result
 
 
 async def get_bot_chats() -> List[Dict]:
@@ -60,80 +169,83 @@ async def get_bot_chats() -> List[Dict]:
     if not BOT_TOKEN:
         return []
 
-    try:
-        import httpx
-    except ImportError:
-        return []
-
     chats: Dict[int, Dict] = {}
     bot_id = BOT_TOKEN.split(":")[0]
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            # Fetch recent updates to discover chat_ids
-            r = await client.get(
-                f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates",
-                params={"limit": 100, "timeout": 0},
-            )
-            data = r.json()
-            if data.get("ok"):
-                for upd in data.get("result", []):
-                    # Extract chat_id from messages, member updates, etc.
-                    for field in ("message", "edited_message", "channel_post", "my_chat_member", "chat_member"):
-                        obj = upd.get(field)
-                        if obj:
-                            chat = obj.get("chat") or {}
-                            cid = chat.get("id")
-                            if cid and cid != 0:
-                                chats[cid] = {
-                                    "chat_id": cid,
-                                    "title": chat.get("title") or chat.get("first_name") or str(cid),
-                                    "type": chat.get("type", "unknown"),
-                                }
-
-            # For each unique chat, call getChat for full info
-            result = []
-            for cid, info in chats.items():
-                try:
-                    r2 = await client.get(
-                        f"https://api.telegram.org/bot{BOT_TOKEN}/getChat",
-                        params={"chat_id": cid},
-                    )
-                    d2 = r2.json()
-                    if d2.get("ok"):
-                        chat_info = d2["result"]
-                        info["title"] = chat_info.get("title") or chat_info.get("first_name") or str(cid)
-                        info["type"] = chat_info.get("type", "unknown")
-                        info["username"] = chat_info.get("username")
-                        info["description"] = chat_info.get("description", "")
-
-                    # Get member count
-                    r3 = await client.get(
-                        f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMemberCount",
-                        params={"chat_id": cid},
-                    )
-                    d3 = r3.json()
-                    info["member_count"] = d3["result"] if d3.get("ok") else None
-
-                    # Check bot's admin status
-                    r4 = await client.get(
-                        f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember",
-                        params={"chat_id": cid, "user_id": bot_id},
-                    )
-                    d4 = r4.json()
-                    if d4.get("ok"):
-                        bot_status = d4["result"].get("status", "")
-                        info["bot_status"] = bot_status
-                        info["bot_is_admin"] = bot_status in ("administrator", "creator")
-                    else:
-                        info["bot_status"] = "unknown"
-                        info["bot_is_admin"] = False
-
-                    # Only include groups/channels (not private chats)
-                    if info["type"] in ("group", "supergroup", "channel"):
-                        result.append(info)
-                except Exception as e:
-                    logger.warning("get_bot_chats: error fetching chat %s: %s", cid, e)
+        client = get_http()
+        # Fetch recent updates to discover chat_ids
+        r = await client.get(
+            f"https://api.telegram.org/bot{BOT_TOKEN}/getUpdates",
+            params={"limit": 100, "timeout": 0},
+            timeout=15.0,
+            upstream="telegram",
+        )
+        data = r.json()
+        if data.get("ok"):
+            for upd in data.get("result", []):
+                # Extract chat_id from messages, member updates, etc.
+                for field in ("message", "edited_message", "channel_post", "my_chat_member", "chat_member"):
+                    obj = upd.get(field)
+                    if obj:
+                        chat = obj.get("chat") or {}
+                        cid = chat.get("id")
+                        if cid and cid != 0:
+                            chats[cid] = {
+                                "chat_id": cid,
+                                "title": chat.get("title") or chat.get("first_name") or str(cid),
+                                "type": chat.get("type", "unknown"),
+                            }
+
+        # For each unique chat, call getChat for full info
+        result = []
+        for cid, info in chats.items():
+            try:
+                r2 = await client.get(
+                    f"https://api.telegram.org/bot{BOT_TOKEN}/getChat",
+                    params={"chat_id": cid},
+                    timeout=15.0,
+                    upstream="telegram",
+                )
+                d2 = r2.json()
+                if d2.get("ok"):
+                    chat_info = d2["result"]
+                    info["title"] = chat_info.get("title") or chat_info.get("first_name") or str(cid)
+                    info["type"] = chat_info.get("type", "unknown")
+                    info["username"] = chat_info.get("username")
+                    info["description"] = chat_info.get("description", "")
+
+                # Get member count
+                r3 = await client.get(
+                    f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMemberCount",
+                    params={"chat_id": cid},
+                    timeout=15.0,
+                    upstream="telegram",
+                )
+                d3 = r3.json()
+                info["member_count"] = d3["result"] if d3.get("ok") else None
+
+                # Check bot's admin status
+                r4 = await client.get(
+                    f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMember",
+                    params={"chat_id": cid, "user_id": bot_id},
+                    timeout=15.0,
+                    upstream="telegram",
+                )
+                d4 = r4.json()
+                if d4.get("ok"):
+                    bot_status = d4["result"].get("status", "")
+                    info["bot_status"] = bot_status
+                    info["bot_is_admin"] = bot_status in ("administrator", "creator")
+                else:
+                    info["bot_status"] = "unknown"
+                    info["bot_is_admin"] = False
+
+                # Only include groups/channels (not private chats)
+                if info["type"] in ("group", "supergroup", "channel"):
+                    result.append(info)
+            except Exception as e:
+                logger.warning("get_bot_chats: error fetching chat %s: %s", cid, e)
 
         _bot_chats_cache = result
         _bot_chats_cache_ts = time.time()
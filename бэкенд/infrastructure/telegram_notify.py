@@ -1,9 +1,8 @@
 import logging
 from typing import Optional
 
-import httpx
-
 from config import GAME_ADMIN_TG_ID, GAME_NOTIFY_BOT_TOKEN
+from infrastructure.http_client import get_http
 
 logger = logging.getLogger(__name__)
 
@@ -26,15 +25,16 @@ async def notify_admin_phoenix_quest(
     )
     url = f"https://api.telegram.org/bot{GAME_NOTIFY_BOT_TOKEN}/sendMessage"
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.post(
-                url,
-                json={"chat_id": GAME_ADMIN_TG_ID, "text": text},
-            )
-            if r.status_code != 200:
-                logger.error("Telegram notify failed: %s %s", r.status_code, r.text)
-                return False
-            return True
+        r = await get_http().post(
+            url,
+            json={"chat_id": GAME_ADMIN_TG_ID, "text": text},
+            timeout=10.0,
+            upstream="telegram",
+        )
+        if r.status_code != 200:
+            logger.error("Telegram notify failed: %s %s", r.status_code, r.text)
+            return False
+        return True
     except Exception as e:
         logger.exception("Telegram notify error: %s", e)
         return False
@@ -59,15 +59,16 @@ async def notify_user_penalty(
     text += "\nШтраф будет удержан при следующем выводе средств."
     url = f"https://api.telegram.org/bot{GAME_NOTIFY_BOT_TOKEN}/sendMessage"
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.post(
-                url,
-                json={"chat_id": telegram_id, "text": text},
-            )
-            if r.status_code != 200:
-                logger.error("Telegram penalty notify failed: %s %s", r.status_code, r.text)
-                return False
-            return True
+        r = await get_http().post(
+            url,
+            json={"chat_id": telegram_id, "text": text},
+            timeout=10.0,
+            upstream="telegram",
+        )
+        if r.status_code != 200:
+            logger.error("Telegram penalty notify failed: %s %s", r.status_code, r.text)
+            return False
+        return True
     except Exception as e:
         logger.exception("Telegram penalty notify error: %s", e)
         return False
@@ -1,31 +1,74 @@
 """
-Конвертация TON-адресов: raw (0:hex) → friendly (UQ…/EQ…).
-Локальная реализация без внешних API (CRC16-XMODEM + base64url).
-In-memory кэш без TTL (адрес не меняется).
+Конвертация TON-адресов: raw (0:hex) ↔ friendly (UQ…/EQ…).
+Локальная реализация без внешних API (CRC16-XMODEM через binascii.crc_hqx + base64url).
+Канонический вид для сравнения — friendly non-bounceable mainnet (UQ…); результат
+кэшируется в ограниченном LRU (адрес не меняется, TTL не нужен).
 """
 import base64
+import binascii
 import logging
 import struct
-from typing import Dict
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-# Кэш: any_address → friendly non-bounceable (UQ…). Адрес неизменен, TTL не нужен.
-_cache: Dict[str, str] = {}
+ADDRESS_CACHE_SIZE = 100_000
+
+TAG_BOUNCEABLE = 0x11
+TAG_NON_BOUNCEABLE = 0x51
+TAG_TESTNET = 0x80
 
 
 def _crc16_xmodem(data: bytes) -> int:
-    """CRC16-XMODEM (poly=0x1021) — используется в TON friendly-адресах."""
-    crc = 0
-    for byte in data:
-        crc ^= byte << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
-    return crc
+    """CRC16-XMODEM (poly=0x1021, init=0) — используется в TON friendly-адресах."""
+    return binascii.crc_hqx(data, 0)
+
+
+def parse_raw(raw_address: str) -> Optional[Tuple[int, bytes]]:
+    """raw «wc:hex64» → (workchain, 32 байта) или None."""
+    if ":" not in raw_address:
+        return None
+    wc, _, hex_part = raw_address.partition(":")
+    try:
+        workchain = int(wc)
+        addr_bytes = bytes.fromhex(hex_part)
+    except ValueError:
+        return None
+    if len(addr_bytes) != 32 or not -128 <= workchain <= 127:
+        return None
+    return workchain, addr_bytes
+
+
+def parse_friendly(address: str) -> Optional[Tuple[int, bytes, bool, bool]]:
+    """
+    friendly (48 символов base64url или base64) → (workchain, 32 байта, bounceable, testnet) или None.
+    Проверяет длину, тег и CRC16.
+    """
+    if len(address) != 48:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(address.replace("+", "-").replace("/", "_"))
+    except (binascii.Error, ValueError):
+        return None
+    if len(data) != 36 or _crc16_xmodem(data[:34]) != struct.unpack(">H", data[34:])[0]:
+        return None
+    tag = data[0]
+    testnet = bool(tag & TAG_TESTNET)
+    tag &= ~TAG_TESTNET
+    if tag not in (TAG_BOUNCEABLE, TAG_NON_BOUNCEABLE):
+        return None
+    workchain = struct.unpack("b", data[1:2])[0]
+    return workchain, data[2:34], tag == TAG_BOUNCEABLE, testnet
+
+
+def encode_friendly(workchain: int, addr_bytes: bytes, bounceable: bool = False, testnet: bool = False) -> str:
+    """(workchain, 32 байта) → friendly base64url: EQ… (bounceable) или UQ… (non-bounceable)."""
+    tag = TAG_BOUNCEABLE if bounceable else TAG_NON_BOUNCEABLE
+    if testnet:
+        tag |= TAG_TESTNET
+    payload = bytes((tag,)) + struct.pack("b", workchain) + addr_bytes
+    return base64.urlsafe_b64encode(payload + struct.pack(">H", _crc16_xmodem(payload))).decode("ascii")
 
 
 def _raw_to_friendly_local(raw_address: str, bounceable: bool = False) -> str:
@@ -33,22 +76,10 @@ def _raw_to_friendly_local(raw_address: str, bounceable: bool = False) -> str:
     Локальная конвертация raw (0:hex) → friendly base64url (EQ/UQ).
     bounceable=True → tag 0x11 (EQ…), bounceable=False → tag 0x51 (UQ…).
     """
-    if ":" not in raw_address:
+    parsed = parse_raw(raw_address)
+    if parsed is None:
         return raw_address
-    parts = raw_address.split(":", 1)
-    try:
-        workchain = int(parts[0])
-        addr_bytes = bytes.fromhex(parts[1])
-    except (ValueError, IndexError):
-        return raw_address
-    if len(addr_bytes) != 32:
-        return raw_address
-    tag = 0x11 if bounceable else 0x51
-    wc_byte = struct.pack("b", workchain)  # signed byte
-    payload = bytes([tag]) + wc_byte + addr_bytes
-    crc = _crc16_xmodem(payload)
-    full = payload + struct.pack(">H", crc)
-    return base64.urlsafe_b64encode(full).decode("ascii").rstrip("=")
+    return encode_friendly(parsed[0], parsed[1], bounceable=bounceable)
 
 
 def _is_friendly(addr: str) -> bool:
@@ -56,30 +87,72 @@ def _is_friendly(addr: str) -> bool:
     return bool(addr) and len(addr) >= 48 and addr[:2] in ("EQ", "UQ", "kQ", "0Q")
 
 
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _canonical_cached(addr: str) -> Tuple[str, str]:
+    """addr (очищенный) → (UQ…, raw «wc:hex»); нераспознанный адрес → (addr, "")."""
+    parsed = parse_raw(addr)
+    if parsed is None:
+        friendly = parse_friendly(addr)
+        if friendly is None:
+            return addr, ""
+        parsed = friendly[:2]
+    workchain, addr_bytes = parsed
+    return encode_friendly(workchain, addr_bytes), f"{workchain}:{addr_bytes.hex()}"
+
+
+def canonical_address(address: str) -> str:
+    """
+    Любой формат (raw 0:hex, EQ/UQ/kQ/0Q, base64 с +/) → friendly non-bounceable (UQ…) для сравнений.
+    Нераспознанный адрес возвращается как есть (без пробелов по краям).
+    """
+    if not address or not isinstance(address, str):
+        return address or ""
+    addr = address.strip()
+    return _canonical_cached(addr)[0] if addr else ""
+
+
+def friendly_to_raw(address: str) -> Optional[str]:
+    """Любой формат → raw «wc:hex» (нижний регистр) или None, если адрес не распознан."""
+    if not address or not isinstance(address, str):
+        return None
+    return _canonical_cached(address.strip())[1] or None
+
+
+def address_key(address: str) -> Optional[bytes]:
+    """
+    Бинарный ключ адреса: 1 байт workchain (со знаком) + 32 байта хэша — как ton_addr_bin() в БД
+    (колонки wallet_addr/owner_addr). None — адрес не распознан.
+    """
+    raw = friendly_to_raw(address)
+    if raw is None:
+        return None
+    wc, _, hex_part = raw.partition(":")
+    return struct.pack("b", int(wc)) + bytes.fromhex(hex_part)
+
+
+def address_forms(address: str) -> List[str]:
+    """Все распространённые записи адреса (исходная, raw, UQ…, EQ…) — для поиска по текстовым колонкам."""
+    addr = (address or "").strip()
+    raw = friendly_to_raw(addr)
+    if raw is None:
+        return [addr] if addr else []
+    forms = [addr, raw, canonical_address(raw), _raw_to_friendly_local(raw, bounceable=True)]
+    return list(dict.fromkeys(forms))
+
+
+def raw_to_friendly_many(addresses: Iterable[str]) -> List[str]:
+    """Пакетная канонизация: список адресов → список UQ… в том же порядке."""
+    return [canonical_address(a) for a in addresses]
+
+
+def cache_info():
+    return _canonical_cached.cache_info()
+
+
 async def raw_to_friendly(raw_address: str) -> str:
     """
     Конвертирует адрес (raw 0:hex или любой формат) в friendly non-bounceable (UQ…).
     Полностью локальная реализация — без обращений к Ton Center API.
-    При ошибке возвращает исходный адрес (fallback).
+    Нераспознанный адрес возвращается как есть (fallback). Для синхронного кода — canonical_address.
     """
-    if not raw_address or not isinstance(raw_address, str):
-        return raw_address or ""
-    addr = raw_address.strip()
-    if not addr:
-        return ""
-    # Если уже UQ — вернуть как есть
-    if addr.startswith("UQ") and len(addr) >= 48:
-        return addr
-    # Кэш
-    if addr in _cache:
-        return _cache[addr]
-    # Локальная конвертация
-    try:
-        friendly = _raw_to_friendly_local(addr, bounceable=False)
-        if friendly and friendly != addr:
-            _cache[addr] = friendly
-            return friendly
-    except Exception as e:
-        logger.warning("raw_to_friendly error: %s", e)
-    # Fallback: вернуть исходный
-    return addr
+    return canonical_address(raw_address)
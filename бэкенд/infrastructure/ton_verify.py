@@ -1,19 +1,21 @@
 """
 Проверка транзакций верификации кошелька через TonAPI.
 Ищет входящие TonTransfer (0.1 TON) или JettonTransfer (PHXPW) с комментарием verify:{telegram_id}.
+События кошелька проекта читает фоновый wallet_verify_watch; здесь — разбор событий и разовый поиск.
 """
 import logging
-from typing import Any, Dict, Optional
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
 
-import httpx
-
-from config import PHOEX_TOKEN_ADDRESS, TON_API_KEY, TON_API_URL
+from config import TON_API_KEY, TON_API_URL
+from infrastructure.http_client import get_http
 
 logger = logging.getLogger(__name__)
 
 MIN_TON_AMOUNT = 0.09
 MIN_PHXPW_AMOUNT = 4400.0
 PHXPW_DECIMALS = 9
+VERIFY_PREFIX = "verify:"
 
 
 def _get_sender_from_source(source: Optional[Dict]) -> str:
@@ -36,20 +38,62 @@ def _parse_comment(payload: Optional[Dict]) -> str:
     return payload.get("comment", "")
 
 
+def parse_verify_transfers(event: Dict[str, Any], prefix: str = VERIFY_PREFIX) -> List[Dict[str, Any]]:
+    """
+    Входящие переводы верификации из одного события TonAPI (/accounts/{wallet}/events).
+
+    TonTransfer с amount >= 0.09 TON или JettonTransfer с amount >= 4400 PHXPW, комментарий начинается с prefix.
+    В TonAPI jetton может приходить как wallet, не master — по адресу jetton не фильтруем.
+
+    Returns:
+        [{"event_id", "comment", "sender", "amount": Decimal, "method": "ton"|"phxpw", "lt", "utime"}]
+    """
+    event_id = event.get("event_id") or event.get("hash") or ""
+    out: List[Dict[str, Any]] = []
+    for action in event.get("actions") or []:
+        atype = action.get("type") or ""
+        if atype in ("TonTransfer", "ton_transfer"):
+            body = action.get("TonTransfer") or action.get("ton_transfer") or {}
+            method, decimals, minimum = "ton", 9, MIN_TON_AMOUNT
+        elif atype in ("JettonTransfer", "jetton_transfer"):
+            body = action.get("JettonTransfer") or action.get("jetton_transfer") or {}
+            method, decimals, minimum = "phxpw", PHXPW_DECIMALS, MIN_PHXPW_AMOUNT
+        else:
+            continue
+        comment = (_parse_comment(body) or body.get("comment") or "").strip()
+        if not comment.startswith(prefix):
+            continue
+        try:
+            amount = Decimal(int(body.get("amount") or 0)) / (10 ** decimals)
+        except (TypeError, ValueError):
+            continue
+        if amount < Decimal(str(minimum)):
+            continue
+        sender = _get_sender_from_source(body.get("source") or body.get("sender") or {})
+        if not sender:
+            continue
+        out.append({
+            "event_id": event_id,
+            "comment": comment,
+            "sender": sender,
+            "amount": amount,
+            "method": method,
+            "lt": int(event.get("lt") or 0),
+            "utime": int(event.get("timestamp") or 0),
+        })
+    return out
+
+
 async def find_verification_tx(
     project_wallet: str,
     verify_comment: str,
     *,
     ton_api_url: Optional[str] = None,
     ton_api_key: Optional[str] = None,
-    jetton_master: Optional[str] = None,
 ) -> Optional[Dict[str, Any]]:
     """
-    Найти транзакцию верификации: 0.1 TON или >= 4400 PHXPW с комментарием verify_comment.
-
-    Запрашивает GET /accounts/{project_wallet}/events?limit=50, перебирает actions,
-    ищет TonTransfer с amount >= 0.09 TON и comment == verify_comment
-    или JettonTransfer с jetton == PHOEX и amount >= 4400 PHXPW и comment == verify_comment.
+    Разовый поиск транзакции верификации среди последних 50 событий кошелька проекта (ручная диагностика).
+    Рабочий путь /wallet/verify — индекс wallet_verify_transfers, который наполняет wallet_verify_watch.
 
     Returns:
         {"sender": str, "amount": float, "tx_hash": str, "method": "ton"|"phxpw"} или None
@@ -58,73 +102,20 @@ async def find_verification_tx(
         return None
     base = (ton_api_url or TON_API_URL).rstrip("/")
     key = ton_api_key or TON_API_KEY
-    jetton = (jetton_master or PHOEX_TOKEN_ADDRESS or "").strip()
     url = f"{base}/accounts/{project_wallet}/events"
-    params = {"limit": 50}
-    headers = {}
-    if key:
-        headers["Authorization"] = f"Bearer {key}"
-
+    headers = {"Authorization": f"Bearer {key}"} if key else {}
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            r = await client.get(url, params=params, headers=headers or None)
-            if r.status_code != 200:
-                logger.warning("TonAPI events status %s for %s", r.status_code, url)
-                return None
-            data = r.json()
+        r = await get_http().get(url, params={"limit": 50}, headers=headers or None, timeout=15.0, upstream="tonapi")
+        if r.status_code != 200:
+            logger.warning("TonAPI events status %s for %s", r.status_code, url)
+            return None
+        data = r.json()
     except Exception as e:
         logger.warning("TonAPI request failed: %s", e)
         return None
 
-    events = data.get("events") or []
-    for event in events:
-        event_id = event.get("event_id") or event.get("hash") or ""
-        actions = event.get("actions") or []
-        for action in actions:
-            atype = action.get("type") or ""
-            # TonTransfer: amount в наноTON, comment в decoded_body или comment
-            if atype in ("TonTransfer", "ton_transfer"):
-                tt = action.get("TonTransfer") or action.get("ton_transfer") or {}
-                comment = _parse_comment(tt) or tt.get("comment", "")
-                if comment.strip() != verify_comment.strip():
-                    continue
-                amount_raw = tt.get("amount") or 0
-                try:
-                    amount_ton = int(amount_raw) / 1e9
-                except (TypeError, ValueError):
-                    amount_ton = 0.0
-                if amount_ton < MIN_TON_AMOUNT:
-                    continue
-                source = tt.get("source") or tt.get("sender") or {}
-                sender = _get_sender_from_source(source)
-                if sender:
-                    return {
-                        "sender": sender,
-                        "amount": amount_ton,
-                        "tx_hash": event_id,
-                        "method": "ton",
-                    }
-            # JettonTransfer: amount в raw (nanounits для jetton, обычно 9 decimals).
-            # Принимаем по comment + amount; в TonAPI jetton может приходить как wallet, не master — не фильтруем по адресу.
-            if atype in ("JettonTransfer", "jetton_transfer"):
-                jt = action.get("JettonTransfer") or action.get("jetton_transfer") or {}
-                comment = _parse_comment(jt) or jt.get("comment", "")
-                if comment.strip() != verify_comment.strip():
-                    continue
-                amount_raw = jt.get("amount") or "0"
-                try:
-                    amount_human = int(amount_raw) / (10 ** PHXPW_DECIMALS)
-                except (TypeError, ValueError):
-                    amount_human = 0.0
-                if amount_human < MIN_PHXPW_AMOUNT:
-                    continue
-                source = jt.get("source") or jt.get("sender") or {}
-                sender = _get_sender_from_source(source)
-                if sender:
-                    return {
-                        "sender": sender,
-                        "amount": amount_human,
-                        "tx_hash": event_id,
-                        "method": "phxpw",
-                    }
+    for event in data.get("events") or []:
+        for t in parse_verify_transfers(event, prefix=verify_comment.strip()):
+            if t["comment"] == verify_comment.strip():
+                return {"sender": t["sender"], "amount": float(t["amount"]), "tx_hash": t["event_id"], "method": t["method"]}
     return None
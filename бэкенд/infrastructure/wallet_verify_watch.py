@@ -0,0 +1,128 @@
+"""
+Фоновый читатель событий кошелька проекта: входящие переводы verify:{telegram_id} → wallet_verify_transfers.
+
+Планировщик (api/main.py) вызывает poll_verify_transfers раз в WALLET_VERIFY_POLL_SEC секунд на одном инстансе.
+Опрос идёт от новых событий к старым (GET /accounts/{wallet}/events, пагинация before_lt = next_from)
+до курсора — lt последнего обработанного события в chain_cursors. Переводы и новый курсор пишутся
+одной транзакцией, поэтому сбой посреди опроса ничего не теряет: следующий опрос начнёт с того же курсора.
+События in_progress не сдвигают курсор за себя — их перечитают, когда они завершатся.
+Если событий больше MAX_PAGES страниц, разрыв дочитывается следующими опросами (HEAD_NAME / RESUME_NAME).
+POST /wallet/verify делает только поиск по индексу (verify_wallet_binding_by_transfer).
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import PROJECT_WALLET_ADDRESS, TON_API_KEY, TON_API_URL
+from infrastructure.database import get_chain_cursors, save_wallet_verify_transfers
+from infrastructure.http_client import HttpClient, get_http
+from infrastructure.ton_verify import parse_verify_transfers
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = "wallet_verify"
+# Незавершённое догоняние: будущий курсор и lt, с которого продолжить чтение вниз
+HEAD_NAME = "wallet_verify:head"
+RESUME_NAME = "wallet_verify:resume"
+EVENTS_PAGE = 100
+# Сколько страниц читать за один опрос (первый запуск — глубина начальной загрузки)
+MAX_PAGES = 20
+
+
+async def _fetch_page(client: HttpClient, wallet: str, before_lt: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Страница событий кошелька (новые первыми); None — ошибка TonAPI."""
+    params: Dict[str, Any] = {"limit": EVENTS_PAGE}
+    if before_lt:
+        params["before_lt"] = before_lt
+    headers = {"Authorization": f"Bearer {TON_API_KEY}"} if TON_API_KEY else None
+    try:
+        r = await client.get(
+            f"{TON_API_URL.rstrip('/')}/accounts/{wallet}/events",
+            params=params, headers=headers, timeout=15.0, upstream="tonapi",
+        )
+    except Exception as e:
+        logger.warning("wallet_verify_watch: request failed: %s", e)
+        return None
+    if r.status_code != 200:
+        logger.warning("wallet_verify_watch: TonAPI events → %s", r.status_code)
+        return None
+    return r.json()
+
+
+async def collect_new_events(
+    client: HttpClient,
+    wallet: str,
+    cursor: Optional[int],
+    before_lt: Optional[int] = None,
+    max_pages: Optional[int] = None,
+) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+    """
+    События новее cursor (и старше before_lt, если задан) — не больше max_pages (по умолчанию MAX_PAGES) страниц.
+    Возвращает (события, truncated): truncated — лимит страниц исчерпан, до курсора не дошли.
+    None — страница не получена.
+    """
+    events: List[Dict[str, Any]] = []
+    for _ in range(max_pages or MAX_PAGES):
+        data = await _fetch_page(client, wallet, before_lt)
+        if data is None:
+            return None
+        page = data.get("events") or []
+        for ev in page:
+            if cursor is not None and int(ev.get("lt") or 0) <= cursor:
+                return events, False
+            events.append(ev)
+        before_lt = int(data.get("next_from") or 0)
+        if not page or not before_lt:
+            return events, False
+    return events, True
+
+
+def next_cursor(events: List[Dict[str, Any]], cursor: Optional[int]) -> Optional[int]:
+    """Новый курсор: максимальный lt среди завершённых событий, которые старше любого in_progress."""
+    pending = [int(ev.get("lt") or 0) for ev in events if ev.get("in_progress")]
+    limit = min(pending) if pending else None
+    done = [
+        int(ev.get("lt") or 0) for ev in events
+        if not ev.get("in_progress") and (limit is None or int(ev.get("lt") or 0) < limit)
+    ]
+    if not done:
+        return cursor
+    return max(done + ([cursor] if cursor is not None else []))
+
+
+async def poll_verify_transfers(client: Optional[HttpClient] = None, wallet: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Один опрос: прочитать новые события, записать verify-переводы, сдвинуть курсор.
+
+    Если за опрос не дошли до курсора (больше MAX_PAGES страниц), курсор не сдвигается: в HEAD_NAME
+    запоминается будущий курсор, в RESUME_NAME — самый старый прочитанный lt. Следующие опросы
+    дочитывают разрыв от RESUME_NAME вниз до курсора и только потом переносят курсор на HEAD_NAME.
+    """
+    wallet = (wallet or PROJECT_WALLET_ADDRESS or "").strip()
+    stats = {"events": 0, "transfers": 0, "inserted": 0, "cursor": None, "gap": False, "errors": 0}
+    if not wallet:
+        return stats
+    saved = await get_chain_cursors([CURSOR_NAME, HEAD_NAME, RESUME_NAME])
+    cursor, resume = saved.get(CURSOR_NAME), saved.get(RESUME_NAME)
+    result = await collect_new_events(client or get_http(), wallet, cursor, before_lt=resume)
+    if result is None:
+        stats["errors"] = 1
+        stats["cursor"] = cursor
+        return stats
+    events, truncated = result
+    if cursor is None:
+        # Первый запуск: глубина начальной загрузки ограничена MAX_PAGES, старее не дочитываем
+        truncated = False
+    transfers = [t for ev in events if not ev.get("in_progress") for t in parse_verify_transfers(ev)]
+    head = saved.get(HEAD_NAME) if resume is not None else next_cursor(events, cursor)
+    if truncated:
+        logger.warning("wallet_verify_watch: %d страниц не дошли до курсора %s — дочитаем в следующий опрос", MAX_PAGES, cursor)
+        cursors = {HEAD_NAME: head, RESUME_NAME: min(int(ev.get("lt") or 0) for ev in events)}
+    else:
+        cursors = {CURSOR_NAME: head, HEAD_NAME: None, RESUME_NAME: None} if head is not None else {}
+    stats["events"] = len(events)
+    stats["transfers"] = len(transfers)
+    stats["cursor"] = cursor if truncated else head
+    stats["gap"] = truncated
+    if transfers or truncated or head != cursor or resume is not None:
+        stats["inserted"] = await save_wallet_verify_transfers(transfers, cursors)
+    return stats
@@ -0,0 +1,64 @@
+"""
+Локальный фейковый TonAPI для юнит-тестов: обработчик для httpx.MockTransport.
+
+Отдаёт GET /v2/accounts/{address}/events по образцу TonAPI: события от новых к старым, limit,
+пагинация before_lt → next_from (0 — страниц больше нет). Считает запросы.
+"""
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from infrastructure.http_client import HttpClient
+
+
+class FakeTonApi:
+    def __init__(self) -> None:
+        self.events: Dict[str, List[Dict[str, Any]]] = {}
+        self.requests: List[httpx.Request] = []
+        self.fail_status: Optional[int] = None
+        self._lt = 1_000_000
+
+    def add_event(
+        self,
+        account: str,
+        *,
+        comment: str = "",
+        amount: int = 100_000_000,
+        sender: str = "0:" + "aa" * 32,
+        jetton: bool = False,
+        in_progress: bool = False,
+    ) -> Dict[str, Any]:
+        """Добавить событие с одним входящим переводом (TonTransfer или JettonTransfer)."""
+        self._lt += 10
+        kind = "JettonTransfer" if jetton else "TonTransfer"
+        event = {
+            "event_id": f"ev{self._lt}",
+            "lt": self._lt,
+            "timestamp": 1_700_000_000 + self._lt,
+            "in_progress": in_progress,
+            "actions": [{
+                "type": kind,
+                kind: {"amount": str(amount), "comment": comment, "sender": {"address": sender}},
+            }],
+        }
+        self.events.setdefault(account, []).append(event)
+        return event
+
+    def client(self) -> HttpClient:
+        return HttpClient(transport=httpx.MockTransport(self), failure_threshold=100)
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.fail_status:
+            return httpx.Response(self.fail_status, json={"error": "fake"})
+        parts = request.url.path.strip("/").split("/")
+        if len(parts) != 4 or parts[1] != "accounts" or parts[3] != "events":
+            return httpx.Response(404, json={"error": "not found"})
+        limit = int(request.url.params.get("limit", "100"))
+        before_lt = int(request.url.params.get("before_lt", "0") or 0)
+        newest_first = sorted(self.events.get(parts[2], []), key=lambda e: e["lt"], reverse=True)
+        if before_lt:
+            newest_first = [e for e in newest_first if e["lt"] < before_lt]
+        page = newest_first[:limit]
+        next_from = page[-1]["lt"] if len(newest_first) > limit else 0
+        return httpx.Response(200, json={"events": page, "next_from": next_from})
@@ -0,0 +1,84 @@
+"""
+Юнит-тесты правил крафта (core/craft.py: plan_merge, plan_upgrade, plan_reroll) без БД.
+Исход задаётся фиксированным генератором.
+Запуск: из корня бэкенда: pytest tests/test_craft_plans.py -v
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from core.craft import CraftAbort, CraftChanges, MAX_ITEM_LEVEL, plan_merge, plan_reroll, plan_upgrade
+from infrastructure.catalog import ItemCatalog, ItemDef
+
+CATALOG = ItemCatalog([
+    ItemDef(1, "relic_a", "relic_slot", "", "A", "common"),
+    ItemDef(2, "relic_b", "relic_slot", "", "B", "common"),
+    ItemDef(3, "amulet_r", "amulet", "", "R", "rare"),
+])
+
+
+class _Rng:
+    def __init__(self, r: float):
+        self.r = r
+
+    def random(self):
+        return self.r
+
+    def choice(self, seq):
+        return seq[-1]
+
+
+def _item(item_id, def_id=1, level=1):
+    return {"id": item_id, "item_def_id": def_id, "item_level": level}
+
+
+def test_merge_ok_creates_new_item():
+    ch = CraftChanges()
+    res = plan_merge([_item(1, 1, 2), _item(2, 2, 2), _item(3, 1, 3)], ch, CATALOG, _Rng(0.5))
+    assert res["result"] == "ok" and res["level"] == 2 and res["_new_idx"] == 0
+    assert ch.delete_ids == [1, 2, 3]
+    assert ch.new_items == [(2, 2, {})]
+
+
+def test_merge_level_bonus_and_break():
+    ch = CraftChanges()
+    assert plan_merge([_item(i) for i in (1, 2, 3)], ch, CATALOG, _Rng(0.9))["level"] == 2
+    ch = CraftChanges()
+    res = plan_merge([_item(i) for i in (1, 2, 3)], ch, CATALOG, _Rng(0.01))
+    assert res["result"] == "break" and not ch.new_items and ch.delete_ids == [1, 2, 3]
+
+
+def test_merge_requires_same_rarity():
+    with pytest.raises(CraftAbort) as e:
+        plan_merge([_item(1, 1), _item(2, 2), _item(3, 3)], CraftChanges(), CATALOG, _Rng(0.5))
+    assert e.value.error == "same_type_required"
+
+
+def test_upgrade_outcomes():
+    ch = CraftChanges()
+    assert plan_upgrade([_item(5, level=2)], ch, _Rng(0.5)) == {
+        "ok": True, "result": "ok", "output_item_id": 5, "level": 3,
+    }
+    assert ch.level_ups == [5]
+    ch = CraftChanges()
+    assert plan_upgrade([_item(5)], ch, _Rng(0.9))["result"] == "same" and not ch.level_ups
+    ch = CraftChanges()
+    assert plan_upgrade([_item(5)], ch, _Rng(0.01))["result"] == "break" and ch.delete_ids == [5]
+
+
+def test_upgrade_max_level():
+    with pytest.raises(CraftAbort) as e:
+        plan_upgrade([_item(5, level=MAX_ITEM_LEVEL)], CraftChanges(), _Rng(0.5))
+    assert e.value.error == "max_level"
+
+
+def test_reroll_outcomes():
+    ch = CraftChanges()
+    assert plan_reroll([_item(7)], ch, _Rng(0.5))["result"] == "ok" and not ch.delete_ids
+    ch = CraftChanges()
+    assert plan_reroll([_item(7)], ch, _Rng(0.1))["result"] == "break" and ch.delete_ids == [7]
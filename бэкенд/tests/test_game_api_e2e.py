@@ -195,6 +195,28 @@ def test_inventory(client):
     assert isinstance(j, (dict, list))
 
 
+def test_inventory_page_and_etag(client):
+    r = client.get("/api/game/inventory", params={"view": "page", "limit": 5}, headers=HEADERS)
+    assert r.status_code == 200
+    j = r.json()
+    assert "items" in j and "next_cursor" in j
+    assert len(j["items"]) <= 5
+    for it in j["items"]:
+        assert "item_def_id" in it and "name" not in it
+    etag = r.headers.get("ETag")
+    assert etag
+    r2 = client.get("/api/game/inventory", params={"view": "page", "limit": 5},
+                    headers={**HEADERS, "If-None-Match": etag})
+    assert r2.status_code == 304
+
+
+def test_inventory_summary(client):
+    r = client.get("/api/game/inventory", params={"view": "summary"}, headers=HEADERS)
+    assert r.status_code == 200
+    j = r.json()
+    assert "items" in j and "eggs" in j and "version" in j
+
+
 # ——— Поле и здания ———
 
 def test_field(client):
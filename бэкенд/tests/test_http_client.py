@@ -0,0 +1,184 @@
+"""
+Юнит-тесты общего HTTP-клиента (infrastructure/http_client.py): повторы, circuit breaker, fallback.
+Сеть не нужна — upstream подменяется httpx.MockTransport.
+Запуск: из корня бэкенда: pytest tests/test_http_client.py -v
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+import httpx
+import pytest
+
+from infrastructure.http_client import CircuitBreaker, HttpClient, TokenBucket, UpstreamUnavailable
+
+
+class _FakeUpstream:
+    """Отвечает status на каждый запрос и считает обращения."""
+
+    def __init__(self, status: int = 200):
+        self.status = status
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        return httpx.Response(self.status, json={"ok": self.status < 400})
+
+
+def _client(upstream: _FakeUpstream, **kwargs) -> HttpClient:
+    return HttpClient(transport=httpx.MockTransport(upstream), **kwargs)
+
+
+def test_retries_idempotent_on_503_then_returns_last_response():
+    async def scenario():
+        up = _FakeUpstream(503)
+        http = _client(up, failure_threshold=100)
+        r = await http.get("http://up/x", upstream="up", retries=2, backoff=0)
+        await http.aclose()
+        return up.calls, r.status_code, http.metrics()["upstreams"]["up"]
+
+    calls, status, m = asyncio.run(scenario())
+    assert calls == 3
+    assert status == 503
+    assert m["retries"] == 2
+    assert m["status"] == {"503": 3}
+
+
+def test_post_not_retried_on_5xx():
+    async def scenario():
+        up = _FakeUpstream(502)
+        http = _client(up)
+        r = await http.post("http://up/x", upstream="up", backoff=0)
+        await http.aclose()
+        return up.calls, r.status_code
+
+    assert asyncio.run(scenario()) == (1, 502)
+
+
+def test_breaker_opens_rejects_and_recovers():
+    async def scenario():
+        up = _FakeUpstream(500)
+        http = _client(up, failure_threshold=3, reset_timeout=0.1)
+        for _ in range(3):
+            await http.get("http://up/x", upstream="up", retries=0)
+        assert http.breaker_state("up") == "open"
+
+        # Открытый breaker не пропускает запросы к upstream
+        assert await http.get("http://up/x", upstream="up", fallback=None) is None
+        with pytest.raises(UpstreamUnavailable):
+            await http.get("http://up/x", upstream="up")
+        assert up.calls == 3
+
+        # После reset_timeout — один пробный запрос; успех закрывает breaker
+        await asyncio.sleep(0.12)
+        up.status = 200
+        r = await http.get("http://up/x", upstream="up", retries=0)
+        assert r.status_code == 200
+        assert http.breaker_state("up") == "closed"
+        m = http.metrics()["upstreams"]["up"]
+        await http.aclose()
+        return m
+
+    m = asyncio.run(scenario())
+    assert m["rejected_by_breaker"] == 2
+    assert m["errors"] == 3
+
+
+def test_failed_probe_reopens_breaker():
+    async def scenario():
+        up = _FakeUpstream(503)
+        http = _client(up, failure_threshold=1, reset_timeout=0.05)
+        await http.get("http://up/x", upstream="up", retries=0)
+        await asyncio.sleep(0.06)
+        await http.get("http://up/x", upstream="up", retries=0)
+        state = http.breaker_state("up")
+        await http.aclose()
+        return up.calls, state
+
+    assert asyncio.run(scenario()) == (2, "open")
+
+
+def test_cancelled_probe_does_not_stick_half_open():
+    state = {"hang": False, "calls": 0}
+
+    async def handler(request):
+        state["calls"] += 1
+        if state["hang"]:
+            await asyncio.sleep(10)
+        return httpx.Response(500 if state["calls"] == 1 else 200)
+
+    async def scenario():
+        http = HttpClient(transport=httpx.MockTransport(handler), failure_threshold=1, reset_timeout=0.05)
+        await http.get("http://up/x", upstream="up", retries=0)
+        assert http.breaker_state("up") == "open"
+        await asyncio.sleep(0.06)
+        state["hang"] = True
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(http.get("http://up/x", upstream="up", retries=0), timeout=0.05)
+        assert http.breaker_state("up") == "half_open"
+        state["hang"] = False
+        r = await http.get("http://up/x", upstream="up", retries=0, fallback=None)
+        result = (r.status_code if r is not None else None, http.breaker_state("up"))
+        await http.aclose()
+        return result
+
+    assert asyncio.run(scenario()) == (200, "closed")
+
+
+def test_stale_half_open_probe_is_replaced():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+    time.sleep(0.06)
+    assert breaker.allow() is True
+
+
+def test_breakers_are_per_upstream_and_4xx_is_not_failure():
+    async def scenario():
+        bad, missing = _FakeUpstream(500), _FakeUpstream(404)
+        http_bad = _client(bad, failure_threshold=1)
+        await http_bad.get("http://a/x", upstream="a", retries=0)
+        http_missing = _client(missing, failure_threshold=1)
+        for _ in range(3):
+            await http_missing.get("http://b/x", upstream="b", retries=0)
+        states = (http_bad.breaker_state("a"), http_bad.breaker_state("b"), http_missing.breaker_state("b"))
+        await http_bad.aclose()
+        await http_missing.aclose()
+        return states
+
+    assert asyncio.run(scenario()) == ("open", "closed", "closed")
+
+
+def test_transport_error_raises_upstream_unavailable():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    async def scenario():
+        http = HttpClient(transport=httpx.MockTransport(handler))
+        try:
+            await http.get("http://down/x", upstream="down", retries=1, backoff=0)
+        finally:
+            m = http.metrics()["upstreams"]["down"]
+            await http.aclose()
+        return m
+
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(scenario())
+
+
+def test_token_bucket_limits_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=20, burst=2)
+        t0 = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        return time.monotonic() - t0
+
+    # 2 токена сразу, ещё 4 — по 1/20 с
+    assert asyncio.run(scenario()) >= 0.18
@@ -0,0 +1,62 @@
+"""
+Юнит-тесты индекса владения NFT (infrastructure/nft_ownership.py) без сети и БД.
+Запуск: из корня бэкенда: pytest tests/test_nft_ownership.py -v
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from infrastructure import nft_ownership
+from infrastructure.ton_address import address_key, canonical_address
+
+WALLET_RAW = "0:" + "ab" * 32
+WALLET = canonical_address(WALLET_RAW)
+
+
+def _rows():
+    return [{
+        "nft_address": "0:" + "01" * 32,
+        "owner_addr": address_key(WALLET),
+        "name": "Paw #1",
+        "image": "https://x/1.png",
+        "collection_name": "Phoenix Paw",
+        "collection_address": "UQcoll",
+    }]
+
+
+def _run(synced_at, live):
+    nft_ownership._synced_at = (synced_at, float("inf"))
+    nft_ownership._live_memo.clear()
+    with mock.patch.object(nft_ownership, "get_dev_nfts_for_user", mock.AsyncMock(return_value=_rows())), \
+            mock.patch.object(nft_ownership, "check_user_has_project_nft", live):
+        return asyncio.run(nft_ownership.check_project_nfts([WALLET_RAW, WALLET_RAW]))
+
+
+def test_fresh_index_does_not_call_tonapi():
+    live = mock.AsyncMock()
+    out = _run(datetime.now(timezone.utc), live)
+    live.assert_not_called()
+    assert out["source"] == "index"
+    assert out["has_project_nft"] and out["count"] == 1 and out["wallets_checked"] == 1
+    assert out["items"][0]["collection_name"] == "Phoenix Paw"
+
+
+def test_stale_index_uses_live_once_per_wallet():
+    live = mock.AsyncMock(return_value={"items": [], "error": None})
+    out = _run(datetime.now(timezone.utc) - timedelta(days=1), live)
+    assert out["source"] == "live" and out["count"] == 0
+    with mock.patch.object(nft_ownership, "check_user_has_project_nft", live):
+        asyncio.run(nft_ownership._live_items(WALLET))
+    live.assert_called_once()
+
+
+def test_live_error_falls_back_to_index():
+    live = mock.AsyncMock(return_value={"items": [], "error": "api_429"})
+    out = _run(None, live)
+    assert out["source"] == "index" and out["count"] == 1
@@ -0,0 +1,31 @@
+"""
+Юнит-тесты пайплайна NFT-синка (infrastructure/nft_sync.py) без сети и БД.
+Запуск: из корня бэкенда: pytest tests/test_nft_sync.py -v
+"""
+import sys
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from infrastructure.nft_sync import _nft_row
+
+
+def test_nft_row_parses_item():
+    item = {
+        "address": "0:" + "ab" * 32,
+        "index": "7",
+        "owner": {"address": "0:" + "cd" * 32},
+        "metadata": {"name": "Paw #7", "image": "https://x/7.png", "attributes": [{"trait_type": "a"}]},
+    }
+    row = _nft_row(item, "UQcoll", default_owner="UQdev")
+    assert row["nft_index"] == 7
+    assert row["collection_address"] == "UQcoll"
+    assert row["owner_address"].startswith("UQ")
+    assert row["name"] == "Paw #7"
+    assert row["attributes"] == [{"trait_type": "a"}]
+
+
+def test_nft_row_without_address():
+    assert _nft_row({"index": 1}, "UQcoll") is None
@@ -0,0 +1,145 @@
+"""
+Юнит-тесты ленты курсов (infrastructure/price.py) без сети, Redis и БД.
+Запуск: из корня бэкенда: pytest tests/test_price_feed.py -v
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+from unittest import mock
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from infrastructure import price
+
+
+class _Upstream:
+    """Фейковый источник курса: считает вызовы, может «висеть» до release."""
+
+    def __init__(self, value, hang: bool = False):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+        if not hang:
+            self.release.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.value
+
+
+def _reset():
+    price._entries.clear()
+    price._inflight.clear()
+    price._started.clear()
+    price._lkg_loaded.clear()
+    price._lkg_tasks.clear()
+
+
+def _patched(fetchers, lkg=None):
+    store = {}
+
+    async def cache_get(key):
+        return store.get(key)
+
+    async def cache_set(key, value, ttl_sec=300):
+        store[key] = value
+
+    async def get_price_feed(symbol):
+        return lkg.get(symbol) if lkg else None
+
+    return mock.patch.multiple(
+        price,
+        FETCHERS=fetchers,
+        cache_get=cache_get,
+        cache_set=cache_set,
+        get_price_feed=get_price_feed,
+        save_price_feed=mock.AsyncMock(),
+    ), store
+
+
+def test_rates_do_not_wait_for_upstream_and_single_flight():
+    async def scenario():
+        _reset()
+        phxpw = _Upstream({"ton": 0.00003, "usd": 0.0001}, hang=True)
+        ton = _Upstream({"usd": 3.2}, hang=True)
+        patcher, store = _patched({"phxpw": phxpw, "ton_usd": ton})
+        with patcher:
+            t0 = time.perf_counter()
+            results = await asyncio.gather(*(price.get_rates() for _ in range(50)))
+            assert time.perf_counter() - t0 < 0.5
+            assert results[0]["phxpw_price_ton"] == "0.000024"
+            assert phxpw.calls == 1 and ton.calls == 1
+            phxpw.release.set()
+            ton.release.set()
+            await asyncio.sleep(0)
+            await asyncio.gather(*price._inflight.values())
+            rates = await price.get_rates()
+            assert rates["phxpw_price_ton"] == "0.00003"
+            assert rates["ton_price_usd"] == 3.2
+            assert store["price:phxpw"]["value"]["ton"] == 0.00003
+    asyncio.run(scenario())
+
+
+def test_last_known_good_served_and_per_symbol_ttl():
+    async def scenario():
+        _reset()
+        from datetime import datetime, timezone
+        fresh = datetime.now(timezone.utc)
+        lkg = {"phxpw": ({"ton": 0.00005, "usd": None}, fresh), "ton_usd": ({"usd": 2.5}, fresh)}
+        phxpw = _Upstream(None)
+        ton = _Upstream({"usd": 9.9})
+        patcher, _ = _patched({"phxpw": phxpw, "ton_usd": ton}, lkg=lkg)
+        with patcher:
+            rates = await price.get_rates()
+            assert rates["phxpw_price_ton"] == "0.00005" and rates["ton_price_usd"] == 2.5
+            assert phxpw.calls == 0 and ton.calls == 0
+            # Устарел только TON/USD — обновляется только он
+            price._entries["ton_usd"].fetched_at -= price.FEED_TTL_SEC["ton_usd"]
+            await price.get_rates()
+            await asyncio.gather(*price._inflight.values())
+            assert phxpw.calls == 0 and ton.calls == 1
+            assert (await price.get_rates())["ton_price_usd"] == 9.9
+    asyncio.run(scenario())
+
+
+def test_failed_upstream_keeps_value_and_backs_off():
+    async def scenario():
+        _reset()
+        phxpw = _Upstream(None)
+        patcher, _ = _patched({"phxpw": phxpw, "ton_usd": _Upstream(None)})
+        with patcher:
+            price._entries["phxpw"] = price.PriceEntry({"ton": 0.00004, "usd": None}, time.time() - 10_000)
+            for _ in range(5):
+                assert await price.get_phxpw_price_ton() == 0.00004
+                await asyncio.sleep(0)
+            assert phxpw.calls == 1
+    asyncio.run(scenario())
+
+
+def test_lkg_load_is_single_flight_and_retried_after_db_failure():
+    async def scenario():
+        _reset()
+        from datetime import datetime, timezone
+        fresh = datetime.now(timezone.utc)
+        reads = {"n": 0, "fail": True}
+
+        async def get_price_feed(symbol):
+            reads["n"] += 1
+            await asyncio.sleep(0.01)
+            if reads["fail"]:
+                raise RuntimeError("db down")
+            return {"phxpw": ({"ton": 0.00005, "usd": None}, fresh), "ton_usd": ({"usd": 2.5}, fresh)}[symbol]
+
+        patcher, _ = _patched({"phxpw": _Upstream(None, hang=True), "ton_usd": _Upstream(None, hang=True)})
+        with patcher, mock.patch.object(price, "get_price_feed", get_price_feed):
+            await asyncio.gather(*(price.get_price("phxpw") for _ in range(20)))
+            assert reads["n"] == 1 and "phxpw" not in price._lkg_loaded
+            reads["fail"] = False
+            results = await asyncio.gather(*(price.get_rates() for _ in range(20)))
+            assert all(r["phxpw_price_ton"] == "0.00005" and r["ton_price_usd"] == 2.5 for r in results)
+            assert reads["n"] == 3
+    asyncio.run(scenario())
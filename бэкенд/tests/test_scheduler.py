@@ -0,0 +1,89 @@
+"""
+Юнит-тесты планировщика (infrastructure/scheduler.py): cron-выражения, локальный запуск, таймауты.
+БД не нужна — без пула задачи выполняются локально.
+Запуск: из корня бэкенда: pytest tests/test_scheduler.py -v
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+import pytest
+
+from infrastructure.scheduler import CronSpec, Job, Scheduler, _lock_key
+
+
+def _dt(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_cron_every_15_minutes():
+    spec = CronSpec("*/15 * * * *")
+    assert spec.next_after(_dt(2026, 1, 1, 10, 7)) == _dt(2026, 1, 1, 10, 15)
+    assert spec.next_after(_dt(2026, 1, 1, 10, 45)) == _dt(2026, 1, 1, 11, 0)
+
+
+def test_cron_daily_rolls_over_month_and_year():
+    spec = CronSpec("5 0 * * *")
+    assert spec.next_after(_dt(2026, 12, 31, 0, 5)) == _dt(2027, 1, 1, 0, 5)
+
+
+def test_cron_weekday_sunday_as_7():
+    spec = CronSpec("0 12 * * 7")
+    # 2026-01-01 — четверг, ближайшее воскресенье — 4 января
+    assert spec.next_after(_dt(2026, 1, 1)) == _dt(2026, 1, 4, 12, 0)
+
+
+def test_cron_invalid():
+    with pytest.raises(ValueError):
+        CronSpec("61 * * * *")
+    with pytest.raises(ValueError):
+        CronSpec("* * *")
+
+
+def test_job_requires_single_schedule():
+    async def noop():
+        pass
+    with pytest.raises(ValueError):
+        Job("x", noop)
+    with pytest.raises(ValueError):
+        Job("x", noop, interval=1, cron="* * * * *")
+
+
+def test_lock_key_stable_and_signed_bigint():
+    k = _lock_key("nft_sync")
+    assert k == _lock_key("nft_sync")
+    assert k != _lock_key("ws_heartbeat")
+    assert -(2 ** 63) <= k < 2 ** 63
+
+
+def test_scheduler_runs_locally_without_pool_and_records_metrics():
+    calls = []
+
+    async def no_pool():
+        return None
+
+    async def work():
+        calls.append(1)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def scenario():
+        s = Scheduler(no_pool, instance_id="test")
+        s.add_job("work", work, interval=0.05)
+        s.add_job("slow", slow, interval=10, timeout=0.05)
+        await s.start()
+        await asyncio.sleep(0.2)
+        await s.stop()
+        return s.metrics()
+
+    m = asyncio.run(scenario())
+    assert len(calls) >= 2
+    assert m["jobs"]["work"]["ok"] == len(calls)
+    assert m["jobs"]["slow"]["timeouts"] == 1
+    assert m["jobs"]["slow"]["last_status"] == "timeout"
@@ -0,0 +1,29 @@
+"""
+Копии общих модулей в сервисах deploy/ и сервисы/ совпадают с бэкенд/infrastructure.
+Список копий — в deploy/sync_shared.sh (там же команда синхронизации).
+Запуск: из корня бэкенда: pytest tests/test_shared_copies.py -v
+"""
+import re
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+REPO_ROOT = BACKEND_ROOT.parent
+SYNC_SCRIPT = REPO_ROOT / "deploy" / "sync_shared.sh"
+
+
+def _copies():
+    text = SYNC_SCRIPT.read_text(encoding="utf-8")
+    block = re.search(r"^COPIES=\((.*?)^\)", text, re.S | re.M).group(1)
+    return re.findall(r'"(\S+) (\S+)"', block)
+
+
+def test_sync_script_lists_copies():
+    assert _copies()
+
+
+def test_shared_copies_match_source():
+    stale = [
+        dst for src, dst in _copies()
+        if (BACKEND_ROOT / "infrastructure" / src).read_bytes() != (REPO_ROOT / dst).read_bytes()
+    ]
+    assert not stale, f"Копии разошлись с бэкенд/infrastructure — запустите bash deploy/sync_shared.sh: {stale}"
@@ -0,0 +1,82 @@
+"""
+Юнит-тесты кэша membership (infrastructure/telegram_chat.py): TTL, правило restricted, пакетная проверка.
+Telegram подменяется httpx.MockTransport; без Redis работает кэш процесса.
+Запуск: из корня бэкенда: pytest tests/test_telegram_chat.py -v
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+import httpx
+import pytest
+
+from infrastructure import http_client, telegram_chat
+
+
+@pytest.fixture
+def telegram(monkeypatch):
+    """Фейковый getChatMember: user_id 1 — member, остальные — left. Считает запросы."""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        user_id = int(request.url.params["user_id"])
+        calls.append((int(request.url.params["chat_id"]), user_id))
+        status = "member" if user_id == 1 else "left"
+        return httpx.Response(200, json={"ok": True, "result": {"status": status, "user": {"id": user_id}}})
+
+    async def no_cache_get(key):
+        return None
+
+    async def no_cache_set(key, value, ttl_sec=300):
+        return None
+
+    monkeypatch.setattr(telegram_chat, "BOT_TOKEN", "1:test")
+    monkeypatch.setattr(telegram_chat, "cache_get", no_cache_get)
+    monkeypatch.setattr(telegram_chat, "cache_set", no_cache_set)
+    monkeypatch.setattr(http_client, "_http", http_client.HttpClient(transport=httpx.MockTransport(handler)))
+    telegram_chat._member_cache.clear()
+    yield calls
+    telegram_chat._member_cache.clear()
+
+
+def test_check_user_in_chat_is_cached(telegram):
+    async def scenario():
+        first = await telegram_chat.check_user_in_chat(-100, 1)
+        second = await telegram_chat.check_user_in_chat(-100, 1)
+        fresh = await telegram_chat.check_user_in_chat(-100, 1, fresh=True)
+        return first, second, fresh
+
+    assert asyncio.run(scenario()) == ((True, "member"),) * 3
+    assert len(telegram) == 2
+
+
+def test_negative_ttl_is_shorter(telegram, monkeypatch):
+    monkeypatch.setattr(telegram_chat, "TG_MEMBER_TTL_NEGATIVE", 0)
+
+    async def scenario():
+        await telegram_chat.check_user_in_chat(-100, 2)
+        return await telegram_chat.check_user_in_chat(-100, 2)
+
+    assert asyncio.run(scenario()) == (False, "left")
+    assert len(telegram) == 2
+
+
+def test_restricted_without_is_member_is_not_in_chat():
+    assert telegram_chat._is_in_chat({"status": "restricted"}) is False
+    assert telegram_chat._is_in_chat({"status": "restricted", "is_member": True}) is True
+    assert telegram_chat._is_in_chat({"status": "member"}) is True
+
+
+def test_batch_checks_only_cache_misses(telegram):
+    async def scenario():
+        await telegram_chat.check_user_in_chat(-100, 1)
+        return await telegram_chat.check_users_in_chats([1, 2, 2], [-100, -200])
+
+    results = asyncio.run(scenario())
+    assert results[1][-100] == {"in_chat": True, "status": "member"}
+    assert results[2][-200] == {"in_chat": False, "status": "left"}
+    assert sorted(telegram) == [(-200, 1), (-200, 2), (-100, 1), (-100, 2)]
@@ -0,0 +1,84 @@
+"""
+Юнит-тесты кодека TON-адресов (infrastructure/ton_address.py): CRC, raw ↔ friendly, канонизация.
+Запуск: из корня бэкенда: pytest tests/test_ton_address.py -v
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from infrastructure.ton_address import (
+    _crc16_xmodem,
+    _raw_to_friendly_local,
+    canonical_address,
+    friendly_to_raw,
+    parse_friendly,
+    raw_to_friendly,
+    raw_to_friendly_many,
+)
+
+RAW = "0:" + "83dfd552e63729b472fcbcc8c45ebcc6691702558b68ec7527e1ba403a0f31a8"
+
+
+def _crc_bitwise(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return crc
+
+
+def test_crc_matches_bitwise_xmodem():
+    for data in (b"", b"123456789", bytes(range(256))):
+        assert _crc16_xmodem(data) == _crc_bitwise(data)
+    assert _crc16_xmodem(b"123456789") == 0x31C3
+
+
+def test_raw_friendly_round_trip():
+    uq = canonical_address(RAW)
+    eq = _raw_to_friendly_local(RAW, bounceable=True)
+    assert uq.startswith("UQ") and eq.startswith("EQ") and len(uq) == 48
+    assert friendly_to_raw(uq) == RAW
+    assert friendly_to_raw(eq) == RAW
+    # EQ и UQ одного адреса канонизируются одинаково
+    assert canonical_address(eq) == uq
+    assert parse_friendly(eq)[2] is True and parse_friendly(uq)[2] is False
+
+
+def test_masterchain_and_base64_variants():
+    raw = "-1:" + "ff" * 32
+    uq = canonical_address(raw)
+    assert friendly_to_raw(uq) == raw
+    std = uq.replace("-", "+").replace("_", "/")
+    assert canonical_address(std) == uq
+
+
+def test_invalid_addresses_pass_through():
+    assert canonical_address("  not-an-address ") == "not-an-address"
+    assert canonical_address("") == ""
+    assert friendly_to_raw("0:abcd") is None
+    # испорченный CRC
+    uq = canonical_address(RAW)
+    broken = uq[:-2] + ("AA" if uq[-2:] != "AA" else "BB")
+    assert parse_friendly(broken) is None
+
+
+def test_batch_and_async_wrapper():
+    uq = canonical_address(RAW)
+    assert raw_to_friendly_many([RAW, uq, "", "x"]) == [uq, uq, "", "x"]
+    assert asyncio.run(raw_to_friendly(RAW)) == uq
+
+
+def test_address_key_matches_across_formats():
+    from infrastructure.ton_address import address_key
+    raw = "-1:" + "ab" * 32
+    key = address_key(raw)
+    assert len(key) == 33 and key[0] == 0xFF and key[1:] == bytes.fromhex("ab" * 32)
+    assert address_key(_raw_to_friendly_local(raw, bounceable=True)) == key
+    assert address_key(canonical_address(raw)) == key
+    assert address_key("garbage") is None
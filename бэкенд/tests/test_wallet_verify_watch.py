@@ -0,0 +1,119 @@
+"""
+Юнит-тесты фонового читателя verify-переводов (infrastructure/wallet_verify_watch.py).
+TonAPI — локальный фейк (tests/fake_tonapi.py), БД — словари в памяти.
+Запуск: из корня бэкенда: pytest tests/test_wallet_verify_watch.py -v
+"""
+import asyncio
+import sys
+from pathlib import Path
+from unittest import mock
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+if str(BACKEND_ROOT) not in sys.path:
+    sys.path.insert(0, str(BACKEND_ROOT))
+
+from infrastructure import wallet_verify_watch as watch
+from tests.fake_tonapi import FakeTonApi
+
+WALLET = "0:" + "ff" * 32
+
+
+class _Store:
+    """chain_cursors + wallet_verify_transfers в памяти."""
+
+    def __init__(self):
+        self.cursors = {}
+        self.transfers = {}
+
+    @property
+    def cursor(self):
+        return self.cursors.get(watch.CURSOR_NAME)
+
+    async def get_cursors(self, names):
+        return {n: self.cursors[n] for n in names if n in self.cursors}
+
+    async def save(self, transfers, cursors):
+        new = [t for t in transfers if (t["event_id"], t["comment"]) not in self.transfers]
+        for t in new:
+            self.transfers[(t["event_id"], t["comment"])] = t
+        for name, lt in cursors.items():
+            if lt is None:
+                self.cursors.pop(name, None)
+            else:
+                self.cursors[name] = lt
+        return len(new)
+
+
+def _poll(api: FakeTonApi, store: _Store):
+    with mock.patch.object(watch, "get_chain_cursors", store.get_cursors), \
+            mock.patch.object(watch, "save_wallet_verify_transfers", store.save):
+        return asyncio.run(watch.poll_verify_transfers(client=api.client(), wallet=WALLET))
+
+
+def test_indexes_verify_transfers_beyond_one_page():
+    api, store = FakeTonApi(), _Store()
+    api.add_event(WALLET, comment="verify:1")
+    for _ in range(250):
+        api.add_event(WALLET, comment="hello")
+    api.add_event(WALLET, comment="verify:2", amount=4400 * 10 ** 9, jetton=True)
+    api.add_event(WALLET, comment="verify:3", amount=1)  # меньше 0.09 TON
+    stats = _poll(api, store)
+    assert stats["events"] == 253 and stats["inserted"] == 2
+    assert {c for _, c in store.transfers} == {"verify:1", "verify:2"}
+    assert store.cursor == max(e["lt"] for e in api.events[WALLET])
+
+
+def test_cursor_stops_paging_and_reindex_is_noop():
+    api, store = FakeTonApi(), _Store()
+    for _ in range(150):
+        api.add_event(WALLET, comment="x")
+    _poll(api, store)
+    api.requests.clear()
+    api.add_event(WALLET, comment="verify:7")
+    stats = _poll(api, store)
+    assert len(api.requests) == 1
+    assert stats["events"] == 1 and stats["inserted"] == 1
+    stats = _poll(api, store)
+    assert stats["events"] == 0 and stats["inserted"] == 0
+
+
+def test_page_limit_keeps_cursor_and_resumes_gap():
+    api, store = FakeTonApi(), _Store()
+    api.add_event(WALLET, comment="x")
+    _poll(api, store)
+    start = store.cursor
+    api.add_event(WALLET, comment="verify:old")
+    for _ in range(250):
+        api.add_event(WALLET, comment="x")
+    api.add_event(WALLET, comment="verify:new")
+    newest = max(e["lt"] for e in api.events[WALLET])
+    with mock.patch.object(watch, "MAX_PAGES", 2):
+        stats = _poll(api, store)
+        assert stats["gap"] and store.cursor == start
+        assert {c for _, c in store.transfers} == {"verify:new"}
+        while store.cursor == start:
+            _poll(api, store)
+    assert store.cursor == newest
+    assert watch.RESUME_NAME not in store.cursors and watch.HEAD_NAME not in store.cursors
+    assert {c for _, c in store.transfers} == {"verify:new", "verify:old"}
+
+
+def test_in_progress_event_holds_cursor():
+    api, store = FakeTonApi(), _Store()
+    done = api.add_event(WALLET, comment="verify:1")
+    pending = api.add_event(WALLET, comment="verify:2", in_progress=True)
+    api.add_event(WALLET, comment="verify:3")
+    _poll(api, store)
+    assert store.cursor == done["lt"]
+    assert {c for _, c in store.transfers} == {"verify:1", "verify:3"}
+    pending["in_progress"] = False
+    _poll(api, store)
+    assert {c for _, c in store.transfers} == {"verify:1", "verify:2", "verify:3"}
+
+
+def test_upstream_error_keeps_cursor():
+    api, store = FakeTonApi(), _Store()
+    api.add_event(WALLET, comment="verify:1")
+    api.fail_status = 404
+    stats = _poll(api, store)
+    assert stats["errors"] == 1 and store.cursor is None and not store.transfers
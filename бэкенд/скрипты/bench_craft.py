@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк крафта на живой БД: запросов на один крафт и задержка p50/p99.
+
+Создаёт тестового пользователя (telegram_id из --telegram-id), начисляет COINS/STARS,
+выдаёт предметы и мастерскую, затем выполняет --n крафтов каждого вида
+(merge, upgrade, reroll, furnace_upgrade). Запросы считаются логгером asyncpg на всех
+соединениях пула. Запуск из папки бэкенд: python скрипты/bench_craft.py --n 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+if str(BACKEND) not in sys.path:
+    sys.path.insert(0, str(BACKEND))
+
+os.chdir(BACKEND)
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(BACKEND / ".env")
+except ImportError:
+    pass
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, record) -> None:
+        self.count += 1
+
+
+def _pct(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+async def _seed(conn, user_id: int, n: int) -> dict:
+    await conn.execute(
+        """INSERT INTO user_balances (user_id, currency, balance) VALUES ($1, 'COINS', $2), ($1, 'STARS', $2)
+           ON CONFLICT (user_id, currency) DO UPDATE SET balance = EXCLUDED.balance""",
+        user_id, 10 ** 12,
+    )
+    await conn.execute(
+        """INSERT INTO user_buildings (user_id, building_key) VALUES ($1, 'workshop')
+           ON CONFLICT (user_id, building_key) DO NOTHING""",
+        user_id,
+    )
+    relic = await conn.fetchval(
+        "SELECT id FROM item_defs WHERE item_type IN ('relic_slot', 'amulet') ORDER BY id LIMIT 1"
+    )
+    furnace = await conn.fetchval("SELECT id FROM item_defs WHERE item_type = 'furnace' ORDER BY id LIMIT 1")
+    if not relic:
+        raise SystemExit("item_defs без реликвий — сначала python скрипты/seed_items_catalog.py")
+
+    async def give(def_id: int, count: int) -> list:
+        rows = await conn.fetch(
+            """INSERT INTO user_items (user_id, item_def_id, state, item_level)
+               SELECT $1, $2, 'inventory', 1 FROM generate_series(1, $3) RETURNING id""",
+            user_id, def_id, count,
+        )
+        return [int(r["id"]) for r in rows]
+
+    return {
+        "relics": await give(relic, n * 5),
+        "furnaces": await give(furnace, n * 2) if furnace else [],
+        "extras": await give(relic, n) if furnace else [],
+    }
+
+
+async def run(n: int, telegram_id: int) -> None:
+    import asyncpg
+    from config import DATABASE_URL
+    from core import craft
+    from infrastructure import database
+    from infrastructure.catalog import get_item_catalog
+
+    counter = QueryCounter()
+
+    async def _init(conn) -> None:
+        conn.add_query_logger(counter)
+
+    await database.init_db()
+    await database.close_db()
+    database._pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=10, init=_init)
+
+    user_id = await database.ensure_user(telegram_id)
+    pool = await database.get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM user_items WHERE user_id = $1", user_id)
+        items = await _seed(conn, user_id, n)
+    await get_item_catalog()
+
+    relics = items["relics"]
+    cases = {
+        "merge": lambda i: craft.craft_merge(user_id, relics[3 * i:3 * i + 3]),
+        "upgrade": lambda i: craft.craft_upgrade(user_id, relics[3 * n + i]),
+        "reroll": lambda i: craft.craft_reroll(user_id, relics[4 * n + i]),
+    }
+    if items["furnaces"]:
+        f, e = items["furnaces"], items["extras"]
+        cases["furnace_upgrade"] = lambda i: craft.craft_furnace_upgrade(
+            user_id, f[2 * i], f[2 * i + 1], e[i], ad_watched=True,
+        )
+
+    print(f"{'крафт':<16}{'n':>6}{'запросов/крафт':>16}{'p50, мс':>10}{'p99, мс':>10}{'ошибок':>8}")
+    for name, call in cases.items():
+        timings, errors = [], 0
+        counter.count = 0
+        for i in range(n):
+            t0 = time.perf_counter()
+            res = await call(i)
+            timings.append(time.perf_counter() - t0)
+            errors += 0 if res.get("ok") else 1
+        print(f"{name:<16}{n:>6}{counter.count / n:>16.1f}{_pct(timings, 0.5):>10.2f}"
+              f"{_pct(timings, 0.99):>10.2f}{errors:>8}")
+
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM user_items WHERE user_id = $1", user_id)
+    await database.close_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк крафта: запросы и задержка")
+    parser.add_argument("--n", type=int, default=200, help="крафтов каждого вида")
+    parser.add_argument("--telegram-id", type=int, default=-900001, help="telegram_id тестового пользователя")
+    args = parser.parse_args()
+    asyncio.run(run(args.n, args.telegram_id))
+
+
+if __name__ == "__main__":
+    main()
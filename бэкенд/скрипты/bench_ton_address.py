@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк кодека TON-адресов (infrastructure/ton_address.py), БД и сеть не нужны.
+
+Генерирует --n случайных raw-адресов и замеряет:
+- CRC16: побитовый цикл (прежняя реализация) против binascii.crc_hqx;
+- raw → UQ без кэша, пакет raw_to_friendly_many (промахи LRU) и повторный пакет (попадания);
+- friendly → raw.
+Запуск из папки бэкенд: python скрипты/bench_ton_address.py --n 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+if str(BACKEND) not in sys.path:
+    sys.path.insert(0, str(BACKEND))
+
+from infrastructure import ton_address  # noqa: E402
+
+
+def _crc_bitwise(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc <<= 1
+            crc &= 0xFFFF
+    return crc
+
+
+def _timed(label: str, n: int, fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<40}{elapsed:>8.2f} с{n / elapsed:>14,.0f} адр/с")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк кодека TON-адресов")
+    parser.add_argument("--n", type=int, default=1_000_000, help="число адресов")
+    parser.add_argument("--crc-sample", type=int, default=100_000,
+                        help="адресов для замера побитового CRC (он медленный)")
+    args = parser.parse_args()
+    n = args.n
+
+    raws = [f"{0 if i % 16 else -1}:{os.urandom(32).hex()}" for i in range(n)]
+    payloads = [bytes((0x51, 0)) + bytes.fromhex(r.split(":", 1)[1]) for r in raws[:args.crc_sample]]
+    print(f"адресов: {n:,}, LRU: {ton_address.ADDRESS_CACHE_SIZE:,}")
+
+    _timed("CRC16 побитовый цикл", len(payloads), lambda: [_crc_bitwise(p) for p in payloads])
+    _timed("CRC16 binascii.crc_hqx", len(payloads), lambda: [ton_address._crc16_xmodem(p) for p in payloads])
+    _timed("raw → UQ без кэша", n, lambda: [ton_address._raw_to_friendly_local(r) for r in raws])
+
+    ton_address._canonical_cached.cache_clear()
+    friendly = []
+    _timed("raw_to_friendly_many (промахи)", n, lambda: friendly.extend(ton_address.raw_to_friendly_many(raws)))
+    hot = raws[-min(n, ton_address.ADDRESS_CACHE_SIZE):]
+    _timed("raw_to_friendly_many (попадания)", len(hot), lambda: ton_address.raw_to_friendly_many(hot))
+
+    ton_address._canonical_cached.cache_clear()
+    back = []
+    _timed("friendly → raw", n, lambda: back.extend(ton_address.friendly_to_raw(f) for f in friendly))
+    assert back == raws, "round-trip raw → friendly → raw не совпал"
+    print(f"round-trip: ok, {ton_address.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
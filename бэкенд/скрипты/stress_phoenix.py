@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Стресс-тест квеста ФЕНИКС на живой БД: сотни одновременных правильных сдач одного слова.
+
+Создаёт --users тестовых пользователей (telegram_id от --telegram-id вниз), выдаёт каждому
+буквы текущего слова и одновременно отправляет phoenix_submit_word от всех. Проверяет:
+ровно 5 победителей с местами 1..5, слово сменилось ровно один раз. Печатает задержку
+сдачи p50/p99/max. Запуск из папки бэкенд: python скрипты/stress_phoenix.py --users 300
+Код возврата: 0 — инварианты выполнены, 1 — нарушены.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+if str(BACKEND) not in sys.path:
+    sys.path.insert(0, str(BACKEND))
+
+os.chdir(BACKEND)
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(BACKEND / ".env")
+except ImportError:
+    pass
+
+
+def _pct(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+async def run(users: int, telegram_id: int, pool_size: int) -> int:
+    import asyncpg
+    from config import DATABASE_URL
+    from infrastructure import database
+
+    await database.init_db()
+    await database.close_db()
+    database._pool = await asyncpg.create_pool(DATABASE_URL, min_size=pool_size, max_size=pool_size)
+
+    before = await database.get_phoenix_quest_state()
+    word = before["current_word"]
+    print(f"слово: {word}, сдач до теста: {before['submissions_count']}, участников: {users}")
+    # Ровно 5 мест должно достаться тесту — обнуляем счётчик текущего слова
+    pool = await database.get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("UPDATE phoenix_quest_state SET submissions_count = 0 WHERE id = 1")
+
+    telegram_ids = [telegram_id - i for i in range(users)]
+    user_ids = [await database.ensure_user(t) for t in telegram_ids]
+    letters = {}
+    for uid in user_ids:
+        letters[uid] = [await database.add_letter_to_user(uid, ch) for ch in word]
+
+    async def submit(uid: int):
+        t0 = time.perf_counter()
+        res = await database.phoenix_submit_word(uid, word, letters[uid])
+        return res, time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    outcomes = await asyncio.gather(*(submit(uid) for uid in user_ids))
+    elapsed = time.perf_counter() - t0
+
+    after = await database.get_phoenix_quest_state()
+    places = sorted(res["place"] for res, _ in outcomes if res.get("place"))
+    next_words = [res["next_word"] for res, _ in outcomes if res.get("next_word")]
+    timings = [t for _, t in outcomes]
+    print(f"время: {elapsed:.2f} с, задержка p50 {_pct(timings, 0.5):.1f} мс, "
+          f"p99 {_pct(timings, 0.99):.1f} мс, max {max(timings) * 1000:.1f} мс")
+    print(f"места: {places}, новое слово: {after['current_word']} (index {after['word_index']})")
+
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM users WHERE telegram_id = ANY($1::bigint[])", telegram_ids)
+    await database.close_db()
+
+    expected_index = (before["word_index"] + 1) % len(database.PHOENIX_WORDS_LIST)
+    ok = (
+        places == list(range(1, database.PHOENIX_MAX_SUBMISSIONS + 1))
+        and len(next_words) == 1
+        and after["word_index"] == expected_index
+        and after["submissions_count"] == 0
+    )
+    print("инварианты: ok" if ok else "инварианты: НАРУШЕНЫ")
+    return 0 if ok else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Стресс-тест квеста ФЕНИКС")
+    parser.add_argument("--users", type=int, default=300, help="одновременных сдач")
+    parser.add_argument("--telegram-id", type=int, default=-910001, help="первый telegram_id тестовых пользователей")
+    parser.add_argument("--pool-size", type=int, default=50, help="соединений в пуле")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.users, args.telegram_id, args.pool_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Общий исходящий HTTP-клиент: один httpx.AsyncClient на процесс (keep-alive пулы по хостам,
+HTTP/2 при установленном пакете h2), повторы с экспоненциальной паузой, circuit breaker
+на каждый upstream и гистограммы латентности/ошибок.
+
+Жизненный цикл — в lifespan приложения: start_http() / close_http().
+Вне приложения (скрипты, тесты) клиент создаётся лениво при первом get_http().
+
+Пример:
+    r = await get_http().get(url, params=..., upstream="tonapi", fallback=None)
+Если breaker upstream открыт или попытки исчерпаны — возвращается fallback (если передан),
+иначе бросается UpstreamUnavailable.
+
+Источник модуля — бэкенд/infrastructure/http_client.py; копии в deploy/tigrit_api/tigrit_shared
+и сервисы/auth обновляются bash deploy/sync_shared.sh (совпадение проверяет tests/test_shared_copies.py).
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых запрос повторяется (для идемпотентных методов)
+RETRY_STATUSES = (429, 502, 503, 504)
+# Границы корзин гистограммы латентности, мс
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_IDEMPOTENT = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+_NO_FALLBACK = object()
+
+
+class UpstreamUnavailable(httpx.HTTPError):
+    """Upstream недоступен: breaker открыт или исчерпаны попытки."""
+
+
+class CircuitBreaker:
+    """
+    closed → (failure_threshold ошибок подряд) → open → (reset_timeout) → half_open → один пробный запрос.
+    Пробный запрос, оборвавшийся без ответа (отмена, не сетевое исключение), освобождается release_probe();
+    проба старше reset_timeout считается потерянной — разрешается новая.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "half_open" and (
+            not self._probe_in_flight or now - self._probe_started >= self.reset_timeout
+        ):
+            self._probe_in_flight = True
+            self._probe_started = now
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Запрос завершился без ответа и без ошибки upstream — пробу можно повторить."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("circuit breaker opened after %d failures", self.failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class TokenBucket:
+    """Token bucket: rate запросов/сек, всплеск до burst. Общий на процесс — под лимит тарифа upstream."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = max(rate, 0.01)
+        self.capacity = float(max(burst, 1))
+        self._tokens = self.capacity
+        self._ts = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+                self._ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class UpstreamStats:
+    """Счётчики и гистограмма латентности одного upstream."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.retries = 0
+        self.status_counts: Dict[str, int] = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+
+    def observe(self, latency_ms: float, status: Optional[int], error: bool) -> None:
+        self.requests += 1
+        if error:
+            self.errors += 1
+        key = str(status) if status is not None else "transport_error"
+        self.status_counts[key] = self.status_counts.get(key, 0) + 1
+        self.latency_sum_ms += latency_ms
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                self.latency_buckets[i] += 1
+                break
+        else:
+            self.latency_buckets[-1] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected_by_breaker": self.rejected,
+            "retries": self.retries,
+            "status": dict(self.status_counts),
+            "latency_avg_ms": round(self.latency_sum_ms / self.requests, 1) if self.requests else None,
+            "latency_histogram": dict(zip(labels, self.latency_buckets)),
+        }
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpClient:
+    """Обёртка над общим httpx.AsyncClient с повторами, breaker'ами и метриками по upstream."""
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        kwargs: Dict[str, Any] = {
+            "timeout": timeout,
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        }
+        self.http2 = transport is None and _http2_available()
+        if transport is not None:
+            kwargs["transport"] = transport
+        else:
+            kwargs["http2"] = self.http2
+        self._client = httpx.AsyncClient(**kwargs)
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, UpstreamStats] = {}
+
+    def _upstream(self, name: str) -> Tuple[CircuitBreaker, UpstreamStats]:
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(self._failure_threshold, self._reset_timeout)
+            self._stats[name] = UpstreamStats()
+        return self._breakers[name], self._stats[name]
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        upstream: Optional[str] = None,
+        retries: Optional[int] = None,
+        backoff: float = 0.3,
+        fallback: Any = _NO_FALLBACK,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        Запрос через общий пул. upstream — имя для breaker/метрик (по умолчанию хост URL).
+        retries — число повторов (по умолчанию 2). POST повторяется только при ошибке соединения,
+        когда запрос точно не ушёл; идемпотентные методы — также при таймаутах, 429 и 502–504.
+        4xx (кроме 429) не считаются отказом upstream.
+        """
+        method = method.upper()
+        name = upstream or urlsplit(url).netloc or "unknown"
+        breaker, stats = self._upstream(name)
+        idempotent = method in _IDEMPOTENT
+        attempts = 1 + (2 if retries is None else max(retries, 0))
+        last_exc: Optional[Exception] = None
+        for attempt in range(attempts):
+            if not breaker.allow():
+                stats.rejected += 1
+                last_exc = UpstreamUnavailable(f"{name}: circuit open")
+                break
+            if attempt:
+                stats.retries += 1
+            t0 = time.monotonic()
+            try:
+                resp = await self._client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                stats.observe((time.monotonic() - t0) * 1000, None, True)
+                breaker.record_failure()
+                last_exc = e
+                connect_failed = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if attempt + 1 < attempts and (idempotent or connect_failed):
+                    await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+                    continue
+                break
+            except BaseException:
+                # Отмена (wait_for, разрыв клиента) или не сетевая ошибка: не оставлять half_open с «висящей» пробой
+                breaker.release_probe()
+                raise
+            latency_ms = (time.monotonic() - t0) * 1000
+            failed = resp.status_code >= 500
+            stats.observe(latency_ms, resp.status_code, failed)
+            if failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if resp.status_code in RETRY_STATUSES and idempotent and attempt + 1 < attempts:
+                delay = backoff * (2 ** attempt) * (0.5 + random.random())
+                try:
+                    delay = max(delay, min(float(resp.headers.get("Retry-After") or 0), 30.0))
+                except ValueError:
+                    pass
+                await asyncio.sleep(delay)
+                continue
+            return resp
+        if fallback is not _NO_FALLBACK:
+            return fallback
+        if isinstance(last_exc, UpstreamUnavailable):
+            raise last_exc
+        raise UpstreamUnavailable(f"{name}: {last_exc}") from last_exc
+
+    async def get(self, url: str, **kwargs: Any) -> Any:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> Any:
+        return await self.request("POST", url, **kwargs)
+
+    def breaker_state(self, upstream: str) -> str:
+        b = self._breakers.get(upstream)
+        return b.state if b else "closed"
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "upstreams": {
+                name: {"breaker": self._breakers[name].state, **stats.as_dict()}
+                for name, stats in self._stats.items()
+            },
+        }
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_http: Optional[HttpClient] = None
+
+
+def get_http() -> HttpClient:
+    """Общий клиент процесса (создаётся лениво, если start_http() не вызывался)."""
+    global _http
+    if _http is None:
+        _http = HttpClient()
+    return _http
+
+
+async def start_http(**kwargs: Any) -> HttpClient:
+    global _http
+    if _http is None:
+        _http = HttpClient(**kwargs)
+    return _http
+
+
+async def close_http() -> None:
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
@@ -6,14 +6,25 @@ import hashlib
 import json
 import hmac
 import os
+from contextlib import asynccontextmanager
 from typing import Any, Dict, Optional
 from urllib.parse import parse_qsl, unquote
 
-import httpx
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
-app = FastAPI(title="Auth Service", version="0.1.0")
+from http_client import close_http, get_http, start_http
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Общий исходящий HTTP-клиент (keep-alive к Secrets и Игра) на время жизни процесса."""
+    await start_http(timeout=10.0)
+    yield
+    await close_http()
+
+
+app = FastAPI(title="Auth Service", version="0.1.0", lifespan=lifespan)
 
 SECRETS_SERVICE_URL = os.environ.get("SECRETS_SERVICE_URL", "http://secrets:8003").rstrip("/")
 INTERNAL_TOKEN = os.environ.get("INTERNAL_TOKEN") or os.environ.get("SECRETS_INTERNAL_TOKEN", "")
@@ -26,7 +37,7 @@ class VerifyBody(BaseModel):
     token: Optional[str] = None
 
 
-def _get_bot_token() -> str:
+async def _get_bot_token() -> str:
     """
     Токен бота для проверки подписи Telegram initData.
     Сначала из env (TELEGRAM_BOT_TOKEN), иначе из сервиса Secrets — независимость при падении Secrets.
@@ -37,11 +48,12 @@ def _get_bot_token() -> str:
     if not INTERNAL_TOKEN:
         return ""
     try:
-        r = httpx.get(
+        r = await get_http().get(
             f"{SECRETS_SERVICE_URL}/secret",
             params={"key": "TELEGRAM_BOT_TOKEN"},
             headers={"X-Internal-Token": INTERNAL_TOKEN},
             timeout=5.0,
+            upstream="secrets",
         )
         if r.status_code != 200:
             return ""
@@ -51,18 +63,19 @@ def _get_bot_token() -> str:
         return ""
 
 
-def _get_internal_secret() -> str:
+async def _get_internal_secret() -> str:
     """Секрет для вызова ensure_user: из env или из Secrets."""
     if INTERNAL_API_SECRET:
         return INTERNAL_API_SECRET
     if not INTERNAL_TOKEN:
         return ""
     try:
-        r = httpx.get(
+        r = await get_http().get(
             f"{SECRETS_SERVICE_URL}/secret",
             params={"key": "INTERNAL_API_SECRET"},
             headers={"X-Internal-Token": INTERNAL_TOKEN},
             timeout=5.0,
+            upstream="secrets",
         )
         if r.status_code != 200:
             return ""
@@ -111,20 +124,21 @@ def _telegram_user_id_from_init_data(parsed: Dict[str, str]) -> Optional[int]:
 
 async def _ensure_user(telegram_id: int) -> Optional[int]:
     """Вызов internal API Игра ensure-user. Возвращает user_id или None."""
-    secret = _get_internal_secret()
+    secret = await _get_internal_secret()
     if not secret:
         return None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.post(
-                f"{GAME_API_BASE}/api/internal/ensure-user",
-                json={"telegram_id": telegram_id},
-                headers={"X-Internal-Secret": secret},
-            )
-            if r.status_code != 200:
-                return None
-            data = r.json()
-            return data.get("user_id")
+        r = await get_http().post(
+            f"{GAME_API_BASE}/api/internal/ensure-user",
+            json={"telegram_id": telegram_id},
+            headers={"X-Internal-Secret": secret},
+            timeout=10.0,
+            upstream="game_api",
+        )
+        if r.status_code != 200:
+            return None
+        data = r.json()
+        return data.get("user_id")
     except Exception:
         return None
 
@@ -137,7 +151,7 @@ async def verify(body: VerifyBody):
     """
     telegram_id = None
     if body.init_data:
-        bot_token = _get_bot_token()
+        bot_token = await _get_bot_token()
         if not bot_token:
             raise HTTPException(status_code=500, detail="secrets unavailable")
         try: